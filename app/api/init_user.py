@@ -2,7 +2,6 @@
 初始化用户脚本
 用于创建第一个管理员用户
 """
-import sqlite3
 import hashlib
 import sys
 import os
@@ -11,6 +10,8 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 
 from app.services.membership.store import MembershipStore
+from app.db.migrations import migrate_user_db
+from app.db.connection import get_database
 
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
@@ -20,21 +21,10 @@ def init_user(username: str, password: str):
     store = MembershipStore()
     user_db_path = os.path.join(os.path.dirname(store.db_path), "users.db")
     
-    con = sqlite3.connect(user_db_path)
+    migrate_user_db(user_db_path)
+    users_db = get_database(user_db_path)
+    con = users_db.begin()
     try:
-        # 创建表
-        con.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                created_at INTEGER,
-                updated_at INTEGER
-            )
-            """
-        )
-        
         # 检查用户是否已存在
         cur = con.execute("SELECT id FROM users WHERE username=?", (username,))
         if cur.fetchone():
@@ -53,7 +43,7 @@ def init_user(username: str, password: str):
         print(f"✅ 用户 '{username}' 创建成功")
         return True
     finally:
-        con.close()
+        users_db.end(con)
 
 if __name__ == "__main__":
     if len(sys.argv) < 3:
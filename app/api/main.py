@@ -2,12 +2,13 @@
 FastAPI 后端服务
 提供交易数据API和用户认证API
 """
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Query
+from fastapi.responses import Response, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
+from pydantic_core import to_json
 from typing import Optional, List, Dict
-import sqlite3
 import hashlib
 import secrets
 import time
@@ -18,6 +19,13 @@ from app.config.settings import get_settings
 from app.config.trader_config import TraderConfig
 from app.services.okx.state_cache import OKXStateCache
 from app.services.membership.store import MembershipStore
+from app.services.ai.usage import UsageRecorder
+from app.db.migrations import migrate_user_db
+from app.db import queries
+from app.services.trades import ledger, traces
+from app.db.connection import get_database
+from app.utils import metrics
+from app.utils.profiler import get_profiler
 
 app = FastAPI(title="交易监控API", version="1.0.0")
 
@@ -39,81 +47,60 @@ app.add_middleware(
 # 安全配置
 security = HTTPBearer()
 settings = get_settings()
+
+# 请求耗时指标（按处理函数名统计，未匹配路由的请求归为 unmatched）
+REQUEST_SECONDS = metrics.histogram('api_request_seconds', 'API 请求耗时（秒）', ('method', 'handler', 'status'))
+
+if settings.METRICS_ENABLED:
+    @app.middleware("http")
+    async def record_request_metrics(request: Request, call_next):
+        started = time.perf_counter()
+        status_code = 500
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            return response
+        finally:
+            handler = getattr(request.scope.get('endpoint'), '__name__', 'unmatched')
+            if handler != 'get_metrics':
+                REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method,
+                                        handler=handler, status=status_code)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def get_metrics():
+        """Prometheus 文本格式的指标（API 进程：请求耗时、OKX 轮询、SQLite 写事务等）"""
+        return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
 trader_config = TraderConfig()
 store = MembershipStore()
 okx_cache = OKXStateCache()
 okx_cache.start()
+usage_recorder = UsageRecorder()
 
 # 时间格式化辅助函数（UTC+8）
+TZ_UTC8 = timezone(timedelta(hours=8))
+
 def format_datetime_utc8(timestamp: int) -> str:
-    """将时间戳转换为UTC+8时区的字符串格式"""
+    """将时间戳转换为UTC+8时区的字符串格式（列表查询在 SQL 中用 strftime 做同样的转换）"""
     if not timestamp:
         return ""
-    # 创建UTC+8时区
-    tz_utc8 = timezone(timedelta(hours=8))
-    # 从时间戳创建datetime对象（UTC时间），然后转换为UTC+8
-    dt = datetime.fromtimestamp(timestamp, tz=timezone.utc).astimezone(tz_utc8)
-    return dt.strftime("%Y-%m-%d %H:%M:%S")
+    return datetime.fromtimestamp(timestamp, tz=TZ_UTC8).strftime("%Y-%m-%d %H:%M:%S")
 
 # 用户认证相关
 USER_DB_PATH = os.path.join(os.path.dirname(store.db_path), "users.db")
 
 def init_user_db():
-    """初始化用户数据库"""
-    # 确保数据库目录存在
-    db_dir = os.path.dirname(USER_DB_PATH)
-    if db_dir and not os.path.exists(db_dir):
-        os.makedirs(db_dir, exist_ok=True)
-    con = sqlite3.connect(USER_DB_PATH)
-    try:
-        con.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                role TEXT NOT NULL DEFAULT 'user',
-                note TEXT,
-                created_at INTEGER,
-                updated_at INTEGER
-            )
-            """
-        )
-        # 添加role字段（如果表已存在但没有该字段）
-        try:
-            con.execute("ALTER TABLE users ADD COLUMN role TEXT DEFAULT 'user'")
-            # 为现有用户设置默认角色
-            con.execute("UPDATE users SET role='user' WHERE role IS NULL")
-            con.commit()
-        except sqlite3.OperationalError:
-            # 字段已存在，但确保所有用户都有 role
-            con.execute("UPDATE users SET role='user' WHERE role IS NULL")
-            con.commit()
-        # 添加note字段（如果表已存在但没有该字段）
-        try:
-            con.execute("ALTER TABLE users ADD COLUMN note TEXT")
-            con.commit()
-        except sqlite3.OperationalError:
-            pass  # 字段已存在
-        
-        con.execute(
-            """
-            CREATE TABLE IF NOT EXISTS sessions (
-                token TEXT PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                expires_at INTEGER NOT NULL,
-                created_at INTEGER,
-                FOREIGN KEY(user_id) REFERENCES users(id)
-            )
-            """
-        )
-        con.commit()
-    finally:
-        con.close()
+    """初始化用户数据库（执行 users.db 的版本化迁移）"""
+    migrate_user_db(USER_DB_PATH)
 
 # 初始化数据库
 init_user_db()
 
+# 共享连接（WAL 模式、每线程长连接、写入串行化）
+# 写事务（begin / transaction）可能等待机器人进程的写锁（最长 busy_timeout），写数据的接口都用普通 def，
+# 由 FastAPI 放到线程池执行，避免阻塞事件循环上的其他请求
+trades_db = get_database(store.db_path)
+users_db = get_database(USER_DB_PATH)
+
 # 密码哈希
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
@@ -159,6 +146,7 @@ class TradeResponse(BaseModel):
 class TradesResponse(BaseModel):
     success: bool
     data: List[TradeResponse]
+    next_cursor: Optional[str] = None  # 分页时下一页的游标，为空表示没有下一页
 
 class TradeDetailResponse(BaseModel):
     success: bool
@@ -168,8 +156,7 @@ class TradeDetailResponse(BaseModel):
 # 认证依赖
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     token = credentials.credentials
-    con = sqlite3.connect(USER_DB_PATH)
-    try:
+    with users_db.reader() as con:
         cur = con.execute(
             "SELECT user_id, expires_at FROM sessions WHERE token=?",
             (token,)
@@ -181,14 +168,11 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         if expires_at < int(time.time()):
             raise HTTPException(status_code=401, detail="token已过期")
         return user_id
-    finally:
-        con.close()
 
 async def get_current_user_with_role(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """获取当前用户信息（包括角色）"""
     token = credentials.credentials
-    con = sqlite3.connect(USER_DB_PATH)
-    try:
+    with users_db.reader() as con:
         cur = con.execute(
             """
             SELECT s.user_id, s.expires_at, u.role
@@ -205,8 +189,6 @@ async def get_current_user_with_role(credentials: HTTPAuthorizationCredentials =
         if expires_at < int(time.time()):
             raise HTTPException(status_code=401, detail="token已过期")
         return {"user_id": user_id, "role": role}
-    finally:
-        con.close()
 
 async def require_admin(user_info: dict = Depends(get_current_user_with_role)):
     """要求管理员权限"""
@@ -216,31 +198,20 @@ async def require_admin(user_info: dict = Depends(get_current_user_with_role)):
 
 # API路由
 @app.post("/api/auth/login", response_model=LoginResponse)
-async def login(request: LoginRequest):
-    """用户登录"""
-    con = sqlite3.connect(USER_DB_PATH)
+def login(request: LoginRequest):
+    """用户登录（普通 def：在线程池中执行，等待写锁和校验密码都不阻塞事件循环）"""
     try:
-        # 先尝试查询包含 role 字段
-        cur = con.execute(
-            "SELECT id, password_hash, COALESCE(role, 'user') as role FROM users WHERE username=?",
-            (request.username,)
-        )
-        row = cur.fetchone()
+        # 只读查询不占写锁
+        with users_db.reader() as con:
+            row = con.execute(
+                "SELECT id, password_hash, COALESCE(role, 'user') as role FROM users WHERE username=?",
+                (request.username,)
+            ).fetchone()
         if not row:
             return LoginResponse(success=False, message="用户名或密码错误")
         
         user_id, password_hash, role = row
         
-        # 如果 role 为 None，设置为默认值 'user'
-        if role is None:
-            role = 'user'
-            # 更新数据库中的 role 字段
-            con.execute(
-                "UPDATE users SET role=? WHERE id=?",
-                (role, user_id)
-            )
-            con.commit()
-        
         if not verify_password(request.password, password_hash):
             return LoginResponse(success=False, message="用户名或密码错误")
         
@@ -249,11 +220,11 @@ async def login(request: LoginRequest):
         expires_at = int(time.time()) + 7 * 24 * 3600  # 7天有效期
         now = int(time.time())
         
-        con.execute(
-            "INSERT INTO sessions(token, user_id, expires_at, created_at) VALUES(?,?,?,?)",
-            (token, user_id, expires_at, now)
-        )
-        con.commit()
+        with users_db.transaction() as con:
+            con.execute(
+                "INSERT INTO sessions(token, user_id, expires_at, created_at) VALUES(?,?,?,?)",
+                (token, user_id, expires_at, now)
+            )
         
         return LoginResponse(success=True, token=token, role=role or 'user')
     except Exception as e:
@@ -261,8 +232,6 @@ async def login(request: LoginRequest):
         import traceback
         traceback.print_exc()
         return LoginResponse(success=False, message=f"登录失败: {str(e)}")
-    finally:
-        con.close()
 
 @app.post("/api/auth/logout")
 async def logout(user_id: int = Depends(get_current_user)):
@@ -271,9 +240,9 @@ async def logout(user_id: int = Depends(get_current_user)):
     return {"success": True, "message": "登出成功"}
 
 @app.post("/api/auth/change-password")
-async def change_password(request: ChangePasswordRequest, user_id: int = Depends(get_current_user)):
+def change_password(request: ChangePasswordRequest, user_id: int = Depends(get_current_user)):
     """修改密码"""
-    con = sqlite3.connect(USER_DB_PATH)
+    con = users_db.begin()
     try:
         cur = con.execute(
             "SELECT password_hash FROM users WHERE id=?",
@@ -297,239 +266,244 @@ async def change_password(request: ChangePasswordRequest, user_id: int = Depends
         
         return {"success": True, "message": "密码修改成功"}
     finally:
-        con.close()
+        users_db.end(con)
+
+def trade_from_projection(row, trader_names: Dict[str, str], live_price) -> Dict:
+    """由 queries.TRADE_LISTING 的一行组装返回数据（列表与详情共用）
+
+    派生字段（状态、盈亏、部分出局拆分、时间字符串）已在 SQL 中算好，这里只补充带单员名称，
+    并为待入场 / 尚无实时状态的持仓单填充实时价格。
+    trader_names: 带单员ID -> 名称；live_price: 交易对 -> 实时价格（无价格时返回 None）
+    """
+    (trade_id, trader_id, ch_id, symbol, side, entry_price, take_profit, stop_loss, confidence, created_at,
+     created_at_str, lifecycle, status, current_price, pnl_points, pnl_percent,
+     exited_pnl_points, remaining_pnl_points) = row
+    if symbol and (lifecycle == queries.LIFECYCLE_PENDING or (
+            not current_price and lifecycle not in (queries.LIFECYCLE_CLOSED, queries.LIFECYCLE_PARTIAL))):
+        price = live_price(symbol)
+        if price:
+            current_price = price
+    return {
+        "id": trade_id,
+        "trader_id": trader_id,
+        "channel_id": ch_id,
+        "channel_name": trader_names.get(trader_id, ch_id) if trader_id else ch_id,
+        "symbol": symbol or "",
+        "side": side or "",
+        "entry_price": float(entry_price) if entry_price else 0,
+        "take_profit": float(take_profit) if take_profit else 0,
+        "stop_loss": float(stop_loss) if stop_loss else 0,
+        "current_price": float(current_price) if current_price else None,
+        "status": status or "未进场",
+        "pnl_points": float(pnl_points) if pnl_points else None,
+        "pnl_percent": float(pnl_percent) if pnl_percent else None,
+        "confidence": float(confidence) if confidence else None,
+        "created_at": created_at,
+        "created_at_str": created_at_str,
+        "exited_pnl_points": exited_pnl_points,
+        "remaining_pnl_points": remaining_pnl_points,
+    }
+
+def trader_names() -> Dict[str, str]:
+    """带单员ID -> 名称（每个请求取一次，避免逐行查配置）"""
+    return {t["id"]: t["name"] for t in trader_config.get_all_traders()}
+
+def encode_trade_cursor(created_at, trade_id) -> str:
+    """分页游标：上一页最后一条的 (created_at, trade_id)"""
+    return f"{created_at or 0}_{trade_id}"
+
+def decode_trade_cursor(cursor: str):
+    try:
+        created_at, trade_id = cursor.split("_", 1)
+        return int(created_at), int(trade_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="cursor 无效")
+
+def trade_filters(channel_id=None, trader_id=None, status_group=None, symbol=None, side=None,
+                  since=None, until=None):
+    """列表/汇总共用的筛选条件，返回 (条件列表, 参数列表)；每个条件都有对应的 trade_projection 索引"""
+    conditions = []
+    params = []
+    if channel_id:
+        conditions.append("p.channel_id = ?")
+        params.append(channel_id)
+    if trader_id:
+        conditions.append("p.trader_id = ?")
+        params.append(trader_id)
+    if status_group:
+        lifecycles = queries.LIFECYCLE_GROUPS.get(status_group)
+        if lifecycles is None:
+            raise HTTPException(status_code=400, detail=f"status 只能是 {'/'.join(queries.LIFECYCLE_GROUPS)}")
+        conditions.append(f"p.lifecycle IN ({','.join('?' * len(lifecycles))})")
+        params.extend(lifecycles)
+    if symbol:
+        conditions.append("p.symbol = ?")
+        params.append(symbol.strip().upper())
+    if side:
+        if side not in ("long", "short"):
+            raise HTTPException(status_code=400, detail="side 只能是 long/short")
+        conditions.append("p.side = ?")
+        params.append(side)
+    if since is not None:
+        conditions.append("p.created_at >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("p.created_at < ?")
+        params.append(until)
+    return conditions, params
 
 @app.get("/api/trades", response_model=TradesResponse)
 async def get_trades(
     channel_id: Optional[str] = None, 
     trader_id: Optional[str] = None,
+    status_group: Optional[str] = Query(None, alias="status"),
+    symbol: Optional[str] = None,
+    side: Optional[str] = None,
+    since: Optional[int] = None,
+    until: Optional[int] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
     user_id: int = Depends(get_current_user)
 ):
-    """获取交易单列表
+    """获取交易单列表（读取事件投影 trade_projection，按创建时间倒序分页）
     
     参数:
     - channel_id: 通过Discord频道ID过滤
     - trader_id: 通过带单员ID过滤（例如: trader1）
+    - status: 状态分组 pending(待入场) / active(持仓中，含部分出局) / open(未结束) / ended(已结束)
+    - symbol: 交易对 instId（例如: BTC-USDT-SWAP）
+    - side: long / short
+    - since / until: 创建时间范围（Unix 秒，含 since，不含 until）
+    - limit: 每页条数（默认 TRADES_PAGE_DEFAULT_LIMIT，不超过 TRADES_PAGE_MAX_LIMIT）
+    - cursor: 上一页返回的 next_cursor
+    
+    按 (created_at, id) 键集分页，响应中的 next_cursor 为空表示没有下一页；
+    每个筛选条件都有对应的索引，查询开销只与页大小有关。汇总统计见 /api/trades/stats。
     """
-    con = sqlite3.connect(store.db_path)
+    conditions, params = trade_filters(channel_id, trader_id, status_group, symbol, side, since, until)
+    page_size = max(1, min(limit or settings.TRADES_PAGE_DEFAULT_LIMIT, settings.TRADES_PAGE_MAX_LIMIT))
+    if cursor:
+        # 行值比较可直接在 (…, created_at, rowid) 索引上定位，不需要 OR 展开
+        conditions.append("(p.created_at, p.trade_id) < (?, ?)")
+        params.extend(decode_trade_cursor(cursor))
+
+    con = trades_db.connection()
     try:
-        # 确保表存在
-        con.execute(
-            """
-            CREATE TABLE IF NOT EXISTS trades (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                trader_id TEXT,
-                source_message_id TEXT,
-                channel_id TEXT,
-                user_id TEXT,
-                symbol TEXT,
-                side TEXT,
-                entry_price REAL,
-                take_profit REAL,
-                stop_loss REAL,
-                confidence REAL,
-                created_at INTEGER
-            )
-            """
-        )
-        con.execute(
-            """
-            CREATE TABLE IF NOT EXISTS trade_status_detail (
-                trade_id INTEGER PRIMARY KEY,
-                status TEXT,
-                pnl_points REAL,
-                pnl_percent REAL,
-                current_price REAL,
-                updated_at INTEGER
-            )
-            """
-        )
-        con.execute(
-            """
-            CREATE TABLE IF NOT EXISTS trade_updates (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                trader_id TEXT,
-                trade_ref_id INTEGER,
-                source_message_id TEXT,
-                channel_id TEXT,
-                user_id TEXT,
-                text TEXT,
-                pnl_points REAL,
-                status TEXT,
-                created_at INTEGER
-            )
-            """
-        )
-        con.commit()
-        
-        query = """
-            SELECT t.id, t.trader_id, t.channel_id, t.symbol, t.side, 
-                   t.entry_price, t.take_profit, t.stop_loss, t.confidence, t.created_at,
-                   ts.status, ts.pnl_points, ts.pnl_percent, ts.current_price
-            FROM trades t
-            LEFT JOIN trade_status_detail ts ON t.id = ts.trade_id
-        """
-        params = []
-        conditions = []
-        if channel_id:
-            conditions.append("t.channel_id = ?")
-            params.append(channel_id)
-        if trader_id:
-            conditions.append("t.trader_id = ?")
-            params.append(trader_id)
-        
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-        query += " ORDER BY t.created_at DESC"
-        
-        cur = con.execute(query, params)
-        rows = cur.fetchall()
+        trader_config.check_reload()
+        query = queries.trade_listing_page(conditions)
+        # 多取一条判断是否还有下一页
+        params.append(page_size + 1)
         
+        # 单条语句取回全部派生字段；行已按 TradeResponse 的字段类型组装，
+        # 直接用 pydantic-core 序列化，跳过 response_model 对上万行的逐行校验和 json.dumps
+        names = trader_names()
+        live_price = okx_cache.get_price
         trades = []
+        rows = con.execute(query, params).fetchall()
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = encode_trade_cursor(rows[-1][9], rows[-1][0])
         for row in rows:
-            (trade_id, trader_id, ch_id, symbol, side, entry_price, take_profit, 
-             stop_loss, confidence, created_at, status, pnl_points, pnl_percent, current_price) = row
-            
-            # 检查是否有部分出局的更新记录
-            partial_exit = con.execute(
-                """
-                SELECT status, pnl_points, created_at FROM trade_updates 
-                WHERE trade_ref_id=? 
-                AND (status LIKE '%部分%' OR status LIKE '%部分出局%')
-                ORDER BY created_at DESC LIMIT 1
-                """,
-                (trade_id,)
-            ).fetchone()
-            
-            # 检查是否有最新的更新状态（已止盈/止损等）
-            latest_update = con.execute(
-                """
-                SELECT status, pnl_points FROM trade_updates 
-                WHERE trade_ref_id=? 
-                AND status IN ('已止盈', '已止损', '带单主动止盈', '带单主动止损')
-                ORDER BY created_at DESC LIMIT 1
-                """,
-                (trade_id,)
-            ).fetchone()
-            
-            # 判断交易是否已结束
-            is_ended = False
-            exited_pnl = None  # 已出局部分的盈亏
-            if latest_update:
-                status = latest_update[0]
-                is_ended = True
-                if latest_update[1]:
-                    pnl_points = float(latest_update[1])
-                    # 重新计算盈亏百分比（基于最终盈亏点数）
-                    if entry_price and entry_price > 0:
-                        pnl_percent = (pnl_points / entry_price) * 100
-            elif status and status in ['已止盈', '已止损', '带单主动止盈', '带单主动止损']:
-                is_ended = True
-            elif partial_exit:
-                # 部分出局：显示已出局部分的盈亏
-                exited_pnl = float(partial_exit[1]) if partial_exit[1] else None
-                # 状态保持为部分出局，但需要显示已出局和剩余部分的盈亏
-                status = partial_exit[0]  # 使用部分出局的状态
-            
-            # 获取带单员信息
-            trader = trader_config.get_trader_by_id(trader_id) if trader_id else None
-            channel_name = trader['name'] if trader else ch_id
-            
-            # 如果没有状态，计算默认状态
-            if not status:
-                status = "未进场"
-            
-            # 如果是"待入场"状态，尝试获取当前价格用于显示，但不重新计算状态
-            if status == "待入场":
-                # 待入场状态：只获取价格用于显示，不计算盈亏
-                if not current_price and symbol:
-                    price = okx_cache.get_price(symbol)
-                    if price:
-                        current_price = float(price)
-                # 待入场状态时，清空盈亏数据
-                pnl_points = None
-                pnl_percent = None
-            # 如果交易已结束，不再更新价格和重新计算（保持最终状态）
-            elif is_ended:
-                # 已结束的交易，不再获取实时价格，使用已保存的最终价格
-                # 如果trade_status_detail中有价格，使用它；否则使用entry_price作为显示
-                if not current_price:
-                    current_price = entry_price  # 使用进场价作为显示，不再实时更新
-            elif not current_price and symbol:
-                # 如果交易未结束，尝试从OKX获取当前价格用于计算
-                price = okx_cache.get_price(symbol)
-                if price:
-                    current_price = float(price)
-            
-            created_at_str = format_datetime_utc8(created_at)
-            
             try:
-                    # 如果是"待入场"状态，不计算盈亏
-                    if status == "待入场":
-                        final_pnl_points = None
-                        final_pnl_percent = None
-                        exited_pnl_points = None
-                        remaining_pnl_points = None
-                    # 如果是部分出局，计算并显示已出局和剩余部分的盈亏
-                    elif partial_exit and exited_pnl is not None:
-                        # 如果是部分出局，pnl_points 是剩余部分的盈亏，需要加上已出局部分的盈亏
-                        # 剩余部分的盈亏已经在 pnl_points 中
-                        # 已出局部分的盈亏在 exited_pnl 中
-                        # 总盈亏 = 已出局 + 剩余部分
-                        remaining_pnl = float(pnl_points) if pnl_points else 0
-                        total_pnl = exited_pnl + remaining_pnl
-                        total_pnl_percent = (total_pnl / entry_price) * 100 if entry_price and entry_price > 0 else 0
-                        
-                        # 设置已出局和剩余部分的盈亏
-                        exited_pnl_points = exited_pnl
-                        remaining_pnl_points = remaining_pnl
-                        
-                        # 总盈亏显示在 pnl_points 中
-                        final_pnl_points = total_pnl
-                        final_pnl_percent = total_pnl_percent
-                    else:
-                        # 正常情况：使用数据库中的盈亏数据
-                        final_pnl_points = pnl_points
-                        final_pnl_percent = pnl_percent
-                        exited_pnl_points = None
-                        remaining_pnl_points = None
-                    
-                    trades.append(TradeResponse(
-                        id=trade_id,
-                        trader_id=trader_id,
-                        channel_id=ch_id,
-                        channel_name=channel_name,
-                        symbol=symbol or "",
-                        side=side or "",
-                        entry_price=float(entry_price) if entry_price else 0,
-                        take_profit=float(take_profit) if take_profit else 0,
-                        stop_loss=float(stop_loss) if stop_loss else 0,
-                        current_price=float(current_price) if current_price else None,
-                        status=status or "未进场",
-                        pnl_points=float(final_pnl_points) if final_pnl_points else None,
-                        pnl_percent=float(final_pnl_percent) if final_pnl_percent else None,
-                        confidence=float(confidence) if confidence else None,
-                        created_at=created_at,
-                        created_at_str=created_at_str,
-                        exited_pnl_points=exited_pnl_points,
-                        remaining_pnl_points=remaining_pnl_points
-                    ))
+                trades.append(trade_from_projection(row, names, live_price))
             except Exception as e:
-                print(f"处理交易单 {trade_id} 时出错: {e}")
+                print(f"处理交易单 {row[0]} 时出错: {e}")
                 continue
         
-        return TradesResponse(success=True, data=trades)
+        return Response(to_json({"success": True, "data": trades, "next_cursor": next_cursor}),
+                        media_type="application/json")
     except Exception as e:
         print(f"获取交易单列表异常: {e}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"获取交易单列表失败: {str(e)}")
-    finally:
-        con.close()
+
+@app.get("/api/trades/stats")
+async def get_trade_stats(
+    channel_id: Optional[str] = None,
+    trader_id: Optional[str] = None,
+    since: Optional[int] = None,
+    until: Optional[int] = None,
+    latest: int = 3,
+    user_id: int = Depends(get_current_user)
+):
+    """按带单员汇总交易单（首页概览卡片、带单员页统计栏），附带每个带单员最新的未结束交易单
+    
+    参数:
+    - channel_id / trader_id / since / until: 与 /api/trades 相同的筛选条件
+    - latest: 每个带单员附带的最新未结束交易单数量（最多 20）
+    """
+    conditions, params = trade_filters(channel_id, trader_id, since=since, until=until)
+    where = "".join(" AND " + condition for condition in conditions)
+    latest = max(0, min(latest, 20))
+    # 已结束交易单读汇总表（只按带单员/频道汇总）；带时间范围时才扫描已结束交易单
+    if since is None and until is None:
+        closed_sql = queries.TRADE_CLOSED_TOTALS.format(where=where)
+    else:
+        closed_sql = queries.TRADE_CLOSED_STATS.format(where=where)
+    try:
+        trader_config.check_reload()
+        with trades_db.reader() as con:
+            open_stats = {row[0]: row[1:] for row in con.execute(
+                queries.TRADE_OPEN_STATS.format(listing=queries.TRADE_LISTING, where=where), params
+            )}
+            closed_stats = {row[0]: row[1:] for row in con.execute(closed_sql, params)}
+            open_rows = []
+            if latest:
+                # 每个带单员、每种未结束状态各取最新 latest 单（索引查找），合并后再截取
+                latest_sql = queries.TRADE_LATEST_OPEN.format(where=where)
+                picked = []
+                for stats_trader_id in open_stats:
+                    candidates = []
+                    for lifecycle in queries.LIFECYCLE_GROUPS["open"]:
+                        candidates.extend(con.execute(
+                            latest_sql, [stats_trader_id, lifecycle] + params + [latest]
+                        ).fetchall())
+                    candidates.sort(key=lambda row: (row[1] or 0, row[0]), reverse=True)
+                    picked.extend(row[0] for row in candidates[:latest])
+                if picked:
+                    open_rows = con.execute(queries.trade_listing_by_ids(len(picked)), picked).fetchall()
+        
+        names = trader_names()
+        live_price = okx_cache.get_price
+        latest_by_trader: Dict[str, List[Dict]] = {}
+        for row in open_rows:
+            latest_by_trader.setdefault(row[1], []).append(trade_from_projection(row, names, live_price))
+        
+        data = []
+        for stats_trader_id in sorted(set(open_stats) | set(closed_stats)):
+            (pending, entered, floating_profit, floating_loss, entered_pnl, entered_pnl_percent,
+             profitable, losing) = open_stats.get(stats_trader_id, (0,) * 8)
+            ended, closed_pnl = closed_stats.get(stats_trader_id, (0, 0))
+            pending, entered = pending or 0, entered or 0
+            data.append({
+                "trader_id": stats_trader_id,
+                "total": pending + entered + ended,
+                "open": pending + entered,
+                "pending": pending,
+                "entered": entered,
+                "ended": ended,
+                "floating_profit": floating_profit or 0,
+                "floating_loss": floating_loss or 0,
+                "entered_pnl_points": entered_pnl or 0,
+                "entered_pnl_percent_avg": (entered_pnl_percent or 0) / entered if entered else 0,
+                "profitable": profitable or 0,
+                "losing": losing or 0,
+                "total_pnl_points": (entered_pnl or 0) + (closed_pnl or 0),
+                "latest_open": latest_by_trader.get(stats_trader_id, []),
+            })
+        return {"success": True, "data": data}
+    except Exception as e:
+        print(f"获取交易单统计异常: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"获取交易单统计失败: {str(e)}")
 
 @app.get("/api/traders")
 async def get_traders(user_id: int = Depends(get_current_user)):
     """获取带单员列表"""
+    trader_config.check_reload()
     traders = trader_config.get_all_traders()
     return {
         "success": True,
@@ -547,38 +521,16 @@ async def get_traders(user_id: int = Depends(get_current_user)):
 @app.get("/api/trades/{trade_id}", response_model=TradeDetailResponse)
 async def get_trade_detail(trade_id: int, user_id: int = Depends(get_current_user)):
     """获取单个交易单的详细信息（包括所有更新记录）"""
-    con = sqlite3.connect(store.db_path)
+    con = trades_db.connection()
     try:
         # 获取交易单基本信息
-        cur = con.execute(
-            """
-            SELECT t.id, t.trader_id, t.channel_id, t.symbol, t.side, 
-                   t.entry_price, t.take_profit, t.stop_loss, t.confidence, t.created_at,
-                   ts.status, ts.pnl_points, ts.pnl_percent, ts.current_price
-            FROM trades t
-            LEFT JOIN trade_status_detail ts ON t.id = ts.trade_id
-            WHERE t.id = ?
-            """,
-            (trade_id,)
-        )
-        row = cur.fetchone()
+        row = con.execute(queries.TRADE_LISTING + " WHERE p.trade_id = ?", (trade_id,)).fetchone()
         
         if not row:
             raise HTTPException(status_code=404, detail="交易单不存在")
         
-        (trade_id, trader_id, ch_id, symbol, side, entry_price, take_profit, 
-         stop_loss, confidence, created_at, status, pnl_points, pnl_percent, current_price) = row
-        
         # 获取所有更新记录
-        updates_cur = con.execute(
-            """
-            SELECT id, text, status, pnl_points, created_at
-            FROM trade_updates
-            WHERE trade_ref_id = ?
-            ORDER BY created_at DESC
-            """,
-            (trade_id,)
-        )
+        updates_cur = con.execute(queries.TRADE_UPDATES_FOR_TRADE, (trade_id,))
         updates = []
         for update_row in updates_cur.fetchall():
             update_id, text, update_status, update_pnl, update_created_at = update_row
@@ -591,40 +543,7 @@ async def get_trade_detail(trade_id: int, user_id: int = Depends(get_current_use
                 "created_at_str": format_datetime_utc8(update_created_at) if update_created_at else ""
             })
         
-        # 获取带单员信息
-        trader = trader_config.get_trader_by_id(trader_id) if trader_id else None
-        channel_name = trader['name'] if trader else ch_id
-        
-        # 如果没有状态，计算默认状态
-        if not status:
-            status = "未进场"
-        
-        # 如果没有当前价格，尝试从OKX获取
-        if not current_price and symbol:
-            price = okx_cache.get_price(symbol)
-            if price:
-                current_price = float(price)
-        
-        created_at_str = format_datetime_utc8(created_at)
-        
-        trade_data = TradeResponse(
-            id=trade_id,
-            trader_id=trader_id,
-            channel_id=ch_id,
-            channel_name=channel_name,
-            symbol=symbol or "",
-            side=side or "",
-            entry_price=float(entry_price) if entry_price else 0,
-            take_profit=float(take_profit) if take_profit else 0,
-            stop_loss=float(stop_loss) if stop_loss else 0,
-            current_price=float(current_price) if current_price else None,
-            status=status or "未进场",
-            pnl_points=float(pnl_points) if pnl_points else None,
-            pnl_percent=float(pnl_percent) if pnl_percent else None,
-            confidence=float(confidence) if confidence else None,
-            created_at=created_at,
-            created_at_str=created_at_str
-        )
+        trade_data = trade_from_projection(row, trader_names(), okx_cache.get_price)
         
         return TradeDetailResponse(success=True, data=trade_data, updates=updates)
     except HTTPException:
@@ -634,29 +553,89 @@ async def get_trade_detail(trade_id: int, user_id: int = Depends(get_current_use
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"获取交易单详情失败: {str(e)}")
-    finally:
-        con.close()
 
 @app.get("/api/prices")
 async def get_prices(user_id: int = Depends(get_current_user)):
     """获取实时价格"""
     prices = {}
-    for inst_id in settings.OKX_INST_IDS:
+    for inst_id in list(okx_cache.inst_ids):
         price = okx_cache.get_price(inst_id)
         if price:
             prices[inst_id] = float(price)
     return {"success": True, "data": prices}
 
+@app.get("/api/llm/usage")
+async def get_llm_usage(since_hours: Optional[int] = None, user_info: dict = Depends(require_admin)):
+    """获取 LLM token 用量（按带单员/提示词版本汇总，含缓存命中率）- 仅管理员
+
+    服务端没返回 usage 或流中途断开的请求计入 usage_unknown_calls / usage_unknown_messages，不按 0 token 计算
+
+    参数:
+    - since_hours: 只统计最近 N 小时（留空统计全部）
+    """
+    since = int(time.time()) - since_hours * 3600 if since_hours else None
+    try:
+        return {"success": True, "data": usage_recorder.summary(since)}
+    except Exception as e:
+        print(f"获取 LLM 用量异常: {e}")
+        raise HTTPException(status_code=500, detail=f"获取 LLM 用量失败: {str(e)}")
+
+@app.get("/api/admin/traces/slowest")
+async def get_slowest_traces(limit: int = 20, since_hours: float = 24, user_info: dict = Depends(require_admin)):
+    """最近处理最慢的消息及各阶段耗时（网关延迟、预过滤、LLM、校验、入库、初始状态）- 仅管理员
+
+    参数:
+    - limit: 返回条数（最多 200）
+    - since_hours: 只看最近 N 小时收到的消息
+    """
+    limit = max(1, min(limit, 200))
+    since = time.time() - since_hours * 3600
+    try:
+        with trades_db.reader() as con:
+            data = traces.slowest_from_db(con, limit, since)
+        return {"success": True, "data": data}
+    except Exception as e:
+        print(f"获取消息耗时异常: {e}")
+        raise HTTPException(status_code=500, detail=f"获取消息耗时失败: {str(e)}")
+
+@app.post("/api/admin/profiler/start")
+async def start_profiler(interval_ms: Optional[float] = None, max_seconds: Optional[float] = None,
+                         user_info: dict = Depends(require_admin)):
+    """启动 API 进程的采样分析器（采样所有线程的调用栈）- 仅管理员
+
+    参数:
+    - interval_ms: 采样间隔（毫秒，默认 PROFILER_INTERVAL_MS）
+    - max_seconds: 最长运行时间（秒，不超过 PROFILER_MAX_SECONDS，到时自动停止）
+    """
+    profiler = get_profiler()
+    if not profiler.start(interval_ms, max_seconds):
+        raise HTTPException(status_code=409, detail="分析器已在运行")
+    return {"success": True, "data": profiler.status()}
+
+@app.post("/api/admin/profiler/stop")
+def stop_profiler(user_info: dict = Depends(require_admin)):
+    """停止采样并返回 collapsed stack 文本（可直接用于 flamegraph.pl / speedscope）- 仅管理员"""
+    # 普通 def：FastAPI 放到线程池执行，stop() 等待采样线程退出（最长 5 秒）时不阻塞事件循环
+    return PlainTextResponse(get_profiler().stop())
+
+@app.get("/api/admin/profiler/status")
+async def get_profiler_status(user_info: dict = Depends(require_admin)):
+    """采样分析器状态（是否运行、采样轮数、不同调用栈数量）- 仅管理员"""
+    return {"success": True, "data": get_profiler().status()}
+
 @app.delete("/api/trades/{trade_id}")
-async def delete_trade(trade_id: int, user_info: dict = Depends(require_admin)):
+def delete_trade(trade_id: int, user_info: dict = Depends(require_admin)):
     """删除指定的交易单（包括相关的更新记录和状态记录）- 仅管理员"""
-    con = sqlite3.connect(store.db_path)
+    con = trades_db.begin()
     try:
         # 检查交易单是否存在
         cur = con.execute("SELECT id FROM trades WHERE id=?", (trade_id,))
         if not cur.fetchone():
             raise HTTPException(status_code=404, detail="交易单不存在")
         
+        # 事件日志只追加：记录删除事件（同时移除投影），原始事件保留
+        ledger.record(con, trade_id, ledger.EVENT_DELETED, source=f'api:{user_info["user_id"]}')
+        
         # 删除相关的更新记录
         con.execute("DELETE FROM trade_updates WHERE trade_ref_id=?", (trade_id,))
         
@@ -676,18 +655,18 @@ async def delete_trade(trade_id: int, user_info: dict = Depends(require_admin)):
         print(f'[API] ❌ 删除交易单失败: {e}')
         raise HTTPException(status_code=500, detail=f"删除交易单失败: {str(e)}")
     finally:
-        con.close()
+        trades_db.end(con)
 
 @app.post("/api/trades/{trade_id}/close")
-async def close_trade(trade_id: int, user_info: dict = Depends(require_admin)):
+def close_trade(trade_id: int, user_info: dict = Depends(require_admin)):
     """手动结单：将活跃交易单标记为已结束 - 仅管理员"""
-    con = sqlite3.connect(store.db_path)
+    con = trades_db.begin()
     try:
         # 获取交易单信息
         cur = con.execute(
             """
             SELECT t.id, t.symbol, t.side, t.entry_price, t.take_profit, t.stop_loss,
-                   ts.status, ts.current_price
+                   ts.status, ts.current_price, t.lifecycle
             FROM trades t
             LEFT JOIN trade_status_detail ts ON t.id = ts.trade_id
             WHERE t.id = ?
@@ -700,11 +679,10 @@ async def close_trade(trade_id: int, user_info: dict = Depends(require_admin)):
             raise HTTPException(status_code=404, detail="交易单不存在")
         
         (trade_id, symbol, side, entry_price, take_profit, stop_loss, 
-         current_status, current_price) = row
+         current_status, current_price, lifecycle) = row
         
         # 检查是否已经结束
-        ended_statuses = ['已止盈', '已止损', '带单主动止盈', '带单主动止损']
-        if current_status and current_status in ended_statuses:
+        if lifecycle == queries.LIFECYCLE_CLOSED or current_status in queries.FINAL_STATUSES:
             raise HTTPException(status_code=400, detail="交易单已经结束，无法再次结单")
         
         # 获取当前价格
@@ -744,6 +722,10 @@ async def close_trade(trade_id: int, user_info: dict = Depends(require_admin)):
             """,
             (trade_id, final_status, round(pnl_points, 2), round(pnl_percent, 2), current_price, now)
         )
+        # 同一事务内将交易单标记为已结束
+        queries.update_lifecycle(con, trade_id, final_status, round(pnl_points, 2), now)
+        ledger.record(con, trade_id, ledger.EVENT_MANUAL_CLOSE, final_status, current_price, round(pnl_points, 2),
+                      source=f'api:{user_info["user_id"]}', now=now)
         
         # 可选：在trade_updates表中记录手动结单操作
         con.execute(
@@ -772,7 +754,7 @@ async def close_trade(trade_id: int, user_info: dict = Depends(require_admin)):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"手动结单失败: {str(e)}")
     finally:
-        con.close()
+        trades_db.end(con)
 
 # 用户管理API（仅管理员）
 class CreateUserRequest(BaseModel):
@@ -805,8 +787,7 @@ class UsersResponse(BaseModel):
 @app.get("/api/users", response_model=UsersResponse)
 async def get_users(user_info: dict = Depends(require_admin)):
     """获取所有用户列表 - 仅管理员"""
-    con = sqlite3.connect(USER_DB_PATH)
-    try:
+    with users_db.reader() as con:
         cur = con.execute(
             "SELECT id, username, role, note, created_at, updated_at FROM users ORDER BY id DESC"
         )
@@ -822,16 +803,14 @@ async def get_users(user_info: dict = Depends(require_admin)):
                 updated_at=updated_at
             ))
         return UsersResponse(success=True, data=users)
-    finally:
-        con.close()
 
 @app.post("/api/users", response_model=UserResponse)
-async def create_user(request: CreateUserRequest, user_info: dict = Depends(require_admin)):
+def create_user(request: CreateUserRequest, user_info: dict = Depends(require_admin)):
     """创建新用户 - 仅管理员"""
     if request.role not in ["admin", "user"]:
         raise HTTPException(status_code=400, detail="角色必须是 'admin' 或 'user'")
     
-    con = sqlite3.connect(USER_DB_PATH)
+    con = users_db.begin()
     try:
         # 检查用户名是否已存在
         cur = con.execute("SELECT id FROM users WHERE username=?", (request.username,))
@@ -862,15 +841,15 @@ async def create_user(request: CreateUserRequest, user_info: dict = Depends(requ
         con.rollback()
         raise HTTPException(status_code=500, detail=f"创建用户失败: {str(e)}")
     finally:
-        con.close()
+        users_db.end(con)
 
 @app.put("/api/users/{user_id}", response_model=UserResponse)
-async def update_user(user_id: int, request: UpdateUserRequest, user_info: dict = Depends(require_admin)):
+def update_user(user_id: int, request: UpdateUserRequest, user_info: dict = Depends(require_admin)):
     """更新用户信息 - 仅管理员"""
     if request.role and request.role not in ["admin", "user"]:
         raise HTTPException(status_code=400, detail="角色必须是 'admin' 或 'user'")
     
-    con = sqlite3.connect(USER_DB_PATH)
+    con = users_db.begin()
     try:
         # 检查用户是否存在
         cur = con.execute("SELECT id, username, role FROM users WHERE id=?", (user_id,))
@@ -933,16 +912,16 @@ async def update_user(user_id: int, request: UpdateUserRequest, user_info: dict
         con.rollback()
         raise HTTPException(status_code=500, detail=f"更新用户失败: {str(e)}")
     finally:
-        con.close()
+        users_db.end(con)
 
 @app.delete("/api/users/{user_id}")
-async def delete_user(user_id: int, user_info: dict = Depends(require_admin)):
+def delete_user(user_id: int, user_info: dict = Depends(require_admin)):
     """删除用户 - 仅管理员"""
     # 不能删除自己
     if user_id == user_info["user_id"]:
         raise HTTPException(status_code=400, detail="不能删除自己的账户")
     
-    con = sqlite3.connect(USER_DB_PATH)
+    con = users_db.begin()
     try:
         # 检查用户是否存在
         cur = con.execute("SELECT id FROM users WHERE id=?", (user_id,))
@@ -963,10 +942,10 @@ async def delete_user(user_id: int, user_info: dict = Depends(require_admin)):
         con.rollback()
         raise HTTPException(status_code=500, detail=f"删除用户失败: {str(e)}")
     finally:
-        con.close()
+        users_db.end(con)
 
 @app.post("/api/users/batch-delete")
-async def batch_delete_users(request: BatchDeleteRequest, user_info: dict = Depends(require_admin)):
+def batch_delete_users(request: BatchDeleteRequest, user_info: dict = Depends(require_admin)):
     """批量删除用户 - 仅管理员"""
     if not request.user_ids:
         raise HTTPException(status_code=400, detail="请选择要删除的用户")
@@ -975,7 +954,7 @@ async def batch_delete_users(request: BatchDeleteRequest, user_info: dict = Depe
     if user_info["user_id"] in request.user_ids:
         raise HTTPException(status_code=400, detail="不能删除自己的账户")
     
-    con = sqlite3.connect(USER_DB_PATH)
+    con = users_db.begin()
     try:
         # 检查所有用户是否存在
         placeholders = ",".join("?" * len(request.user_ids))
@@ -999,13 +978,12 @@ async def batch_delete_users(request: BatchDeleteRequest, user_info: dict = Depe
         con.rollback()
         raise HTTPException(status_code=500, detail=f"批量删除用户失败: {str(e)}")
     finally:
-        con.close()
+        users_db.end(con)
 
 @app.get("/api/users/{user_id}/password-info")
 async def get_user_password_info(user_id: int, user_info: dict = Depends(require_admin)):
     """获取用户密码信息（用于显示提示）- 仅管理员"""
-    con = sqlite3.connect(USER_DB_PATH)
-    try:
+    with users_db.reader() as con:
         cur = con.execute(
             "SELECT password_hash FROM users WHERE id=?",
             (user_id,)
@@ -1023,14 +1001,11 @@ async def get_user_password_info(user_id: int, user_info: dict = Depends(require
                 "password_hint": password_hash[:8] + "..." if password_hash else None
             }
         }
-    finally:
-        con.close()
 
 @app.get("/api/auth/me")
 async def get_current_user_info(user_info: dict = Depends(get_current_user_with_role)):
     """获取当前登录用户信息"""
-    con = sqlite3.connect(USER_DB_PATH)
-    try:
+    with users_db.reader() as con:
         cur = con.execute(
             "SELECT id, username, role, note, created_at FROM users WHERE id=?",
             (user_info["user_id"],)
@@ -1049,8 +1024,6 @@ async def get_current_user_info(user_info: dict = Depends(get_current_user_with_
                 "created_at": row[4] or 0
             }
         }
-    finally:
-        con.close()
 
 if __name__ == "__main__":
     import uvicorn
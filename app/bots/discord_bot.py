@@ -3,10 +3,20 @@ from discord.ext import commands
 from discord.ext import tasks
 from discord import app_commands
 from app.config.settings import get_settings
+from app.db import queries
+from app.services.trades import ledger
+from app.utils.logs import setup_monitor_logging, LazyJson, Truncated
+from app.utils import metrics
+from app.utils.profiler import get_profiler
+from app.utils.loop_watchdog import LoopWatchdog
+import io
 import time
+import atexit
+import asyncio
+import json
 import logging
-from logging.handlers import TimedRotatingFileHandler
-from pathlib import Path
+from typing import Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
 
 # 体验权限申请按钮视图
 class TrialView(discord.ui.View):
@@ -337,61 +347,144 @@ class OKXCog(commands.Cog):
         self.ws.unsubscribe(inst_id)
         await interaction.response.send_message(f"已取消订阅 {inst_id}")
 
+# 监控指标（机器人进程通过 METRICS_BOT_PORT 暴露）
+MESSAGES = metrics.counter('monitor_messages_total', '处理的频道消息数', ('source', 'result'))
+MESSAGE_SECONDS = metrics.histogram('monitor_message_seconds', '单条消息各阶段耗时（秒）', ('stage',))
+PERIODIC_SECONDS = metrics.histogram('monitor_periodic_seconds', '一轮交易状态计算耗时（秒）')
+FLUSH_SECONDS = metrics.histogram('monitor_flush_seconds', '交易单状态和频道游标写回数据库的耗时（秒）')
+ACTIVE_TRADES = metrics.gauge('monitor_active_trades', '内存中未结束的交易单数量')
+
 class MonitorCog(commands.Cog):
-    _logger_initialized = False
+    # 内存交易单与数据库对账的间隔（秒）
+    RECONCILE_INTERVAL_SEC = 60
+    # 处理失败的消息等待多久后在定时任务中重试一次（秒）
+    RETRY_DELAY_SEC = 30
     
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         from app.config.settings import get_settings
         from app.config.trader_config import TraderConfig
         from app.services.ai.deepseek import DeepseekClient
+        from app.services.ai.prefilter import SignalPrefilter
         self.settings = get_settings()
         self.trader_config = TraderConfig()
         self.ai = DeepseekClient()
+        self.prefilter = SignalPrefilter()
+        self.batcher = None
+        if self.settings.MONITOR_BATCH_ENABLED:
+            from app.services.ai.batcher import TradeParseBatcher
+            self.batcher = TradeParseBatcher(self.ai, self.settings.MONITOR_BATCH_WINDOW_MS, self.settings.MONITOR_BATCH_MAX)
         from app.services.membership.store import MembershipStore
         # 复用membership.db，也可分表
         self.store = MembershipStore()
         # 绑定OKX价格缓存（只用于获取实时币价）
         from app.services.okx.state_cache import OKXStateCache
         self.okx_cache = OKXStateCache()
+        self.okx_cache.subscribe(self.trader_config.get_inst_ids())
         self.okx_cache.start()
+        # 永续合约交易对注册表：规范化解析出的交易对并按配置规则过滤（后台加载，按 TTL 刷新）
+        from app.services.okx.instruments import InstrumentRegistry
+        self.instruments = InstrumentRegistry(self.okx_cache.client)
+        self.instruments.refresh_in_background()
+        # 带单员配置热加载时更新价格订阅和频道游标
+        self.trader_config.add_listener(self._on_traders_changed)
+        # 未结束交易单的内存表（cog_load 时加载），状态变化时批量写回
+        from app.services.trades.active_store import ActiveTradeStore
+        self.active_trades = ActiveTradeStore(self.store.db_path)
+        self._last_reconcile = time.monotonic()
+        self._last_snapshot = time.monotonic()
+        self._snapshot_future: Optional[asyncio.Future] = None
+        self._flush_future: Optional[asyncio.Future] = None
+        # 回复消息 -> 被回复消息的缓存（更新消息沿回复链关联交易单）
+        from app.services.trades.reply_links import ReplyLinkResolver
+        self.reply_links = ReplyLinkResolver(self.settings.REPLY_CACHE_SIZE, self.settings.REPLY_CHAIN_MAX_HOPS)
+        # 每个频道最后处理的消息 id（重启/重连后从这里补拉）
+        from app.services.trades.cursors import ChannelCursorStore
+        self.cursors = ChannelCursorStore(self.store.db_path)
+        # 每条消息的阶段耗时（环形缓冲区 + 可选写入 message_traces 表）
+        from app.services.trades.traces import TraceRecorder
+        self.traces = TraceRecorder(
+            self.store.db_path, self.settings.TRACE_BUFFER_SIZE, self.settings.TRACE_PERSIST,
+            self.settings.TRACE_RETENTION_DAYS, enabled=self.settings.TRACE_ENABLED,
+        )
+        self._in_flight = set()
+        # 处理失败、等待定时任务重试的消息：message_id -> (消息, 失败时间)
+        self._retry_messages: Dict[int, tuple] = {}
+        self._backfilling = {}
+        self._backfill_lock = asyncio.Lock()
+        # Deepseek 解析线程池：默认线程池在小机器上只有几个线程，会限制补拉时的并发
+        self._parse_executor = ThreadPoolExecutor(
+            max_workers=max(4, self.settings.BACKFILL_CONCURRENCY), thread_name_prefix='monitor-parse'
+        )
+        # 进程退出时（包括未经过 cog_unload 的退出）把未写回的状态刷到数据库
+        atexit.register(self._flush_active_trades)
         
-        self.logger = logging.getLogger('monitor')
-        if not MonitorCog._logger_initialized:
-            self._setup_logger()
-            MonitorCog._logger_initialized = True
+        # 日志经队列交给后台线程写文件/控制台，事件循环上不做 I/O
+        self.logger = setup_monitor_logging()
 
-    def _setup_logger(self):
-        log_dir = Path(self.settings.MONITOR_LOG_DIR)
-        log_dir.mkdir(parents=True, exist_ok=True)
-        log_file = log_dir / 'monitor.log'
-        handler_exists = any(
-            isinstance(handler, TimedRotatingFileHandler) and getattr(handler, 'baseFilename', None) == str(log_file)
-            for handler in self.logger.handlers
+    def _log_event(self, message: str, *args, level=logging.INFO, **fields):
+        """记录监控日志：args 为 %-格式参数（后台线程中才格式化），fields 写入 JSON 日志的结构化字段"""
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, message, *args, extra={'fields': fields} if fields else None)
+
+    def _log_prefilter_stats(self, every: int = 100):
+        """每处理 every 条消息输出一次预过滤统计"""
+        st = self.prefilter.stats()
+        total = st['passed'] + st['rejected']
+        if not total or total % every:
+            return
+        fmt = lambda v: '-' if v is None else f'{v:.2%}'
+        self._log_event(
+            '[Monitor] 📊 预过滤统计 - 放行: %s, 拒绝: %s (审计 %s), 拒绝率: %s, 漏判率: %s, 真拒绝率: %s',
+            st["passed"], st["rejected"], st["audited"],
+            fmt(st["reject_rate"]), fmt(st["false_negative_rate"]), fmt(st["true_reject_rate"])
         )
-        if not handler_exists:
-            handler = TimedRotatingFileHandler(
-                log_file,
-                when='midnight',
-                backupCount=2,
-                encoding='utf-8'
-            )
-            formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
-            handler.setFormatter(formatter)
-            self.logger.setLevel(logging.INFO)
-            self.logger.addHandler(handler)
-            self.logger.propagate = False
 
-    def _log_event(self, message: str, level=logging.INFO):
-        print(message)
-        if level == logging.ERROR:
-            self.logger.error(message)
-        elif level == logging.WARNING:
-            self.logger.warning(message)
-        else:
-            self.logger.info(message)
+    def _flush_active_trades(self):
+        try:
+            flushed = self.active_trades.flush()
+            if flushed:
+                print(f'[Monitor] 💾 已写回 {flushed} 个交易单状态')
+        except Exception as e:
+            print(f'[Monitor] ❌ 写回交易单状态失败: {e}')
+        try:
+            self.cursors.flush()
+        except Exception as e:
+            print(f'[Monitor] ❌ 写回频道游标失败: {e}')
+
+    def _slowest_traces_route(self, query: dict):
+        """指标服务路由：内存中最近最慢的消息（?limit=20&since_minutes=60）"""
+        limit = min(int(query.get('limit', 20)), 200)
+        since = time.time() - float(query['since_minutes']) * 60 if query.get('since_minutes') else None
+        return 'application/json; charset=utf-8', json.dumps(self.traces.slowest(limit, since), ensure_ascii=False)
+
+    def _on_traders_changed(self, added, removed):
+        """带单员配置热加载回调（在事件循环中由 _periodic_compute 触发）"""
+        for trader in removed:
+            self._log_event('[Monitor] ➖ 停止监控带单员 %s (频道ID: %s)', trader.get("name", trader["id"]), trader["channel_id"])
+        for trader in added:
+            self._log_event('[Monitor] ➕ 开始监控带单员 %s (频道ID: %s)', trader.get("name", trader["id"]), trader["channel_id"])
+        # 价格订阅：保留仍被其他带单员使用、或仍有未结束交易单的交易对
+        self.okx_cache.subscribe(self.trader_config.get_inst_ids())
+        wanted = set(self.trader_config.get_inst_ids()) | set(self.active_trades.symbols())
+        self.okx_cache.unsubscribe([i for t in removed for i in t.get('inst_ids') or [] if i not in wanted])
+        # 新频道：有游标时补拉错过的消息，没有游标时从当前位置开始记录
+        if added and self.bot.is_ready():
+            semaphore = asyncio.Semaphore(max(1, self.settings.BACKFILL_CONCURRENCY))
+            for trader in added:
+                asyncio.get_running_loop().create_task(self._backfill_channel(str(trader['channel_id']), semaphore))
 
     async def cog_load(self):
+        # 加载未结束的交易单到内存
+        loaded = self.active_trades.load()
+        self._log_event('[Monitor] 📥 已加载 %s 个未结束的交易单到内存', loaded)
+        self.okx_cache.subscribe(self.active_trades.symbols())
+        self.cursors.load()
+        ACTIVE_TRADES.set(loaded)
+        # 机器人进程单独运行，指标通过独立的 HTTP 服务暴露
+        if self.settings.METRICS_ENABLED:
+            metrics.add_route('/traces/slowest', self._slowest_traces_route)
+            metrics.start_http_server(self.settings.METRICS_BOT_PORT, self.settings.METRICS_BOT_HOST)
         # 在cog加载时启动周期任务，并设置间隔
         interval = max(5, int(self.settings.OKX_POLL_INTERVAL_SEC))
         self._periodic_compute.change_interval(seconds=interval)
@@ -400,20 +493,228 @@ class MonitorCog(commands.Cog):
         
         # 显示配置信息
         traders = self.trader_config.get_all_traders()
-        self._log_event(f'[Monitor] ✅ MonitorCog 已加载 - 价格轮询间隔: {interval}秒')
+        self._log_event('[Monitor] ✅ MonitorCog 已加载 - 价格轮询间隔: %s秒', interval)
+        if self.batcher:
+            self._log_event('[Monitor] 📦 微批处理已启用 - 窗口: %sms, 单批最多: %s 条', self.settings.MONITOR_BATCH_WINDOW_MS, self.settings.MONITOR_BATCH_MAX)
         if traders:
-            self._log_event(f'[Monitor] 📋 已配置 {len(traders)} 个带单员:')
+            self._log_event('[Monitor] 📋 已配置 %s 个带单员:', len(traders))
             for trader in traders:
-                self._log_event(f'  - {trader.get("name", trader["id"])} (ID: {trader["id"]}, 频道ID: {trader["channel_id"]})')
+                self._log_event('  - %s (ID: %s, 频道ID: %s)', trader.get("name", trader["id"]), trader["id"], trader["channel_id"])
+        else:
+            self._log_event('[Monitor] ⚠️ 未配置任何带单员，请在 .env 中设置 TRADER_CONFIG')
+
+    async def cog_unload(self):
+        if self._periodic_compute.is_running():
+            self._periodic_compute.cancel()
+        if self.batcher:
+            # 等待正在解析的批次完成后再关闭线程池
+            await self.batcher.close()
+        self._parse_executor.shutdown(wait=False)
+        self._flush_active_trades()
+
+    @app_commands.command(name="profiler", description="采样分析机器人进程（仅管理员）")
+    @app_commands.describe(action="start / stop / status", seconds="最长采样时间（秒，仅 start 使用）")
+    async def profiler(self, interaction: discord.Interaction, action: str, seconds: int = 60):
+        # 分析结果包含内部调用栈：未配置 ADMIN_ROLE_IDS 或不在服务器内时一律拒绝
+        admin_roles = set(self.settings.ADMIN_ROLE_IDS)
+        user_roles = {str(r.id) for r in getattr(interaction.user, 'roles', [])}
+        if not (admin_roles and user_roles & admin_roles):
+            await interaction.response.send_message("❌ 无权限，仅管理员可使用此命令", ephemeral=True)
+            return
+        profiler = get_profiler()
+        if action == 'start':
+            if profiler.start(max_seconds=max(1, seconds)):
+                st = profiler.status()
+                await interaction.response.send_message(
+                    f"▶️ 分析器已启动 - 间隔: {st['interval_ms']:g}ms, 最长: {st['max_seconds']:g}秒", ephemeral=True)
+            else:
+                await interaction.response.send_message("⚠️ 分析器已在运行", ephemeral=True)
+        elif action == 'stop':
+            # join 采样线程可能等待一个采样间隔，放到线程池中执行
+            text = await asyncio.get_running_loop().run_in_executor(None, profiler.stop)
+            st = profiler.status()
+            if not text:
+                await interaction.response.send_message("⚠️ 没有采样数据", ephemeral=True)
+                return
+            file = discord.File(io.BytesIO(text.encode('utf-8')), filename=f'profile-{int(time.time())}.collapsed.txt')
+            await interaction.response.send_message(
+                f"⏹️ 分析器已停止 - {st['samples']} 轮, {st['stacks']} 个调用栈, 用时 {st['duration_sec']}秒",
+                file=file, ephemeral=True)
+        elif action == 'status':
+            st = profiler.status()
+            await interaction.response.send_message(
+                f"{'运行中' if st['running'] else '未运行'} | 采样: {st['samples']} 轮 | 调用栈: {st['stacks']} | 用时: {st['duration_sec']}秒",
+                ephemeral=True)
         else:
-            self._log_event(f'[Monitor] ⚠️ 未配置任何带单员，请在 .env 中设置 TRADER_CONFIG')
+            await interaction.response.send_message("用法: /profiler [start|stop|status] [seconds]", ephemeral=True)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        await self.backfill('启动')
+
+    @commands.Cog.listener()
+    async def on_resumed(self):
+        await self.backfill('重连')
+
+    async def backfill(self, reason: str) -> int:
+        """补拉各带单员频道在离线期间错过的消息（各频道并发，解析并发受 BACKFILL_CONCURRENCY 限制）"""
+        if not self.settings.BACKFILL_ENABLED:
+            return 0
+        if self._backfill_lock.locked():
+            return 0
+        async with self._backfill_lock:
+            started = time.perf_counter()
+            traders = self.trader_config.get_all_traders()
+            semaphore = asyncio.Semaphore(max(1, self.settings.BACKFILL_CONCURRENCY))
+            results = await asyncio.gather(
+                *(self._backfill_channel(str(t['channel_id']), semaphore) for t in traders),
+                return_exceptions=True
+            )
+            total = 0
+            for trader, result in zip(traders, results):
+                if isinstance(result, Exception):
+                    self._log_event('[Monitor] ❌ 补拉频道 %s 失败: %s', trader["channel_id"], result, level=logging.ERROR)
+                else:
+                    total += result
+            self.cursors.flush()
+            self._log_event('[Monitor] 📥 %s补拉完成 - %s 个频道, %s 条消息, 耗时 %.1f秒', reason, len(traders), total, time.perf_counter() - started)
+            return total
+
+    async def _backfill_channel(self, channel_id: str, semaphore: asyncio.Semaphore) -> int:
+        channel = self.bot.get_channel(int(channel_id))
+        if channel is None:
+            channel = await self.bot.fetch_channel(int(channel_id))
+        after_id = self.cursors.get(channel_id)
+        if after_id is None:
+            # 首次运行没有游标：从当前位置开始记录，不回放历史消息
+            if channel.last_message_id:
+                self.cursors.advance(channel_id, channel.last_message_id)
+            return 0
+        
+        # 补拉期间该频道的实时消息先等待，保证按时间顺序入库
+        done = asyncio.Event()
+        self._backfilling[channel_id] = done
+        try:
+            # 按 BACKFILL_MAX_MESSAGES 分批补拉，直到追上最新消息（只取前 N 条会让之后的消息被实时消息的游标越过）
+            total = 0
+            page_size = max(1, self.settings.BACKFILL_MAX_MESSAGES)
+            while True:
+                page = [
+                    m async for m in channel.history(
+                        limit=page_size, after=discord.Object(id=after_id), oldest_first=True
+                    )
+                ]
+                if not page:
+                    break
+                after_id = page[-1].id
+                messages = [m for m in page if m.author != self.bot.user]
+                if messages:
+                    self._log_event('[Monitor] 📥 频道 %s 补拉到 %s 条错过的消息', channel_id, len(messages))
+                    await self._backfill_messages(channel_id, messages, semaphore)
+                    total += len(messages)
+                if len(page) < page_size:
+                    break
+            return total
+        finally:
+            self._backfilling.pop(channel_id, None)
+            done.set()
+
+    async def _backfill_messages(self, channel_id: str, messages: list, semaphore: asyncio.Semaphore):
+        async def parse(message, ctx):
+            with ctx['trace'].span('wait'):
+                await semaphore.acquire()
+            try:
+                with MESSAGE_SECONDS.time(stage='parse'):
+                    return await self._parse_message(message, ctx)
+            finally:
+                semaphore.release()
+        
+        # 解析并发执行，入库按时间顺序逐条进行（更新消息需要关联此前的入场单）
+        prepared = []
+        for m in messages:
+            trace = self.traces.start(m, source='backfill')
+            with trace.span('prepare'):
+                ctx = self._prepare_message(m)
+            if ctx is not None:
+                ctx['trace'] = trace
+            prepared.append((m, ctx))
+        tasks = [asyncio.create_task(parse(m, ctx)) if ctx else None for m, ctx in prepared]
+        for (message, ctx), task in zip(prepared, tasks):
+            if ctx is None:
+                MESSAGES.inc(source='backfill', result='skipped')
+                if message.id not in self._in_flight:
+                    self.cursors.advance(channel_id, message.id)
+                continue
+            result = 'error'
+            try:
+                data = await task
+                if data:
+                    with MESSAGE_SECONDS.time(stage='store'):
+                        result = 'stored' if self._store_message(message, ctx, data) else 'rejected'
+                elif not ctx.get('llm_failed'):
+                    result = 'no_signal'
+            except Exception as e:
+                self._log_event('[Monitor] ❌ 补拉消息 %s 处理失败: %s', message.id, e, level=logging.ERROR)
+            finally:
+                MESSAGES.inc(source='backfill', result=result)
+                self._finish_message(message, ctx, result)
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
         # 只忽略自己的消息，允许监听其他机器人的消息和 webhook 消息
         if message.author == self.bot.user:
             return
-        
+        await self._process_message(message)
+
+    async def _process_message(self, message: discord.Message, source: str = 'live'):
+        """完整处理一条消息：预检查 -> Deepseek 解析 -> 入库，结束后推进频道游标"""
+        channel_id = str(message.channel.id)
+        trace = self.traces.start(message, source=source)
+        # 频道正在补拉时，实时消息等补拉完成后再处理，保证同一频道按时间顺序入库
+        backfilling = self._backfilling.get(channel_id)
+        if backfilling is not None:
+            with trace.span('wait'):
+                await backfilling.wait()
+        with trace.span('prepare'):
+            ctx = self._prepare_message(message)
+        if ctx is None:
+            MESSAGES.inc(source=source, result='skipped')
+            # 重试的消息已不需要处理（已入库 / 解析已关闭）：不再挡住游标
+            if source == 'retry' and message.id not in self._in_flight:
+                self.cursors.advance(channel_id, message.id)
+            return
+        ctx['trace'] = trace
+        result = 'error'
+        try:
+            with MESSAGE_SECONDS.time(stage='parse'):
+                data = await self._parse_message(message, ctx)
+            if data:
+                with MESSAGE_SECONDS.time(stage='store'):
+                    result = 'stored' if self._store_message(message, ctx, data) else 'rejected'
+            elif not ctx.get('llm_failed'):
+                result = 'no_signal'
+        finally:
+            MESSAGES.inc(source=source, result=result)
+            self._finish_message(message, ctx, result)
+
+    def _finish_message(self, message: discord.Message, ctx: dict, result: str):
+        self._in_flight.discard(message.id)
+        self._retry_messages.pop(message.id, None)
+        # 只有明确的结果才推进游标；出错的消息挡住游标，由定时任务在 RETRY_DELAY_SEC 后重试一次
+        if result in ('stored', 'rejected', 'no_signal'):
+            self.cursors.advance(ctx['channel_id'], message.id)
+        elif self.cursors.fail(ctx['channel_id'], message.id):
+            self._retry_messages[message.id] = (message, time.monotonic())
+        else:
+            self._log_event('[Monitor] ❌ 消息 %s 重试后仍处理失败，放弃并推进频道游标', message.id,
+                            level=logging.ERROR, message_id=str(message.id), channel_id=ctx['channel_id'])
+        trace = ctx['trace']
+        trace.trader_id = ctx['trader_id']
+        trace.finish(result)
+        self.traces.record(trace)
+
+    def _prepare_message(self, message: discord.Message) -> Optional[dict]:
+        """预检查：频道是否有带单员、内容是否为空、是否已处理过；需要解析时返回消息上下文"""
         # 检查是否是 webhook 消息
         is_webhook = message.webhook_id is not None
         author_name = getattr(message.author, 'name', None) or getattr(message.author, 'display_name', None) or f"Webhook-{message.webhook_id}" if is_webhook else "Unknown"
@@ -428,74 +729,144 @@ class MonitorCog(commands.Cog):
                 all_traders = self.trader_config.get_all_traders()
                 if all_traders:
                     channel_ids = [t['channel_id'] for t in all_traders]
-                    self._log_event(f'[Monitor] 🔍 调试: 当前消息频道ID {channel_id} 不在监控列表中')
-                    self._log_event(f'[Monitor] 🔍 调试: 已配置的频道ID: {channel_ids}')
+                    self._log_event('[Monitor] 🔍 调试: 当前消息频道ID %s 不在监控列表中', channel_id)
+                    self._log_event('[Monitor] 🔍 调试: 已配置的频道ID: %s', channel_ids)
                 else:
-                    self._log_event(f'[Monitor] ⚠️ 调试: 未配置任何带单员，无法监控任何频道')
+                    self._log_event('[Monitor] ⚠️ 调试: 未配置任何带单员，无法监控任何频道')
                 self._debug_logged = True
             return  # 该频道没有配置带单员，跳过
         
         trader_id = trader['id']
         trader_name = trader.get('name', trader_id)
         
+        # 去重：补拉与实时事件可能重复送达同一条消息
+        if message.id in self._in_flight:
+            return None
+        with self.store.db.reader() as con:
+            if con.execute(queries.MESSAGE_PROCESSED, {'message_id': str(message.id)}).fetchone():
+                self._log_event('[Monitor] ⏭️ 消息 %s 已处理过，跳过', message.id)
+                return None
+        
         # 检测到频道消息日志（包括 webhook 消息）
         msg_type = "Webhook" if is_webhook else "用户"
-        self._log_event(f'[Monitor] 📨 检测到频道消息 ({msg_type}) - 带单员: {trader_name}({trader_id}), 频道ID: {channel_id}, 发送者: {author_name}')
+        self._log_event('[Monitor] 📨 检测到频道消息 (%s) - 带单员: %s(%s), 频道ID: %s, 发送者: %s',
+                        msg_type, trader_name, trader_id, channel_id, author_name,
+                        message_id=str(message.id), channel_id=channel_id, trader_id=trader_id)
         
         # 记录消息内容（即使为空也要记录）
-        message_content = message.content or "(消息内容为空)"
-        self._log_event(f'[Monitor] 📝 原始消息内容: {message_content}')
+        self._log_event('[Monitor] 📝 原始消息内容: %s', Truncated(message.content or "(消息内容为空)", 2000),
+                        message_id=str(message.id))
         
         if not message.content:
-            self._log_event(f'[Monitor] ⏭️ 跳过处理: 消息内容为空')
+            self._log_event('[Monitor] ⏭️ 跳过处理: 消息内容为空')
             return
         
         if not self.settings.MONITOR_PARSE_ENABLED:
-            self._log_event(f'[Monitor] ⏭️ 跳过处理: 消息解析功能已禁用 (MONITOR_PARSE_ENABLED=False)')
+            self._log_event('[Monitor] ⏭️ 跳过处理: 消息解析功能已禁用 (MONITOR_PARSE_ENABLED=False)')
             return
         
         if not self.ai.available():
-            self._log_event(f'[Monitor] ⏭️ 跳过处理: Deepseek AI 服务不可用', level=logging.WARNING)
+            self._log_event('[Monitor] ⏭️ 跳过处理: Deepseek AI 服务不可用', level=logging.WARNING)
             return
         
         # 检查是否是回复/引用消息，如果是，需要特别关注
         is_reply = message.reference is not None
+        reply_to_id = str(message.reference.message_id) if is_reply and message.reference.message_id else None
+        # 记录回复关系（包括不会被解析的消息），后续回复可沿回复链找到交易单
+        self.reply_links.remember(message.id, reply_to_id)
+        resolved = getattr(message.reference, 'resolved', None) if is_reply else None
+        if isinstance(resolved, discord.Message) and resolved.reference:
+            self.reply_links.remember(resolved.id, resolved.reference.message_id)
         full_content = message.content
         
         # 如果是回复消息，在内容前添加提示
         if is_reply:
             full_content = f"[回复消息] {message.content}"
-            self._log_event(f'[Monitor] 💬 检测到回复消息，重点关注止盈止损信息')
+            self._log_event('[Monitor] 💬 检测到回复消息，重点关注止盈止损信息')
+        
+        self._in_flight.add(message.id)
+        self.cursors.begin(channel_id, message.id)
+        return {
+            'trader_id': trader_id,
+            'trader_name': trader_name,
+            'channel_id': channel_id,
+            'is_reply': is_reply,
+            'reply_to_id': reply_to_id,
+            'full_content': full_content,
+        }
+
+    async def _parse_message(self, message: discord.Message, ctx: dict) -> Optional[dict]:
+        """预过滤 + Deepseek 解析，返回提取到的交易信息（非交易信号返回 None）"""
+        trader_id = ctx['trader_id']
+        is_reply = ctx['is_reply']
+        full_content = ctx['full_content']
+        
+        trace = ctx['trace']
+        
+        # 预过滤：明显的非信号消息不调用 Deepseek
+        with trace.span('prefilter'):
+            decision = self.prefilter.evaluate(message.content, is_reply=is_reply)
+        if not decision.call_llm:
+            self._log_event('[Monitor] ⏭️ 预过滤跳过: 非交易信号 (得分 %.3f < 阈值 %s)', decision.score, self.prefilter.threshold)
+            self._log_prefilter_stats()
+            return
+        if decision.audit:
+            self._log_event('[Monitor] 🔍 预过滤抽样审计: 得分 %.3f 低于阈值，仍调用 Deepseek 以统计漏判率', decision.score)
         
         # 使用Deepseek解析交易信息
-        self._log_event(f'[Monitor] 🤖 开始调用 Deepseek 解析消息...')
-        data = self.ai.extract_trade(full_content)
+        self._log_event('[Monitor] 🤖 开始调用 Deepseek 解析消息...', level=logging.DEBUG)
+        with trace.span('llm'):
+            if self.batcher:
+                data = await self.batcher.submit(str(message.id), full_content, trader_id)
+            else:
+                # 在专用线程池中调用，避免阻塞事件循环（补拉时多条消息并发解析）
+                data = await asyncio.get_running_loop().run_in_executor(
+                    self._parse_executor, self.ai.extract_trade, full_content, trader_id
+                )
+        
+        # 记录预过滤结果（None 表示 API 错误，没有可用标签）
+        if data is None:
+            # 解析失败不算处理完成：频道游标停在这条消息之前，下次补拉时重试
+            ctx['llm_failed'] = True
+        else:
+            self.prefilter.record_outcome(decision, bool(isinstance(data, dict) and data.get('type')))
+            if decision.audit and isinstance(data, dict) and data.get('type'):
+                self._log_event('[Monitor] ⚠️ 预过滤漏判: 得分 %.3f 的消息被识别为交易信号', decision.score, level=logging.WARNING)
+            self._log_prefilter_stats()
         
         # 记录 Deepseek 解析结果（无论成功失败）
         if data and isinstance(data, dict) and data.get('type'):
-            # 解析成功，记录完整 JSON
-            self._log_event(f'[Monitor] 🤖 Deepseek 解析结果: {json_module.dumps(data, ensure_ascii=False, indent=2)}')
+            # 解析成功，记录完整 JSON（后台线程中才序列化）
+            self._log_event('[Monitor] 🤖 Deepseek 解析结果: %s', LazyJson(data), message_id=str(message.id))
         else:
             # 解析失败或返回空，记录原因
             if data is None:
-                self._log_event(f'[Monitor] ⚠️ Deepseek 解析失败: 返回 None（可能是 API 错误）', level=logging.WARNING)
+                self._log_event('[Monitor] ⚠️ Deepseek 解析失败: 返回 None（可能是 API 错误）', level=logging.WARNING)
             elif isinstance(data, dict) and not data:
-                self._log_event(f'[Monitor] ⚠️ Deepseek 解析结果: 空对象 {{}}（未识别为交易信号）')
+                self._log_event('[Monitor] ⚠️ Deepseek 解析结果: 空对象 {}（未识别为交易信号）')
             else:
-                self._log_event(f'[Monitor] ⚠️ Deepseek 解析结果异常: {data}', level=logging.WARNING)
+                self._log_event('[Monitor] ⚠️ Deepseek 解析结果异常: %s', data, level=logging.WARNING)
             
             # 检查消息是否包含出局/止盈/止损关键词，如果包含但未提取到，记录日志
-            exit_keywords = ['出局', '止盈', '止损', '获利', '亏损', '剩余', '继续持有', '设置止损', '成本价', '补仓', '补货', '加仓']
-            if any(keyword in message.content for keyword in exit_keywords):
-                self._log_event(f'[Monitor] ⚠️ 消息包含出局/止盈/止损/补仓关键词，但Deepseek未提取到信息', level=logging.WARNING)
+            from app.services.ai.prefilter import UPDATE_KEYWORDS
+            if any(keyword in message.content for keyword in UPDATE_KEYWORDS):
+                self._log_event('[Monitor] ⚠️ 消息包含出局/止盈/止损/补仓关键词，但Deepseek未提取到信息', level=logging.WARNING)
             if is_reply:
-                self._log_event(f'[Monitor] ⚠️ 回复消息中未提取到交易信息，已跳过', level=logging.WARNING)
-            return
+                self._log_event('[Monitor] ⚠️ 回复消息中未提取到交易信息，已跳过', level=logging.WARNING)
+            return None
+        return data
+
+    def _store_message(self, message: discord.Message, ctx: dict, data: dict) -> bool:
+        """把解析结果存入数据库：按 trades / updates 分流，返回是否已保存"""
+        trader_id = ctx['trader_id']
+        trader_name = ctx['trader_name']
+        channel_id = ctx['channel_id']
+        reply_to_id = ctx['reply_to_id']
+        trace = ctx['trace']
+        trace.checkpoint()
         
-        # 存入数据库：按 trades / updates 分流
-        import sqlite3, time
-        con = sqlite3.connect(self.store.db_path)
-        try:
+        # 写事务：进程内串行执行，WAL 模式下不阻塞 API 读取
+        with self.store.db.transaction() as con:
             now = int(time.time())
             if data.get('type') == 'entry':
                 # 提取到入场信号日志
@@ -504,36 +875,11 @@ class MonitorCog(commands.Cog):
                 entry_price = data.get('entry_price', 'N/A')
                 take_profit = data.get('take_profit', 'N/A')
                 stop_loss = data.get('stop_loss', 'N/A')
-                self._log_event(f'[Monitor] ✅ 提取到入场信号 - 带单员: {trader_name}')
-                self._log_event(f'  📊 交易对: {symbol} | 方向: {side.upper()}')
-                self._log_event(f'  📍 进场点位: {entry_price}')
-                self._log_event(f'  🎯 止盈点位: {take_profit}')
-                self._log_event(f'  🛑 止损点位: {stop_loss}')
-                # 创建表（如果不存在），添加trader_id字段
-                con.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS trades (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        trader_id TEXT,
-                        source_message_id TEXT,
-                        channel_id TEXT,
-                        user_id TEXT,
-                        symbol TEXT,
-                        side TEXT,
-                        entry_price REAL,
-                        take_profit REAL,
-                        stop_loss REAL,
-                        confidence REAL,
-                        created_at INTEGER
-                    )
-                    """
-                )
-                # 如果表已存在但没有trader_id字段，添加它
-                try:
-                    con.execute("ALTER TABLE trades ADD COLUMN trader_id TEXT")
-                except sqlite3.OperationalError:
-                    pass  # 字段已存在
-                
+                self._log_event('[Monitor] ✅ 提取到入场信号 - 带单员: %s', trader_name)
+                self._log_event('  📊 交易对: %s | 方向: %s', symbol, side.upper())
+                self._log_event('  📍 进场点位: %s', entry_price)
+                self._log_event('  🎯 止盈点位: %s', take_profit)
+                self._log_event('  🛑 止损点位: %s', stop_loss)
                 # 处理 webhook 消息的 user_id（webhook 消息可能没有 author.id）
                 user_id = str(getattr(message.author, 'id', message.webhook_id)) if message.webhook_id else str(message.author.id)
                 
@@ -545,17 +891,31 @@ class MonitorCog(commands.Cog):
                 stop_loss = data.get('stop_loss')
                 
                 if not symbol or not side or entry_price is None:
-                    self._log_event(f'[Monitor] ❌ 数据验证失败 - 缺少必要字段: symbol={symbol}, side={side}, entry_price={entry_price}', level=logging.ERROR)
-                    self._log_event(f'[Monitor] ❌ 完整解析数据: {json_module.dumps(data, ensure_ascii=False)}', level=logging.ERROR)
+                    self._log_event('[Monitor] ❌ 数据验证失败 - 缺少必要字段: symbol=%s, side=%s, entry_price=%s', symbol, side, entry_price, level=logging.ERROR)
+                    self._log_event('[Monitor] ❌ 完整解析数据: %s', LazyJson(data), level=logging.ERROR)
+                    con.rollback()
+                    return False
+                
+                # 规范化为 OKX instId（别名索引查找），并按 INSTRUMENT_ALLOW / DENY / MIN_VOL_24H 规则过滤
+                inst_id = self.instruments.normalize(symbol)
+                if not inst_id:
+                    self._log_event('[Monitor] ⏭️ 跳过未知交易对: %s', symbol)
+                    con.rollback()
+                    return False
+                if not self.instruments.is_allowed(inst_id):
+                    self._log_event('[Monitor] ⏭️ 跳过不在记录规则内的交易对: %s', inst_id)
                     con.rollback()
-                    return
+                    return False
+                symbol = inst_id
+                # 首次出现的交易对加入价格轮询
+                self.okx_cache.subscribe([symbol])
                 
-                # 只允许BTC和ETH的交易对
-                allowed_symbols = ['BTC-USDT-SWAP', 'ETH-USDT-SWAP']
-                if symbol not in allowed_symbols:
-                    self._log_event(f'[Monitor] ⏭️ 跳过非BTC/ETH交易对: {symbol} (只记录BTC-USDT-SWAP和ETH-USDT-SWAP)')
+                # 同一条消息重复到达（例如网关重连后重放）时不重复建单
+                if con.execute("SELECT id FROM trades WHERE source_message_id=?", (str(message.id),)).fetchone():
+                    self._log_event('[Monitor] ⏭️ 消息 %s 已创建过交易单，跳过', message.id)
                     con.rollback()
-                    return
+                    return False
+                trace.lap('validate')
                 
                 try:
                     con.execute(
@@ -566,14 +926,20 @@ class MonitorCog(commands.Cog):
                         (trader_id, str(message.id), channel_id, user_id, symbol, side, entry_price, take_profit, stop_loss, data.get('confidence'), now)
                     )
                     trade_id = con.execute("SELECT last_insert_rowid()").fetchone()[0]
-                    self._log_event(f'[Monitor] 💾 已保存交易记录到数据库 - Trade ID: {trade_id}, 带单员: {trader_name}, 交易对: {symbol}, 方向: {side}, 入场价: {entry_price}, 止盈: {take_profit}, 止损: {stop_loss}')
+                    # 入场事件（同一事务内写入交易单投影）
+                    ledger.record_entry(con, trade_id, {
+                        'trader_id': trader_id, 'channel_id': channel_id, 'symbol': symbol, 'side': side,
+                        'entry_price': entry_price, 'take_profit': take_profit, 'stop_loss': stop_loss,
+                        'confidence': data.get('confidence'),
+                    }, str(message.id), now=now)
+                    self._log_event('[Monitor] 💾 已保存交易记录到数据库 - Trade ID: %s, 带单员: %s, 交易对: %s, 方向: %s, 入场价: %s, 止盈: %s, 止损: %s', trade_id, trader_name, symbol, side, entry_price, take_profit, stop_loss)
                 except Exception as e:
-                    self._log_event(f'[Monitor] ❌ 保存交易记录失败: {e}', level=logging.ERROR)
-                    self._log_event(f'[Monitor] ❌ 尝试保存的数据: trader_id={trader_id}, symbol={symbol}, side={side}, entry_price={entry_price}', level=logging.ERROR)
-                    import traceback
-                    self._log_event(f'[Monitor] ❌ 错误堆栈: {traceback.format_exc()}', level=logging.ERROR)
+                    self._log_event('[Monitor] ❌ 保存交易记录失败: %s', e, level=logging.ERROR)
+                    self._log_event('[Monitor] ❌ 尝试保存的数据: trader_id=%s, symbol=%s, side=%s, entry_price=%s', trader_id, symbol, side, entry_price, level=logging.ERROR)
+                    self.logger.exception('[Monitor] ❌ 错误堆栈')
                     con.rollback()
-                    return
+                    return False
+                trace.lap('db_write')
                 
                 # 检查币价是否到达入场价（使用已验证的变量）
                 
@@ -598,78 +964,59 @@ class MonitorCog(commands.Cog):
                                 symbol, side, entry_price, take_profit, stop_loss, current_price
                             )
                             self._upsert_trade_status(con, trade_id, status, pnl_points, pnl_percent, current_price)
-                            self._log_event(f'[Monitor] ✅ 币价已到达入场价 - 当前价: {current_price}, 入场价: {entry_price}, 状态: {status}')
+                            self._log_event('[Monitor] ✅ 币价已到达入场价 - 当前价: %s, 入场价: %s, 状态: %s', current_price, entry_price, status)
                         else:
                             # 币价未到达，标记为"待入场"
                             self._upsert_trade_status(con, trade_id, "待入场", None, None, current_price)
-                            self._log_event(f'[Monitor] ⏳ 币价未到达入场价 - 当前价: {current_price}, 入场价: {entry_price}, 等待中...')
+                            self._log_event('[Monitor] ⏳ 币价未到达入场价 - 当前价: %s, 入场价: %s, 等待中...', current_price, entry_price)
                     else:
                         # 无法获取价格，标记为"待入场"
                         self._upsert_trade_status(con, trade_id, "待入场", None, None, None)
-                        self._log_event(f'[Monitor] ⏳ 无法获取当前价格，标记为待入场')
+                        self._log_event('[Monitor] ⏳ 无法获取当前价格，标记为待入场')
                 else:
                     # 缺少必要信息，标记为"待入场"
                     self._upsert_trade_status(con, trade_id, "待入场", None, None, None)
-                    self._log_event(f'[Monitor] ⏳ 缺少交易对或入场价信息，标记为待入场')
+                    self._log_event('[Monitor] ⏳ 缺少交易对或入场价信息，标记为待入场')
+                trace.lap('status')
                 
                 con.commit()
+                # 新交易单加入内存中的未结束交易单表
+                self.active_trades.refresh(con, trade_id)
+                trace.lap('db_write')
+                return True
             elif data.get('type') == 'update':
                 # 提取到更新信号日志
                 status = data.get('status', 'N/A')
                 pnl_points = data.get('pnl_points', 'N/A')
-                self._log_event(f'[Monitor] ✅ 提取到更新信号 - 带单员: {trader_name}')
-                self._log_event(f'  📈 状态: {status}')
+                self._log_event('[Monitor] ✅ 提取到更新信号 - 带单员: %s', trader_name)
+                self._log_event('  📈 状态: %s', status)
                 if pnl_points and pnl_points != 'N/A':
-                    self._log_event(f'  💰 盈亏点数: {pnl_points}')
+                    self._log_event('  💰 盈亏点数: %s', pnl_points)
                 
                 # 如果是补仓/补货/加仓信号，特别标注
                 if status and ('补仓' in status or '补货' in status or '加仓' in status):
-                    self._log_event(f'[Monitor] 📥 检测到补仓/补货/加仓信号 - 状态: {status}', level=logging.INFO)
-                    self._log_event(f'[Monitor] 📥 原始消息内容: {message.content}')
+                    self._log_event('[Monitor] 📥 检测到补仓/补货/加仓信号 - 状态: %s', status, level=logging.INFO)
+                    self._log_event('[Monitor] 📥 原始消息内容: %s', message.content)
                 
-                # 确保表存在
-                con.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS trade_updates (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        trader_id TEXT,
-                        trade_ref_id INTEGER,
-                        source_message_id TEXT,
-                        channel_id TEXT,
-                        user_id TEXT,
-                        text TEXT,
-                        pnl_points REAL,
-                        status TEXT,
-                        created_at INTEGER
-                    )
-                    """
-                )
-                try:
-                    con.execute("ALTER TABLE trade_updates ADD COLUMN trader_id TEXT")
-                except sqlite3.OperationalError:
-                    pass
+                # 回复消息：按被回复的消息直接关联交易单（索引查找），未命中时沿回复链向上查找
+                latest_trade = None
+                if reply_to_id:
+                    latest_trade, hops = self.reply_links.resolve(con, reply_to_id, channel_id)
+                    if latest_trade:
+                        via = '直接回复' if hops == 0 else f'回复链 {hops + 1} 层'
+                        self._log_event('[Monitor] 🔗 通过%s关联交易单 - Trade ID: %s', via, latest_trade[0])
                 
-                # 尝试找到最近的活跃交易单（未结束的）
-                cur = con.execute(
-                    """
-                    SELECT id, entry_price, take_profit, stop_loss, side, symbol FROM trades
-                    WHERE trader_id=? AND channel_id=?
-                    AND id NOT IN (
-                        SELECT DISTINCT trade_ref_id FROM trade_updates 
-                        WHERE status IN ('已止盈', '已止损', '带单主动止盈', '带单主动止损') 
-                        AND trade_ref_id IS NOT NULL
-                    )
-                    ORDER BY created_at DESC LIMIT 1
-                    """,
-                    (trader_id, channel_id)
-                )
-                latest_trade = cur.fetchone()
+                if not latest_trade:
+                    # 非回复消息（或回复的消息不属于任何交易单）：关联最近的活跃交易单（未结束的）
+                    cur = con.execute(queries.LATEST_OPEN_TRADE, (trader_id, channel_id))
+                    latest_trade = cur.fetchone()
+                    if latest_trade:
+                        self._log_event('[Monitor] 🔗 找到关联交易单 - Trade ID: %s', latest_trade[0])
                 trade_ref_id = latest_trade[0] if latest_trade else None
+                trace.lap('link')
                 
-                if trade_ref_id:
-                    self._log_event(f'[Monitor] 🔗 找到关联交易单 - Trade ID: {trade_ref_id}')
-                else:
-                    self._log_event(f'[Monitor] ⚠️ 未找到关联交易单，仅保存更新记录', level=logging.WARNING)
+                if not trade_ref_id:
+                    self._log_event('[Monitor] ⚠️ 未找到关联交易单，仅保存更新记录', level=logging.WARNING)
                 
                 # 保存更新记录
                 # 处理 webhook 消息的 user_id（webhook 消息可能没有 author.id）
@@ -677,13 +1024,15 @@ class MonitorCog(commands.Cog):
                 
                 con.execute(
                     """
-                    INSERT INTO trade_updates(trader_id, trade_ref_id, source_message_id, channel_id, user_id, text, pnl_points, status, created_at)
-                    VALUES(?,?,?,?,?,?,?,?,?)
+                    INSERT INTO trade_updates(trader_id, trade_ref_id, source_message_id, reply_to_message_id, channel_id, user_id, text, pnl_points, status, is_partial, created_at)
+                    VALUES(?,?,?,?,?,?,?,?,?,?,?)
                     """,
-                    (trader_id, trade_ref_id, str(message.id), channel_id, user_id, message.content, data.get('pnl_points'), data.get('status'), now)
+                    (trader_id, trade_ref_id, str(message.id), reply_to_id, channel_id, user_id, message.content, data.get('pnl_points'), data.get('status'),
+                     int(queries.is_partial_status(data.get('status'))), now)
                 )
                 update_id = con.execute("SELECT last_insert_rowid()").fetchone()[0]
-                self._log_event(f'[Monitor] 💾 已保存更新记录到数据库 - Update ID: {update_id}, 状态: {data.get("status")}, 关联交易单: {trade_ref_id or "无"}')
+                trace.lap('db_write')
+                self._log_event('[Monitor] 💾 已保存更新记录到数据库 - Update ID: %s, 状态: %s, 关联交易单: %s', update_id, data.get("status"), trade_ref_id or "无")
                 
                 # 如果找到了对应的交易单，更新其状态
                 if trade_ref_id and latest_trade:
@@ -697,8 +1046,11 @@ class MonitorCog(commands.Cog):
                     is_final_status = update_status in final_statuses
                     
                     # 如果是部分出局，交易单仍然活跃，但需要更新状态
-                    if '部分' in update_status or '部分出局' in update_status:
+                    if queries.is_partial_status(update_status):
                         # 部分出局：交易单仍然活跃，但状态显示为部分出局
+                        queries.update_lifecycle(con, trade_id, update_status, None, now)
+                        ledger.record(con, trade_id, ledger.EVENT_PARTIAL_EXIT, update_status, None,
+                                      data.get('pnl_points'), source='message', now=now)
                         # 获取当前价格计算剩余部分的盈亏
                         current_price = self.okx_cache.get_price(symbol)
                         if current_price:
@@ -712,7 +1064,7 @@ class MonitorCog(commands.Cog):
                             
                             # 更新状态为部分出局，但交易单仍然活跃
                             self._upsert_trade_status(con, trade_id, update_status, remaining_pnl, remaining_pnl_percent, current_price)
-                            self._log_event(f'[Monitor] 💰 部分出局 - 剩余部分盈亏: {remaining_pnl:.2f}点 ({remaining_pnl_percent:.2f}%)')
+                            self._log_event('[Monitor] 💰 部分出局 - 剩余部分盈亏: %.2f点 (%.2f%%)', remaining_pnl, remaining_pnl_percent)
                     elif is_final_status:
                         # 最终状态：已止盈/已止损，交易单结束
                         # 使用更新消息中的盈亏点数，如果没有则计算
@@ -729,8 +1081,8 @@ class MonitorCog(commands.Cog):
                                 final_pnl = 0
                         
                         final_pnl_percent = (final_pnl / entry_price) * 100 if entry_price > 0 else 0
-                        self._upsert_trade_status(con, trade_id, update_status, final_pnl, final_pnl_percent, None)
-                        self._log_event(f'[Monitor] ✅ 交易单已结束 - 状态: {update_status}, 盈亏: {final_pnl:.2f}点 ({final_pnl_percent:.2f}%)')
+                        self._upsert_trade_status(con, trade_id, update_status, final_pnl, final_pnl_percent, None, source='message')
+                        self._log_event('[Monitor] ✅ 交易单已结束 - 状态: %s, 盈亏: %.2f点 (%.2f%%)', update_status, final_pnl, final_pnl_percent)
                     else:
                         # 其他更新状态（如浮盈、浮亏等），继续计算实时状态
                         current_price = self.okx_cache.get_price(symbol)
@@ -739,187 +1091,154 @@ class MonitorCog(commands.Cog):
                                 symbol, side, entry_price, take_profit, stop_loss, current_price
                             )
                             self._upsert_trade_status(con, trade_id, status, pnl_points, pnl_percent, current_price)
+                    trace.lap('status')
                 
                 con.commit()
-        finally:
-            con.close()
+                if trade_ref_id:
+                    # 同步内存中的未结束交易单
+                    self.active_trades.refresh(con, trade_ref_id)
+                trace.lap('db_write')
+                return True
+        return False
 
     @tasks.loop(seconds=5.0)
     async def _periodic_compute(self):
-        """定期计算交易状态：结合实时币价和Deepseek解析的数据"""
-        import sqlite3
-        import time
+        """定期计算交易状态：结合实时币价和Deepseek解析的数据
+
+        交易单状态保存在内存中（按交易对分组），只有状态或盈亏变化的交易单才在本轮结束时批量写回数据库
+        """
+        with PERIODIC_SECONDS.time():
+            self._compute_round()
+
+    def _snapshot_projection(self):
+        """后台线程：生成交易单投影快照（分批写入，每批只短暂占用写锁）"""
         try:
-            con = sqlite3.connect(self.store.db_path)
-            try:
-                # 确保trades表存在
-                con.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS trades (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        trader_id TEXT,
-                        source_message_id TEXT,
-                        channel_id TEXT,
-                        user_id TEXT,
-                        symbol TEXT,
-                        side TEXT,
-                        entry_price REAL,
-                        take_profit REAL,
-                        stop_loss REAL,
-                        confidence REAL,
-                        created_at INTEGER
-                    )
-                    """
-                )
-                con.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS trade_updates (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        trader_id TEXT,
-                        trade_ref_id INTEGER,
-                        source_message_id TEXT,
-                        channel_id TEXT,
-                        user_id TEXT,
-                        text TEXT,
-                        pnl_points REAL,
-                        status TEXT,
-                        created_at INTEGER
-                    )
-                    """
-                )
-                con.commit()
-                
-                # 获取所有活跃的交易单（未结束的，且不是"待入场"状态）
-                # 排除已结束的交易单（已止盈、已止损、带单主动止盈、带单主动止损）
-                # 排除"待入场"状态的交易（它们由上面的 pending_trades 处理）
-                cur = con.execute(
-                            """
-                            SELECT t.id, t.trader_id, t.channel_id, t.symbol, t.side, t.entry_price, t.take_profit, t.stop_loss
-                            FROM trades t
-                            WHERE t.id NOT IN (
-                                SELECT DISTINCT trade_ref_id FROM trade_updates 
-                                WHERE status IN ('已止盈', '已止损', '带单主动止盈', '带单主动止损') 
-                                AND trade_ref_id IS NOT NULL
-                            )
-                            AND t.id NOT IN (
-                                SELECT trade_id FROM trade_status_detail
-                                WHERE status IN ('已止盈', '已止损', '带单主动止盈', '带单主动止损', '待入场')
-                            )
-                            ORDER BY t.created_at DESC
-                            """
-                )
-                active_trades = cur.fetchall()
-                
-                # 检查"待入场"的交易是否到达入场价
-                pending_trades = con.execute(
-                    """
-                    SELECT t.id, t.symbol, t.side, t.entry_price, t.take_profit, t.stop_loss
-                    FROM trades t
-                    INNER JOIN trade_status_detail ts ON t.id = ts.trade_id
-                    WHERE ts.status = '待入场'
-                    ORDER BY t.created_at DESC
-                    """
-                ).fetchall()
-                
-                for pending_row in pending_trades:
-                    trade_id, symbol, side, entry_price, take_profit, stop_loss = pending_row
-                    if not symbol or not entry_price:
-                        continue
-                    
-                    current_price = self.okx_cache.get_price(symbol)
-                    if not current_price:
-                        continue
-                    
-                    # 检查是否到达入场价（限价单逻辑：严格匹配）
-                    price_reached = False
-                    
-                    if side == 'long':
-                        # 做多：价格必须下跌到入场价或以下，当前价 <= 入场价（限价买单）
-                        price_reached = current_price <= entry_price
-                    else:  # short
-                        # 做空：价格必须上涨到入场价或以上，当前价 >= 入场价（限价卖单）
-                        price_reached = current_price >= entry_price
-                    
-                    if price_reached:
-                        # 币价已到达，开始正常计算状态
-                        status, pnl_points, pnl_percent = self._compute_trade_status(
-                            symbol, side, entry_price, take_profit, stop_loss, current_price
-                        )
-                        self._upsert_trade_status(con, trade_id, status, pnl_points, pnl_percent, current_price)
-                        self._log_event(f'[Monitor] ✅ 待入场交易 #{trade_id} 币价已到达 - 当前价: {current_price}, 入场价: {entry_price}, 状态: {status}')
-                    else:
-                        # 更新当前价格，但保持"待入场"状态
-                        self._upsert_trade_status(con, trade_id, "待入场", None, None, current_price)
-                
-                for trade_row in active_trades:
-                    trade_id, trader_id, channel_id, symbol, side, entry_price, take_profit, stop_loss = trade_row
-                    
-                    # 检查是否有部分出局的更新记录
-                    partial_exit = con.execute(
-                        """
-                        SELECT status, pnl_points FROM trade_updates
-                        WHERE trade_ref_id=? 
-                        AND (status LIKE '%部分%' OR status LIKE '%部分出局%')
-                        ORDER BY created_at DESC LIMIT 1
-                        """,
-                        (trade_id,)
-                    ).fetchone()
-                    
-                    # 如果已经有部分出局记录，检查状态是否应该更新
-                    if partial_exit:
-                        # 部分出局后，继续计算剩余部分的实时状态
-                        current_price = self.okx_cache.get_price(symbol)
-                        if current_price:
-                            # 计算剩余部分的盈亏
-                            if side == 'long':
-                                remaining_pnl = current_price - entry_price
-                            else:  # short
-                                remaining_pnl = entry_price - current_price
-                            
-                            remaining_pnl_percent = (remaining_pnl / entry_price) * 100 if entry_price > 0 else 0
-                            
-                            # 检查是否触发止盈/止损
-                            final_status = None
-                            if side == 'long':
-                                if take_profit and current_price >= take_profit:
-                                    final_status = "已止盈"
-                                elif stop_loss and current_price <= stop_loss:
-                                    final_status = "已止损"
-                            else:  # short
-                                if take_profit and current_price <= take_profit:
-                                    final_status = "已止盈"
-                                elif stop_loss and current_price >= stop_loss:
-                                    final_status = "已止损"
-                            
-                            if final_status:
-                                # 触发止盈/止损，更新为最终状态
-                                self._upsert_trade_status(con, trade_id, final_status, remaining_pnl, remaining_pnl_percent, current_price)
-                            else:
-                                # 继续显示部分出局状态，但更新剩余部分的盈亏
-                                status_text = partial_exit[0]  # 使用部分出局的状态文本
-                                self._upsert_trade_status(con, trade_id, status_text, remaining_pnl, remaining_pnl_percent, current_price)
-                        continue
-                    
-                    # 获取实时价格
-                    current_price = self.okx_cache.get_price(symbol)
-                    if not current_price:
-                        continue
-                    
-                    # 计算状态（基于Deepseek解析的数据和实时币价）
-                    status, pnl_points, pnl_percent = self._compute_trade_status(
-                        symbol, side, entry_price, take_profit, stop_loss, 
-                        current_price
-                    )
-                    
-                    # 更新交易单状态
-                    self._upsert_trade_status(con, trade_id, status, pnl_points, pnl_percent, current_price)
-                
-                con.commit()
-            finally:
-                con.close()
+            snapshot_id, rows = ledger.snapshot_in_batches(self.store.db, keep=self.settings.PROJECTION_SNAPSHOT_KEEP)
+            self._log_event('[Monitor] 📸 已生成交易单投影快照 #%s: %s 笔', snapshot_id, rows)
+        except Exception as e:
+            self._log_event('[Monitor] ❌ 生成交易单投影快照失败: %s', e, level=logging.ERROR)
+
+    def _flush_round(self):
+        """后台线程：把本轮变化的交易单状态、频道游标和消息耗时写回数据库"""
+        with FLUSH_SECONDS.time():
+            for name, flush in (('交易单状态', self.active_trades.flush), ('频道游标', self.cursors.flush),
+                                ('消息耗时', self.traces.flush)):
+                try:
+                    flush()
+                except Exception as e:
+                    self._log_event('[Monitor] ❌ 写回%s失败: %s', name, e, level=logging.ERROR)
+
+    def _retry_failed_messages(self):
+        """重新处理失败满 RETRY_DELAY_SEC 的消息，避免一次临时失败把频道游标挡到下次补拉"""
+        deadline = time.monotonic() - self.RETRY_DELAY_SEC
+        due = [mid for mid, (_, failed_at) in self._retry_messages.items() if failed_at <= deadline]
+        for message_id in due:
+            message, _ = self._retry_messages.pop(message_id)
+            self._log_event('[Monitor] 🔁 重试处理失败的消息 %s', message_id, message_id=str(message_id))
+            asyncio.get_running_loop().create_task(self._process_message(message, source='retry'))
+
+    def _compute_round(self):
+        try:
+            # 带单员配置文件修改后热加载（变更通过 _on_traders_changed 通知）
+            self.trader_config.check_reload()
+            self.instruments.refresh_in_background()
+            
+            # 定期与数据库对账，移除在 API 中手动结单或删除的交易单
+            now = time.monotonic()
+            if now - self._last_reconcile >= self.RECONCILE_INTERVAL_SEC:
+                self._last_reconcile = now
+                removed = self.active_trades.reconcile()
+                if removed:
+                    self._log_event('[Monitor] 🔄 对账移除 %s 个已在其他进程中结束/删除的交易单', removed)
+                # 停止轮询已没有未结束交易单、也不在带单员配置中的交易对；仍需要的交易对补订阅
+                wanted = set(self.active_trades.symbols()) | set(self.trader_config.get_inst_ids())
+                self.okx_cache.subscribe(sorted(wanted))
+                self.okx_cache.unsubscribe([i for i in self.okx_cache.inst_ids if i not in wanted])
+            
+            # 定期生成交易单投影快照（投影重建时从最近的快照开始重放事件）；复制整张投影表放到后台线程分批完成
+            if (now - self._last_snapshot >= self.settings.PROJECTION_SNAPSHOT_INTERVAL_SEC
+                    and (self._snapshot_future is None or self._snapshot_future.done())):
+                self._last_snapshot = now
+                self._snapshot_future = asyncio.get_running_loop().run_in_executor(None, self._snapshot_projection)
+            
+            if self._retry_messages:
+                self._retry_failed_messages()
+            
+            for symbol in self.active_trades.symbols():
+                # 每个交易对只取一次价格
+                current_price = self.okx_cache.get_price(symbol)
+                if not current_price:
+                    continue
+                for trade in self.active_trades.trades_for(symbol):
+                    self._compute_active_trade(trade, current_price)
+            
+            # 写回放到后台线程（写事务可能等待其他进程的写锁）；上一轮还没写完时本轮的变化留到下一轮
+            if self._flush_future is None or self._flush_future.done():
+                self._flush_future = asyncio.get_running_loop().run_in_executor(None, self._flush_round)
+            ACTIVE_TRADES.set(len(self.active_trades))
         except Exception as e:
             print(f"Monitor状态计算异常: {e}")
 
+    def _compute_active_trade(self, trade, current_price: float):
+        """根据实时币价更新一笔内存中的交易单"""
+        entry_price = trade.entry_price
+        side = trade.side
+        if not entry_price:
+            return
+        
+        if trade.is_pending:
+            # 检查是否到达入场价（限价单逻辑：严格匹配）
+            if side == 'long':
+                # 做多：价格必须下跌到入场价或以下，当前价 <= 入场价（限价买单）
+                price_reached = current_price <= entry_price
+            else:  # short
+                # 做空：价格必须上涨到入场价或以上，当前价 >= 入场价（限价卖单）
+                price_reached = current_price >= entry_price
+            
+            if price_reached:
+                # 币价已到达，开始正常计算状态
+                status, pnl_points, pnl_percent = self._compute_trade_status(
+                    trade.symbol, side, entry_price, trade.take_profit, trade.stop_loss, current_price
+                )
+                self.active_trades.set_status(trade, status, pnl_points, pnl_percent, current_price)
+                self._log_event('[Monitor] ✅ 待入场交易 #%s 币价已到达 - 当前价: %s, 入场价: %s, 状态: %s', trade.trade_id, current_price, entry_price, status)
+            else:
+                # 只更新内存中的当前价格，保持"待入场"状态（不写数据库）
+                self.active_trades.set_status(trade, "待入场", None, None, current_price)
+            return
+        
+        if trade.partial_status:
+            # 部分出局后，继续计算剩余部分的实时状态
+            if side == 'long':
+                remaining_pnl = current_price - entry_price
+            else:  # short
+                remaining_pnl = entry_price - current_price
+            remaining_pnl_percent = (remaining_pnl / entry_price) * 100 if entry_price > 0 else 0
+            
+            # 检查是否触发止盈/止损
+            final_status = None
+            if side == 'long':
+                if trade.take_profit and current_price >= trade.take_profit:
+                    final_status = "已止盈"
+                elif trade.stop_loss and current_price <= trade.stop_loss:
+                    final_status = "已止损"
+            else:  # short
+                if trade.take_profit and current_price <= trade.take_profit:
+                    final_status = "已止盈"
+                elif trade.stop_loss and current_price >= trade.stop_loss:
+                    final_status = "已止损"
+            
+            # 触发止盈/止损则更新为最终状态，否则继续显示部分出局状态并更新剩余部分的盈亏
+            status = final_status or trade.partial_status
+            self.active_trades.set_status(trade, status, round(remaining_pnl, 2), round(remaining_pnl_percent, 2), current_price)
+            return
+        
+        # 计算状态（基于Deepseek解析的数据和实时币价）
+        status, pnl_points, pnl_percent = self._compute_trade_status(
+            trade.symbol, side, entry_price, trade.take_profit, trade.stop_loss, current_price
+        )
+        self.active_trades.set_status(trade, status, pnl_points, pnl_percent, current_price)
+
     def _compute_trade_status(self, symbol: str, side: str, entry_price: float, 
                              take_profit: float, stop_loss: float, 
                              current_price: float):
@@ -964,23 +1283,7 @@ class MonitorCog(commands.Cog):
 
     def _upsert_status(self, con, channel_id: str, trader_id: str, status: str = None, pnl_points: float = None):
         """更新频道状态（旧方法，保留兼容性）"""
-        import sqlite3
         cur = con.cursor()
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS trade_status (
-                channel_id TEXT PRIMARY KEY,
-                trader_id TEXT,
-                last_state TEXT,
-                last_pnl_points REAL,
-                updated_at INTEGER
-            )
-            """
-        )
-        try:
-            con.execute("ALTER TABLE trade_status ADD COLUMN trader_id TEXT")
-        except sqlite3.OperationalError:
-            pass
         import time
         now = int(time.time())
         row = cur.execute("SELECT channel_id FROM trade_status WHERE channel_id=?", (channel_id,)).fetchone()
@@ -992,21 +1295,9 @@ class MonitorCog(commands.Cog):
                         (channel_id, trader_id, status, pnl_points, now))
     
     def _upsert_trade_status(self, con, trade_id: int, status: str, pnl_points: float = None, 
-                            pnl_percent: float = None, current_price: float = None):
-        """更新单个交易单的状态"""
+                            pnl_percent: float = None, current_price: float = None, source: str = 'bot'):
+        """更新单个交易单的状态（成交/止盈/止损等状态变化同时写入事件日志）"""
         cur = con.cursor()
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS trade_status_detail (
-                trade_id INTEGER PRIMARY KEY,
-                status TEXT,
-                pnl_points REAL,
-                pnl_percent REAL,
-                current_price REAL,
-                updated_at INTEGER
-            )
-            """
-        )
         import time
         now = int(time.time())
         cur.execute(
@@ -1022,6 +1313,9 @@ class MonitorCog(commands.Cog):
             """,
             (trade_id, status, pnl_points, pnl_percent, current_price, now)
         )
+        # 同一事务内同步交易单生命周期
+        queries.update_lifecycle(con, trade_id, status, pnl_points, now)
+        ledger.record_status(con, trade_id, status, current_price, pnl_points, source=source, now=now)
 
 def create_discord_bot(token, config=None):
     intents = discord.Intents.default()
@@ -1041,6 +1335,10 @@ def setup_discord_bot(bot, token):
             await bot.add_cog(OKXCog(bot))
             await bot.add_cog(MonitorCog(bot))
             print('[Discord] ✅ 所有 Cogs 已注册')
+            # 事件循环阻塞检测（同步 LLM / SQLite / 会员存储调用误入事件循环时能及时发现）
+            if get_settings().LOOP_WATCHDOG_ENABLED:
+                bot.loop_watchdog = LoopWatchdog()
+                bot.loop_watchdog.start()
             print('[Discord] ⏳ 等待连接到 Discord Gateway...')
         except Exception as e:
             print(f'[Discord] ❌ setup_hook 初始化出错: {e}')
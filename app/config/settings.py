@@ -33,6 +33,33 @@ class Settings:
         # 默认使用相对路径 ./data/membership.db
         default_db_path = os.path.join(os.getcwd(), 'data', 'membership.db')
         self.MEMBERSHIP_DB_PATH = os.getenv('MEMBERSHIP_DB_PATH', default_db_path)
+        # SQLite 连接参数（WAL 模式下机器人写入与 API 读取互不阻塞）
+        self.DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))
+        self.DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL').strip().upper() or 'NORMAL'
+        self.DB_CACHED_STATEMENTS = int(os.getenv('DB_CACHED_STATEMENTS', '256'))
+        # 交易单投影快照：间隔（秒）与保留份数，投影重建时从最近的快照开始重放事件
+        self.PROJECTION_SNAPSHOT_INTERVAL_SEC = int(os.getenv('PROJECTION_SNAPSHOT_INTERVAL_SEC', '3600'))
+        self.PROJECTION_SNAPSHOT_KEEP = int(os.getenv('PROJECTION_SNAPSHOT_KEEP', '3'))
+        # 交易单列表分页：未传 limit 时的默认条数与单页最大条数
+        self.TRADES_PAGE_DEFAULT_LIMIT = int(os.getenv('TRADES_PAGE_DEFAULT_LIMIT', '100'))
+        self.TRADES_PAGE_MAX_LIMIT = int(os.getenv('TRADES_PAGE_MAX_LIMIT', '500'))
+
+        # 指标：API 进程在 /metrics 暴露；机器人进程在独立端口暴露（0 表示不启动）
+        self.METRICS_ENABLED = _env_bool('METRICS_ENABLED', 'true')
+        self.METRICS_BOT_HOST = os.getenv('METRICS_BOT_HOST', '127.0.0.1').strip() or '127.0.0.1'
+        self.METRICS_BOT_PORT = int(os.getenv('METRICS_BOT_PORT', '9101'))
+        # 消息处理耗时分解：内存中保留的条数；是否写入 message_traces 表（供 API 查询）及保留天数
+        self.TRACE_ENABLED = _env_bool('TRACE_ENABLED', 'true')
+        self.TRACE_BUFFER_SIZE = int(os.getenv('TRACE_BUFFER_SIZE', '1000'))
+        self.TRACE_PERSIST = _env_bool('TRACE_PERSIST', 'true')
+        self.TRACE_RETENTION_DAYS = float(os.getenv('TRACE_RETENTION_DAYS', '7'))
+        # 采样分析器（管理员按需启动）：采样间隔（毫秒）与单次最长运行时间（秒，超时自动停止）
+        self.PROFILER_INTERVAL_MS = float(os.getenv('PROFILER_INTERVAL_MS', '10'))
+        self.PROFILER_MAX_SECONDS = float(os.getenv('PROFILER_MAX_SECONDS', '300'))
+        # 事件循环阻塞检测：心跳间隔与判定为阻塞的阈值（毫秒）
+        self.LOOP_WATCHDOG_ENABLED = _env_bool('LOOP_WATCHDOG_ENABLED', 'true')
+        self.LOOP_WATCHDOG_INTERVAL_MS = float(os.getenv('LOOP_WATCHDOG_INTERVAL_MS', '100'))
+        self.LOOP_WATCHDOG_THRESHOLD_MS = float(os.getenv('LOOP_WATCHDOG_THRESHOLD_MS', '250'))
 
         # OKX
         self.OKX_REST_BASE = os.getenv('OKX_REST_BASE', 'https://www.okx.com')
@@ -40,17 +67,69 @@ class Settings:
         self.OKX_INST_IDS = [s.strip() for s in os.getenv('OKX_INST_IDS', 'BTC-USDT-SWAP,ETH-USDT-SWAP').split(',') if s.strip()]
         self.OKX_COPY_MONITOR_ENABLED = _env_bool('OKX_COPY_MONITOR_ENABLED', 'true')
         self.OKX_POLL_INTERVAL_SEC = float(os.getenv('OKX_POLL_INTERVAL_SEC', '5'))
+        # 轮询的交易对达到该数量时改为一次请求获取全部永续合约行情
+        self.OKX_TICKERS_BATCH_MIN = int(os.getenv('OKX_TICKERS_BATCH_MIN', '4'))
         self.OKX_WS_ENABLED = _env_bool('OKX_WS_ENABLED', 'true')
         self.OKX_REST_ENABLED = _env_bool('OKX_REST_ENABLED', 'true')
+        # 永续合约交易对注册表：交易对列表缓存时间、记录规则（instId 通配，逗号分隔）、24 小时成交额下限
+        self.INSTRUMENT_TTL_SEC = float(os.getenv('INSTRUMENT_TTL_SEC', '3600'))
+        self.INSTRUMENT_QUOTE_CCY = os.getenv('INSTRUMENT_QUOTE_CCY', 'USDT').strip().upper() or 'USDT'
+        self.INSTRUMENT_ALLOW = [s.strip() for s in os.getenv('INSTRUMENT_ALLOW', '*-USDT-SWAP').split(',') if s.strip()]
+        self.INSTRUMENT_DENY = [s.strip() for s in os.getenv('INSTRUMENT_DENY', '').split(',') if s.strip()]
+        self.INSTRUMENT_MIN_VOL_24H = float(os.getenv('INSTRUMENT_MIN_VOL_24H', '5000000'))
+        # 额外的交易对别名：别名:币种;别名2:币种2（如 大饼:BTC;姨太:ETH）
+        self.INSTRUMENT_ALIASES = {}
+        for p in os.getenv('INSTRUMENT_ALIASES', '').split(';'):
+            if ':' in p:
+                alias, target = [s.strip() for s in p.split(':', 1)]
+                if alias and target:
+                    self.INSTRUMENT_ALIASES[alias] = target
 
         # Monitoring & AI
         self.MONITOR_CHANNEL_IDS = [cid.strip() for cid in os.getenv('MONITOR_CHANNEL_IDS', '').split(',') if cid.strip()]
         self.MONITOR_PARSE_ENABLED = _env_bool('MONITOR_PARSE_ENABLED', 'true')
+        # 重启/断线重连后补拉错过的消息：每批补拉的条数（逐批补拉直到追上最新消息）、同时解析的消息数
+        self.BACKFILL_ENABLED = _env_bool('BACKFILL_ENABLED', 'true')
+        self.BACKFILL_MAX_MESSAGES = int(os.getenv('BACKFILL_MAX_MESSAGES', '500'))
+        self.BACKFILL_CONCURRENCY = int(os.getenv('BACKFILL_CONCURRENCY', '8'))
+        # 回复引用关联：缓存的回复关系数量、沿回复链向上查找的最大层数
+        self.REPLY_CACHE_SIZE = int(os.getenv('REPLY_CACHE_SIZE', '10000'))
+        self.REPLY_CHAIN_MAX_HOPS = int(os.getenv('REPLY_CHAIN_MAX_HOPS', '5'))
         self.DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY')
         self.DEEPSEEK_MODEL = os.getenv('DEEPSEEK_MODEL', 'deepseek-v3.2')
         self.DEEPSEEK_ENDPOINT = os.getenv('DEEPSEEK_ENDPOINT', 'https://api.v3.cm/v1/chat/completions')
+        # 备用端点：主端点超过延迟分位数未返回时发送对冲请求（留空则不启用）
+        self.DEEPSEEK_FALLBACK_ENDPOINT = os.getenv('DEEPSEEK_FALLBACK_ENDPOINT', '').strip()
+        self.DEEPSEEK_FALLBACK_MODEL = os.getenv('DEEPSEEK_FALLBACK_MODEL', '').strip()
+        self.DEEPSEEK_FALLBACK_API_KEY = os.getenv('DEEPSEEK_FALLBACK_API_KEY', '').strip()
+        self.DEEPSEEK_HEDGE_PERCENTILE = float(os.getenv('DEEPSEEK_HEDGE_PERCENTILE', '90'))
+        self.DEEPSEEK_HEDGE_DEFAULT_DELAY_MS = float(os.getenv('DEEPSEEK_HEDGE_DEFAULT_DELAY_MS', '2000'))
+        self.DEEPSEEK_HEDGE_MIN_DELAY_MS = float(os.getenv('DEEPSEEK_HEDGE_MIN_DELAY_MS', '200'))
+        self.DEEPSEEK_HEDGE_MAX_DELAY_MS = float(os.getenv('DEEPSEEK_HEDGE_MAX_DELAY_MS', '10000'))
+        # 流式模式：JSON 一闭合就停止接收，缩短出信号时间；启用对冲时总是流式（落败的请求才能及时断开）
+        self.DEEPSEEK_STREAM = _env_bool('DEEPSEEK_STREAM', 'false')
+        # 微批处理：窗口期内到达的多条消息合并为一次 LLM 请求
+        self.MONITOR_BATCH_ENABLED = _env_bool('MONITOR_BATCH_ENABLED', 'false')
+        self.MONITOR_BATCH_WINDOW_MS = int(os.getenv('MONITOR_BATCH_WINDOW_MS', '1500'))
+        self.MONITOR_BATCH_MAX = int(os.getenv('MONITOR_BATCH_MAX', '6'))
         default_log_dir = os.path.join(os.getcwd(), 'logs', 'monitor')
         self.MONITOR_LOG_DIR = os.getenv('MONITOR_LOG_DIR', default_log_dir)
+        # monitor.log 按天轮转保留的份数；DEBUG 日志（Deepseek 原始响应等）的抽样比例，0 表示不记录
+        self.MONITOR_LOG_BACKUP_COUNT = int(os.getenv('MONITOR_LOG_BACKUP_COUNT', '2'))
+        self.MONITOR_LOG_DEBUG_SAMPLE_RATE = float(os.getenv('MONITOR_LOG_DEBUG_SAMPLE_RATE', '0.05'))
+
+        # 预过滤器：在调用 LLM 之前剔除明显的非信号消息
+        self.MONITOR_PREFILTER_ENABLED = _env_bool('MONITOR_PREFILTER_ENABLED', 'true')
+        self.MONITOR_PREFILTER_THRESHOLD = float(os.getenv('MONITOR_PREFILTER_THRESHOLD', '0.15'))
+        # 被拒绝消息中仍抽样送往 LLM 的比例，用于估算漏判率
+        self.MONITOR_PREFILTER_AUDIT_RATE = float(os.getenv('MONITOR_PREFILTER_AUDIT_RATE', '0.05'))
+        default_weights_path = os.path.join(os.getcwd(), 'data', 'prefilter_weights.json')
+        self.MONITOR_PREFILTER_WEIGHTS_PATH = os.getenv('MONITOR_PREFILTER_WEIGHTS_PATH', default_weights_path)
+        self.MONITOR_PREFILTER_LOG_PATH = os.getenv('MONITOR_PREFILTER_LOG_PATH', os.path.join(self.MONITOR_LOG_DIR, 'prefilter_outcomes.jsonl'))
+
+        # 带单员配置文件（JSON，修改后自动热加载）；未设置或文件不存在时使用 TRADER_CONFIG
+        self.TRADER_CONFIG_PATH = os.getenv('TRADER_CONFIG_PATH', '').strip()
+        self.TRADER_CONFIG_RELOAD_SEC = float(os.getenv('TRADER_CONFIG_RELOAD_SEC', '5'))
 
         # Trader configuration: trader_id|channel_id|trader_name;trader2|channel2|name2
         # 格式：带单员ID|Discord频道ID|带单员名称
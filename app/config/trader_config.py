@@ -1,52 +1,166 @@
 """
 带单员配置管理类
 用于管理带单员与 Discord 频道的映射关系
+
+配置来源：TRADER_CONFIG_PATH 指向的 JSON 文件（修改后自动热加载），未配置文件时使用 .env 中的 TRADER_CONFIG。
+JSON 格式：
+  [{"id": "trader1", "channel_id": "123456789", "name": "带单员1",
+    "unique_code": "35E22983F436F55B", "inst_ids": ["BTC-USDT-SWAP"]}]
+频道 -> 带单员、带单员 -> 频道都是预先建好的字典索引；重新加载时整体替换索引，读取方不会看到半更新的状态。
 """
-from typing import Dict, List, Optional
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
 from app.config.settings import get_settings
 
+# 监听器：(新增的带单员列表, 移除的带单员列表)
+TraderListener = Callable[[List[Dict], List[Dict]], None]
+
+
+class _TraderIndex:
+    """一份不可变的带单员配置及其索引"""
+    __slots__ = ('trader_map', 'by_channel')
+
+    def __init__(self, trader_map: Dict[str, Dict]):
+        self.trader_map = trader_map
+        self.by_channel = {t['channel_id']: t for t in trader_map.values() if t.get('channel_id')}
+
+
+def _load_file(path: str) -> Dict[str, Dict]:
+    with open(path, 'r', encoding='utf-8') as f:
+        rows = json.load(f)
+    if isinstance(rows, dict):
+        rows = [dict(v, id=v.get('id', k)) for k, v in rows.items()]
+    trader_map = {}
+    channels = set()
+    for row in rows:
+        trader_id = str(row['id']).strip()
+        channel_id = str(row['channel_id']).strip()
+        if trader_id in trader_map:
+            raise ValueError(f'带单员 ID 重复: {trader_id}')
+        if channel_id in channels:
+            raise ValueError(f'频道 ID 重复: {channel_id}')
+        channels.add(channel_id)
+        trader_map[trader_id] = {
+            'id': trader_id,
+            'channel_id': channel_id,
+            'name': row.get('name') or trader_id,
+            'unique_code': row.get('unique_code'),
+            'inst_ids': [s.strip() for s in row.get('inst_ids') or [] if s.strip()],
+        }
+    return trader_map
+
 
 class TraderConfig:
     """带单员配置管理类"""
-    
-    def __init__(self):
-        self.reload_config()
-    
-    def reload_config(self):
-        """重新加载配置"""
+
+    def __init__(self, path: Optional[str] = None):
         self.settings = get_settings()
-        self.trader_map = self.settings.TRADER_CONFIG
-    
+        self.path = path if path is not None else self.settings.TRADER_CONFIG_PATH
+        self.reload_interval = self.settings.TRADER_CONFIG_RELOAD_SEC
+        self._index = _TraderIndex({})
+        self._mtime = None
+        self._last_check = 0.0
+        self._listeners: List[TraderListener] = []
+        self._lock = threading.Lock()
+        self.reload_config()
+
+    @property
+    def trader_map(self) -> Dict[str, Dict]:
+        return self._index.trader_map
+
+    def _read_source(self) -> Tuple[Dict[str, Dict], Optional[float]]:
+        if self.path and os.path.exists(self.path):
+            mtime = os.path.getmtime(self.path)
+            return _load_file(self.path), mtime
+        trader_map = {
+            tid: {'id': tid, 'channel_id': t['channel_id'], 'name': t.get('name') or tid, 'unique_code': None, 'inst_ids': []}
+            for tid, t in self.settings.TRADER_CONFIG.items()
+        }
+        return trader_map, None
+
+    def reload_config(self) -> bool:
+        """重新加载配置，返回是否有变化；配置文件格式错误时保留当前配置"""
+        with self._lock:
+            try:
+                trader_map, mtime = self._read_source()
+            except Exception as e:
+                # 记录本次文件的修改时间，文件再次修改前不重复尝试
+                self._mtime = os.path.getmtime(self.path) if self.path and os.path.exists(self.path) else None
+                print(f'[Trader] ❌ 加载带单员配置失败，继续使用当前配置: {e}')
+                return False
+            self._mtime = mtime
+            old = self._index.trader_map
+            if trader_map == old:
+                return False
+            added = [t for tid, t in trader_map.items() if old.get(tid) != t]
+            removed = [t for tid, t in old.items() if trader_map.get(tid) != t]
+            # 整体替换索引（单次赋值），读取方要么看到旧配置要么看到新配置
+            self._index = _TraderIndex(trader_map)
+            listeners = list(self._listeners)
+        if old:
+            print(f'[Trader] 🔄 带单员配置已重新加载 - 共 {len(trader_map)} 个, 新增/变更 {len(added)}, 移除/变更 {len(removed)}')
+        for listener in listeners:
+            try:
+                listener(added, removed)
+            except Exception as e:
+                print(f'[Trader] ❌ 带单员变更通知失败: {e}')
+        return True
+
+    def check_reload(self, force: bool = False) -> bool:
+        """配置文件修改时间变化时重新加载（按 TRADER_CONFIG_RELOAD_SEC 节流）"""
+        now = time.monotonic()
+        if not force and now - self._last_check < self.reload_interval:
+            return False
+        self._last_check = now
+        if not self.path or not os.path.exists(self.path):
+            return False
+        if os.path.getmtime(self.path) == self._mtime:
+            return False
+        return self.reload_config()
+
+    def add_listener(self, listener: TraderListener):
+        """注册带单员新增/移除的回调（在调用 check_reload / reload_config 的线程中执行）"""
+        self._listeners.append(listener)
+
     def get_trader_by_id(self, trader_id: str) -> Optional[Dict]:
         """根据带单员ID获取配置"""
-        return self.trader_map.get(trader_id)
-    
+        return self._index.trader_map.get(trader_id)
+
     def get_trader_by_channel_id(self, channel_id: str) -> Optional[Dict]:
         """根据频道ID获取带单员配置"""
-        for trader in self.trader_map.values():
-            if trader.get('channel_id') == channel_id:
-                return trader
-        return None
-    
+        return self._index.by_channel.get(channel_id)
+
     def get_all_traders(self) -> List[Dict]:
         """获取所有带单员配置"""
-        return list(self.trader_map.values())
-    
+        return list(self._index.trader_map.values())
+
+    def get_inst_ids(self) -> List[str]:
+        """所有带单员需要的交易对（价格订阅用）"""
+        inst_ids = []
+        for trader in self._index.trader_map.values():
+            for inst_id in trader.get('inst_ids') or []:
+                if inst_id not in inst_ids:
+                    inst_ids.append(inst_id)
+        return inst_ids
+
     def get_channel_id(self, trader_id: str) -> Optional[str]:
         """获取带单员对应的频道ID"""
         trader = self.get_trader_by_id(trader_id)
         return trader.get('channel_id') if trader else None
-    
+
     def get_trader_name(self, trader_id: str) -> Optional[str]:
         """获取带单员名称"""
         trader = self.get_trader_by_id(trader_id)
         return trader.get('name') if trader else None
-    
+
     def is_trader_configured(self, trader_id: str) -> bool:
         """检查带单员是否已配置"""
-        return trader_id in self.trader_map
-    
+        return trader_id in self._index.trader_map
+
     def is_channel_monitored(self, channel_id: str) -> bool:
         """检查频道是否被监控（是否有对应的带单员配置）"""
-        return self.get_trader_by_channel_id(channel_id) is not None
-
+        return channel_id in self._index.by_channel
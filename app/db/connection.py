@@ -0,0 +1,136 @@
+"""
+SQLite 连接层
+- WAL 模式：机器人写入时 API 仍可并发读取
+- synchronous=NORMAL + busy_timeout：减少 fsync，遇到锁时等待而不是立即报 "database is locked"
+- 每个线程一个长连接，复用预编译语句缓存
+- 进程内所有写入经由 transaction() 串行执行（BEGIN IMMEDIATE），跨进程依赖 busy_timeout 排队
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from app.config.settings import get_settings
+from app.utils import metrics
+
+WRITE_WAIT_SECONDS = metrics.histogram('db_write_wait_seconds', '等待写锁和 BEGIN IMMEDIATE 的耗时（秒）', ('db',))
+WRITE_SECONDS = metrics.histogram('db_write_seconds', '写事务持有写锁的耗时（秒）', ('db',))
+
+
+class Database:
+    def __init__(self, path: str, busy_timeout_ms: int = 5000, synchronous: str = 'NORMAL',
+                 cached_statements: int = 256):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.busy_timeout_ms = busy_timeout_ms
+        self.synchronous = synchronous
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        db_dir = os.path.dirname(self.path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+        con = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout_ms / 1000.0,
+            cached_statements=self.cached_statements,
+        )
+        con.execute('PRAGMA journal_mode=WAL')
+        con.execute(f'PRAGMA synchronous={self.synchronous}')
+        con.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        con.execute('PRAGMA foreign_keys=OFF')
+        with self._connections_lock:
+            self._connections.append(con)
+        return con
+
+    def connection(self) -> sqlite3.Connection:
+        """当前线程的长连接（不要 close）"""
+        con = getattr(self._local, 'con', None)
+        if con is None:
+            con = self._connect()
+            self._local.con = con
+        return con
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """只读访问：WAL 下读取不会阻塞写入"""
+        yield self.connection()
+
+    def begin(self) -> sqlite3.Connection:
+        """开始写事务：取得进程内写锁并 BEGIN IMMEDIATE；必须与 end() 成对调用"""
+        con = self.connection()
+        started = time.perf_counter()
+        self._write_lock.acquire()
+        try:
+            con.execute('BEGIN IMMEDIATE')
+        except BaseException:
+            self._write_lock.release()
+            raise
+        self._local.write_started = now = time.perf_counter()
+        WRITE_WAIT_SECONDS.observe(now - started, db=self.name)
+        return con
+
+    def end(self, con: sqlite3.Connection):
+        """结束写事务：未提交的修改回滚，释放写锁"""
+        try:
+            if con.in_transaction:
+                con.rollback()
+        finally:
+            WRITE_SECONDS.observe(time.perf_counter() - self._local.write_started, db=self.name)
+            self._write_lock.release()
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """写事务：进程内串行，正常结束提交，异常回滚"""
+        con = self.begin()
+        try:
+            yield con
+            if con.in_transaction:
+                con.commit()
+        finally:
+            self.end(con)
+
+    def close_all(self):
+        """关闭所有线程的连接（进程退出前调用）"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for con in connections:
+            try:
+                con.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+
+_databases: Dict[str, Database] = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(path: Optional[str] = None) -> Database:
+    """按路径共享 Database 实例；默认 membership.db"""
+    settings = get_settings()
+    path = path or settings.MEMBERSHIP_DB_PATH
+    key = os.path.abspath(path)
+    with _databases_lock:
+        db = _databases.get(key)
+        if db is None:
+            db = Database(
+                path,
+                busy_timeout_ms=settings.DB_BUSY_TIMEOUT_MS,
+                synchronous=settings.DB_SYNCHRONOUS,
+                cached_statements=settings.DB_CACHED_STATEMENTS,
+            )
+            _databases[key] = db
+        return db
+
+
+def user_database() -> Database:
+    """后台登录用户库 users.db（与 membership.db 同目录）"""
+    from app.db.migrations import user_db_path
+    return get_database(user_db_path())
@@ -0,0 +1,617 @@
+"""
+数据库版本化迁移
+schema_version 表记录已执行的迁移版本，启动时按顺序执行未执行的迁移；业务代码不再执行任何 DDL
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+from app.config.settings import get_settings
+
+Migration = Tuple[int, str, Callable[[sqlite3.Connection], None]]
+
+# 已迁移的数据库路径（同一进程内只检查一次）
+_migrated = set()
+_lock = threading.Lock()
+
+# 迁移连接等待其他进程写锁的秒数
+_MIGRATION_BUSY_TIMEOUT = 300.0
+
+
+def add_column_if_missing(con: sqlite3.Connection, table: str, column: str, ddl: str) -> bool:
+    """表中缺少该列时添加，返回是否添加"""
+    columns = [row[1] for row in con.execute(f"PRAGMA table_info({table})").fetchall()]
+    if column in columns:
+        return False
+    con.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+    return True
+
+
+# ========== membership.db ==========
+
+def _membership_v1_base_tables(con: sqlite3.Connection):
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id TEXT PRIMARY KEY,
+            used_trial INTEGER DEFAULT 0,
+            trial_start INTEGER,
+            trial_end INTEGER,
+            member_end INTEGER
+        )
+        """
+    )
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS trades (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            trader_id TEXT,
+            source_message_id TEXT,
+            channel_id TEXT,
+            user_id TEXT,
+            symbol TEXT,
+            side TEXT,
+            entry_price REAL,
+            take_profit REAL,
+            stop_loss REAL,
+            confidence REAL,
+            created_at INTEGER
+        )
+        """
+    )
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS trade_updates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            trader_id TEXT,
+            trade_ref_id INTEGER,
+            source_message_id TEXT,
+            channel_id TEXT,
+            user_id TEXT,
+            text TEXT,
+            pnl_points REAL,
+            status TEXT,
+            created_at INTEGER
+        )
+        """
+    )
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS trade_status_detail (
+            trade_id INTEGER PRIMARY KEY,
+            status TEXT,
+            pnl_points REAL,
+            pnl_percent REAL,
+            current_price REAL,
+            updated_at INTEGER
+        )
+        """
+    )
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS trade_status (
+            channel_id TEXT PRIMARY KEY,
+            trader_id TEXT,
+            last_state TEXT,
+            last_pnl_points REAL,
+            updated_at INTEGER
+        )
+        """
+    )
+
+
+def _membership_v2_trader_id(con: sqlite3.Connection):
+    # 早期版本的表没有 trader_id 字段
+    add_column_if_missing(con, 'trades', 'trader_id', 'TEXT')
+    add_column_if_missing(con, 'trade_updates', 'trader_id', 'TEXT')
+    add_column_if_missing(con, 'trade_status', 'trader_id', 'TEXT')
+
+
+def _membership_v3_llm_usage(con: sqlite3.Connection):
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS llm_usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            request_id TEXT,
+            trader_id TEXT,
+            prompt_version TEXT,
+            endpoint TEXT,
+            model TEXT,
+            messages INTEGER,
+            prompt_tokens INTEGER,
+            cached_tokens INTEGER,
+            completion_tokens INTEGER,
+            latency_ms INTEGER,
+            created_at INTEGER
+        )
+        """
+    )
+
+
+def _membership_v4_trade_indexes(con: sqlite3.Connection):
+    # 部分出局标记，替代无法走索引的 LIKE '%部分%'
+    add_column_if_missing(con, 'trade_updates', 'is_partial', 'INTEGER NOT NULL DEFAULT 0')
+    con.execute("UPDATE trade_updates SET is_partial=1 WHERE status LIKE '%部分%'")
+    # 更新消息按 (trader_id, channel_id) 查找最近的交易单
+    con.execute("CREATE INDEX IF NOT EXISTS idx_trades_trader_channel_created ON trades(trader_id, channel_id, created_at)")
+    # 列表和定时任务按创建时间倒序遍历
+    con.execute("CREATE INDEX IF NOT EXISTS idx_trades_created ON trades(created_at)")
+    # 已结束交易单的 NOT IN 子查询：按状态取 trade_ref_id（覆盖索引）
+    con.execute("CREATE INDEX IF NOT EXISTS idx_trade_updates_status_ref ON trade_updates(status, trade_ref_id)")
+    # 单笔交易的部分出局/结束记录和全部更新记录；包含 status、pnl_points，前两类查询无需回表
+    con.execute("CREATE INDEX IF NOT EXISTS idx_trade_updates_ref_partial ON trade_updates(trade_ref_id, is_partial, created_at, status, pnl_points)")
+    # 定时任务按状态取"待入场"交易单
+    con.execute("CREATE INDEX IF NOT EXISTS idx_trade_status_detail_status ON trade_status_detail(status, trade_id)")
+
+
+def _membership_v5_trade_lifecycle(con: sqlite3.Connection):
+    # 交易单生命周期：pending(待入场) / active(持仓中) / partial(部分出局) / closed(已结束)
+    add_column_if_missing(con, 'trades', 'lifecycle', "TEXT NOT NULL DEFAULT 'active'")
+    add_column_if_missing(con, 'trades', 'closed_at', 'INTEGER')
+    add_column_if_missing(con, 'trades', 'final_pnl', 'REAL')
+    # 已结束：有止盈/止损更新记录，或状态明细为结束状态
+    con.execute(
+        """
+        UPDATE trades SET
+            lifecycle = 'closed',
+            closed_at = COALESCE(
+                (SELECT MAX(u.created_at) FROM trade_updates u
+                 WHERE u.trade_ref_id = trades.id AND u.status IN ('已止盈', '已止损', '带单主动止盈', '带单主动止损')),
+                (SELECT ts.updated_at FROM trade_status_detail ts WHERE ts.trade_id = trades.id)
+            ),
+            final_pnl = COALESCE(
+                (SELECT u.pnl_points FROM trade_updates u
+                 WHERE u.trade_ref_id = trades.id AND u.status IN ('已止盈', '已止损', '带单主动止盈', '带单主动止损')
+                 ORDER BY u.created_at DESC LIMIT 1),
+                (SELECT ts.pnl_points FROM trade_status_detail ts WHERE ts.trade_id = trades.id)
+            )
+        WHERE id IN (
+            SELECT trade_ref_id FROM trade_updates
+            WHERE status IN ('已止盈', '已止损', '带单主动止盈', '带单主动止损') AND trade_ref_id IS NOT NULL
+        )
+        OR id IN (
+            SELECT trade_id FROM trade_status_detail
+            WHERE status IN ('已止盈', '已止损', '带单主动止盈', '带单主动止损')
+        )
+        """
+    )
+    con.execute(
+        """
+        UPDATE trades SET lifecycle = 'partial'
+        WHERE lifecycle != 'closed'
+        AND id IN (SELECT trade_ref_id FROM trade_updates WHERE is_partial = 1 AND trade_ref_id IS NOT NULL)
+        """
+    )
+    con.execute(
+        """
+        UPDATE trades SET lifecycle = 'pending'
+        WHERE lifecycle = 'active'
+        AND id IN (SELECT trade_id FROM trade_status_detail WHERE status = '待入场')
+        """
+    )
+    # 按生命周期取未结束交易单；更新消息按 (trader_id, channel_id, lifecycle) 关联最近的交易单
+    con.execute("CREATE INDEX IF NOT EXISTS idx_trades_lifecycle_created ON trades(lifecycle, created_at)")
+    con.execute("DROP INDEX IF EXISTS idx_trades_trader_channel_created")
+    # 未结束判断改为读 lifecycle，NOT IN 子查询用到的索引不再需要
+    con.execute("DROP INDEX IF EXISTS idx_trade_updates_status_ref")
+    con.execute("DROP INDEX IF EXISTS idx_trade_status_detail_status")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_trades_trader_channel_lifecycle ON trades(trader_id, channel_id, lifecycle, created_at)")
+
+
+
+_PROJECTION_COLUMNS_DDL = """
+    trade_id INTEGER PRIMARY KEY,
+    trader_id TEXT,
+    channel_id TEXT,
+    symbol TEXT,
+    side TEXT,
+    entry_price REAL,
+    take_profit REAL,
+    stop_loss REAL,
+    confidence REAL,
+    created_at INTEGER,
+    lifecycle TEXT NOT NULL,
+    status TEXT,
+    filled_at INTEGER,
+    filled_price REAL,
+    exited_pnl REAL,
+    partial_at INTEGER,
+    final_pnl REAL,
+    close_price REAL,
+    closed_at INTEGER,
+    last_event_id INTEGER NOT NULL
+"""
+
+
+# v6 的常量与投影规则按当时的账本冻结在这里：迁移不能依赖之后还会修改的 app 模块
+_V6_FINAL_STATUSES = ('已止盈', '已止损', '带单主动止盈', '带单主动止损')
+_V6_ENTRY_FIELDS = ('trader_id', 'channel_id', 'symbol', 'side', 'entry_price', 'take_profit', 'stop_loss', 'confidence')
+_V6_PROJECTION_COLUMNS = (
+    'trade_id', 'trader_id', 'channel_id', 'symbol', 'side', 'entry_price', 'take_profit', 'stop_loss',
+    'confidence', 'created_at', 'lifecycle', 'status', 'filled_at', 'filled_price', 'exited_pnl', 'partial_at',
+    'final_pnl', 'close_price', 'closed_at', 'last_event_id',
+)
+
+
+def _v6_num(value) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _v6_close_event(status: str) -> str:
+    if status == '已止盈':
+        return 'tp_hit'
+    if status == '已止损':
+        return 'sl_hit'
+    return 'manual_close'
+
+
+def _v6_project(events) -> dict:
+    """按 v6 时的规则重放补写的事件（只有入场、成交、部分出局、结束四类），返回 {trade_id: 投影}"""
+    states = {}
+    for event_id, trade_id, event_type, status, price, pnl_points, data, created_at in events:
+        state = states.get(trade_id)
+        if event_type == 'entry_parsed':
+            fields = json.loads(data) if data else {}
+            state = dict.fromkeys(_V6_PROJECTION_COLUMNS)
+            state.update({k: fields.get(k) for k in _V6_ENTRY_FIELDS})
+            state.update(trade_id=trade_id, created_at=created_at, lifecycle='pending', status=status or '待入场')
+        elif state is None:
+            continue
+        elif state['lifecycle'] == 'closed':
+            pass
+        elif event_type == 'entry_filled':
+            if state['lifecycle'] == 'pending':
+                state.update(lifecycle='active', status=status, filled_at=created_at, filled_price=price)
+        elif event_type == 'partial_exit':
+            state.update(lifecycle='partial', status=status, partial_at=created_at,
+                         exited_pnl=pnl_points if pnl_points is not None else state['exited_pnl'])
+        elif event_type in ('tp_hit', 'sl_hit', 'manual_close'):
+            state.update(lifecycle='closed', status=status, final_pnl=pnl_points,
+                         close_price=price, closed_at=created_at)
+        state['last_event_id'] = event_id
+        states[trade_id] = state
+    return states
+
+
+def _membership_v6_trade_events(con: sqlite3.Connection):
+    # 只追加的事件日志；trade_id 不设外键，交易单删除后事件仍然保留
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS trade_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            trade_id INTEGER NOT NULL,
+            event_type TEXT NOT NULL,
+            status TEXT,
+            price REAL,
+            pnl_points REAL,
+            data TEXT,
+            source TEXT,
+            created_at INTEGER NOT NULL
+        )
+        """
+    )
+    con.execute("CREATE INDEX IF NOT EXISTS idx_trade_events_trade ON trade_events(trade_id, id)")
+    con.execute(f"CREATE TABLE IF NOT EXISTS trade_projection ({_PROJECTION_COLUMNS_DDL})")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_trade_projection_created ON trade_projection(created_at)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_trade_projection_trader_created ON trade_projection(trader_id, created_at)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_trade_projection_channel_created ON trade_projection(channel_id, created_at)")
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS projection_snapshots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            last_event_id INTEGER NOT NULL,
+            row_count INTEGER,
+            created_at INTEGER
+        )
+        """
+    )
+    con.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS trade_projection_snapshot_rows (
+            snapshot_id INTEGER NOT NULL,
+            {_PROJECTION_COLUMNS_DDL.replace('trade_id INTEGER PRIMARY KEY', 'trade_id INTEGER NOT NULL')},
+            PRIMARY KEY(snapshot_id, trade_id)
+        )
+        """
+    )
+
+    # 由现有的 trades / trade_updates / trade_status_detail 补写历史事件，再整体重建投影
+    final_placeholders = ','.join('?' * len(_V6_FINAL_STATUSES))
+    events = []
+    trades = con.execute(
+        f"""
+        SELECT t.id, t.trader_id, t.channel_id, t.symbol, t.side, t.entry_price, t.take_profit, t.stop_loss,
+               t.confidence, t.source_message_id, t.created_at, t.lifecycle, t.closed_at, t.final_pnl,
+               ts.status, ts.current_price,
+               (SELECT u.status FROM trade_updates u
+                WHERE u.trade_ref_id = t.id AND u.status IN ({final_placeholders})
+                ORDER BY u.created_at DESC LIMIT 1)
+        FROM trades t
+        LEFT JOIN trade_status_detail ts ON ts.trade_id = t.id
+        """,
+        _V6_FINAL_STATUSES
+    ).fetchall()
+    for (trade_id, trader_id, channel_id, symbol, side, entry_price, take_profit, stop_loss, confidence,
+         source_message_id, created_at, lifecycle, closed_at, final_pnl, status, current_price, final_update) in trades:
+        created_at = created_at or 0
+        data = {
+            'trader_id': trader_id, 'channel_id': channel_id, 'symbol': symbol, 'side': side,
+            'entry_price': entry_price, 'take_profit': take_profit, 'stop_loss': stop_loss,
+            'confidence': confidence, 'source_message_id': source_message_id,
+        }
+        events.append((created_at, trade_id, 'entry_parsed', '待入场', entry_price, None,
+                       json.dumps(data, ensure_ascii=False)))
+        if lifecycle != 'pending':
+            # 旧数据没有成交时间，按创建时间记录
+            events.append((created_at, trade_id, 'entry_filled', None, entry_price, None, None))
+        if lifecycle == 'closed':
+            final_status = final_update or (status if status in _V6_FINAL_STATUSES else '带单主动止盈')
+            events.append((closed_at or created_at, trade_id, _v6_close_event(final_status),
+                           final_status, current_price, final_pnl, None))
+    for trade_id, status, pnl_points, created_at in con.execute(
+        "SELECT trade_ref_id, status, pnl_points, created_at FROM trade_updates WHERE is_partial = 1 AND trade_ref_id IS NOT NULL"
+    ).fetchall():
+        events.append((created_at or 0, trade_id, 'partial_exit', status, None, _v6_num(pnl_points), None))
+
+    # 同一时间的事件保持 入场 -> 成交 -> 部分出局 -> 结束 的顺序
+    order = {'entry_parsed': 0, 'entry_filled': 1, 'partial_exit': 2}
+    events.sort(key=lambda e: (e[0], e[1], order.get(e[2], 3)))
+    con.executemany(
+        """
+        INSERT INTO trade_events(created_at, trade_id, event_type, status, price, pnl_points, data, source)
+        VALUES(?,?,?,?,?,?,?,'backfill')
+        """,
+        events
+    )
+    states = _v6_project(con.execute(
+        "SELECT id, trade_id, event_type, status, price, pnl_points, data, created_at FROM trade_events ORDER BY id"
+    ))
+    con.executemany(
+        f"INSERT INTO trade_projection({', '.join(_V6_PROJECTION_COLUMNS)}) "
+        f"VALUES({', '.join('?' * len(_V6_PROJECTION_COLUMNS))})",
+        (tuple(state[c] for c in _V6_PROJECTION_COLUMNS) for state in states.values())
+    )
+
+
+
+def _membership_v7_source_message_index(con: sqlite3.Connection):
+    # 同一条 Discord 消息只能创建一笔交易单；旧数据中重复的保留最早的一笔
+    con.execute(
+        """
+        UPDATE trades SET source_message_id = NULL
+        WHERE source_message_id IS NOT NULL
+        AND id NOT IN (SELECT MIN(id) FROM trades WHERE source_message_id IS NOT NULL GROUP BY source_message_id)
+        """
+    )
+    con.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_trades_source_message ON trades(source_message_id) "
+        "WHERE source_message_id IS NOT NULL"
+    )
+    # 回复链：更新消息所回复的消息 id，回复更新消息的消息可沿链找到交易单
+    add_column_if_missing(con, 'trade_updates', 'reply_to_message_id', 'TEXT')
+    con.execute("CREATE INDEX IF NOT EXISTS idx_trade_updates_source_message ON trade_updates(source_message_id)")
+
+
+
+def _membership_v8_channel_cursors(con: sqlite3.Connection):
+    # 每个监控频道最后处理的消息 id（Discord 雪花 id 随时间递增），重连/重启后从这里补拉
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS channel_cursors (
+            channel_id TEXT PRIMARY KEY,
+            last_message_id INTEGER NOT NULL,
+            updated_at INTEGER
+        )
+        """
+    )
+    # 补拉的消息可能已处理过：更新记录同样按来源消息去重
+    con.execute(
+        """
+        UPDATE trade_updates SET source_message_id = NULL
+        WHERE source_message_id IS NOT NULL
+        AND id NOT IN (SELECT MIN(id) FROM trade_updates WHERE source_message_id IS NOT NULL GROUP BY source_message_id)
+        """
+    )
+    con.execute("DROP INDEX IF EXISTS idx_trade_updates_source_message")
+    con.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_trade_updates_source_message ON trade_updates(source_message_id) "
+        "WHERE source_message_id IS NOT NULL"
+    )
+
+
+def _membership_v9_message_traces(con: sqlite3.Connection):
+    # 消息处理耗时分解（Discord 发送 -> 收到 -> 预过滤 -> LLM -> 校验 -> 入库 -> 初始状态），spans 为 JSON {阶段: 毫秒}
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS message_traces (
+            message_id TEXT PRIMARY KEY,
+            channel_id TEXT,
+            trader_id TEXT,
+            source TEXT,
+            result TEXT,
+            created_at REAL,
+            received_at REAL NOT NULL,
+            lag_ms REAL,
+            total_ms REAL NOT NULL,
+            spans TEXT
+        )
+        """
+    )
+    con.execute("CREATE INDEX IF NOT EXISTS idx_message_traces_received ON message_traces(received_at)")
+
+
+def _membership_v10_trade_projection_filters(con: sqlite3.Connection):
+    # 交易单列表的筛选条件（状态分组、交易对、方向、带单员 + 状态分组）各自走索引，
+    # 并按 (created_at, trade_id) 倒序分页（trade_id 即 rowid，隐含在每个索引末尾）
+    con.execute("CREATE INDEX IF NOT EXISTS idx_trade_projection_lifecycle_created ON trade_projection(lifecycle, created_at)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_trade_projection_symbol_created ON trade_projection(symbol, created_at)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_trade_projection_side_created ON trade_projection(side, created_at)")
+    con.execute(
+        "CREATE INDEX IF NOT EXISTS idx_trade_projection_trader_lifecycle_created "
+        "ON trade_projection(trader_id, lifecycle, created_at)"
+    )
+
+
+def _membership_v11_trade_closed_totals(con: sqlite3.Connection):
+    # 首页统计每 3 秒轮询，已结束交易单按 (带单员, 频道) 汇总成小表，由账本在结单/删除时增量维护
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS trade_closed_totals(
+            trader_id TEXT NOT NULL,
+            channel_id TEXT NOT NULL,
+            closed_count INTEGER NOT NULL DEFAULT 0,
+            closed_pnl REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY(trader_id, channel_id)
+        )
+        """
+    )
+    con.execute("DELETE FROM trade_closed_totals")
+    con.execute(
+        """
+        INSERT INTO trade_closed_totals(trader_id, channel_id, closed_count, closed_pnl)
+        SELECT COALESCE(p.trader_id, ''), COALESCE(p.channel_id, ''), COUNT(*),
+               COALESCE(SUM(COALESCE(p.final_pnl, ts.pnl_points)), 0)
+        FROM trade_projection p
+        LEFT JOIN trade_status_detail ts ON ts.trade_id = p.trade_id
+        WHERE p.lifecycle = 'closed'
+        GROUP BY 1, 2
+        """
+    )
+
+
+MEMBERSHIP_MIGRATIONS: List[Migration] = [
+    (1, '基础表 users/trades/trade_updates/trade_status_detail/trade_status', _membership_v1_base_tables),
+    (2, '补充 trader_id 字段', _membership_v2_trader_id),
+    (3, 'LLM 用量表 llm_usage', _membership_v3_llm_usage),
+    (4, '交易表索引与 is_partial 标记', _membership_v4_trade_indexes),
+    (5, '交易单生命周期 lifecycle/closed_at/final_pnl', _membership_v5_trade_lifecycle),
+    (6, '交易单事件日志 trade_events 与投影 trade_projection', _membership_v6_trade_events),
+    (7, '回复引用索引 source_message_id / reply_to_message_id', _membership_v7_source_message_index),
+    (8, '频道消息游标 channel_cursors 与更新记录去重', _membership_v8_channel_cursors),
+    (9, '消息处理耗时分解 message_traces', _membership_v9_message_traces),
+    (10, '交易单列表筛选与分页索引', _membership_v10_trade_projection_filters),
+    (11, '已结束交易单汇总表 trade_closed_totals', _membership_v11_trade_closed_totals),
+]
+
+
+# ========== users.db（后台登录用户） ==========
+
+def _users_v1_base_tables(con: sqlite3.Connection):
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'user',
+            note TEXT,
+            created_at INTEGER,
+            updated_at INTEGER
+        )
+        """
+    )
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sessions (
+            token TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            expires_at INTEGER NOT NULL,
+            created_at INTEGER,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+        """
+    )
+
+
+def _users_v2_role_note(con: sqlite3.Connection):
+    # init_user.py / create_user.py 创建的旧表可能缺少 role、note 字段
+    add_column_if_missing(con, 'users', 'role', "TEXT DEFAULT 'user'")
+    add_column_if_missing(con, 'users', 'note', 'TEXT')
+    con.execute("UPDATE users SET role='user' WHERE role IS NULL")
+
+
+USER_MIGRATIONS: List[Migration] = [
+    (1, '基础表 users/sessions', _users_v1_base_tables),
+    (2, '补充 role/note 字段', _users_v2_role_note),
+]
+
+
+def migrate(db_path: str, migrations: List[Migration]) -> int:
+    """按版本顺序执行尚未执行的迁移，返回当前版本号；同一进程内对同一数据库只执行一次"""
+    key = os.path.abspath(db_path)
+    with _lock:
+        if key in _migrated:
+            return migrations[-1][0] if migrations else 0
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+        # 机器人和 API 是两个进程，启动时都会执行迁移：另一进程的迁移可能耗时较长，等待写锁的时间要足够
+        con = sqlite3.connect(db_path, timeout=_MIGRATION_BUSY_TIMEOUT)
+        try:
+            con.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT,
+                    applied_at INTEGER
+                )
+                """
+            )
+            con.commit()
+            current = con.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+            for version, description, apply in migrations:
+                if version <= current:
+                    continue
+                try:
+                    # 每个迁移在单独的写事务中执行，失败时回滚并停止后续迁移；
+                    # 拿到写锁后重新读取版本，另一进程已经执行过的迁移直接跳过
+                    con.execute("BEGIN IMMEDIATE")
+                    current = con.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+                    if version <= current:
+                        con.rollback()
+                        continue
+                    apply(con)
+                    con.execute(
+                        "INSERT INTO schema_version(version, description, applied_at) VALUES(?,?,?)",
+                        (version, description, int(time.time()))
+                    )
+                    con.commit()
+                except Exception:
+                    con.rollback()
+                    print(f'[DB] ❌ 迁移失败: {os.path.basename(db_path)} v{version} {description}')
+                    raise
+                current = version
+                print(f'[DB] ✅ 已执行迁移: {os.path.basename(db_path)} v{version} {description}')
+        finally:
+            con.close()
+        _migrated.add(key)
+        return current
+
+
+def migrate_membership_db(db_path: Optional[str] = None) -> int:
+    return migrate(db_path or get_settings().MEMBERSHIP_DB_PATH, MEMBERSHIP_MIGRATIONS)
+
+
+def user_db_path(membership_db_path: Optional[str] = None) -> str:
+    """users.db 与 membership.db 位于同一目录"""
+    return os.path.join(os.path.dirname(membership_db_path or get_settings().MEMBERSHIP_DB_PATH), 'users.db')
+
+
+def migrate_user_db(db_path: Optional[str] = None) -> int:
+    return migrate(db_path or user_db_path(), USER_MIGRATIONS)
+
+
+def run_all(membership_db_path: Optional[str] = None) -> None:
+    """启动时调用：迁移 membership.db 和 users.db"""
+    migrate_membership_db(membership_db_path)
+    migrate_user_db(user_db_path(membership_db_path))
+
+
+if __name__ == '__main__':
+    run_all()
@@ -0,0 +1,296 @@
+"""
+交易相关的热点查询
+机器人和 API 共用同一份 SQL，query_plan 检查会对这些语句执行 EXPLAIN QUERY PLAN，确保都能走索引
+"""
+
+# 交易单结束的状态
+FINAL_STATUSES = ('已止盈', '已止损', '带单主动止盈', '带单主动止损')
+
+# 交易单生命周期（trades.lifecycle）
+LIFECYCLE_PENDING = 'pending'    # 待入场：价格尚未到达入场价
+LIFECYCLE_ACTIVE = 'active'      # 持仓中
+LIFECYCLE_PARTIAL = 'partial'    # 部分出局，剩余仓位仍持有
+LIFECYCLE_CLOSED = 'closed'      # 已结束（止盈/止损/手动结单）
+
+# 交易单列表的状态分组（/api/trades?status=）
+LIFECYCLE_GROUPS = {
+    'pending': (LIFECYCLE_PENDING,),
+    'active': (LIFECYCLE_ACTIVE, LIFECYCLE_PARTIAL),
+    'open': (LIFECYCLE_PENDING, LIFECYCLE_ACTIVE, LIFECYCLE_PARTIAL),  # 未结束（待入场 + 持仓中）
+    'ended': (LIFECYCLE_CLOSED,),
+}
+
+
+def is_partial_status(status) -> bool:
+    """更新状态是否为部分出局（写入 trade_updates.is_partial，替代 LIKE '%部分%' 查询）"""
+    return bool(status) and '部分' in status
+
+
+def lifecycle_for_status(status) -> str:
+    """由展示状态推导生命周期"""
+    if status == '待入场':
+        return LIFECYCLE_PENDING
+    if status in FINAL_STATUSES:
+        return LIFECYCLE_CLOSED
+    if is_partial_status(status):
+        return LIFECYCLE_PARTIAL
+    return LIFECYCLE_ACTIVE
+
+
+# 生命周期只能前进：已结束不再变化，部分出局后的浮盈/浮亏仍保持 partial
+UPDATE_TRADE_LIFECYCLE = """
+    UPDATE trades SET
+        lifecycle = CASE
+            WHEN lifecycle = 'closed' THEN lifecycle
+            WHEN lifecycle = 'partial' AND :lifecycle IN ('active', 'pending') THEN lifecycle
+            ELSE :lifecycle
+        END,
+        closed_at = CASE WHEN lifecycle != 'closed' AND :lifecycle = 'closed' THEN :now ELSE closed_at END,
+        final_pnl = CASE WHEN lifecycle != 'closed' AND :lifecycle = 'closed' THEN :pnl ELSE final_pnl END
+    WHERE id = :trade_id
+"""
+
+
+def next_lifecycle(current: str, status: str) -> str:
+    """与 UPDATE_TRADE_LIFECYCLE 相同的推进规则（内存中的交易单使用）"""
+    target = lifecycle_for_status(status)
+    if current == LIFECYCLE_CLOSED:
+        return current
+    if current == LIFECYCLE_PARTIAL and target in (LIFECYCLE_ACTIVE, LIFECYCLE_PENDING):
+        return current
+    return target
+
+
+def update_lifecycle(con, trade_id: int, status: str, pnl_points, now: int):
+    """在写入状态明细的同一事务中同步交易单生命周期"""
+    con.execute(UPDATE_TRADE_LIFECYCLE, {
+        'lifecycle': lifecycle_for_status(status),
+        'now': now,
+        'pnl': pnl_points,
+        'trade_id': trade_id,
+    })
+
+
+# 带单员在该频道最近一笔未结束的交易单（更新消息关联用）
+LATEST_OPEN_TRADE = """
+    SELECT id, entry_price, take_profit, stop_loss, side, symbol FROM trades
+    WHERE trader_id=? AND channel_id=? AND lifecycle IN ('pending', 'active', 'partial')
+    ORDER BY created_at DESC LIMIT 1
+"""
+
+# 未结束交易单及其当前状态（启动时加载到内存）；有统计信息时优化器会认为 3 种生命周期占大部分行而改为全表扫描，这里固定走生命周期索引
+OPEN_TRADES_WITH_STATUS = """
+    SELECT t.id, t.trader_id, t.channel_id, t.symbol, t.side, t.entry_price, t.take_profit, t.stop_loss, t.lifecycle,
+           ts.status, ts.pnl_points, ts.pnl_percent, ts.current_price
+    FROM trades t INDEXED BY idx_trades_lifecycle_created
+    LEFT JOIN trade_status_detail ts ON ts.trade_id = t.id
+    WHERE t.lifecycle IN ('pending', 'active', 'partial')
+"""
+
+# 单笔交易单及其当前状态（消息写入后刷新内存）
+TRADE_WITH_STATUS = """
+    SELECT t.id, t.trader_id, t.channel_id, t.symbol, t.side, t.entry_price, t.take_profit, t.stop_loss, t.lifecycle,
+           ts.status, ts.pnl_points, ts.pnl_percent, ts.current_price
+    FROM trades t
+    LEFT JOIN trade_status_detail ts ON ts.trade_id = t.id
+    WHERE t.id = ?
+"""
+
+# 未结束交易单的 id（与内存对账，发现 API 手动结单/删除的交易单）
+OPEN_TRADE_IDS = """
+    SELECT id FROM trades WHERE lifecycle IN ('pending', 'active', 'partial')
+"""
+
+# 批量写回状态：交易单已被删除或已结束（例如 API 手动结单）时不覆盖
+UPSERT_OPEN_TRADE_STATUS = """
+    INSERT INTO trade_status_detail(trade_id, status, pnl_points, pnl_percent, current_price, updated_at)
+    SELECT :trade_id, :status, :pnl_points, :pnl_percent, :current_price, :now
+    WHERE EXISTS (SELECT 1 FROM trades WHERE id = :trade_id AND lifecycle != 'closed')
+    ON CONFLICT(trade_id) DO UPDATE SET
+        status=excluded.status,
+        pnl_points=excluded.pnl_points,
+        pnl_percent=excluded.pnl_percent,
+        current_price=excluded.current_price,
+        updated_at=excluded.updated_at
+"""
+
+# 交易单最近一次部分出局记录
+LATEST_PARTIAL_EXIT = """
+    SELECT status, pnl_points, created_at FROM trade_updates
+    WHERE trade_ref_id=? AND is_partial=1
+    ORDER BY created_at DESC LIMIT 1
+"""
+
+# 交易单详情页的全部更新记录
+TRADE_UPDATES_FOR_TRADE = """
+    SELECT id, text, status, pnl_points, created_at
+    FROM trade_updates
+    WHERE trade_ref_id = ?
+    ORDER BY created_at DESC
+"""
+
+# 交易单列表/详情：事件投影 + 实时状态（浮盈/浮亏、当前价），派生字段在同一条语句中计算：
+#   待入场   不计算盈亏（当前价由 API 用实时价格填充）
+#   已结束   使用结束事件中的最终盈亏和平仓价，不再随行情变化
+#   部分出局 总盈亏 = 已出局部分（部分出局事件） + 剩余部分（实时状态）
+#   持仓中   浮盈/浮亏等实时状态由机器人写入 trade_status_detail
+# 列顺序: 交易单字段(0-9), created_at_str, lifecycle, display_status, display_price, total_pnl, total_pnl_percent,
+#         exited_pnl_points, remaining_pnl_points
+TRADE_LISTING = """
+    SELECT p.trade_id, p.trader_id, p.channel_id, p.symbol, p.side,
+           p.entry_price, p.take_profit, p.stop_loss, p.confidence, p.created_at,
+           CASE WHEN p.created_at THEN strftime('%Y-%m-%d %H:%M:%S', p.created_at, 'unixepoch', '+8 hours')
+                ELSE '' END AS created_at_str,
+           p.lifecycle,
+           CASE p.lifecycle
+               WHEN 'pending' THEN '待入场'
+               WHEN 'closed' THEN p.status
+               WHEN 'partial' THEN p.status
+               ELSE COALESCE(NULLIF(ts.status, ''), p.status)
+           END AS display_status,
+           CASE WHEN p.lifecycle = 'closed'
+                THEN COALESCE(NULLIF(p.close_price, 0), NULLIF(ts.current_price, 0), p.entry_price)
+                ELSE ts.current_price END AS display_price,
+           CASE
+               WHEN p.lifecycle = 'pending' THEN NULL
+               WHEN p.lifecycle = 'closed' AND p.final_pnl IS NOT NULL THEN p.final_pnl
+               WHEN p.lifecycle = 'partial' AND p.exited_pnl IS NOT NULL
+                   THEN p.exited_pnl + COALESCE(ts.pnl_points, 0)
+               ELSE ts.pnl_points
+           END AS total_pnl,
+           CASE
+               WHEN p.lifecycle = 'pending' THEN NULL
+               WHEN p.lifecycle = 'closed' AND p.final_pnl IS NOT NULL
+                   THEN CASE WHEN p.entry_price > 0 THEN CAST(p.final_pnl AS REAL) / p.entry_price * 100 END
+               WHEN p.lifecycle = 'partial' AND p.exited_pnl IS NOT NULL
+                   THEN CASE WHEN p.entry_price > 0
+                             THEN CAST(p.exited_pnl + COALESCE(ts.pnl_points, 0) AS REAL) / p.entry_price * 100
+                             ELSE 0 END
+               ELSE ts.pnl_percent
+           END AS total_pnl_percent,
+           CASE WHEN p.lifecycle = 'partial' AND p.exited_pnl IS NOT NULL THEN p.exited_pnl END AS exited_pnl_points,
+           CASE WHEN p.lifecycle = 'partial' AND p.exited_pnl IS NOT NULL THEN COALESCE(ts.pnl_points, 0) END
+               AS remaining_pnl_points
+    FROM trade_projection p
+    LEFT JOIN trade_status_detail ts ON ts.trade_id = p.trade_id
+"""
+
+def trade_listing_page(conditions) -> str:
+    """/api/trades 的分页语句：TRADE_LISTING + 筛选条件 + 按 (created_at, trade_id) 倒序，末尾参数为 LIMIT"""
+    query = TRADE_LISTING
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return query + " ORDER BY p.created_at DESC, p.trade_id DESC LIMIT ?"
+
+
+def trade_listing_by_ids(count: int) -> str:
+    """按 trade_id 批量读取列表行（/api/trades/stats 的最新未结束交易单）"""
+    return TRADE_LISTING + f" WHERE p.trade_id IN ({','.join('?' * count)}) ORDER BY p.created_at DESC, p.trade_id DESC"
+
+
+# 按带单员汇总（首页概览卡片 / 带单员页统计栏）。汇总拆成几条语句：
+#   TRADE_OPEN_STATS     未结束交易单，派生字段与列表相同（浮盈/浮亏、实时盈亏），开销与未结束交易单数量有关；
+#                        GROUP BY +trader_id 使分组不能借用 (trader_id, …) 索引的顺序，否则有统计信息时会遍历整个索引
+#   TRADE_CLOSED_TOTALS  已结束交易单读 trade_closed_totals 汇总表（账本在结单/删除时增量维护），开销与带单员数量有关
+#   TRADE_CLOSED_STATS   带时间范围筛选时汇总表无法使用，才扫描已结束交易单
+#   TRADE_LATEST_OPEN    每个带单员、每种未结束状态最新的若干单，走 (trader_id, lifecycle, created_at) 索引
+# {where} 为 TRADE_LISTING 的筛选条件（不含 WHERE），{listing} 为 TRADE_LISTING
+# 列顺序: trader_id, 待入场, 已入场(持仓中+部分出局), 浮盈, 浮亏,
+#         已入场总盈亏, 已入场盈亏比例之和, 已入场盈利单数, 已入场亏损单数
+TRADE_OPEN_STATS = """
+    SELECT trader_id,
+           SUM(lifecycle = 'pending'),
+           SUM(lifecycle IN ('active', 'partial')),
+           SUM(display_status = '浮盈'),
+           SUM(display_status = '浮亏'),
+           SUM(CASE WHEN lifecycle IN ('active', 'partial') THEN total_pnl END),
+           SUM(CASE WHEN lifecycle IN ('active', 'partial') THEN total_pnl_percent END),
+           SUM(lifecycle IN ('active', 'partial') AND COALESCE(total_pnl, 0) >= 0),
+           SUM(lifecycle IN ('active', 'partial') AND COALESCE(total_pnl, 0) < 0)
+    FROM ({listing} WHERE p.lifecycle IN ('pending', 'active', 'partial') {where})
+    GROUP BY +trader_id
+"""
+
+# 已结束交易单的盈亏（与 TRADE_LISTING 的 total_pnl 一致：缺少最终盈亏时取实时状态）
+CLOSED_PNL = "COALESCE(p.final_pnl, ts.pnl_points)"
+
+# 列顺序: trader_id, 已结束数量, 已结束总盈亏；{where} 只能包含 p.trader_id / p.channel_id 条件
+TRADE_CLOSED_TOTALS = """
+    SELECT NULLIF(p.trader_id, ''), SUM(p.closed_count), SUM(p.closed_pnl)
+    FROM trade_closed_totals p
+    WHERE 1 {where}
+    GROUP BY p.trader_id
+"""
+
+TRADE_CLOSED_STATS = f"""
+    SELECT p.trader_id, COUNT(*), SUM({CLOSED_PNL})
+    FROM trade_projection p
+    LEFT JOIN trade_status_detail ts ON ts.trade_id = p.trade_id
+    WHERE p.lifecycle = 'closed' {{where}}
+    GROUP BY p.trader_id
+"""
+
+# 账本结单/删除时增量调整汇总表（delta 为 +1 / -1）；缺少 trader_id / channel_id 时记为空字符串（主键不能为 NULL）
+ADJUST_CLOSED_TOTALS = """
+    INSERT INTO trade_closed_totals(trader_id, channel_id, closed_count, closed_pnl)
+    VALUES(:trader_id, :channel_id, :delta, :delta * :pnl)
+    ON CONFLICT(trader_id, channel_id) DO UPDATE SET
+        closed_count = closed_count + excluded.closed_count,
+        closed_pnl = closed_pnl + excluded.closed_pnl
+"""
+
+# 由投影整体重算汇总表（迁移、重建投影后使用）
+REFRESH_CLOSED_TOTALS = f"""
+    INSERT INTO trade_closed_totals(trader_id, channel_id, closed_count, closed_pnl)
+    SELECT COALESCE(p.trader_id, ''), COALESCE(p.channel_id, ''), COUNT(*), COALESCE(SUM({CLOSED_PNL}), 0)
+    FROM trade_projection p
+    LEFT JOIN trade_status_detail ts ON ts.trade_id = p.trade_id
+    WHERE p.lifecycle = 'closed'
+    GROUP BY 1, 2
+"""
+
+TRADE_LATEST_OPEN = """
+    SELECT p.trade_id, p.created_at FROM trade_projection p
+    WHERE p.trader_id = ? AND p.lifecycle = ? {where}
+    ORDER BY p.created_at DESC, p.trade_id DESC LIMIT ?
+"""
+
+# 重建投影时按顺序读取事件
+TRADE_EVENTS_AFTER = """
+    SELECT id, trade_id, event_type, status, price, pnl_points, data, created_at
+    FROM trade_events WHERE id > ? ORDER BY id
+"""
+
+# 回复引用关联：被回复的消息是入场消息（唯一索引，同频道）
+TRADE_BY_SOURCE_MESSAGE = """
+    SELECT id, entry_price, take_profit, stop_loss, side, symbol FROM trades
+    WHERE source_message_id = ? AND channel_id = ?
+"""
+
+TRADE_BY_ID = """
+    SELECT id, entry_price, take_profit, stop_loss, side, symbol FROM trades WHERE id = ?
+"""
+
+# 被回复的消息是已保存的更新消息：取其关联的交易单，或继续沿回复链向上查找
+UPDATE_BY_SOURCE_MESSAGE = """
+    SELECT trade_ref_id, reply_to_message_id FROM trade_updates
+    WHERE source_message_id = ? AND channel_id = ?
+    ORDER BY id DESC LIMIT 1
+"""
+
+# 消息是否已处理（已创建交易单或已保存为更新记录），补拉时去重
+MESSAGE_PROCESSED = """
+    SELECT 1 FROM trades WHERE source_message_id = :message_id
+    UNION ALL
+    SELECT 1 FROM trade_updates WHERE source_message_id = :message_id
+    LIMIT 1
+"""
+
+# 最近一段时间内处理最慢的消息（管理后台排查信号延迟）
+SLOWEST_MESSAGE_TRACES = """
+    SELECT message_id, channel_id, trader_id, source, result, created_at, received_at, lag_ms, total_ms, spans
+    FROM message_traces
+    WHERE received_at >= ?
+    ORDER BY total_ms DESC
+    LIMIT ?
+"""
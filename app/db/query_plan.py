@@ -0,0 +1,177 @@
+"""
+热点查询执行计划检查
+对 app.db.queries 中的语句（以及 API 实际拼出的列表/汇总语句）执行 EXPLAIN QUERY PLAN，
+出现全表扫描（SCAN，包括遍历整个索引）且不在 ALLOWED_SCANS 中时返回非零退出码
+
+用法: python -m app.db.query_plan [数据库路径]
+不指定数据库时在临时库上执行全部迁移后检查两遍：没有统计信息（线上库未执行 ANALYZE 时的计划），
+以及写入按 10 万笔交易单估算的 sqlite_stat1 后（执行过 ANALYZE 的大库上的计划）
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+from typing import Dict, List, Tuple, Union
+
+from app.db import queries
+from app.db.migrations import MEMBERSHIP_MIGRATIONS, migrate
+
+_CURSOR = '(p.created_at, p.trade_id) < (?, ?)'
+
+
+def _lifecycles(group: str) -> str:
+    return f"p.lifecycle IN ({','.join('?' * len(queries.LIFECYCLE_GROUPS[group]))})"
+
+
+# (名称, SQL, 参数)
+HOT_QUERIES: List[Tuple[str, str, Union[tuple, dict]]] = [
+    ('latest_open_trade', queries.LATEST_OPEN_TRADE, ('trader', 'channel')),
+    ('latest_partial_exit', queries.LATEST_PARTIAL_EXIT, (1,)),
+    ('trade_updates_for_trade', queries.TRADE_UPDATES_FOR_TRADE, (1,)),
+    ('open_trades_with_status', queries.OPEN_TRADES_WITH_STATUS, ()),
+    ('trade_with_status', queries.TRADE_WITH_STATUS, (1,)),
+    ('open_trade_ids', queries.OPEN_TRADE_IDS, ()),
+    ('trade_projection_by_id', queries.TRADE_LISTING + ' WHERE p.trade_id = ?', (1,)),
+    # /api/trades 的分页语句（与 trade_filters 生成的条件相同）：首页不带游标，翻页带 (created_at, trade_id) 游标
+    ('trade_listing_first_page', queries.trade_listing_page([]), (101,)),
+    ('trade_listing_page', queries.trade_listing_page([_CURSOR]), (0, 0, 101)),
+    ('trade_listing_page_by_trader', queries.trade_listing_page(['p.trader_id = ?']), ('trader', 101)),
+    ('trade_listing_page_by_channel', queries.trade_listing_page(['p.channel_id = ?', _CURSOR]), ('channel', 0, 0, 101)),
+    ('trade_listing_page_pending', queries.trade_listing_page([_lifecycles('pending')]), ('pending', 101)),
+    ('trade_listing_page_ended', queries.trade_listing_page([_lifecycles('ended'), _CURSOR]), ('closed', 0, 0, 101)),
+    ('trade_listing_page_active', queries.trade_listing_page([_lifecycles('active')]),
+     queries.LIFECYCLE_GROUPS['active'] + (101,)),
+    ('trade_listing_page_active_cursor', queries.trade_listing_page([_lifecycles('active'), _CURSOR]),
+     queries.LIFECYCLE_GROUPS['active'] + (0, 0, 101)),
+    ('trade_listing_page_open', queries.trade_listing_page([_lifecycles('open')]),
+     queries.LIFECYCLE_GROUPS['open'] + (101,)),
+    ('trade_listing_page_open_cursor', queries.trade_listing_page([_lifecycles('open'), _CURSOR]),
+     queries.LIFECYCLE_GROUPS['open'] + (0, 0, 101)),
+    ('trade_listing_page_by_trader_ended',
+     queries.trade_listing_page(['p.trader_id = ?', _lifecycles('ended'), _CURSOR]), ('trader', 'closed', 0, 0, 101)),
+    ('trade_listing_page_by_trader_open', queries.trade_listing_page(['p.trader_id = ?', _lifecycles('open')]),
+     ('trader',) + queries.LIFECYCLE_GROUPS['open'] + (101,)),
+    ('trade_listing_page_by_symbol',
+     queries.trade_listing_page(['p.symbol = ?', 'p.created_at >= ?', 'p.created_at < ?']), ('BTC-USDT-SWAP', 0, 0, 101)),
+    ('trade_listing_page_by_side', queries.trade_listing_page(['p.side = ?']), ('long', 101)),
+    # /api/trades/stats：首页不带筛选条件，带单员页按 trader_id 筛选
+    ('trade_open_stats', queries.TRADE_OPEN_STATS.format(listing=queries.TRADE_LISTING, where=''), ()),
+    ('trade_open_stats_by_trader',
+     queries.TRADE_OPEN_STATS.format(listing=queries.TRADE_LISTING, where=' AND p.trader_id = ?'), ('trader',)),
+    ('trade_open_stats_by_channel',
+     queries.TRADE_OPEN_STATS.format(listing=queries.TRADE_LISTING, where=' AND p.channel_id = ?'), ('channel',)),
+    ('trade_closed_totals', queries.TRADE_CLOSED_TOTALS.format(where=''), ()),
+    ('trade_closed_totals_by_trader', queries.TRADE_CLOSED_TOTALS.format(where=' AND p.trader_id = ?'), ('trader',)),
+    ('trade_closed_stats_since', queries.TRADE_CLOSED_STATS.format(where=' AND p.created_at >= ?'), (0,)),
+    ('trade_closed_stats_by_trader_range',
+     queries.TRADE_CLOSED_STATS.format(where=' AND p.trader_id = ? AND p.created_at >= ? AND p.created_at < ?'),
+     ('trader', 0, 0)),
+    ('trade_latest_open', queries.TRADE_LATEST_OPEN.format(where=''), ('trader', 'active', 3)),
+    ('trade_listing_by_ids', queries.trade_listing_by_ids(3), (1, 2, 3)),
+    ('trade_events_after', queries.TRADE_EVENTS_AFTER, (0,)),
+    ('trade_by_source_message', queries.TRADE_BY_SOURCE_MESSAGE, ('1', 'channel')),
+    ('update_by_source_message', queries.UPDATE_BY_SOURCE_MESSAGE, ('1', 'channel')),
+    ('message_processed', queries.MESSAGE_PROCESSED, {'message_id': '1'}),
+    ('slowest_message_traces', queries.SLOWEST_MESSAGE_TRACES, (0, 50)),
+]
+
+# 允许的遍历（查询名 -> SCAN 明细前缀），用于确实需要遍历的查询：
+#   trade_listing_first_page / _active / _open  按创建时间索引倒序遍历，取满一页（LIMIT）即停止；
+#       多个生命周期的分组有统计信息时走这个计划（未结束交易单占比高时比生命周期索引 + 排序快）
+#   trade_closed_totals  汇总表每个 (带单员, 频道) 一行
+_ORDERED_PAGE = ('SCAN p USING INDEX idx_trade_projection_created',)
+ALLOWED_SCANS: Dict[str, Tuple[str, ...]] = {
+    'trade_listing_first_page': _ORDERED_PAGE,
+    'trade_listing_page_active': _ORDERED_PAGE,
+    'trade_listing_page_open': _ORDERED_PAGE,
+    'trade_closed_totals': ('SCAN p USING INDEX sqlite_autoindex_trade_closed_totals_1',),
+}
+
+
+def explain(con: sqlite3.Connection, sql: str, params) -> List[str]:
+    return [row[-1] for row in con.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+
+
+def find_full_scans(name: str, plan: List[str]) -> List[str]:
+    allowed = ALLOWED_SCANS.get(name, ())
+    bad = []
+    for detail in plan:
+        if not detail.startswith('SCAN '):
+            continue
+        if any(detail.startswith(a) for a in allowed):
+            continue
+        # 覆盖索引的 SCAN 仍然是遍历整个索引，同样视为全表扫描
+        bad.append(detail)
+    return bad
+
+
+# 估算统计信息：表行数（未列出的表按 _STAT_ROWS）和各列不同取值的数量（未列出的列视为唯一）
+_STAT_ROWS = 100000
+_STAT_TABLE_ROWS = {
+    'trade_closed_totals': 400, 'channel_cursors': 20, 'trade_status': 20, 'projection_snapshots': 3,
+    'schema_version': 20, 'users': 10000,
+}
+_STAT_DISTINCT = {
+    'lifecycle': 4, 'trader_id': 20, 'channel_id': 20, 'symbol': 20, 'side': 2, 'is_partial': 2, 'status': 10,
+}
+
+
+def seed_stats(db_path: str):
+    """按估算的规模写入 sqlite_stat1（相当于在 10 万笔交易单的库上执行过 ANALYZE）"""
+    con = sqlite3.connect(db_path)
+    try:
+        con.execute("ANALYZE sqlite_master")
+        con.execute("DELETE FROM sqlite_stat1")
+        tables = [r[0] for r in con.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
+        ).fetchall()]
+        for table in tables:
+            rows = _STAT_TABLE_ROWS.get(table, _STAT_ROWS)
+            con.execute("INSERT INTO sqlite_stat1(tbl, idx, stat) VALUES(?, NULL, ?)", (table, str(rows)))
+            for index in con.execute(f"PRAGMA index_list({table})").fetchall():
+                columns = [r[2] for r in con.execute(f"PRAGMA index_info({index[1]})").fetchall()]
+                stat, distinct = [str(rows)], 1
+                for column in columns:
+                    distinct = min(rows, distinct * _STAT_DISTINCT.get(column, rows))
+                    stat.append(str(max(1, rows // distinct)))
+                con.execute("INSERT INTO sqlite_stat1(tbl, idx, stat) VALUES(?, ?, ?)", (table, index[1], ' '.join(stat)))
+        con.commit()
+    finally:
+        con.close()
+
+
+def check(db_path: str) -> bool:
+    con = sqlite3.connect(db_path)
+    ok = True
+    try:
+        for name, sql, params in HOT_QUERIES:
+            plan = explain(con, sql, params)
+            bad = find_full_scans(name, plan)
+            mark = '❌' if bad else '✅'
+            print(f'{mark} {name}')
+            for detail in plan:
+                print(f'    {detail}')
+            if bad:
+                ok = False
+                print(f'    全表扫描: {"; ".join(bad)}')
+    finally:
+        con.close()
+    return ok
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        return 0 if check(argv[0]) else 1
+    db_path = os.path.join(tempfile.mkdtemp(prefix='query_plan_'), 'membership.db')
+    migrate(db_path, MEMBERSHIP_MIGRATIONS)
+    print('== 无统计信息 ==')
+    ok = check(db_path)
+    seed_stats(db_path)
+    print(f'== 估算统计信息（{_STAT_ROWS} 笔交易单） ==')
+    ok = check(db_path) and ok
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
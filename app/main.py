@@ -2,11 +2,14 @@ import threading
 import discord
 from app.config.settings import get_settings
 from app.bots.discord_bot import create_discord_bot, setup_discord_bot
+from app.db import migrations
 
 def run_discord_bot():
     settings = get_settings()
     token = settings.DISCORD_BOT_TOKEN
     if token:
+        # 启动前执行一次数据库迁移，之后的消息处理只做数据读写
+        migrations.run_all(settings.MEMBERSHIP_DB_PATH)
         bot = create_discord_bot(token)
         setup_discord_bot(bot, token)
         try:
@@ -29,7 +32,7 @@ def main():
     print('=== Discord 机器人启动器 ===')
 
     if settings.ENABLE_DISCORD and settings.DISCORD_BOT_TOKEN:
-        dt = threading.Thread(target=run_discord_bot, daemon=True)
+        dt = threading.Thread(target=run_discord_bot, daemon=True, name='discord-bot')
         dt.start()
 
         print('Discord 机器人已启动，按Ctrl+C退出...')
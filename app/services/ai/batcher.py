@@ -0,0 +1,62 @@
+"""
+消息解析微批处理
+带单员经常在几秒内连发多条消息，把短时间窗口内到达的消息合并成一次 LLM 请求，摊薄系统提示词的 token 和连接开销
+"""
+import asyncio
+from typing import Dict, List, Optional, Set, Tuple
+
+
+class TradeParseBatcher:
+    """收集窗口期内的消息，合并为一次 extract_trades_batch 调用，再把结果分发回每条消息"""
+
+    def __init__(self, ai, window_ms: int = 1500, max_batch: int = 6):
+        self.ai = ai
+        self.window = max(0, window_ms) / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._pending: List[Tuple[str, str, Optional[str], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # 事件循环只持有任务的弱引用：保留正在执行的批次，避免被回收，也让 close() 能等它们结束
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, message_id: str, text: str, trader_id: Optional[str] = None) -> Optional[Dict]:
+        """提交一条消息，等待所在批次解析完成后返回该消息的结果"""
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((message_id, text, trader_id, fut))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await fut
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, str, Optional[str], asyncio.Future]]):
+        items = [(mid, text) for mid, text, _, _ in batch]
+        trader_ids = {mid: tid for mid, _, tid, _ in batch}
+        if len(batch) > 1:
+            print(f'[Batcher] 📦 合并 {len(batch)} 条消息为一次解析请求')
+        try:
+            # 同步 HTTP 请求放到线程中执行，避免阻塞事件循环
+            results = await asyncio.to_thread(self.ai.extract_trades_batch, items, trader_ids)
+        except Exception as e:
+            print(f'[Batcher] ❌ 批量解析异常: {e}')
+            results = {}
+        # 按提交顺序设置结果，保证同一批次内的消息按到达顺序继续处理
+        for mid, _, _, fut in batch:
+            if not fut.done():
+                fut.set_result(results.get(mid))
+
+    async def close(self):
+        """立即处理剩余的消息，并等待所有批次完成（卸载时调用，之后才能关闭线程池）"""
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -1,232 +1,457 @@
+import json
+import logging
+import re
+import threading
+import time
 import requests
-from typing import Optional, Dict
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Optional, Dict, List, Tuple
 from app.config.settings import get_settings
+from app.services.ai.json_stream import IncrementalJSONScanner
+from app.services.ai.hedge import LLMEndpoint, HedgedCaller
+from app.services.ai.prompts import PROMPT_VERSION, PROMPT_FINGERPRINT, TRADE_SYSTEM_PROMPT, BATCH_SYSTEM_PROMPT
+from app.services.ai.usage import UsageRecorder, parse_usage
+from app.utils.logs import setup_monitor_logging, Truncated
+from app.utils import metrics
+
+logger = logging.getLogger('monitor.deepseek')
+
+LLM_SECONDS = metrics.histogram('llm_request_seconds', 'LLM 解析请求耗时（秒，含对冲请求）', ('mode',))
+LLM_REQUESTS = metrics.counter('llm_requests_total', 'LLM 解析请求数', ('mode', 'result'))
+LLM_ENDPOINT_SECONDS = metrics.histogram('llm_endpoint_seconds', '单个 LLM 端点的成功响应耗时（秒）', ('endpoint',))
+LLM_TOKENS = metrics.counter('llm_tokens_total', 'LLM token 用量', ('kind',))
+LLM_USAGE_UNKNOWN = metrics.counter('llm_usage_unknown_total', '未拿到 usage 的 LLM 请求（服务端未返回或流中途断开）', ('endpoint',))
+PARSE_RESULTS = metrics.counter('llm_parse_results_total', '单条消息解析结果', ('result',))
+
+def _iter_stream_lines(r):
+    """逐行读取流式响应；非 chunked 响应上 iter_lines 要凑满 512 字节才返回，改用 read1 有多少读多少，
+    保证 JSON 闭合和对冲取消都能在当前分块就被发现（urllib3 < 2.3 没有 read1 时退回 iter_lines）"""
+    read1 = getattr(r.raw, 'read1', None)
+    if read1 is None:
+        yield from r.iter_lines()
+        return
+    buffered = b''
+    while True:
+        data = read1(8192, decode_content=True)
+        if not data:
+            break
+        *lines, buffered = (buffered + data).split(b'\n')
+        for line in lines:
+            yield line.rstrip(b'\r')
+    if buffered:
+        yield buffered.rstrip(b'\r')
+
 
 class DeepseekClient:
     def __init__(self):
         self.settings = get_settings()
+        setup_monitor_logging()
         self.api_key = self.settings.DEEPSEEK_API_KEY
         self.endpoint = self.settings.DEEPSEEK_ENDPOINT
         self.model = self.settings.DEEPSEEK_MODEL
+        self.primary = LLMEndpoint('primary', self._normalize_endpoint(self.endpoint), self.model, self.api_key)
+        self.endpoint = self.primary.url
+        self.stream = self.settings.DEEPSEEK_STREAM
+        self.usage = UsageRecorder()
+        # 流式响应的 JSON 闭合后先返回解析结果，剩余的流（末尾的 usage 分块）在这里读完后再记录用量
+        self._usage_drain = ThreadPoolExecutor(max_workers=4, thread_name_prefix='llm-usage')
+        self._drains = set()
+        self._drains_lock = threading.Lock()
+
+        # 配置了备用端点时启用对冲请求
+        self.hedger = None
+        fallback_url = self.settings.DEEPSEEK_FALLBACK_ENDPOINT
+        if fallback_url:
+            fallback = LLMEndpoint(
+                'fallback',
+                self._normalize_endpoint(fallback_url),
+                self.settings.DEEPSEEK_FALLBACK_MODEL or self.model,
+                self.settings.DEEPSEEK_FALLBACK_API_KEY or self.api_key,
+            )
+            self.hedger = HedgedCaller(
+                self.primary,
+                fallback,
+                percentile=self.settings.DEEPSEEK_HEDGE_PERCENTILE,
+                default_delay_ms=self.settings.DEEPSEEK_HEDGE_DEFAULT_DELAY_MS,
+                min_delay_ms=self.settings.DEEPSEEK_HEDGE_MIN_DELAY_MS,
+                max_delay_ms=self.settings.DEEPSEEK_HEDGE_MAX_DELAY_MS,
+            )
 
         # 初始化日志
         if self.available():
-            print(f'[Deepseek] ✅ 初始化成功 - 模型: {self.model}, 端点: {self.endpoint}')
+            logger.info('[Deepseek] ✅ 初始化成功 - 模型: %s, 端点: %s, 提示词版本: %s(%s)', self.model, self.endpoint, PROMPT_VERSION, PROMPT_FINGERPRINT)
+            if self.hedger:
+                logger.info('[Deepseek] 🛡️ 对冲请求已启用 - 备用端点: %s, 模型: %s, 分位数: P%g',
+                            self.hedger.secondary.url, self.hedger.secondary.model, self.settings.DEEPSEEK_HEDGE_PERCENTILE)
         else:
-            print('[Deepseek] ❌ 初始化失败 - API密钥未配置')
+            logger.error('[Deepseek] ❌ 初始化失败 - API密钥未配置')
+
+    @staticmethod
+    def _normalize_endpoint(url: Optional[str]) -> Optional[str]:
+        # 确保端点完整（如果只配置了基础URL，自动补全）
+        if url and url.endswith('/') and not url.endswith('/completions'):
+            url = url.rstrip('/') + '/v1/chat/completions'
+            logger.warning('[Deepseek] ⚠️ 自动补全端点URL: %s', url)
+        return url
 
     def available(self) -> bool:
         return bool(self.api_key)
 
-    def extract_trade(self, text: str) -> Optional[Dict]:
-        if not self.available():
-            return None
-        
-        # 记录输入文本
-        print(f'[Deepseek] 📥 收到解析请求，文本长度: {len(text)} 字符')
-        print(f'[Deepseek] 📝 输入文本内容: {text[:500]}{"..." if len(text) > 500 else ""}')
-        
-        prompt = (
-            "你是专业的交易文本解析助手。请从中文交易信号或战报中提取结构化字段。\n\n"
-            "⚠️ 重要判断规则：\n"
-            "1. 如果文本只是总结、反思、道歉、愿景、策略说明等非交易信号内容，返回: {}\n"
-            "2. 如果文本提到\"取消\"、\"休息\"、\"波动小\"、\"无法开单\"等非交易信息，返回: {}\n"
-            "3. 如果文本包含具体的交易对、价格、方向、止盈止损等交易信号，才进行提取\n"
-            "4. 如果文本是回复/引用之前的消息，且包含止盈/止损/出局信息，必须提取\n"
-            "5. 如果文本包含\"出局\"、\"部分出局\"、\"出局XX%\"、\"剩余\"、\"继续持有\"、\"设置止损\"等关键词，必须识别为更新信号\n"
-            "6. 如果文本中出现「合约策略（限价）」、「具体产品」、「进行方向」、「进场点位」、「止损点位」、「止盈点位」等字段，且给出了具体价格，一定要解析为入场信号（type=\"entry\"）。\n"
-            "7. 如果文本中出现「补仓」、「补货」、「加仓」等字样，一定要识别为更新信号（type=\"update\"），并在 status 字段中体现，例如: \"补仓\"、\"补货\"、\"加仓\"。\n\n"
-            "只返回纯JSON格式，不要包含任何markdown代码块、解释文字或其他内容。\n\n"
-            "如果是入场信号（包含交易对、进场价、止盈、止损），输出JSON格式: {\n"
-            "  \"type\": \"entry\",\n"
-            "  \"symbol\": \"交易对名称（如BTC-USDT-SWAP，如果文本中提到比特币/BTC则使用BTC-USDT-SWAP，提到以太坊/ETH则使用ETH-USDT-SWAP）\",\n"
-            "  \"side\": \"long\" 或 \"short\"（做多或做空，空单/做空/卖出=short，多单/做多/买入=long），\n"
-            "  \"entry_price\": 进场价格（数字，从文本中提取，如\"现价87400附近\"则提取87400，\"现价2806附近\"则提取2806，\"2806附近\"则提取2806），\n"
-            "  \"take_profit\": 止盈价格（数字，从文本中提取，如\"止盈:2650\"则提取2650，\"止盈2650\"则提取2650），\n"
-            "  \"stop_loss\": 止损价格（数字，从文本中提取，如\"止损:2870\"则提取2870，\"止损2870\"则提取2870）\n"
-            "}\n\n"
-            "📝 解析示例：\n"
-            "示例1: \"以太坊现价2806附近做空\\n\\n止盈:2650\\n\\n止损:2870\\n\\n轻仓介入！！！\"\n"
-            "应解析为: {\"type\":\"entry\",\"symbol\":\"ETH-USDT-SWAP\",\"side\":\"short\",\"entry_price\":2806,\"take_profit\":2650,\"stop_loss\":2870}\n\n"
-            "示例2: \"BTC现价87400附近做多 止盈90000 止损86000\"\n"
-            "应解析为: {\"type\":\"entry\",\"symbol\":\"BTC-USDT-SWAP\",\"side\":\"long\",\"entry_price\":87400,\"take_profit\":90000,\"stop_loss\":86000}\n\n"
-            "示例3: \"eth 1800 多单 止盈：4900，止损1600\"\n"
-            "应解析为: {\"type\":\"entry\",\"symbol\":\"ETH-USDT-SWAP\",\"side\":\"long\",\"entry_price\":1800,\"take_profit\":4900,\"stop_loss\":1600}\n\n"
-            "示例4: \"合约策略（限价）\\n\\n具体产品：BTC\\n\\n进行方向：做多\\n\\n进场点位：91530\\n\\n止损点位：89710\\n\\n止盈点位：96216\"\n"
-            "应解析为: {\"type\":\"entry\",\"symbol\":\"BTC-USDT-SWAP\",\"side\":\"long\",\"entry_price\":91530,\"take_profit\":96216,\"stop_loss\":89710}\n\n"
-            "如果是出场/止盈/止损/全部出局/部分出局更新（包含以下任一关键词：出局、止盈、止损、获利、亏损、部分出局、出局XX%、剩余、继续持有、设置止损、成本价等），输出JSON格式: {\n"
-            "  \"type\": \"update\",\n"
-            "  \"status\": \"已止盈\"|\"已止损\"|\"带单主动止盈\"|\"带单主动止损\"|\"部分止盈\"|\"部分止损\"|\"部分出局\"|\"浮盈\"|\"浮亏\",\n"
-            "  \"pnl_points\": 盈亏点数（数字，如\"获利1400点\"则提取1400，\"亏损500点\"则提取-500。如果是部分出局，根据出局价格和进场价计算，例如：空单进场价92550，出局价90300，则盈亏为92550-90300=2250点）\n"
-            "}\n\n"
-            "⚠️ 特别注意（这些情况必须识别为更新信号）：\n"
-            "- \"出局XX%\"（如\"出局70%\"、\"出局50%\"）→ status: \"部分止盈\"或\"部分出局\"\n"
-            "- \"部分出局\"、\"部分止盈\"、\"部分止损\"→ status: 对应状态\n"
-            "- \"剩余部分继续持有\"、\"剩下部分\"、\"剩余XX%\"→ status: \"部分止盈\"或\"部分出局\"\n"
-            "- \"设置成本价XX止损\"、\"设置止损\"、\"止损调整为XX\"→ status: \"浮盈\"或\"浮亏\"（表示更新止损）\n"
-            "- \"现价XX出局\"、\"XX价格出局\"→ status: \"已止盈\"或\"已止损\"（根据盈亏判断）\n"
-            "- \"补仓\"、\"补货\"、\"加仓\"→ 一律识别为更新信号（type: \"update\"），在 status 中体现（例如: \"补仓\"），如果可以的话，也在额外字段中说明补仓价格和次数。\n"
-            "- 即使消息没有明确提到交易对，只要包含上述关键词和价格信息，也要识别为更新信号\n\n"
-            "若文本只是总结、反思、道歉、策略说明、取消交易等非交易信号内容，返回: {}\n\n"
-            "只返回JSON，不要有任何其他文字、markdown标记或解释。"
-        )
+    def _request_content(self, system_prompt: str, user_content: str, expect: str = 'object',
+                         trader_ids: Optional[List[Optional[str]]] = None) -> Optional[str]:
+        """发送聊天补全请求，返回模型输出的文本内容（请求失败返回 None）
+
+        system_prompt 必须是 prompts 模块中的常量，消息内容只放在最后的 user 消息里，保证请求前缀字节稳定。
+        """
+        mode = 'batch' if expect == 'array' else 'single'
+        content = None
+        with LLM_SECONDS.time(mode=mode):
+            try:
+                if self.hedger:
+                    content = self.hedger.call(
+                        lambda endpoint, cancel: self._request_endpoint(endpoint, system_prompt, user_content, expect, cancel, trader_ids)
+                    )
+                else:
+                    content = self._request_endpoint(self.primary, system_prompt, user_content, expect, None, trader_ids)
+            finally:
+                LLM_REQUESTS.inc(mode=mode, result='error' if content is None else 'ok')
+        return content
+
+    def _request_endpoint(self, endpoint: LLMEndpoint, system_prompt: str, user_content: str,
+                          expect: str = 'object', cancel: Optional[threading.Event] = None,
+                          trader_ids: Optional[List[Optional[str]]] = None) -> Optional[str]:
+        """向单个端点发送请求；cancel 被设置时放弃结果（对冲请求中落败的一方）"""
+        # 对冲请求总是流式：非流式请求在服务端生成完之前一直阻塞在读取上，落败后无法中断，
+        # 会占住对冲线程池的线程直到超时；流式响应每个分块检查一次 cancel 并关闭连接
+        stream = self.stream or cancel is not None
+        started = time.monotonic()
         body = {
-            "model": self.model,
+            "model": endpoint.model,
             "messages": [
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": text},
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_content},
             ]
         }
+        if stream:
+            body["stream"] = True
+            # 要求在流的最后一个分块中返回 usage（JSON 闭合后由后台线程继续读到流末尾）
+            body["stream_options"] = {"include_usage": True}
+        headers = {"Authorization": f"Bearer {endpoint.api_key}", "Content-Type": "application/json"}
+        
+        # 验证端点URL
+        if not endpoint.url or not endpoint.url.startswith('http'):
+            logger.error('[Deepseek] ❌ API端点配置错误: %s', endpoint.url)
+            return None
+        
+        logger.debug('[Deepseek] 🚀 发送API请求到: %s', endpoint.url)
+        logger.debug('[Deepseek] 📤 提示词版本: %s(%s), 消息长度: %d 字符', PROMPT_VERSION, PROMPT_FINGERPRINT, len(user_content))
+        
+        r = requests.post(endpoint.url, json=body, headers=headers, timeout=30, stream=stream)
+        
+        if cancel is not None and cancel.is_set():
+            r.close()
+            logger.info('[Deepseek] ⏹️ 端点 %s 的请求已被对冲取消', endpoint.name)
+            return None
+        
+        logger.debug('[Deepseek] 📥 API响应状态码: %s', r.status_code)
+        
+        if r.status_code != 200:
+            logger.error('[Deepseek] ❌ API请求失败: %s', r.status_code)
+            logger.error('[Deepseek] ❌ 端点: %s', endpoint.url)
+            logger.error('[Deepseek] ❌ 响应内容前500字符: %s', r.text[:500])
+            # 如果返回的是HTML，说明端点可能不对
+            if r.text.strip().startswith('<!DOCTYPE') or r.text.strip().startswith('<html'):
+                logger.warning('[Deepseek] ⚠️ API返回了HTML而不是JSON，请检查端点配置是否正确')
+                logger.warning('[Deepseek] ⚠️ 当前端点: %s', endpoint.url)
+                logger.warning('[Deepseek] ⚠️ 正确的端点应该是类似: https://api.v3.cm/v1/chat/completions')
+            return None
+        
+        if stream:
+            content, usage, rest = self._read_stream(r, expect, cancel)
+            latency_ms = (time.monotonic() - started) * 1000
+            if content is not None:
+                if rest is None:
+                    self._record_usage(endpoint, usage, trader_ids, latency_ms)
+                else:
+                    drain = self._usage_drain.submit(self._drain_usage, r, rest, endpoint, trader_ids, latency_ms)
+                    with self._drains_lock:
+                        self._drains.add(drain)
+                    drain.add_done_callback(self._drain_done)
+            return content
+        
+        # 检查响应是否为JSON
         try:
-            headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
-            
-            # 验证端点URL
-            if not self.endpoint or not self.endpoint.startswith('http'):
-                print(f'[Deepseek] ❌ API端点配置错误: {self.endpoint}')
-                return None
-            
-            # 确保端点完整（如果只配置了基础URL，自动补全）
-            if self.endpoint.endswith('/') and not self.endpoint.endswith('/completions'):
-                self.endpoint = self.endpoint.rstrip('/') + '/v1/chat/completions'
-                print(f'[Deepseek] ⚠️ 自动补全端点URL: {self.endpoint}')
-            
-            print(f'[Deepseek] 🚀 发送API请求到: {self.endpoint}')
-            print(f'[Deepseek] 📤 请求体大小: {len(str(body))} 字符')
-            
-            r = requests.post(self.endpoint, json=body, headers=headers, timeout=30)
-            
-            print(f'[Deepseek] 📥 API响应状态码: {r.status_code}')
+            data = r.json()
+        except ValueError as e:
+            logger.error('[Deepseek] ❌ API返回的不是JSON格式: %s', e)
+            logger.error('[Deepseek] ❌ 响应内容: %s', r.text[:500])
+            return None
+        
+        # 检查响应结构
+        if "choices" not in data or not data.get("choices"):
+            logger.warning('[Deepseek] ⚠️ API响应格式异常，缺少choices字段')
+            logger.warning('[Deepseek] ⚠️ 响应内容: %s', data)
+            return None
+        
+        content = data.get("choices", [{}])[0].get("message", {}).get("content", "")
+        
+        # 记录 API 响应的完整内容（用于调试，DEBUG 级别按比例抽样，后台线程中才格式化）
+        logger.debug('[Deepseek] 📥 API返回的完整响应: %s', Truncated(data, 1000))
+        logger.debug('[Deepseek] 📝 API返回的原始内容: %s', Truncated(content))
+        self._record_usage(endpoint, data.get("usage"), trader_ids, (time.monotonic() - started) * 1000)
+        return content or ""
+
+    def _drain_done(self, drain):
+        with self._drains_lock:
+            self._drains.discard(drain)
+
+    def flush_usage(self, timeout: float = 30.0):
+        """等待后台读取 usage 分块的任务完成（评估工具汇总用量前调用）"""
+        with self._drains_lock:
+            pending = list(self._drains)
+        if pending:
+            wait(pending, timeout=timeout)
+
+    def _record_usage(self, endpoint: LLMEndpoint, usage: Optional[Dict], trader_ids: Optional[List[Optional[str]]],
+                      latency_ms: float):
+        """latency_ms 为拿到解析内容的耗时（流式请求不含之后读取 usage 分块的时间）"""
+        prompt, cached, completion = parse_usage(usage)
+        LLM_ENDPOINT_SECONDS.observe(latency_ms / 1000, endpoint=endpoint.name)
+        if prompt is not None:
+            LLM_TOKENS.inc(prompt, kind='prompt')
+            LLM_TOKENS.inc(cached or 0, kind='cached')
+            LLM_TOKENS.inc(completion or 0, kind='completion')
+            logger.info('[Deepseek] 🧮 Token 用量 - 提示: %s (缓存命中: %s), 输出: %s, 耗时: %.0fms', prompt, cached or 0, completion, latency_ms)
+        else:
+            # 服务端没有返回 usage（或流在 usage 分块之前断开）：仍写一行（token 为 NULL），汇总中作为"用量未知"单独统计
+            LLM_USAGE_UNKNOWN.inc(endpoint=endpoint.name)
+            logger.debug('[Deepseek] 🧮 Token 用量未知（响应中没有 usage），耗时: %.0fms', latency_ms)
+        try:
+            self.usage.record(usage, PROMPT_VERSION, endpoint.name, endpoint.model, trader_ids or [None], latency_ms)
+        except Exception as e:
+            logger.warning('[Deepseek] ⚠️ 记录 token 用量失败: %s', e)
+
+    @staticmethod
+    def _stream_chunk(raw) -> Optional[Dict]:
+        """解析一行 SSE；非 data 行或无法解析时返回 None，[DONE] 返回空 dict"""
+        # 按 UTF-8 自行解码，SSE 响应头通常不带 charset
+        line = raw.decode('utf-8', errors='replace') if isinstance(raw, bytes) else raw
+        if not line or not line.startswith('data:'):
+            return None
+        payload = line[5:].strip()
+        if payload == '[DONE]':
+            return {}
+        try:
+            chunk = json.loads(payload)
+        except ValueError:
+            return None
+        return chunk if isinstance(chunk, dict) else None
+
+    def _read_stream(self, r, expect: str = 'object', cancel: Optional[threading.Event] = None):
+        """读取 SSE 流式响应；顶层 JSON 一闭合就返回，不等待模型后续的解释文字
+
+        返回 (内容, usage, 剩余行)；被取消时内容为 None。JSON 提前闭合时连接保持打开，剩余行交给调用方
+        读到流末尾取 usage 分块（_drain_usage 负责关闭连接），其余情况剩余行为 None、连接已关闭。
+        """
+        scanner = IncrementalJSONScanner(expect)
+        parts = []
+        usage = None
+        lines = _iter_stream_lines(r)
+        rest = None
+        try:
+            for raw in lines:
+                if cancel is not None and cancel.is_set():
+                    logger.info('[Deepseek] ⏹️ 流式请求已被对冲取消')
+                    return None, None, None
+                chunk = self._stream_chunk(raw)
+                if chunk is None:
+                    continue
+                if not chunk:
+                    break
+                if chunk.get("usage"):
+                    usage = chunk["usage"]
+                choices = chunk.get("choices") or []
+                delta = (choices[0].get("delta") or {}).get("content") if choices else None
+                if not delta:
+                    continue
+                parts.append(delta)
+                if scanner.feed(delta) is not None:
+                    logger.info('[Deepseek] ⚡ 流式响应中 JSON 已闭合，先返回解析结果')
+                    rest = lines
+                    break
+        finally:
+            if rest is None:
+                r.close()
+        content = scanner.result if scanner.complete else ''.join(parts)
+        logger.debug('[Deepseek] 📝 API返回的原始内容(流式): %s', Truncated(content))
+        return content, usage, rest
+
+    def _drain_usage(self, r, lines, endpoint: LLMEndpoint, trader_ids: Optional[List[Optional[str]]],
+                     latency_ms: float):
+        """后台线程：读完 JSON 闭合之后的剩余流，取末尾的 usage 分块并记录用量"""
+        usage = None
+        try:
+            for raw in lines:
+                chunk = self._stream_chunk(raw)
+                if chunk is None:
+                    continue
+                if not chunk:
+                    break
+                if chunk.get("usage"):
+                    usage = chunk["usage"]
+        except Exception as e:
+            logger.debug('[Deepseek] 读取流末尾的 usage 失败: %s', e)
+        finally:
+            r.close()
+        self._record_usage(endpoint, usage, trader_ids, latency_ms)
+
+    def _parse_json(self, content: str, expect: str = 'object'):
+        """清理 markdown 标记并解析 JSON（expect='object' 返回 dict，'array' 返回 list），失败时返回空结果"""
+        empty = {} if expect == 'object' else []
+        
+        # 清理内容：移除可能的markdown代码块标记
+        content = content.strip()
+        # 移除 ```json 和 ``` 标记
+        content = re.sub(r'^```json\s*', '', content, flags=re.MULTILINE)
+        content = re.sub(r'^```\s*', '', content, flags=re.MULTILINE)
+        content = re.sub(r'```\s*$', '', content, flags=re.MULTILINE)
+        content = content.strip()
+        
+        # 快速路径：内容本身就是合法 JSON（流式扫描器截取的结果总是如此）
+        try:
+            result = json.loads(content)
+            if isinstance(result, dict if expect == 'object' else list):
+                return result
+        except ValueError:
+            pass
+        
+        if expect == 'array':
+            # 数组：截取第一个 [ 到最后一个 ] 之间的内容
+            lo, hi = content.find('['), content.rfind(']')
+            if lo != -1 and hi > lo:
+                content = content[lo:hi + 1]
+        else:
+            # 尝试提取JSON对象（如果内容中包含其他文字）
+            json_match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', content, re.DOTALL)
+            if json_match:
+                content = json_match.group(0)
+        
+        try:
+            result = json.loads(content)
+        except json.JSONDecodeError as e:
+            logger.warning('[Deepseek] ⚠️ JSON解析失败')
+            logger.warning('[Deepseek] ⚠️ 原始内容长度: %s', len(content))
+            logger.warning('[Deepseek] ⚠️ 原始内容前500字符: %s', content[:500])
+            logger.warning('[Deepseek] ⚠️ 解析错误: %s', e)
             
-            if r.status_code != 200:
-                print(f'[Deepseek] ❌ API请求失败: {r.status_code}')
-                print(f'[Deepseek] ❌ 端点: {self.endpoint}')
-                print(f'[Deepseek] ❌ 响应内容前500字符: {r.text[:500]}')
-                # 如果返回的是HTML，说明端点可能不对
-                if r.text.strip().startswith('<!DOCTYPE') or r.text.strip().startswith('<html'):
-                    print(f'[Deepseek] ⚠️ API返回了HTML而不是JSON，请检查端点配置是否正确')
-                    print(f'[Deepseek] ⚠️ 当前端点: {self.endpoint}')
-                    print(f'[Deepseek] ⚠️ 正确的端点应该是类似: https://api.v3.cm/v1/chat/completions')
-                return None
+            # 如果内容为空或只有空白，返回空结果
+            if not content.strip():
+                logger.warning('[Deepseek] ⚠️ 内容为空，返回空结果')
+                return empty
             
-            # 检查响应是否为JSON
+            # 尝试修复常见的JSON格式问题
+            fixed_content = content.replace("'", '"')  # 单引号转双引号
+            # 修复未加引号的键名（但保留已加引号的）
+            fixed_content = re.sub(r'(\w+):', lambda m: f'"{m.group(1)}":' if not m.group(1).startswith('"') else m.group(0), fixed_content)
             try:
-                data = r.json()
-            except ValueError as e:
-                print(f'[Deepseek] ❌ API返回的不是JSON格式: {e}')
-                print(f'[Deepseek] ❌ 响应内容: {r.text[:500]}')
-                return None
-            
-            # 检查响应结构
-            if "choices" not in data or not data.get("choices"):
-                print(f'[Deepseek] ⚠️ API响应格式异常，缺少choices字段')
-                print(f'[Deepseek] ⚠️ 响应内容: {data}')
+                result = json.loads(fixed_content)
+                logger.info('[Deepseek] ✅ 修复后成功解析JSON')
+            except Exception as e2:
+                logger.error('[Deepseek] ❌ 修复后仍无法解析: %s', e2)
+                logger.error('[Deepseek] ❌ 修复后的内容: %s', fixed_content[:500])
+                # 如果无法解析，返回空结果而不是None
+                result = empty
+        
+        if expect == 'array' and not isinstance(result, list):
+            return empty
+        return result
+
+    def _log_result(self, result):
+        if result and isinstance(result, dict) and result.get('type'):
+            # 详细日志：显示进出场点位、止盈止损情况
+            if result.get('type') == 'entry':
+                logger.info(
+                    '[Deepseek] ✅ 提取到入场信号\n  📊 交易对: %s | 方向: %s\n  📍 进场点位: %s\n  🎯 止盈点位: %s\n  🛑 止损点位: %s',
+                    result.get('symbol', 'N/A'), str(result.get('side', 'N/A')).upper(), result.get('entry_price', 'N/A'),
+                    result.get('take_profit', 'N/A'), result.get('stop_loss', 'N/A'),
+                )
+            elif result.get('type') == 'update':
+                pnl = result.get('pnl_points', 'N/A')
+                if pnl != 'N/A':
+                    logger.info('[Deepseek] ✅ 提取到更新信号\n  📈 状态: %s\n  💰 盈亏点数: %s', result.get('status', 'N/A'), pnl)
+                else:
+                    logger.info('[Deepseek] ✅ 提取到更新信号\n  📈 状态: %s', result.get('status', 'N/A'))
+
+    def _log_exception(self, e: Exception):
+        # 堆栈在日志线程中格式化
+        logger.error('[Deepseek] ❌ 提取异常: %s', e, exc_info=True)
+
+    def extract_trade(self, text: str, trader_id: Optional[str] = None) -> Optional[Dict]:
+        if not self.available():
+            return None
+        
+        # 记录输入文本
+        logger.debug('[Deepseek] 📥 收到解析请求，文本长度: %d 字符', len(text))
+        logger.debug('[Deepseek] 📝 输入文本内容: %s', Truncated(text))
+        
+        try:
+            content = self._request_content(TRADE_SYSTEM_PROMPT, text, trader_ids=[trader_id])
+            if content is None:
+                PARSE_RESULTS.inc(result='error')
                 return None
             
-            content = data.get("choices", [{}])[0].get("message", {}).get("content", "")
-            
-            # 记录 API 响应的完整内容（用于调试）
-            print(f'[Deepseek] 📥 API返回的完整响应: {str(data)[:1000]}{"..." if len(str(data)) > 1000 else ""}')
-            print(f'[Deepseek] 📝 API返回的原始内容: {content[:500]}{"..." if len(content) > 500 else ""}')
-            
             # 如果content为空，返回空结果
-            if not content or not content.strip():
-                print(f'[Deepseek] ⚠️ API返回的内容为空')
+            if not content.strip():
+                logger.warning('[Deepseek] ⚠️ API返回的内容为空')
+                PARSE_RESULTS.inc(result='empty')
                 return {}
             
-            import json
-            import re
-            
-            # 清理内容：移除可能的markdown代码块标记
-            content = content.strip()
-            # 移除 ```json 和 ``` 标记
-            content = re.sub(r'^```json\s*', '', content, flags=re.MULTILINE)
-            content = re.sub(r'^```\s*', '', content, flags=re.MULTILINE)
-            content = re.sub(r'```\s*$', '', content, flags=re.MULTILINE)
-            content = content.strip()
-            
-            # 尝试提取JSON对象（如果内容中包含其他文字）
-            json_match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', content, re.DOTALL)
-            if json_match:
-                content = json_match.group(0)
-            
-            try:
-                result = json.loads(content)
-            except json.JSONDecodeError as e:
-                print(f'[Deepseek] ⚠️ JSON解析失败')
-                print(f'[Deepseek] ⚠️ 原始内容长度: {len(content)}')
-                print(f'[Deepseek] ⚠️ 原始内容前500字符: {content[:500]}')
-                print(f'[Deepseek] ⚠️ 解析错误: {e}')
-                
-                # 如果内容为空或只有空白，返回空结果
-                if not content.strip():
-                    print(f'[Deepseek] ⚠️ 内容为空，返回空结果')
-                    return {}
-                
-                # 尝试提取JSON对象（如果内容中包含其他文字）
-                json_match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', content, re.DOTALL)
-                if json_match:
-                    content = json_match.group(0)
-                    print(f'[Deepseek] 🔍 提取到JSON片段: {content[:200]}')
-                
-                # 尝试修复常见的JSON格式问题
-                fixed_content = content.replace("'", '"')  # 单引号转双引号
-                # 修复未加引号的键名（但保留已加引号的）
-                fixed_content = re.sub(r'(\w+):', lambda m: f'"{m.group(1)}":' if not m.group(1).startswith('"') else m.group(0), fixed_content)
-                try:
-                    result = json.loads(fixed_content)
-                    print(f'[Deepseek] ✅ 修复后成功解析JSON')
-                except Exception as e2:
-                    print(f'[Deepseek] ❌ 修复后仍无法解析: {e2}')
-                    print(f'[Deepseek] ❌ 修复后的内容: {fixed_content[:500]}')
-                    # 如果无法解析，返回空结果而不是None
-                    result = {}
-            
-            if result and isinstance(result, dict) and result.get('type'):
-                # 详细日志：显示进出场点位、止盈止损情况
-                if result.get('type') == 'entry':
-                    symbol = result.get('symbol', 'N/A')
-                    side = result.get('side', 'N/A')
-                    entry = result.get('entry_price', 'N/A')
-                    tp = result.get('take_profit', 'N/A')
-                    sl = result.get('stop_loss', 'N/A')
-                    log_msg = f'[Deepseek] ✅ 提取到入场信号\n  📊 交易对: {symbol} | 方向: {side.upper()}\n  📍 进场点位: {entry}\n  🎯 止盈点位: {tp}\n  🛑 止损点位: {sl}'
-                    print(log_msg)
-                    # 同时写入日志文件（如果 MonitorCog 的 logger 已初始化）
-                    try:
-                        import logging
-                        logger = logging.getLogger('monitor')
-                        if logger.handlers:
-                            logger.info(log_msg)
-                    except:
-                        pass
-                elif result.get('type') == 'update':
-                    status = result.get('status', 'N/A')
-                    pnl = result.get('pnl_points', 'N/A')
-                    log_msg = f'[Deepseek] ✅ 提取到更新信号\n  📈 状态: {status}'
-                    if pnl != 'N/A':
-                        log_msg += f'\n  💰 盈亏点数: {pnl}'
-                    print(log_msg)
-                    # 同时写入日志文件
-                    try:
-                        import logging
-                        logger = logging.getLogger('monitor')
-                        if logger.handlers:
-                            logger.info(log_msg)
-                    except:
-                        pass
+            result = self._parse_json(content)
+            kind = result.get('type') if isinstance(result, dict) else None
+            PARSE_RESULTS.inc(result=kind if kind in ('entry', 'update') else 'empty')
+            self._log_result(result)
             return result
         except Exception as e:
-            error_msg = f'[Deepseek] ❌ 提取异常: {e}'
-            print(error_msg)
-            import traceback
-            tb_str = traceback.format_exc()
-            print(tb_str)
-            # 同时写入日志文件
-            try:
-                import logging
-                logger = logging.getLogger('monitor')
-                if logger.handlers:
-                    logger.error(f'{error_msg}\n{tb_str}')
-            except:
-                pass
+            PARSE_RESULTS.inc(result='error')
+            self._log_exception(e)
             return None
+
+    def extract_trades_batch(self, items: List[Tuple[str, str]],
+                             trader_ids: Optional[Dict[str, Optional[str]]] = None) -> Dict[str, Optional[Dict]]:
+        """一次请求解析多条消息：items 为 [(消息ID, 文本)]，返回 {消息ID: 解析结果}
+
+        trader_ids 为 {消息ID: 带单员ID}，用于按带单员均摊 token 用量。
+
+        批量结果中缺失的消息会退回单条解析；整个批量请求失败时逐条解析。
+        """
+        trader_ids = trader_ids or {}
+        if not self.available():
+            return {mid: None for mid, _ in items}
+        if len(items) == 1:
+            mid, text = items[0]
+            return {mid: self.extract_trade(text, trader_ids.get(mid))}
+        
+        logger.info('[Deepseek] 📦 收到批量解析请求，共 %s 条消息', len(items))
+        results: Dict[str, Optional[Dict]] = {}
+        try:
+            payload = json.dumps([{"id": mid, "text": text} for mid, text in items], ensure_ascii=False)
+            content = self._request_content(BATCH_SYSTEM_PROMPT, payload, expect='array',
+                                            trader_ids=[trader_ids.get(mid) for mid, _ in items])
+            if content is not None and content.strip():
+                for entry in self._parse_json(content, expect='array'):
+                    if not isinstance(entry, dict) or 'id' not in entry:
+                        continue
+                    result = entry.get('result')
+                    results[str(entry['id'])] = result if isinstance(result, dict) else {}
+        except Exception as e:
+            self._log_exception(e)
+        
+        for mid, _ in items:
+            if mid in results:
+                self._log_result(results[mid])
+        missing = [(mid, text) for mid, text in items if mid not in results]
+        if missing:
+            logger.warning('[Deepseek] ⚠️ 批量结果缺少 %s 条消息，改为逐条解析', len(missing))
+            for mid, text in missing:
+                results[mid] = self.extract_trade(text, trader_ids.get(mid))
+        return {mid: results.get(mid) for mid, _ in items}
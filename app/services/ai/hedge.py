@@ -0,0 +1,168 @@
+"""
+多端点对冲请求
+先请求主端点，若在延迟分位数内未返回，则向备用端点发送相同请求，采用先返回的结果并取消另一个
+
+取消只是设置 cancel 事件，请求函数必须在读取响应的过程中检查它并关闭连接（DeepseekClient 对冲时总是流式请求，
+每个分块检查一次），否则落败的请求会一直占用线程池中的线程直到超时。
+"""
+import bisect
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, List, Optional
+
+# 延迟直方图的桶上界（毫秒）
+LATENCY_BUCKETS_MS = [50, 100, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 5000, 7500, 10000, 15000, 20000, 30000]
+
+
+class LatencyHistogram:
+    """固定桶的延迟直方图，用于估算端点延迟分位数"""
+
+    def __init__(self, buckets_ms: List[int] = None):
+        self.buckets = list(buckets_ms or LATENCY_BUCKETS_MS)
+        # 最后一个桶收集超过最大上界的样本
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        ms = seconds * 1000.0
+        idx = bisect.bisect_left(self.buckets, ms)
+        with self._lock:
+            self.counts[idx] += 1
+            self.count += 1
+            self.total_ms += ms
+
+    def percentile(self, p: float) -> Optional[float]:
+        """返回第 p 百分位所在桶的上界（毫秒），无样本时返回 None"""
+        with self._lock:
+            if not self.count:
+                return None
+            target = self.count * p / 100.0
+            cumulative = 0
+            for i, c in enumerate(self.counts):
+                cumulative += c
+                if cumulative >= target:
+                    return float(self.buckets[i]) if i < len(self.buckets) else float(self.buckets[-1])
+        return float(self.buckets[-1])
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {'count': self.count, 'sum_ms': self.total_ms, 'buckets': list(zip(self.buckets, self.counts)), 'overflow': self.counts[-1]}
+
+
+class LLMEndpoint:
+    """一个 OpenAI 兼容的聊天补全端点"""
+
+    def __init__(self, name: str, url: str, model: str, api_key: str):
+        self.name = name
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+        self.latency = LatencyHistogram()
+        self.wins = 0
+        self.errors = 0
+        # 多个调用线程和线程池中的请求线程会同时更新计数
+        self._lock = threading.Lock()
+
+    def record_win(self):
+        with self._lock:
+            self.wins += 1
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+
+class HedgedCaller:
+    """对冲调用器：主端点超过延迟分位数未返回时，向备用端点发起同样的请求"""
+
+    def __init__(self, primary: LLMEndpoint, secondary: LLMEndpoint, percentile: float = 90.0,
+                 default_delay_ms: float = 2000.0, min_delay_ms: float = 200.0, max_delay_ms: float = 10000.0,
+                 min_samples: int = 20):
+        self.primary = primary
+        self.secondary = secondary
+        self.percentile = percentile
+        self.default_delay_ms = default_delay_ms
+        self.min_delay_ms = min_delay_ms
+        self.max_delay_ms = max_delay_ms
+        self.min_samples = min_samples
+        self.hedged = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='llm-hedge')
+
+    def hedge_delay(self) -> float:
+        """根据主端点延迟直方图计算对冲等待时间（秒）"""
+        delay_ms = self.default_delay_ms
+        if self.primary.latency.count >= self.min_samples:
+            delay_ms = self.primary.latency.percentile(self.percentile) or delay_ms
+        return min(max(delay_ms, self.min_delay_ms), self.max_delay_ms) / 1000.0
+
+    def _timed(self, fn: Callable, endpoint: LLMEndpoint, cancel: threading.Event):
+        start = time.monotonic()
+        try:
+            result = fn(endpoint, cancel)
+        except Exception as e:
+            print(f'[Hedge] ❌ 端点 {endpoint.name} 请求异常: {e}')
+            result = None
+        if cancel.is_set():
+            # 被取消的请求也记录耗时（真实延迟至少为此值），避免慢端点的直方图一直没有样本
+            endpoint.latency.observe(time.monotonic() - start)
+            return None
+        if result is None:
+            endpoint.record_error()
+        else:
+            endpoint.latency.observe(time.monotonic() - start)
+        return result
+
+    def call(self, fn: Callable[[LLMEndpoint, threading.Event], Optional[object]]):
+        """fn(endpoint, cancel_event) 执行一次请求，返回 None 表示失败；必须在读取响应时检查 cancel_event 并关闭连接"""
+        cancels = {self.primary.name: threading.Event(), self.secondary.name: threading.Event()}
+        futures = {self._executor.submit(self._timed, fn, self.primary, cancels[self.primary.name]): self.primary}
+        delay = self.hedge_delay()
+        done, _ = wait(futures, timeout=delay)
+        if done:
+            fut = next(iter(done))
+            result = fut.result()
+            if result is not None:
+                self.primary.record_win()
+                return result
+            print(f'[Hedge] ⚠️ 主端点 {self.primary.name} 请求失败，立即改用备用端点 {self.secondary.name}')
+            futures = {}
+        else:
+            print(f'[Hedge] ⏱️ 主端点 {self.primary.name} {delay * 1000:.0f}ms 内未返回，对冲请求备用端点 {self.secondary.name}')
+        with self._lock:
+            self.hedged += 1
+        futures[self._executor.submit(self._timed, fn, self.secondary, cancels[self.secondary.name])] = self.secondary
+        pending = set(futures)
+        result = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                result = fut.result()
+                if result is not None:
+                    winner = futures[fut]
+                    winner.record_win()
+                    # 取消仍在进行的另一个请求
+                    for other in futures.values():
+                        if other is not winner:
+                            cancels[other.name].set()
+                    return result
+        return result
+
+    def stats(self) -> Dict:
+        return {
+            'hedged': self.hedged,
+            'hedge_delay_ms': round(self.hedge_delay() * 1000),
+            'endpoints': {
+                ep.name: {
+                    'wins': ep.wins,
+                    'errors': ep.errors,
+                    'p50_ms': ep.latency.percentile(50),
+                    'p95_ms': ep.latency.percentile(95),
+                    'count': ep.latency.count,
+                }
+                for ep in (self.primary, self.secondary)
+            },
+        }
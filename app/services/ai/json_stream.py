@@ -0,0 +1,53 @@
+"""
+增量 JSON 扫描器
+流式接收模型输出时逐段喂入，顶层 JSON 对象/数组一闭合就返回完整文本，无需等待剩余的 token
+"""
+from typing import Optional
+
+
+class IncrementalJSONScanner:
+    """跟踪括号深度和字符串状态，识别第一个完整的顶层 JSON 值"""
+
+    def __init__(self, expect: str = 'object'):
+        self.opener = '{' if expect == 'object' else '['
+        self.closer = '}' if expect == 'object' else ']'
+        self._buf = []
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.result: Optional[str] = None
+
+    @property
+    def complete(self) -> bool:
+        return self.result is not None
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """喂入一段文本；顶层值闭合时返回其完整文本，否则返回 None"""
+        if self.result is not None:
+            return self.result
+        for ch in chunk:
+            if not self._started:
+                # 跳过 markdown 标记等前缀，直到遇到顶层起始符
+                if ch != self.opener:
+                    continue
+                self._started = True
+            self._buf.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch in '{[':
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self.result = ''.join(self._buf)
+                    return self.result
+        return None
@@ -0,0 +1,288 @@
+"""
+交易信号预过滤器
+在调用 LLM 之前用关键词/价格特征 + 可重新训练的权重表快速剔除明显的非信号消息（休息通知、总结、道歉等）
+"""
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from app.config.settings import get_settings
+from app.utils.logs import LazyJson, setup_jsonl_log
+
+# 交易信号关键词（入场）
+ENTRY_KEYWORDS = ['进场', '入场', '做多', '做空', '多单', '空单', '现价', '附近', '点位', '合约策略', '进行方向', '具体产品', '限价', '挂单']
+# 更新信号关键词（出局/止盈/止损/补仓），与 Deepseek 提示词中的更新规则保持一致
+UPDATE_KEYWORDS = ['出局', '止盈', '止损', '获利', '亏损', '剩余', '继续持有', '设置止损', '成本价', '补仓', '补货', '加仓']
+# 币种关键词
+COIN_KEYWORDS = ['btc', 'eth', 'sol', '比特币', '以太坊', '大饼', '姨太', '二饼']
+# 明显的非信号关键词（提示词规则 1/2 中要求返回 {} 的内容）
+NOISE_KEYWORDS = ['休息', '取消', '波动小', '无法开单', '总结', '反思', '道歉', '抱歉', '复盘', '愿景', '早安', '晚安', '感谢', '周末']
+
+_PRICE_RE = re.compile(r'\d{3,}(?:\.\d+)?')
+_PERCENT_RE = re.compile(r'\d{1,3}\s*%')
+
+# 默认权重表：偏置为负，只有出现交易特征时分数才会升高
+DEFAULT_WEIGHTS = {
+    'bias': -2.0,
+    'features': {
+        **{f'kw:{k}': 2.0 for k in ENTRY_KEYWORDS},
+        **{f'kw:{k}': 2.5 for k in UPDATE_KEYWORDS},
+        **{f'coin:{k}': 1.5 for k in COIN_KEYWORDS},
+        **{f'noise:{k}': -1.5 for k in NOISE_KEYWORDS},
+        'price:0': -1.0,
+        'price:1': 1.5,
+        'price:2+': 2.5,
+        'percent': 1.0,
+        'len:short': -0.5,
+        'len:long': -0.5,
+        'ctx:reply': 3.0,
+    },
+}
+
+
+def extract_features(text: str, is_reply: bool = False) -> List[str]:
+    """把消息文本转换为稀疏特征列表（特征名即权重表中的键）"""
+    lowered = (text or '').lower()
+    features = []
+    for k in ENTRY_KEYWORDS + UPDATE_KEYWORDS:
+        if k in lowered:
+            features.append(f'kw:{k}')
+    for k in COIN_KEYWORDS:
+        if k in lowered:
+            features.append(f'coin:{k}')
+    for k in NOISE_KEYWORDS:
+        if k in lowered:
+            features.append(f'noise:{k}')
+    price_count = len(_PRICE_RE.findall(lowered))
+    features.append('price:0' if price_count == 0 else ('price:1' if price_count == 1 else 'price:2+'))
+    if _PERCENT_RE.search(lowered):
+        features.append('percent')
+    if len(lowered) < 8:
+        features.append('len:short')
+    elif len(lowered) > 400:
+        features.append('len:long')
+    if is_reply:
+        features.append('ctx:reply')
+    return features
+
+
+def _sigmoid(x: float) -> float:
+    if x < -30:
+        return 0.0
+    if x > 30:
+        return 1.0
+    return 1.0 / (1.0 + math.exp(-x))
+
+
+class PrefilterDecision:
+    """单条消息的预过滤结果"""
+    __slots__ = ('features', 'score', 'passed', 'audit')
+
+    def __init__(self, features: List[str], score: float, passed: bool, audit: bool):
+        self.features = features
+        self.score = score
+        self.passed = passed
+        # 被拒绝但仍抽样送往 LLM，用于估算漏判率
+        self.audit = audit
+
+    @property
+    def call_llm(self) -> bool:
+        return self.passed or self.audit
+
+
+class SignalPrefilter:
+    """基于特征权重的逻辑回归打分器，分数低于阈值的消息不调用 LLM"""
+
+    def __init__(self, weights_path: Optional[str] = None, log_path: Optional[str] = None):
+        self.settings = get_settings()
+        self.enabled = self.settings.MONITOR_PREFILTER_ENABLED
+        self.threshold = self.settings.MONITOR_PREFILTER_THRESHOLD
+        self.audit_rate = self.settings.MONITOR_PREFILTER_AUDIT_RATE
+        self.weights_path = weights_path or self.settings.MONITOR_PREFILTER_WEIGHTS_PATH
+        self.log_path = log_path or self.settings.MONITOR_PREFILTER_LOG_PATH
+        self._lock = threading.Lock()
+        # 混淆矩阵计数：tp/fp 来自放行消息，tn/fn 只来自抽样审计的拒绝消息
+        self.counts = {'passed': 0, 'rejected': 0, 'audited': 0, 'tp': 0, 'fp': 0, 'tn': 0, 'fn': 0}
+        self.bias = DEFAULT_WEIGHTS['bias']
+        self.weights: Dict[str, float] = dict(DEFAULT_WEIGHTS['features'])
+        self.load_weights()
+        # 结果日志由后台线程追加写入，record_outcome 在事件循环上只入队
+        self._outcomes = (setup_jsonl_log(f'prefilter.outcomes:{os.path.abspath(self.log_path)}', self.log_path)
+                          if self.log_path else None)
+
+    def load_weights(self):
+        """从权重文件加载（不存在则使用内置默认权重）"""
+        if not self.weights_path or not os.path.exists(self.weights_path):
+            return
+        try:
+            with open(self.weights_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.bias = float(data.get('bias', self.bias))
+            self.weights = {k: float(v) for k, v in data.get('features', {}).items()}
+            print(f'[Prefilter] ✅ 已加载权重表: {self.weights_path} ({len(self.weights)} 个特征)')
+        except Exception as e:
+            print(f'[Prefilter] ⚠️ 加载权重表失败，使用默认权重: {e}')
+
+    def score(self, features: List[str]) -> float:
+        return _sigmoid(self.bias + sum(self.weights.get(f, 0.0) for f in features))
+
+    def evaluate(self, text: str, is_reply: bool = False) -> PrefilterDecision:
+        features = extract_features(text, is_reply=is_reply)
+        score = self.score(features)
+        passed = (not self.enabled) or score >= self.threshold
+        audit = (not passed) and random.random() < self.audit_rate
+        with self._lock:
+            if passed:
+                self.counts['passed'] += 1
+            else:
+                self.counts['rejected'] += 1
+                if audit:
+                    self.counts['audited'] += 1
+        return PrefilterDecision(features, score, passed, audit)
+
+    def record_outcome(self, decision: PrefilterDecision, is_signal: bool):
+        """记录 LLM 给出的真实标签，用于统计误判率和重新训练权重"""
+        if not decision.call_llm:
+            return
+        with self._lock:
+            if decision.passed:
+                self.counts['tp' if is_signal else 'fp'] += 1
+            else:
+                self.counts['fn' if is_signal else 'tn'] += 1
+        if self._outcomes is None:
+            return
+        row = {
+            'ts': int(time.time()),
+            'features': decision.features,
+            'score': round(decision.score, 4),
+            'passed': decision.passed,
+            'label': 1 if is_signal else 0,
+        }
+        if not decision.passed:
+            # 被拒绝的消息只有按 audit_rate 抽中的才有标签，训练时按 1/audit_rate 加权还原
+            row['audit_rate'] = self.audit_rate
+        self._outcomes.info('%s', LazyJson(row))
+
+    def stats(self) -> Dict:
+        """在线统计：漏判率基于抽样审计估算，真拒绝率 = 被正确拒绝的非信号 / 全部非信号"""
+        with self._lock:
+            c = dict(self.counts)
+        audited_labelled = c['tn'] + c['fn']
+        fn_rate = c['fn'] / audited_labelled if audited_labelled else None
+        # 用审计样本的非信号比例外推全部拒绝消息中的非信号数量
+        est_tn = c['rejected'] * (c['tn'] / audited_labelled) if audited_labelled else float(c['rejected'])
+        true_reject_rate = est_tn / (est_tn + c['fp']) if (est_tn + c['fp']) else None
+        total = c['passed'] + c['rejected']
+        return {
+            **c,
+            'reject_rate': c['rejected'] / total if total else None,
+            'false_negative_rate': fn_rate,
+            'true_reject_rate': true_reject_rate,
+        }
+
+
+def _load_samples(log_path: str, default_audit_rate: float) -> List[Tuple[List[str], int, float]]:
+    """返回 (特征, 标签, 样本权重)；被拒绝的审计样本代表 1/audit_rate 条被拒绝的消息
+
+    旧日志中没有 audit_rate 字段时使用当前配置的审计比例
+    """
+    samples = []
+    with open(log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+                weight = 1.0
+                if not row.get('passed', True):
+                    rate = float(row.get('audit_rate', default_audit_rate))
+                    weight = 1.0 / rate if rate > 0 else 1.0
+                samples.append((row['features'], int(row['label']), weight))
+            except Exception:
+                continue
+    return samples
+
+
+def train_weights(samples: List[Tuple[List[str], int, float]], epochs: int = 30, lr: float = 0.1, l2: float = 1e-3,
+                  signal_weight: float = 3.0) -> Dict:
+    """在记录的结果上做逻辑回归（SGD），信号样本加权以压低漏判
+
+    审计样本的权重按样本均值归一化后再乘到梯度上，保持相对比例的同时避免 1/audit_rate 放大学习率
+    """
+    weights = dict(DEFAULT_WEIGHTS['features'])
+    bias = DEFAULT_WEIGHTS['bias']
+    mean_weight = sum(w for _, _, w in samples) / len(samples) if samples else 1.0
+    order = list(range(len(samples)))
+    rng = random.Random(42)
+    for _ in range(epochs):
+        rng.shuffle(order)
+        for i in order:
+            features, label, sample_weight = samples[i]
+            p = _sigmoid(bias + sum(weights.get(f, 0.0) for f in features))
+            grad = (p - label) * (signal_weight if label else 1.0) * sample_weight / mean_weight
+            bias -= lr * grad
+            for f in features:
+                w = weights.get(f, 0.0)
+                weights[f] = w - lr * (grad + l2 * w)
+    return {'bias': round(bias, 4), 'features': {k: round(v, 4) for k, v in sorted(weights.items())}}
+
+
+def threshold_report(samples: List[Tuple[List[str], int, float]], weights: Dict,
+                     thresholds=(0.05, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5)) -> List[Dict]:
+    """不同阈值下的漏判率（信号被拒）与真拒绝率（非信号被拒），用于安全地调阈值（按样本权重还原全部消息）"""
+    bias = weights.get('bias', 0.0)
+    table = weights.get('features', {})
+    scored = [(_sigmoid(bias + sum(table.get(f, 0.0) for f in feats)), label, w) for feats, label, w in samples]
+    signals = sum(w for _, label, w in scored if label)
+    non_signals = sum(w for _, label, w in scored if not label)
+    rows = []
+    for t in thresholds:
+        fn = sum(w for s, label, w in scored if label and s < t)
+        tn = sum(w for s, label, w in scored if not label and s < t)
+        rows.append({
+            'threshold': t,
+            'false_negative_rate': fn / signals if signals else None,
+            'true_reject_rate': tn / non_signals if non_signals else None,
+        })
+    return rows
+
+
+def main(argv: List[str]):
+    """命令行：python -m app.services.ai.prefilter [train|report] [结果日志路径]"""
+    settings = get_settings()
+    cmd = argv[1] if len(argv) > 1 else 'report'
+    log_path = argv[2] if len(argv) > 2 else settings.MONITOR_PREFILTER_LOG_PATH
+    if not os.path.exists(log_path):
+        print(f'结果日志不存在: {log_path}')
+        return 1
+    samples = _load_samples(log_path, settings.MONITOR_PREFILTER_AUDIT_RATE)
+    print(f'📊 样本数: {len(samples)}（信号 {sum(l for _, l, _ in samples)}，被拒绝的审计样本按 1/audit_rate 加权）')
+    if cmd == 'train':
+        weights = train_weights(samples)
+        out_path = settings.MONITOR_PREFILTER_WEIGHTS_PATH
+        out_dir = os.path.dirname(out_path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        tmp_path = out_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(weights, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, out_path)
+        print(f'✅ 权重表已写入: {out_path}')
+    else:
+        prefilter = SignalPrefilter()
+        weights = {'bias': prefilter.bias, 'features': prefilter.weights}
+    for row in threshold_report(samples, weights):
+        fn = row['false_negative_rate']
+        tr = row['true_reject_rate']
+        print(f"阈值 {row['threshold']:.2f}: 漏判率 {'-' if fn is None else f'{fn:.2%}'}, 真拒绝率 {'-' if tr is None else f'{tr:.2%}'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
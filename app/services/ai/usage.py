@@ -0,0 +1,105 @@
+"""
+LLM token 用量记录
+记录每次解析请求返回的 usage（提示 token、缓存命中 token、输出 token），按带单员汇总成本和缓存命中率
+
+流式请求在 JSON 闭合后先返回结果，连接交给后台读完流末尾的 usage 分块再记录；服务端没返回 usage 或流中途断开时
+仍写一行，token 列为 NULL 表示用量未知，汇总时单独计数（usage_unknown_calls / usage_unknown_messages），不按 0 计入 token 和每条消息的平均值。
+"""
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+from app.config.settings import get_settings
+from app.db.migrations import migrate_membership_db
+from app.db.connection import get_database
+
+
+def parse_usage(usage: Optional[Dict]) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+    """兼容 DeepSeek（prompt_cache_hit_tokens）和 OpenAI（prompt_tokens_details.cached_tokens）两种格式"""
+    if not isinstance(usage, dict):
+        return None, None, None
+    prompt = usage.get('prompt_tokens')
+    completion = usage.get('completion_tokens')
+    cached = usage.get('prompt_cache_hit_tokens')
+    if cached is None:
+        cached = (usage.get('prompt_tokens_details') or {}).get('cached_tokens')
+    return prompt, cached, completion
+
+
+class UsageRecorder:
+    def __init__(self, db_path: Optional[str] = None):
+        self.settings = get_settings()
+        self.db_path = db_path or self.settings.MEMBERSHIP_DB_PATH
+        self._init_db()
+        self.db = get_database(self.db_path)
+
+    def _init_db(self):
+        # llm_usage 表由版本化迁移创建
+        migrate_membership_db(self.db_path)
+
+    def record(self, usage: Optional[Dict], prompt_version: str, endpoint: str, model: str,
+               trader_ids: List[Optional[str]], latency_ms: float):
+        """写入一次请求的用量；批量请求按每个带单员的消息条数均摊 token"""
+        prompt, cached, completion = parse_usage(usage)
+        trader_ids = trader_ids or [None]
+        per_trader: Dict[Optional[str], int] = {}
+        for tid in trader_ids:
+            per_trader[tid] = per_trader.get(tid, 0) + 1
+        total = len(trader_ids)
+        share = lambda v, n: None if v is None else int(round(v * n / total))
+        now = int(time.time())
+        # 同一次请求拆成的多行共享 request_id，汇总时按它统计请求次数
+        request_id = uuid.uuid4().hex
+        rows = [
+            (request_id, tid, prompt_version, endpoint, model, n, share(prompt, n), share(cached, n), share(completion, n), int(latency_ms), now)
+            for tid, n in per_trader.items()
+        ]
+        with self.db.transaction() as con:
+            con.executemany(
+                """
+                INSERT INTO llm_usage(request_id, trader_id, prompt_version, endpoint, model, messages, prompt_tokens, cached_tokens, completion_tokens, latency_ms, created_at)
+                VALUES(?,?,?,?,?,?,?,?,?,?,?)
+                """,
+                rows
+            )
+
+    def summary(self, since: Optional[int] = None) -> Dict:
+        """按带单员和提示词版本汇总 token 消耗与缓存命中率"""
+        where = "WHERE created_at >= ?" if since else ""
+        params = (since,) if since else ()
+        with self.db.reader() as con:
+            def aggregate(group_col: str) -> List[Dict]:
+                rows = con.execute(
+                    f"""
+                    SELECT {group_col}, COUNT(DISTINCT request_id), SUM(messages), SUM(prompt_tokens), SUM(cached_tokens),
+                           SUM(completion_tokens), AVG(latency_ms),
+                           COUNT(DISTINCT CASE WHEN prompt_tokens IS NULL THEN request_id END),
+                           SUM(CASE WHEN prompt_tokens IS NULL THEN messages ELSE 0 END)
+                    FROM llm_usage {where}
+                    GROUP BY {group_col}
+                    ORDER BY SUM(prompt_tokens) DESC
+                    """,
+                    params
+                ).fetchall()
+                result = []
+                for key, calls, messages, prompt, cached, completion, avg_latency, unknown_calls, unknown_messages in rows:
+                    prompt = prompt or 0
+                    cached = cached or 0
+                    completion = completion or 0
+                    messages = messages or 0
+                    # 每条消息的平均 token 只按用量已知的消息计算
+                    known_messages = messages - (unknown_messages or 0)
+                    result.append({
+                        group_col: key,
+                        "calls": calls,
+                        "messages": messages,
+                        "prompt_tokens": prompt,
+                        "cached_tokens": cached,
+                        "completion_tokens": completion,
+                        "cache_hit_ratio": round(cached / prompt, 4) if prompt else None,
+                        "tokens_per_message": round((prompt + completion) / known_messages, 1) if known_messages else None,
+                        "avg_latency_ms": round(avg_latency) if avg_latency is not None else None,
+                        "usage_unknown_calls": unknown_calls or 0,
+                        "usage_unknown_messages": unknown_messages or 0,
+                    })
+                return result
+            return {"traders": aggregate("trader_id"), "prompt_versions": aggregate("prompt_version")}
@@ -1,57 +1,36 @@
-import sqlite3
 import time
 from typing import Optional, Dict
 from app.config.settings import get_settings
+from app.db.migrations import migrate_membership_db
+from app.db.connection import get_database
 
 class MembershipStore:
     def __init__(self):
         self.settings = get_settings()
         self.db_path = self.settings.MEMBERSHIP_DB_PATH
         self._init_db()
+        self.db = get_database(self.db_path)
 
     def _init_db(self):
-        import os
-        # 确保数据库目录存在
-        db_dir = os.path.dirname(self.db_path)
-        if db_dir and not os.path.exists(db_dir):
-            os.makedirs(db_dir, exist_ok=True)
-        con = sqlite3.connect(self.db_path)
-        try:
-            con.execute(
-                """
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id TEXT PRIMARY KEY,
-                    used_trial INTEGER DEFAULT 0,
-                    trial_start INTEGER,
-                    trial_end INTEGER,
-                    member_end INTEGER
-                )
-                """
-            )
-            con.commit()
-        finally:
-            con.close()
+        # 表结构由版本化迁移统一维护
+        migrate_membership_db(self.db_path)
 
     def get_user(self, user_id: str) -> Dict:
-        con = sqlite3.connect(self.db_path)
-        try:
+        with self.db.reader() as con:
             cur = con.execute("SELECT user_id, used_trial, trial_start, trial_end, member_end FROM users WHERE user_id=?", (user_id,))
             row = cur.fetchone()
-            if not row:
-                return {"user_id": user_id, "used_trial": 0, "trial_start": None, "trial_end": None, "member_end": None}
-            return {
-                "user_id": row[0],
-                "used_trial": int(row[1] or 0),
-                "trial_start": row[2],
-                "trial_end": row[3],
-                "member_end": row[4],
-            }
-        finally:
-            con.close()
+        if not row:
+            return {"user_id": user_id, "used_trial": 0, "trial_start": None, "trial_end": None, "member_end": None}
+        return {
+            "user_id": row[0],
+            "used_trial": int(row[1] or 0),
+            "trial_start": row[2],
+            "trial_end": row[3],
+            "member_end": row[4],
+        }
 
     def upsert_user(self, data: Dict):
-        con = sqlite3.connect(self.db_path)
-        try:
+        with self.db.transaction() as con:
             con.execute(
                 """
                 INSERT INTO users(user_id, used_trial, trial_start, trial_end, member_end) VALUES(?,?,?,?,?)
@@ -63,9 +42,6 @@ class MembershipStore:
                 """,
                 (data["user_id"], data.get("used_trial", 0), data.get("trial_start"), data.get("trial_end"), data.get("member_end"))
             )
-            con.commit()
-        finally:
-            con.close()
 
     def set_trial(self, user_id: str, duration_hours: int):
         now = int(time.time())
@@ -0,0 +1,148 @@
+"""
+OKX 永续合约交易对注册表
+从 /api/v5/public/instruments（instType=SWAP）加载全部交易对，按 INSTRUMENT_TTL_SEC 缓存，
+并建立别名索引（比特币 / BTC / btc / BTCUSDT / BTC-USDT-SWAP → BTC-USDT-SWAP），
+解析结果的交易对规范化只是一次字典查找，不需要按交易对调用 REST 接口探测。
+
+允许记录的交易对由配置规则决定：
+  INSTRUMENT_ALLOW  允许的 instId 通配规则（如 *-USDT-SWAP）
+  INSTRUMENT_DENY   排除的 instId 通配规则（优先于 ALLOW）
+  INSTRUMENT_MIN_VOL_24H  24 小时成交额下限（计价币，0 表示不限制；随交易对列表一起通过 tickers 批量获取）
+"""
+import fnmatch
+import threading
+import time
+from typing import Dict, List, Optional
+
+from app.config.settings import get_settings
+from .client import OKXClient
+
+# 常见中文 / 俚语别名（可通过 INSTRUMENT_ALIASES 追加或覆盖）
+DEFAULT_ALIASES = {
+    '比特币': 'BTC', '大饼': 'BTC',
+    '以太坊': 'ETH', '以太': 'ETH', '姨太': 'ETH', '二饼': 'ETH',
+    '索拉纳': 'SOL', '狗狗币': 'DOGE', '狗狗': 'DOGE', '瑞波币': 'XRP', '莱特币': 'LTC',
+}
+
+
+def _key(symbol: str) -> str:
+    """别名索引的键：去掉空白和分隔符并转大写（BTC/USDT、btc-usdt、BTCUSDT 得到同一个键）"""
+    return ''.join(ch for ch in str(symbol).strip().upper() if ch not in ' /-_.:')
+
+
+class InstrumentRegistry:
+    """永续合约交易对与别名索引（TTL 缓存，后台线程刷新，查询不加锁）"""
+
+    def __init__(self, client: Optional[OKXClient] = None):
+        self.settings = get_settings()
+        self.client = client or OKXClient()
+        self.ttl = self.settings.INSTRUMENT_TTL_SEC
+        self.quote_ccy = self.settings.INSTRUMENT_QUOTE_CCY
+        self.allow_rules = self.settings.INSTRUMENT_ALLOW
+        self.deny_rules = self.settings.INSTRUMENT_DENY
+        self.min_vol_24h = self.settings.INSTRUMENT_MIN_VOL_24H
+        self.aliases = dict(DEFAULT_ALIASES, **self.settings.INSTRUMENT_ALIASES)
+        # 以下字典在刷新时整体替换
+        self.instruments: Dict[str, Dict] = {}
+        self.volumes: Dict[str, float] = {}
+        self._index: Dict[str, str] = {}
+        self._allowed: Dict[str, bool] = {}
+        self.loaded_at = 0.0
+        self._refreshing = threading.Lock()
+        # 首次加载前只认识 OKX_INST_IDS 中的交易对
+        self._build({inst_id: {'instId': inst_id} for inst_id in self.settings.OKX_INST_IDS}, {})
+
+    def _build(self, instruments: Dict[str, Dict], volumes: Dict[str, float]):
+        index = {}
+        suffix = f'-{self.quote_ccy}-SWAP'
+        for inst_id in instruments:
+            index[_key(inst_id)] = inst_id
+            if inst_id.endswith(suffix):
+                base = inst_id[:-len(suffix)]
+                # BTC、BTCUSDT、BTC-USDT 都指向 USDT 本位永续
+                index.setdefault(_key(base), inst_id)
+                index.setdefault(_key(base + self.quote_ccy), inst_id)
+        for alias, target in self.aliases.items():
+            inst_id = index.get(_key(target))
+            if inst_id:
+                index[_key(alias)] = inst_id
+        self.instruments = instruments
+        self.volumes = volumes
+        self._allowed = {}
+        self._index = index
+
+    def refresh(self) -> bool:
+        """从 OKX 加载交易对列表（以及需要时的 24 小时成交额），失败时保留当前数据"""
+        res = self.client.request('GET', '/api/v5/public/instruments', {'instType': 'SWAP'}, timeout=10)
+        if not res or res.get('code') != '0' or not res.get('data'):
+            print(f'[OKX] ⚠️ 加载交易对列表失败，继续使用当前数据 ({len(self.instruments)} 个)')
+            self.loaded_at = time.monotonic()  # 失败也按 TTL 节流，避免每条消息都重试
+            return False
+        instruments = {
+            row['instId']: row for row in res['data']
+            if row.get('instId') and row.get('state', 'live') == 'live'
+        }
+        volumes = {}
+        if self.min_vol_24h > 0:
+            tickers = self.client.request('GET', '/api/v5/market/tickers', {'instType': 'SWAP'}, timeout=10)
+            if tickers and tickers.get('code') == '0':
+                for t in tickers.get('data') or []:
+                    try:
+                        # volCcy24h 是以币计的成交量，乘以最新价得到计价币成交额
+                        volumes[t['instId']] = float(t.get('volCcy24h') or 0) * float(t.get('last') or 0)
+                    except (TypeError, ValueError):
+                        continue
+            else:
+                volumes = self.volumes
+        self._build(instruments, volumes)
+        self.loaded_at = time.monotonic()
+        print(f'[OKX] ✅ 已加载 {len(instruments)} 个永续合约交易对')
+        return True
+
+    def is_stale(self) -> bool:
+        return time.monotonic() - self.loaded_at >= self.ttl or not self.loaded_at
+
+    def refresh_in_background(self):
+        """缓存过期时在后台线程刷新（已有刷新在进行时直接返回）"""
+        if not self.is_stale() or not self._refreshing.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f'[OKX] ❌ 刷新交易对列表异常: {e}')
+            finally:
+                self._refreshing.release()
+
+        threading.Thread(target=run, daemon=True, name='okx-instruments').start()
+
+    def normalize(self, symbol) -> Optional[str]:
+        """把解析出的交易对名称规范化为 OKX instId，未知的返回 None"""
+        if not symbol:
+            return None
+        return self._index.get(_key(symbol))
+
+    def is_allowed(self, inst_id: str) -> bool:
+        """按配置规则判断是否记录该交易对（结果按 instId 缓存，刷新时清空）"""
+        allowed = self._allowed.get(inst_id)
+        if allowed is None:
+            allowed = self._check_rules(inst_id)
+            self._allowed[inst_id] = allowed
+        return allowed
+
+    def _check_rules(self, inst_id: str) -> bool:
+        if inst_id not in self.instruments:
+            return False
+        if any(fnmatch.fnmatchcase(inst_id, rule) for rule in self.deny_rules):
+            return False
+        if not any(fnmatch.fnmatchcase(inst_id, rule) for rule in self.allow_rules):
+            return False
+        # 成交额未知（tickers 未加载成功）时不按成交额过滤；OKX_INST_IDS 中的交易对始终允许
+        if self.min_vol_24h > 0 and inst_id in self.volumes and inst_id not in self.settings.OKX_INST_IDS:
+            return self.volumes[inst_id] >= self.min_vol_24h
+        return True
+
+    def allowed_inst_ids(self) -> List[str]:
+        return [inst_id for inst_id in self.instruments if self.is_allowed(inst_id)]
+
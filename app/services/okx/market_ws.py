@@ -50,7 +50,7 @@ class OKXMarketWS:
             on_error=self._on_error,
             on_close=self._on_close,
         )
-        self.thread = threading.Thread(target=lambda: self.ws.run_forever(ping_interval=20, ping_timeout=10), daemon=True)
+        self.thread = threading.Thread(target=lambda: self.ws.run_forever(ping_interval=20, ping_timeout=10), daemon=True, name='okx-market-ws')
         self.thread.start()
 
     def stop(self):
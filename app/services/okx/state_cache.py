@@ -1,15 +1,27 @@
 import threading
 import time
-from typing import Dict
+from typing import Dict, Iterable, Optional
 from app.config.settings import get_settings
+from app.utils import metrics
 from .client import OKXClient
 
+POLL_SECONDS = metrics.histogram('okx_poll_seconds', 'OKX 一轮价格轮询耗时（秒）')
+POLL_RESULTS = metrics.counter('okx_poll_prices_total', 'OKX 价格获取次数（按交易对计）', ('result',))
+POLL_ERRORS = metrics.gauge('okx_poll_consecutive_errors', 'OKX 价格轮询连续失败次数')
+POLL_INTERVAL = metrics.gauge('okx_poll_interval_seconds', 'OKX 当前轮询间隔（秒，连续失败时会降频）')
+POLL_BACKOFFS = metrics.counter('okx_poll_backoffs_total', 'OKX 价格轮询因连续失败降频的次数')
+SUBSCRIBED = metrics.gauge('okx_subscribed_instruments', '正在轮询价格的交易对数量')
+
 class OKXStateCache:
     """简单轮询缓存：instId -> last_price（仅用于获取实时币价）"""
     def __init__(self):
         self.settings = get_settings()
         self.client = OKXClient()
         self.prices: Dict[str, float] = {}
+        # 轮询的交易对：OKX_INST_IDS 固定订阅，带单员配置中的交易对按需增减
+        self._base_inst_ids = list(self.settings.OKX_INST_IDS or [])
+        self.inst_ids = list(self._base_inst_ids)
+        self._inst_lock = threading.Lock()
         self._stop = False
         self._thread = None
 
@@ -17,7 +29,7 @@ class OKXStateCache:
         if self._thread and self._thread.is_alive():
             return
         self._stop = False
-        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread = threading.Thread(target=self._run, daemon=True, name='okx-state-cache')
         self._thread.start()
 
     def stop(self):
@@ -25,16 +37,24 @@ class OKXStateCache:
 
     def _run(self):
         interval = max(5.0, float(self.settings.OKX_POLL_INTERVAL_SEC))
-        print(f'[OKX] ✅ 价格轮询已启动 - 间隔: {interval}秒, 交易对: {", ".join(self.settings.OKX_INST_IDS or [])}')
+        print(f'[OKX] ✅ 价格轮询已启动 - 间隔: {interval}秒, 交易对: {", ".join(self.inst_ids)}')
         consecutive_errors = 0
         max_consecutive_errors = 10  # 连续10次错误后降低频率
         
         while not self._stop:
+            started = time.perf_counter()
             try:
                 # 刷新价格（从所有配置的交易对）
-                inst_ids = self.settings.OKX_INST_IDS or []
+                inst_ids = list(self.inst_ids)
                 success_count = 0
-                for inst in inst_ids:
+                # 交易对较多时一次请求取全部永续合约行情，避免按交易对逐个请求
+                batch_count = self._poll_batch(inst_ids) if len(inst_ids) >= self.settings.OKX_TICKERS_BATCH_MIN else None
+                if batch_count is not None:
+                    success_count = batch_count
+                    inst_ids_to_poll = []
+                else:
+                    inst_ids_to_poll = inst_ids
+                for inst in inst_ids_to_poll:
                     try:
                         res = self.client.request("GET", "/api/v5/market/ticker", {"instId": inst}, timeout=8)
                         if res and res.get('code') == '0' and res.get('data'):
@@ -52,12 +72,15 @@ class OKXStateCache:
                         print(f'[OKX] ⚠️ 获取 {inst} 价格失败: {e}')
                         consecutive_errors += 1
                 
+                POLL_RESULTS.inc(success_count, result='ok')
+                POLL_RESULTS.inc(len(inst_ids) - success_count, result='error')
                 # 如果所有请求都失败，增加错误计数
                 if success_count == 0 and inst_ids:
                     consecutive_errors += 1
                     if consecutive_errors >= max_consecutive_errors:
                         # 降低轮询频率
                         interval = min(interval * 2, 60.0)
+                        POLL_BACKOFFS.inc()
                         print(f'[OKX] ⚠️ 连续 {consecutive_errors} 次失败，降低轮询频率至 {interval} 秒')
                         consecutive_errors = 0  # 重置计数
                 elif success_count > 0:
@@ -70,8 +93,49 @@ class OKXStateCache:
             except Exception as e:
                 print(f'[OKX] ❌ 轮询异常: {e}')
                 consecutive_errors += 1
+            POLL_SECONDS.observe(time.perf_counter() - started)
+            POLL_ERRORS.set(consecutive_errors)
+            POLL_INTERVAL.set(interval)
+            SUBSCRIBED.set(len(self.inst_ids))
             time.sleep(interval)
 
+    def _poll_batch(self, inst_ids) -> Optional[int]:
+        """通过 /market/tickers 批量刷新价格，返回成功数量；请求失败时返回 None（回退到逐个请求）"""
+        res = self.client.request("GET", "/api/v5/market/tickers", {"instType": "SWAP"}, timeout=8, max_retries=1)
+        if not res or res.get('code') != '0' or not res.get('data'):
+            return None
+        wanted = set(inst_ids)
+        count = 0
+        for t in res['data']:
+            inst = t.get('instId')
+            if inst in wanted:
+                try:
+                    self.prices[inst] = float(t['last'])
+                    count += 1
+                except (KeyError, TypeError, ValueError):
+                    continue
+        return count
+
+    def subscribe(self, inst_ids: Iterable[str]):
+        """增加轮询的交易对（下一轮生效）"""
+        with self._inst_lock:
+            added = [i for i in inst_ids if i not in self.inst_ids]
+            if added:
+                self.inst_ids = self.inst_ids + added
+        if added:
+            print(f'[OKX] ➕ 新增价格轮询: {", ".join(added)}')
+
+    def unsubscribe(self, inst_ids: Iterable[str]):
+        """移除轮询的交易对（OKX_INST_IDS 中的交易对始终保留）"""
+        with self._inst_lock:
+            removed = [i for i in inst_ids if i in self.inst_ids and i not in self._base_inst_ids]
+            if removed:
+                self.inst_ids = [i for i in self.inst_ids if i not in removed]
+                for inst_id in removed:
+                    self.prices.pop(inst_id, None)
+        if removed:
+            print(f'[OKX] ➖ 停止价格轮询: {", ".join(removed)}')
+
     def get_price(self, inst_id: str) -> float:
         """获取指定币种的实时价格"""
         return self.prices.get(inst_id)
@@ -0,0 +1,210 @@
+"""
+内存中的未结束交易单表
+启动时从数据库加载一次，定时任务在内存中按交易对计算状态；只有状态或盈亏变化的交易单才会被标记为脏，
+按批次在一个事务中写回 trade_status_detail / trades.lifecycle / trade_events，退出时再刷新一次
+"""
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from app.db import queries
+from app.db.connection import get_database
+from app.services.trades import ledger
+
+
+class ActiveTrade:
+    """一笔未结束的交易单（内存记录）"""
+    __slots__ = (
+        'trade_id', 'trader_id', 'channel_id', 'symbol', 'side',
+        'entry_price', 'take_profit', 'stop_loss', 'lifecycle',
+        'status', 'pnl_points', 'pnl_percent', 'current_price',
+        'partial_status',
+    )
+
+    def __init__(self, trade_id: int, trader_id: Optional[str], channel_id: Optional[str], symbol: str, side: str,
+                 entry_price: float, take_profit: Optional[float], stop_loss: Optional[float], lifecycle: str,
+                 status: Optional[str] = None, pnl_points: Optional[float] = None, pnl_percent: Optional[float] = None,
+                 current_price: Optional[float] = None, partial_status: Optional[str] = None):
+        self.trade_id = trade_id
+        self.trader_id = trader_id
+        self.channel_id = channel_id
+        self.symbol = symbol
+        self.side = side
+        self.entry_price = entry_price
+        self.take_profit = take_profit
+        self.stop_loss = stop_loss
+        self.lifecycle = lifecycle
+        self.status = status
+        self.pnl_points = pnl_points
+        self.pnl_percent = pnl_percent
+        self.current_price = current_price
+        # 最近一次部分出局的状态文本（lifecycle=partial 时有值）
+        self.partial_status = partial_status
+
+    @property
+    def is_pending(self) -> bool:
+        return self.lifecycle == queries.LIFECYCLE_PENDING
+
+
+class ActiveTradeStore:
+    """按交易对分组的未结束交易单，写回采用 write-behind 批量刷新"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.db = get_database(db_path)
+        self._records: Dict[int, ActiveTrade] = {}
+        self._by_symbol: Dict[str, Dict[int, ActiveTrade]] = {}
+        self._dirty = set()
+        self._lock = threading.RLock()
+        # 写回串行执行（后台线程的定期写回与退出时的写回不会交错）
+        self._flush_lock = threading.Lock()
+        self.flushed_rows = 0
+
+    def __len__(self):
+        return len(self._records)
+
+    # ========== 加载 ==========
+
+    def _from_row(self, con: sqlite3.Connection, row) -> ActiveTrade:
+        (trade_id, trader_id, channel_id, symbol, side, entry_price, take_profit, stop_loss, lifecycle,
+         status, pnl_points, pnl_percent, current_price) = row
+        partial_status = None
+        if lifecycle == queries.LIFECYCLE_PARTIAL:
+            partial = con.execute(queries.LATEST_PARTIAL_EXIT, (trade_id,)).fetchone()
+            partial_status = partial[0] if partial else None
+        return ActiveTrade(trade_id, trader_id, channel_id, symbol, side, entry_price, take_profit, stop_loss,
+                           lifecycle, status, pnl_points, pnl_percent, current_price, partial_status)
+
+    def load(self) -> int:
+        """从数据库加载全部未结束交易单（启动时调用）"""
+        with self.db.reader() as con:
+            records = [self._from_row(con, row) for row in con.execute(queries.OPEN_TRADES_WITH_STATUS).fetchall()]
+        with self._lock:
+            self._records.clear()
+            self._by_symbol.clear()
+            self._dirty.clear()
+            for record in records:
+                self._track(record)
+        return len(records)
+
+    def refresh(self, con: sqlite3.Connection, trade_id: int):
+        """消息处理已把交易单写入数据库后，用同一连接重新读取该交易单到内存"""
+        row = con.execute(queries.TRADE_WITH_STATUS, (trade_id,)).fetchone()
+        with self._lock:
+            self._untrack(trade_id)
+            self._dirty.discard(trade_id)
+            if row and row[8] != queries.LIFECYCLE_CLOSED:
+                self._track(self._from_row(con, row))
+
+    def reconcile(self) -> int:
+        """与数据库对账：移除已在其他进程中结束或删除的交易单（例如 API 手动结单），返回移除数量"""
+        with self.db.reader() as con:
+            open_ids = {row[0] for row in con.execute(queries.OPEN_TRADE_IDS).fetchall()}
+        with self._lock:
+            stale = [tid for tid in self._records if tid not in open_ids]
+            for tid in stale:
+                self._untrack(tid)
+                self._dirty.discard(tid)
+        return len(stale)
+
+    def _track(self, record: ActiveTrade):
+        self._records[record.trade_id] = record
+        self._by_symbol.setdefault(record.symbol, {})[record.trade_id] = record
+
+    def _untrack(self, trade_id: int):
+        record = self._records.pop(trade_id, None)
+        if record is None:
+            return
+        group = self._by_symbol.get(record.symbol)
+        if group is not None:
+            group.pop(trade_id, None)
+            if not group:
+                del self._by_symbol[record.symbol]
+
+    # ========== 读取与更新 ==========
+
+    def symbols(self) -> List[str]:
+        with self._lock:
+            return list(self._by_symbol)
+
+    def trades_for(self, symbol: str) -> List[ActiveTrade]:
+        with self._lock:
+            return list(self._by_symbol.get(symbol, {}).values())
+
+    def set_status(self, record: ActiveTrade, status: str, pnl_points: Optional[float] = None,
+                   pnl_percent: Optional[float] = None, current_price: Optional[float] = None) -> bool:
+        """更新内存中的状态；只有状态或盈亏变化时才标记为需要写回，返回是否变化"""
+        with self._lock:
+            # 已结束的交易单等待写回后移出内存（写回在后台线程中进行，期间可能又被计算一轮），不再变化
+            if record.lifecycle == queries.LIFECYCLE_CLOSED:
+                return False
+            record.current_price = current_price
+            if status == record.status and pnl_points == record.pnl_points:
+                return False
+            record.status = status
+            record.pnl_points = pnl_points
+            record.pnl_percent = pnl_percent
+            record.lifecycle = queries.next_lifecycle(record.lifecycle, status)
+            self._dirty.add(record.trade_id)
+            return True
+
+    @property
+    def dirty_count(self) -> int:
+        return len(self._dirty)
+
+    # ========== 写回 ==========
+
+    def flush(self, batch_size: int = 500) -> int:
+        """把变化过的交易单分批写回数据库（每批一个事务），返回写入的交易单数量；已结束的交易单写回后移出内存
+
+        可在后台线程中调用：只在取出脏数据和整理内存时持有内存锁，写事务期间事件循环仍可更新内存状态；
+        分批写入使消息入库等待写锁的时间不超过一批
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return 0
+                records = [self._records[tid] for tid in self._dirty if tid in self._records]
+                self._dirty.clear()
+                now = int(time.time())
+                rows = [
+                    {
+                        'trade_id': r.trade_id,
+                        'status': r.status,
+                        'pnl_points': r.pnl_points,
+                        'pnl_percent': r.pnl_percent,
+                        'current_price': r.current_price,
+                        'lifecycle': r.lifecycle,
+                        'now': now,
+                    }
+                    for r in records
+                ]
+            written = 0
+            for start in range(0, len(rows), max(1, batch_size)):
+                batch = rows[start:start + max(1, batch_size)]
+                try:
+                    with self.db.transaction() as con:
+                        con.executemany(queries.UPSERT_OPEN_TRADE_STATUS, batch)
+                        con.executemany(queries.UPDATE_TRADE_LIFECYCLE, [
+                            {'lifecycle': row['lifecycle'], 'now': now, 'pnl': row['pnl_points'],
+                             'trade_id': row['trade_id']}
+                            for row in batch
+                        ])
+                        # 成交、止盈、止损写入事件日志（浮盈/浮亏变化不产生事件）
+                        for row in batch:
+                            ledger.record_status(con, row['trade_id'], row['status'], row['current_price'],
+                                                 row['pnl_points'], now=now)
+                except Exception:
+                    # 写回失败时该批回滚，未写入的交易单恢复脏标记，下次再试
+                    with self._lock:
+                        self._dirty.update(row['trade_id'] for row in rows[start:] if row['trade_id'] in self._records)
+                    raise
+                written += len(batch)
+                with self._lock:
+                    self.flushed_rows += len(batch)
+                    for row in batch:
+                        if row['lifecycle'] == queries.LIFECYCLE_CLOSED:
+                            self._untrack(row['trade_id'])
+                            self._dirty.discard(row['trade_id'])
+            return written
@@ -0,0 +1,103 @@
+"""
+频道消息游标
+记录每个监控频道已连续处理完成的位置（低水位）：游标之前的消息都已有明确结果（入库/拒绝/非信号），
+仍在解析中或解析失败的消息会把游标挡在它之前，即使更晚的消息已先处理完；失败的消息由监控定时任务稍后重试一次。
+处理消息时只更新内存，由定时任务批量写回，重启或断线重连后从游标开始补拉错过的消息
+（游标之后已入库的消息由 MESSAGE_PROCESSED 去重）。
+"""
+import threading
+import time
+from typing import Dict, Optional, Set
+
+from app.db.connection import get_database
+
+
+class ChannelCursorStore:
+    def __init__(self, db_path: str):
+        self.db = get_database(db_path)
+        self._cursors: Dict[str, int] = {}
+        # 已有明确结果的最大消息 id；处理中 / 失败待重试的消息 id（挡住游标）
+        self._done: Dict[str, int] = {}
+        self._pending: Dict[str, Set[int]] = {}
+        self._failed: Set[int] = set()
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def load(self) -> int:
+        with self.db.reader() as con:
+            rows = con.execute("SELECT channel_id, last_message_id FROM channel_cursors").fetchall()
+        with self._lock:
+            for channel_id, last_message_id in rows:
+                # 内存中的游标可能已经比数据库新（加载前已处理过消息）
+                self._cursors[channel_id] = max(self._cursors.get(channel_id, 0), int(last_message_id))
+        return len(rows)
+
+    def get(self, channel_id: str) -> Optional[int]:
+        with self._lock:
+            return self._cursors.get(str(channel_id))
+
+    def begin(self, channel_id: str, message_id: int):
+        """消息开始处理：完成之前游标不会越过它"""
+        with self._lock:
+            self._pending.setdefault(str(channel_id), set()).add(int(message_id))
+
+    def advance(self, channel_id: str, message_id: int):
+        """消息已有明确结果（入库/拒绝/非信号/无需处理）"""
+        channel_id = str(channel_id)
+        message_id = int(message_id)
+        with self._lock:
+            self._failed.discard(message_id)
+            pending = self._pending.get(channel_id)
+            if pending:
+                pending.discard(message_id)
+            if message_id > self._done.get(channel_id, 0):
+                self._done[channel_id] = message_id
+            self._move(channel_id)
+
+    def fail(self, channel_id: str, message_id: int) -> bool:
+        """消息处理失败：继续挡住游标，等调用方重试；已经重试过一次仍失败时放弃并返回 False"""
+        message_id = int(message_id)
+        with self._lock:
+            retry = message_id not in self._failed
+            if retry:
+                self._failed.add(message_id)
+                self._pending.setdefault(str(channel_id), set()).add(message_id)
+        if not retry:
+            self.advance(channel_id, message_id)
+        return retry
+
+    def _move(self, channel_id: str):
+        """游标 = 已完成的最大 id，但不越过最早的处理中 / 失败消息（调用方持有锁）"""
+        cursor = self._done.get(channel_id, 0)
+        pending = self._pending.get(channel_id)
+        if pending:
+            cursor = min(cursor, min(pending) - 1)
+        if cursor > self._cursors.get(channel_id, 0):
+            self._cursors[channel_id] = cursor
+            self._dirty.add(channel_id)
+
+    def flush(self) -> int:
+        """把变化的游标写回数据库（可在后台线程中调用，写事务期间不持有内存锁）"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return 0
+                rows = [(cid, self._cursors[cid], int(time.time())) for cid in self._dirty]
+                self._dirty.clear()
+            try:
+                with self.db.transaction() as con:
+                    con.executemany(
+                        """
+                        INSERT INTO channel_cursors(channel_id, last_message_id, updated_at) VALUES(?,?,?)
+                        ON CONFLICT(channel_id) DO UPDATE SET
+                            last_message_id = MAX(last_message_id, excluded.last_message_id),
+                            updated_at = excluded.updated_at
+                        """,
+                        rows
+                    )
+            except Exception:
+                with self._lock:
+                    self._dirty.update(row[0] for row in rows)
+                raise
+            return len(rows)
@@ -0,0 +1,369 @@
+"""
+交易单事件账本
+trade_events 只追加不修改：入场解析、入场成交、部分出局、止盈、止损、手动结单、删除。
+trade_projection 是由事件增量维护的读模型（列表页/详情页直接读取），写事件与更新投影在同一事务中完成；
+trade_closed_totals 按 (带单员, 频道) 汇总已结束交易单的数量和盈亏（首页统计轮询读取），在结单/删除时同步调整；
+定期把投影复制为快照，重建时从最近的快照开始批量重放之后的事件（--full 则从第一条事件重放）。
+快照的 row_count 为 NULL 表示尚未写完（分批写入中或被中断），重建时不会使用。
+
+浮盈/浮亏等随币价变化的实时数据不是事件，仍写在 trade_status_detail 中（每笔交易单一行）。
+
+用法:
+  python -m app.services.trades.ledger rebuild [--full] [--db 路径]
+  python -m app.services.trades.ledger snapshot [--db 路径]
+"""
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.db import queries
+
+EVENT_ENTRY_PARSED = 'entry_parsed'    # 解析到入场信号（交易单创建）
+EVENT_ENTRY_FILLED = 'entry_filled'    # 币价到达入场价
+EVENT_PARTIAL_EXIT = 'partial_exit'    # 部分出局
+EVENT_TP_HIT = 'tp_hit'                # 已止盈
+EVENT_SL_HIT = 'sl_hit'                # 已止损
+EVENT_MANUAL_CLOSE = 'manual_close'    # 带单员主动止盈/止损，或后台手动结单
+EVENT_DELETED = 'deleted'              # 后台删除
+
+CLOSE_EVENTS = (EVENT_TP_HIT, EVENT_SL_HIT, EVENT_MANUAL_CLOSE)
+
+# 入场事件 data 中保存的交易单字段
+ENTRY_FIELDS = ('trader_id', 'channel_id', 'symbol', 'side', 'entry_price', 'take_profit', 'stop_loss', 'confidence')
+
+PROJECTION_COLUMNS = (
+    'trade_id', 'trader_id', 'channel_id', 'symbol', 'side', 'entry_price', 'take_profit', 'stop_loss',
+    'confidence', 'created_at', 'lifecycle', 'status', 'filled_at', 'filled_price', 'exited_pnl', 'partial_at',
+    'final_pnl', 'close_price', 'closed_at', 'last_event_id',
+)
+
+_COLS = ', '.join(PROJECTION_COLUMNS)
+_PLACEHOLDERS = ', '.join(f':{c}' for c in PROJECTION_COLUMNS)
+
+INSERT_PROJECTION = f"INSERT OR REPLACE INTO trade_projection({_COLS}) VALUES({_PLACEHOLDERS})"
+SELECT_PROJECTION = f"SELECT {_COLS} FROM trade_projection WHERE trade_id=?"
+
+
+def _num(value) -> Optional[float]:
+    """解析器输出的数值可能是字符串或 'N/A'"""
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def close_event_for_status(status: str) -> str:
+    if status == '已止盈':
+        return EVENT_TP_HIT
+    if status == '已止损':
+        return EVENT_SL_HIT
+    return EVENT_MANUAL_CLOSE
+
+
+# ========== 投影规则（增量更新和批量重建共用） ==========
+
+def apply_event(state: Optional[Dict], event: Tuple) -> Optional[Dict]:
+    """把一条事件应用到交易单投影上，返回新的投影（None 表示不存在/已删除）"""
+    event_id, trade_id, event_type, status, price, pnl_points, data, created_at = event
+    if event_type == EVENT_ENTRY_PARSED:
+        fields = json.loads(data) if data else {}
+        state = dict.fromkeys(PROJECTION_COLUMNS)
+        state.update({k: fields.get(k) for k in ENTRY_FIELDS})
+        state.update(trade_id=trade_id, created_at=created_at,
+                     lifecycle=queries.LIFECYCLE_PENDING, status=status or '待入场')
+    elif state is None:
+        # 没有入场事件（或已删除）的交易单不进入投影
+        return None
+    elif event_type == EVENT_DELETED:
+        return None
+    elif state['lifecycle'] == queries.LIFECYCLE_CLOSED:
+        # 已结束的交易单不再变化（例如后台已手动结单，机器人随后又写入止盈）
+        pass
+    elif event_type == EVENT_ENTRY_FILLED:
+        if state['lifecycle'] == queries.LIFECYCLE_PENDING:
+            state.update(lifecycle=queries.LIFECYCLE_ACTIVE, status=status, filled_at=created_at, filled_price=price)
+    elif event_type == EVENT_PARTIAL_EXIT:
+        # 消息中没有盈亏点数时保留上一次部分出局的盈亏
+        state.update(lifecycle=queries.LIFECYCLE_PARTIAL, status=status, partial_at=created_at,
+                     exited_pnl=pnl_points if pnl_points is not None else state['exited_pnl'])
+    elif event_type in CLOSE_EVENTS:
+        state.update(lifecycle=queries.LIFECYCLE_CLOSED, status=status, final_pnl=pnl_points,
+                     close_price=price, closed_at=created_at)
+    state['last_event_id'] = event_id
+    return state
+
+
+def _is_closed(state: Optional[Dict]) -> bool:
+    return state is not None and state['lifecycle'] == queries.LIFECYCLE_CLOSED
+
+
+def _closed_pnl(con, state: Dict) -> float:
+    """已结束交易单计入汇总的盈亏（与 queries.CLOSED_PNL 相同）"""
+    if state['final_pnl'] is not None:
+        return state['final_pnl']
+    row = con.execute("SELECT pnl_points FROM trade_status_detail WHERE trade_id=?", (state['trade_id'],)).fetchone()
+    return (row[0] if row else None) or 0
+
+
+def _adjust_closed_totals(con, before: Optional[Dict], after: Optional[Dict]):
+    """交易单进入/离开已结束状态时调整 trade_closed_totals（已结束的交易单不再变化，只有结单和删除会触发）"""
+    for state, delta in ((before, -1), (after, 1)):
+        if _is_closed(state):
+            con.execute(queries.ADJUST_CLOSED_TOTALS, {
+                'trader_id': state['trader_id'] or '', 'channel_id': state['channel_id'] or '',
+                'delta': delta, 'pnl': _closed_pnl(con, state),
+            })
+
+
+def refresh_closed_totals(con):
+    """由投影整体重算 trade_closed_totals（调用方负责事务）"""
+    con.execute("DELETE FROM trade_closed_totals")
+    con.execute(queries.REFRESH_CLOSED_TOTALS)
+
+
+def _write_projection(con, trade_id: int, state: Optional[Dict]):
+    if state is None:
+        con.execute("DELETE FROM trade_projection WHERE trade_id=?", (trade_id,))
+    else:
+        con.execute(INSERT_PROJECTION, state)
+
+
+# ========== 写入事件 ==========
+
+def record(con, trade_id: int, event_type: str, status: Optional[str] = None, price=None, pnl_points=None,
+           data: Optional[Dict] = None, source: Optional[str] = None, now: Optional[int] = None) -> int:
+    """追加一条事件并在同一事务中更新投影，返回事件 id（调用方负责提交）"""
+    now = now or int(time.time())
+    payload = json.dumps(data, ensure_ascii=False) if data else None
+    cur = con.execute(
+        """
+        INSERT INTO trade_events(trade_id, event_type, status, price, pnl_points, data, source, created_at)
+        VALUES(?,?,?,?,?,?,?,?)
+        """,
+        (trade_id, event_type, status, _num(price), _num(pnl_points), payload, source, now)
+    )
+    event_id = cur.lastrowid
+    row = con.execute(SELECT_PROJECTION, (trade_id,)).fetchone()
+    before = dict(zip(PROJECTION_COLUMNS, row)) if row else None
+    state = apply_event(dict(before) if before else None,
+                        (event_id, trade_id, event_type, status, _num(price), _num(pnl_points), payload, now))
+    if _is_closed(before) != _is_closed(state):
+        _adjust_closed_totals(con, before, state)
+    _write_projection(con, trade_id, state)
+    return event_id
+
+
+def record_entry(con, trade_id: int, fields: Dict, source_message_id: Optional[str] = None,
+                 source: str = 'bot', now: Optional[int] = None) -> int:
+    data = {k: fields.get(k) for k in ENTRY_FIELDS}
+    if source_message_id:
+        data['source_message_id'] = source_message_id
+    return record(con, trade_id, EVENT_ENTRY_PARSED, '待入场', fields.get('entry_price'),
+                  data=data, source=source, now=now)
+
+
+def record_status(con, trade_id: int, status: str, price=None, pnl_points=None,
+                  source: str = 'bot', now: Optional[int] = None) -> List[int]:
+    """由状态变化推导事件：待入场 -> 成交、未结束 -> 止盈/止损/主动结单；部分出局由调用方显式记录"""
+    row = con.execute("SELECT lifecycle FROM trade_projection WHERE trade_id=?", (trade_id,)).fetchone()
+    if not row:
+        return []
+    current = row[0]
+    target = queries.next_lifecycle(current, status)
+    events = []
+    if current == queries.LIFECYCLE_PENDING and target in (queries.LIFECYCLE_ACTIVE, queries.LIFECYCLE_CLOSED):
+        events.append(record(con, trade_id, EVENT_ENTRY_FILLED, status, price, None, source=source, now=now))
+    if target == queries.LIFECYCLE_CLOSED and current != queries.LIFECYCLE_CLOSED:
+        events.append(record(con, trade_id, close_event_for_status(status), status, price, pnl_points,
+                             source=source, now=now))
+    return events
+
+
+# ========== 快照与重建 ==========
+
+_STALE_SNAPSHOTS = "SELECT id FROM projection_snapshots WHERE row_count IS NOT NULL ORDER BY id DESC LIMIT -1 OFFSET ?"
+
+
+def snapshot(con, keep: int = 3) -> Tuple[int, int]:
+    """把当前投影复制为快照，只保留最近 keep 份，返回 (快照 id, 行数)
+
+    整个复制在调用方的一个写事务中完成（命令行使用）；机器人运行中使用 snapshot_in_batches
+    """
+    last_event_id = con.execute("SELECT COALESCE(MAX(id), 0) FROM trade_events").fetchone()[0]
+    cur = con.execute(
+        "INSERT INTO projection_snapshots(last_event_id, row_count, created_at) VALUES(?, NULL, ?)",
+        (last_event_id, int(time.time()))
+    )
+    snapshot_id = cur.lastrowid
+    rows = con.execute(
+        f"INSERT INTO trade_projection_snapshot_rows(snapshot_id, {_COLS}) SELECT ?, {_COLS} FROM trade_projection",
+        (snapshot_id,)
+    ).rowcount
+    con.execute("UPDATE projection_snapshots SET row_count=? WHERE id=?", (rows, snapshot_id))
+    stale = [r[0] for r in con.execute(_STALE_SNAPSHOTS, (max(1, keep),)).fetchall()]
+    for sid in stale:
+        con.execute("DELETE FROM trade_projection_snapshot_rows WHERE snapshot_id=?", (sid,))
+        con.execute("DELETE FROM projection_snapshots WHERE id=?", (sid,))
+    return snapshot_id, rows
+
+
+def snapshot_in_batches(db, keep: int = 3, batch_size: int = 5000) -> Tuple[int, int]:
+    """不长时间占用写锁的快照（机器人在后台线程中调用），返回 (快照 id, 行数)
+
+    在独立连接的读事务中读取事件位置和投影（WAL 下是一致的视图，不阻塞写入），快照行分批写入，每批一个短写事务；
+    全部写完才填 row_count。过期快照先标记为未完成再分批删除，中断留下的未完成快照在下次快照时清理。
+    """
+    reader = sqlite3.connect(db.path, timeout=db.busy_timeout_ms / 1000.0, isolation_level=None)
+    try:
+        reader.execute('BEGIN')
+        last_event_id = reader.execute("SELECT COALESCE(MAX(id), 0) FROM trade_events").fetchone()[0]
+        cur = reader.execute(f"SELECT {_COLS} FROM trade_projection")
+        with db.transaction() as con:
+            stale = [r[0] for r in con.execute("SELECT id FROM projection_snapshots WHERE row_count IS NULL")]
+            snapshot_id = con.execute(
+                "INSERT INTO projection_snapshots(last_event_id, row_count, created_at) VALUES(?, NULL, ?)",
+                (last_event_id, int(time.time()))
+            ).lastrowid
+        insert = (f"INSERT INTO trade_projection_snapshot_rows(snapshot_id, {_COLS}) "
+                  f"VALUES(?, {', '.join('?' * len(PROJECTION_COLUMNS))})")
+        rows = 0
+        while True:
+            batch = cur.fetchmany(batch_size)
+            if not batch:
+                break
+            with db.transaction() as con:
+                con.executemany(insert, ((snapshot_id,) + tuple(row) for row in batch))
+            rows += len(batch)
+        reader.execute('COMMIT')
+        # 读事务期间 WAL 无法回写，这里在后台线程中先做一次被动检查点（不占写锁），
+        # 否则积压的回写会落在下一个提交的写事务上（可能是事件循环中的消息入库）
+        reader.execute('PRAGMA wal_checkpoint(PASSIVE)')
+    finally:
+        reader.close()
+
+    with db.transaction() as con:
+        con.execute("UPDATE projection_snapshots SET row_count=? WHERE id=?", (rows, snapshot_id))
+        expired = [r[0] for r in con.execute(_STALE_SNAPSHOTS, (max(1, keep),)).fetchall()]
+        con.executemany("UPDATE projection_snapshots SET row_count=NULL WHERE id=?", [(sid,) for sid in expired])
+    for sid in stale + expired:
+        while True:
+            with db.transaction() as con:
+                deleted = con.execute(
+                    "DELETE FROM trade_projection_snapshot_rows WHERE rowid IN "
+                    "(SELECT rowid FROM trade_projection_snapshot_rows WHERE snapshot_id=? LIMIT ?)",
+                    (sid, batch_size)
+                ).rowcount
+                if not deleted:
+                    con.execute("DELETE FROM projection_snapshots WHERE id=?", (sid,))
+            if not deleted:
+                break
+    return snapshot_id, rows
+
+
+def _latest_snapshot(con) -> Tuple[Optional[int], int]:
+    row = con.execute(
+        "SELECT id, last_event_id FROM projection_snapshots WHERE row_count IS NOT NULL ORDER BY id DESC LIMIT 1"
+    ).fetchone()
+    return (row[0], row[1]) if row else (None, 0)
+
+
+def replay(events: Iterable[Tuple], states: Optional[Dict[int, Dict]] = None) -> Dict[int, Dict]:
+    """在内存中按顺序重放事件"""
+    states = {} if states is None else states
+    for event in events:
+        trade_id = event[1]
+        state = apply_event(states.get(trade_id), event)
+        if state is None:
+            states.pop(trade_id, None)
+        else:
+            states[trade_id] = state
+    return states
+
+
+def _iter_events(con, after_id: int, batch_size: int):
+    cur = con.execute(queries.TRADE_EVENTS_AFTER, (after_id,))
+    while True:
+        batch = cur.fetchmany(batch_size)
+        if not batch:
+            return
+        yield from batch
+
+
+def _bulk_insert(con, states: Iterable[Dict]):
+    """批量写入投影：先删除二级索引，写完后重建（比逐行维护索引快）"""
+    indexes = con.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type='index' AND tbl_name='trade_projection' AND sql IS NOT NULL"
+    ).fetchall()
+    for name, _ in indexes:
+        con.execute(f"DROP INDEX {name}")
+    con.executemany(
+        f"INSERT INTO trade_projection({_COLS}) VALUES({', '.join('?' * len(PROJECTION_COLUMNS))})",
+        (tuple(state[c] for c in PROJECTION_COLUMNS) for state in states)
+    )
+    for _, sql in indexes:
+        con.execute(sql)
+
+
+def rebuild(con, full: bool = False, batch_size: int = 5000) -> Tuple[int, int]:
+    """由事件日志重建 trade_projection（调用方负责事务），返回 (投影行数, 重放事件数)
+
+    默认从最近的快照开始：快照整体复制回投影表，只重放快照之后的事件；full=True 时在内存中重放全部事件后批量写入
+    """
+    snapshot_id, after_id = (None, 0) if full else _latest_snapshot(con)
+    con.execute("DELETE FROM trade_projection")
+    if snapshot_id is None:
+        states = replay(_iter_events(con, 0, batch_size))
+        _bulk_insert(con, states.values())
+        refresh_closed_totals(con)
+        replayed = con.execute("SELECT COUNT(*) FROM trade_events").fetchone()[0]
+        return len(states), replayed
+
+    con.execute(
+        f"INSERT INTO trade_projection({_COLS}) SELECT {_COLS} FROM trade_projection_snapshot_rows WHERE snapshot_id=?",
+        (snapshot_id,)
+    )
+    events = list(_iter_events(con, after_id, batch_size))
+    touched = {event[1] for event in events}
+    states = {}
+    for trade_id in touched:
+        row = con.execute(SELECT_PROJECTION, (trade_id,)).fetchone()
+        if row:
+            states[trade_id] = dict(zip(PROJECTION_COLUMNS, row))
+    states = replay(events, states)
+    for trade_id in touched:
+        _write_projection(con, trade_id, states.get(trade_id))
+    refresh_closed_totals(con)
+    rows = con.execute("SELECT COUNT(*) FROM trade_projection").fetchone()[0]
+    return rows, len(events)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='交易单事件账本维护')
+    parser.add_argument('command', choices=('rebuild', 'snapshot'))
+    parser.add_argument('--full', action='store_true', help='忽略快照，从第一条事件开始重放')
+    parser.add_argument('--db', default=None, help='数据库路径（默认 MEMBERSHIP_DB_PATH）')
+    args = parser.parse_args(argv)
+
+    from app.config.settings import get_settings
+    from app.db.connection import get_database
+    from app.db.migrations import migrate_membership_db
+
+    migrate_membership_db(args.db)
+    db = get_database(args.db)
+    started = time.perf_counter()
+    with db.transaction() as con:
+        if args.command == 'rebuild':
+            rows, replayed = rebuild(con, full=args.full)
+            message = f'投影已重建: {rows} 笔交易单，重放 {replayed} 条事件'
+        else:
+            snapshot_id, rows = snapshot(con, keep=get_settings().PROJECTION_SNAPSHOT_KEEP)
+            message = f'已生成快照 #{snapshot_id}: {rows} 笔交易单'
+    print(f'[Ledger] ✅ {message}，耗时 {(time.perf_counter() - started) * 1000:.0f} ms')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
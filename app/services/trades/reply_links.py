@@ -0,0 +1,57 @@
+"""
+回复引用关联
+更新消息通过 Discord 的 message.reference.message_id 关联到它所回复的交易单：
+先按 trades.source_message_id（唯一索引）直接查找；未命中时沿回复链向上查找——
+链上的消息可能是已保存的更新消息（trade_updates.source_message_id / reply_to_message_id），
+也可能是未被解析的普通消息（只在内存中缓存其回复关系）。
+"""
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from app.db import queries
+
+
+class ReplyLinkResolver:
+    """消息 id -> 被回复消息 id 的 LRU 缓存，以及基于索引的交易单查找"""
+
+    def __init__(self, cache_size: int = 10000, max_hops: int = 5):
+        self.cache_size = cache_size
+        self.max_hops = max_hops
+        self._parents: 'OrderedDict[str, str]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def remember(self, message_id, parent_id):
+        """记录一条回复消息的被回复消息 id（非回复消息不需要记录）"""
+        if not message_id or not parent_id:
+            return
+        with self._lock:
+            self._parents[str(message_id)] = str(parent_id)
+            self._parents.move_to_end(str(message_id))
+            while len(self._parents) > self.cache_size:
+                self._parents.popitem(last=False)
+
+    def parent_of(self, message_id: str) -> Optional[str]:
+        with self._lock:
+            return self._parents.get(message_id)
+
+    def resolve(self, con, message_id, channel_id: str) -> Tuple[Optional[tuple], int]:
+        """查找 message_id 所回复的交易单，返回 (交易单行, 经过的回复层数)；
+        交易单行与 queries.LATEST_OPEN_TRADE 的列一致"""
+        current = str(message_id) if message_id else None
+        seen = set()
+        hops = 0
+        while current and current not in seen and hops <= self.max_hops:
+            seen.add(current)
+            trade = con.execute(queries.TRADE_BY_SOURCE_MESSAGE, (current, channel_id)).fetchone()
+            if trade:
+                return trade, hops
+            update = con.execute(queries.UPDATE_BY_SOURCE_MESSAGE, (current, channel_id)).fetchone()
+            if update and update[0]:
+                trade = con.execute(queries.TRADE_BY_ID, (update[0],)).fetchone()
+                if trade:
+                    return trade, hops
+            # 继续向上：优先用数据库中保存的回复关系，其次是内存缓存
+            current = (update[1] if update and update[1] else None) or self.parent_of(current)
+            hops += 1
+        return None, hops
@@ -0,0 +1,166 @@
+"""
+消息处理耗时分解
+每条被解析的频道消息记录一组阶段耗时（毫秒）：
+  gateway   Discord 消息 created_at -> 机器人收到（网关延迟）
+  wait      等待同频道补拉完成
+  prepare   频道/带单员检查与去重查询
+  prefilter 预过滤打分
+  llm       Deepseek 解析（微批模式下包含合批等待）
+  validate  字段校验、交易对规范化、去重
+  link      更新消息关联交易单（回复链 / 最近活跃单）
+  db_write  写入交易单 / 更新记录 / 事件并提交
+  status    入场单的初始状态计算（取价、是否到达入场价）
+最近的记录保存在内存环形缓冲区中，由定时任务批量写入 message_traces 表（TRACE_PERSIST），
+API 进程通过该表查询最慢的消息。
+"""
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from app.db import queries
+from app.db.connection import get_database
+
+
+class MessageTrace:
+    """一条消息的耗时记录（只在处理该消息的协程中修改，不加锁）"""
+    __slots__ = ('message_id', 'channel_id', 'trader_id', 'source', 'result',
+                 'created_at', 'received_at', 'lag_ms', 'total_ms', 'spans', '_started', '_lap')
+
+    def __init__(self, message_id, channel_id: str, created_at: Optional[float], source: str = 'live'):
+        self.message_id = str(message_id)
+        self.channel_id = channel_id
+        self.trader_id = None
+        self.source = source
+        self.result = None
+        self.created_at = created_at
+        self.received_at = time.time()
+        self._started = self._lap = time.perf_counter()
+        # 补拉的消息 created_at 是历史时间，网关延迟没有意义
+        self.lag_ms = round(max(0.0, (self.received_at - created_at) * 1000), 1) if created_at and source == 'live' else None
+        self.total_ms = None
+        self.spans: Dict[str, float] = {}
+        if self.lag_ms is not None:
+            self.spans['gateway'] = self.lag_ms
+
+    @contextmanager
+    def span(self, name: str):
+        """计时一个阶段；同名阶段多次进入时累加"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - started) * 1000)
+
+    def add(self, name: str, ms: float):
+        self.spans[name] = round(self.spans.get(name, 0.0) + ms, 1)
+
+    def checkpoint(self):
+        """顺序执行的代码中标记阶段起点，配合 lap() 使用"""
+        self._lap = time.perf_counter()
+
+    def lap(self, name: str):
+        """把上一个 checkpoint / lap 到现在的耗时记入 name 阶段"""
+        now = time.perf_counter()
+        self.add(name, (now - self._lap) * 1000)
+        self._lap = now
+
+    def finish(self, result: str):
+        self.result = result
+        self.total_ms = round((time.perf_counter() - self._started) * 1000 + (self.lag_ms or 0.0), 1)
+
+    def to_dict(self) -> Dict:
+        return {
+            'message_id': self.message_id,
+            'channel_id': self.channel_id,
+            'trader_id': self.trader_id,
+            'source': self.source,
+            'result': self.result,
+            'created_at': self.created_at,
+            'received_at': self.received_at,
+            'lag_ms': self.lag_ms,
+            'total_ms': self.total_ms,
+            'spans': dict(self.spans),
+        }
+
+
+def trace_from_row(row) -> Dict:
+    """message_traces 行（queries.SLOWEST_MESSAGE_TRACES 的列）转为字典"""
+    return {
+        'message_id': row[0],
+        'channel_id': row[1],
+        'trader_id': row[2],
+        'source': row[3],
+        'result': row[4],
+        'created_at': row[5],
+        'received_at': row[6],
+        'lag_ms': row[7],
+        'total_ms': row[8],
+        'spans': json.loads(row[9]) if row[9] else {},
+    }
+
+
+class TraceRecorder:
+    """最近消息耗时的环形缓冲区，可选批量写入 SQLite"""
+
+    def __init__(self, db_path: str, capacity: int = 1000, persist: bool = True, retention_days: float = 7,
+                 enabled: bool = True):
+        self.db = get_database(db_path)
+        self.enabled = enabled
+        self.persist = persist
+        self.retention_days = retention_days
+        self._recent = deque(maxlen=max(1, capacity))
+        self._pending: List[MessageTrace] = []
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+
+    def start(self, message, source: str = 'live') -> MessageTrace:
+        created_at = message.created_at.timestamp() if getattr(message, 'created_at', None) else None
+        return MessageTrace(message.id, str(message.channel.id), created_at, source)
+
+    def record(self, trace: MessageTrace):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._recent.append(trace)
+            if self.persist:
+                self._pending.append(trace)
+
+    def slowest(self, limit: int = 20, since: Optional[float] = None) -> List[Dict]:
+        """内存中最慢的消息（按总耗时倒序）"""
+        with self._lock:
+            traces = [t for t in self._recent if since is None or t.received_at >= since]
+        traces.sort(key=lambda t: t.total_ms or 0, reverse=True)
+        return [t.to_dict() for t in traces[:limit]]
+
+    def flush(self) -> int:
+        """把新记录批量写入 message_traces，并按保留天数清理旧记录"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return 0
+        rows = [
+            (t.message_id, t.channel_id, t.trader_id, t.source, t.result, t.created_at, t.received_at,
+             t.lag_ms, t.total_ms, json.dumps(t.spans, separators=(',', ':')))
+            for t in pending
+        ]
+        now = time.time()
+        with self.db.transaction() as con:
+            con.executemany(
+                """
+                INSERT OR REPLACE INTO message_traces(message_id, channel_id, trader_id, source, result,
+                    created_at, received_at, lag_ms, total_ms, spans)
+                VALUES(?,?,?,?,?,?,?,?,?,?)
+                """,
+                rows
+            )
+            if self.retention_days > 0 and now - self._last_prune >= 3600:
+                self._last_prune = now
+                con.execute("DELETE FROM message_traces WHERE received_at < ?", (now - self.retention_days * 86400,))
+        return len(rows)
+
+
+def slowest_from_db(con, limit: int = 20, since: float = 0) -> List[Dict]:
+    return [trace_from_row(row) for row in con.execute(queries.SLOWEST_MESSAGE_TRACES, (since, limit)).fetchall()]
@@ -0,0 +1,184 @@
+"""
+监控日志管线
+调用方只把日志记录放进内存队列（QueueHandler），格式化、写文件和输出到控制台都在后台线程（QueueListener）中完成，
+事件循环上不再发生磁盘 / stdout I/O。
+
+- 文件：每行一条 JSON（ts / level / logger / msg 以及通过 extra={'fields': {...}} 传入的结构化字段），按天轮转
+- 控制台：只输出消息文本（与原来的 print 输出一致）
+- 消息使用 %-格式的延迟格式化：参数在后台线程中才转成字符串，被过滤掉的日志不产生格式化开销
+- DEBUG 级别的高频日志按 MONITOR_LOG_DEBUG_SAMPLE_RATE 抽样，WARNING 及以上始终保留
+
+setup_jsonl_log 用同样的队列管线追加写 JSONL 数据文件（例如预过滤结果日志），每条日志消息就是一行。
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+from pathlib import Path
+from typing import Dict, Optional
+
+from app.config.settings import get_settings
+
+MONITOR_LOGGER = 'monitor'
+
+_listener: Optional[QueueListener] = None
+_jsonl_listeners: Dict[str, QueueListener] = {}
+_setup_lock = threading.Lock()
+
+
+class LazyJson:
+    """作为日志参数使用：只有真正输出时才序列化"""
+    __slots__ = ('value', 'indent')
+
+    def __init__(self, value, indent: Optional[int] = None):
+        self.value = value
+        self.indent = indent
+
+    def __str__(self):
+        try:
+            return json.dumps(self.value, ensure_ascii=False, indent=self.indent, default=str)
+        except Exception:
+            return repr(self.value)
+
+
+class Truncated:
+    """作为日志参数使用：只有真正输出时才截断长文本"""
+    __slots__ = ('value', 'limit')
+
+    def __init__(self, value, limit: int = 500):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        text = str(self.value)
+        return text if len(text) <= self.limit else text[:self.limit] + '...'
+
+
+class JsonLineFormatter(logging.Formatter):
+    """一条日志一行 JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DebugSampler(logging.Filter):
+    """DEBUG 日志按比例抽样（在入队前过滤，被丢弃的日志不进入队列）"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = max(0.0, min(1.0, rate))
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        return self.rate > 0 and random.random() < self.rate
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """入队时不格式化：同一进程内的队列不需要序列化，格式化留给后台线程"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_monitor_logging() -> logging.Logger:
+    """初始化 monitor 日志管线（进程内只执行一次），返回 monitor logger
+
+    monitor.* 子 logger（例如 monitor.deepseek）的日志也经过同一条管线
+    """
+    global _listener
+    logger = logging.getLogger(MONITOR_LOGGER)
+    with _setup_lock:
+        if _listener is not None:
+            return logger
+        settings = get_settings()
+        log_dir = Path(settings.MONITOR_LOG_DIR)
+        log_dir.mkdir(parents=True, exist_ok=True)
+        file_handler = TimedRotatingFileHandler(
+            log_dir / 'monitor.log',
+            when='midnight',
+            backupCount=settings.MONITOR_LOG_BACKUP_COUNT,
+            encoding='utf-8'
+        )
+        file_handler.setFormatter(JsonLineFormatter())
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(logging.Formatter('%(message)s'))
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = _DeferredQueueHandler(log_queue)
+        queue_handler.addFilter(DebugSampler(settings.MONITOR_LOG_DEBUG_SAMPLE_RATE))
+        logger.setLevel(logging.DEBUG if settings.MONITOR_LOG_DEBUG_SAMPLE_RATE > 0 else logging.INFO)
+        logger.addHandler(queue_handler)
+        logger.propagate = False
+
+        _listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+        _listener.start()
+        # 进程退出前把队列中剩余的日志写完
+        atexit.register(stop_monitor_logging)
+    return logger
+
+
+def setup_jsonl_log(name: str, path: str) -> logging.Logger:
+    """返回把每条消息追加为 path 中一行的 logger（同一 name 只初始化一次）
+
+    消息应为 logger.info('%s', LazyJson(row))：序列化和写文件都在后台线程中完成，调用方只入队
+    """
+    logger = logging.getLogger(name)
+    with _setup_lock:
+        if name in _jsonl_listeners:
+            return logger
+        log_dir = Path(path).parent
+        log_dir.mkdir(parents=True, exist_ok=True)
+        file_handler = logging.FileHandler(path, encoding='utf-8', delay=True)
+        file_handler.setFormatter(logging.Formatter('%(message)s'))
+        log_queue = queue.SimpleQueue()
+        logger.setLevel(logging.INFO)
+        logger.addHandler(_DeferredQueueHandler(log_queue))
+        logger.propagate = False
+        listener = QueueListener(log_queue, file_handler)
+        listener.start()
+        _jsonl_listeners[name] = listener
+        atexit.register(_stop_jsonl_log, name)
+    return logger
+
+
+def _stop_jsonl_log(name: str):
+    with _setup_lock:
+        listener = _jsonl_listeners.pop(name, None)
+        if listener is None:
+            return
+        listener.stop()
+        logger = logging.getLogger(name)
+        for handler in list(logger.handlers):
+            if isinstance(handler, QueueHandler):
+                logger.removeHandler(handler)
+        for handler in listener.handlers:
+            handler.close()
+
+
+def stop_monitor_logging():
+    global _listener
+    with _setup_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener = None
+        logger = logging.getLogger(MONITOR_LOGGER)
+        for handler in list(logger.handlers):
+            if isinstance(handler, QueueHandler):
+                logger.removeHandler(handler)
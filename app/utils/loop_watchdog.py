@@ -0,0 +1,123 @@
+"""
+事件循环阻塞检测
+事件循环中的心跳协程每 LOOP_WATCHDOG_INTERVAL_MS 更新一次时间戳；看门狗线程发现心跳超过
+LOOP_WATCHDOG_THRESHOLD_MS 没有更新时，抓取事件循环线程当时的调用栈（sys._current_frames），
+把阻塞位置写入日志，并在恢复后记录阻塞时长。
+
+指标:
+  event_loop_blocked_total{site}   检测到的阻塞次数（site 为调用栈中最内层的 app 代码位置）
+  event_loop_block_seconds         每次阻塞的持续时间
+  event_loop_lag_seconds           最近一次检查时的心跳延迟
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, Optional
+
+from app.config.settings import get_settings
+from app.utils import metrics
+from app.utils.logs import setup_monitor_logging
+
+logger = logging.getLogger('monitor.watchdog')
+
+BLOCKED = metrics.counter('event_loop_blocked_total', '事件循环阻塞次数', ('site',))
+BLOCK_SECONDS = metrics.histogram('event_loop_block_seconds', '事件循环单次阻塞时长（秒）',
+                                  buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+LAG_SECONDS = metrics.gauge('event_loop_lag_seconds', '事件循环心跳延迟（秒）')
+
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+
+
+def _blocking_site(frame) -> str:
+    """调用栈中最内层的 app 代码位置（没有时取最内层帧），用作指标标签"""
+    innermost = frame
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_APP_DIR) and not filename.endswith('loop_watchdog.py'):
+            return f'{os.path.relpath(filename, _APP_DIR)}:{frame.f_code.co_name}'
+        frame = frame.f_back
+    return f'{os.path.basename(innermost.f_code.co_filename)}:{innermost.f_code.co_name}'
+
+
+class LoopWatchdog:
+    """检测事件循环阻塞（心跳协程 + 看门狗线程）"""
+
+    def __init__(self, threshold_ms: Optional[float] = None, interval_ms: Optional[float] = None):
+        settings = get_settings()
+        self.threshold = (threshold_ms or settings.LOOP_WATCHDOG_THRESHOLD_MS) / 1000.0
+        self.interval = max(10.0, interval_ms or settings.LOOP_WATCHDOG_INTERVAL_MS) / 1000.0
+        self._last_tick = 0.0
+        self._loop_thread: Optional[int] = None
+        self._stall: Optional[Dict] = None
+        self._stop = threading.Event()
+        self._task = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """在事件循环中调用：启动心跳协程和看门狗线程"""
+        if self._thread is not None:
+            return
+        setup_monitor_logging()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._run, daemon=True, name='loop-watchdog')
+        self._thread.start()
+        logger.info('[Watchdog] ✅ 事件循环阻塞检测已启动 - 阈值: %gms', self.threshold * 1000)
+
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _heartbeat(self):
+        self._loop_thread = threading.get_ident()
+        while True:
+            self._last_tick = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            last_tick = self._last_tick
+            if not last_tick:
+                continue
+            # 心跳本应在 last_tick + interval 时再次更新，超出部分即为延迟
+            lag = max(0.0, time.monotonic() - last_tick - self.interval)
+            LAG_SECONDS.set(lag)
+            if lag >= self.threshold:
+                if self._stall is None:
+                    self._stall = self._capture(last_tick + self.interval, lag)
+            elif self._stall is not None:
+                self._report_recovered(last_tick)
+
+    def _capture(self, started: float, lag: float) -> Dict:
+        """抓取事件循环线程的调用栈并立即报告（阻塞可能一直不结束）"""
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            site, stack = 'unknown', []
+        else:
+            site = _blocking_site(frame)
+            frames = traceback.extract_stack(frame)
+            # 只保留事件循环回调（asyncio Handle._run）以内的帧，外层的 run_forever 等对定位无用
+            for i in range(len(frames) - 1, -1, -1):
+                if frames[i].filename.endswith(os.path.join('asyncio', 'events.py')):
+                    frames = frames[i + 1:]
+                    break
+            stack = [line.rstrip() for line in traceback.format_list(frames[-15:])]
+        BLOCKED.inc(site=site)
+        logger.warning(
+            '[Watchdog] ⚠️ 事件循环已阻塞 %.0fms - 位置: %s\n%s', lag * 1000, site, '\n'.join(stack),
+            extra={'fields': {'event': 'loop_blocked', 'lag_ms': round(lag * 1000, 1), 'site': site, 'stack': stack}}
+        )
+        return {'started': started, 'site': site}
+
+    def _report_recovered(self, resumed: float):
+        stall, self._stall = self._stall, None
+        duration = max(0.0, resumed - stall['started'])
+        BLOCK_SECONDS.observe(duration)
+        logger.info(
+            '[Watchdog] ✅ 事件循环已恢复 - 阻塞 %.0fms, 位置: %s', duration * 1000, stall['site'],
+            extra={'fields': {'event': 'loop_recovered', 'blocked_ms': round(duration * 1000, 1), 'site': stall['site']}}
+        )
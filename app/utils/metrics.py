@@ -0,0 +1,241 @@
+"""
+进程内指标注册表（Prometheus 文本格式）
+计数器（Counter）、仪表（Gauge）和固定分桶直方图（Histogram），支持标签；
+API 进程通过 /metrics 暴露，机器人进程通过 METRICS_BOT_PORT 上的独立 HTTP 服务暴露。
+
+用法:
+  from app.utils import metrics
+  OKX_POLL = metrics.histogram('okx_poll_seconds', 'OKX 一轮价格轮询耗时')
+  with OKX_POLL.time():
+      ...
+  metrics.counter('llm_requests_total', 'LLM 请求数', ('result',)).inc(result='ok')
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlparse
+
+# 默认分桶（秒）：覆盖亚毫秒级的 SQLite 操作到数十秒的 LLM 请求
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_str(names: Sequence[str], values: Tuple, extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, label_values: Dict) -> Tuple:
+        return tuple(str(label_values.get(n, '')) for n in self.labels)
+
+    def render(self):
+        yield f'# HELP {self.name} {self.doc}'
+        yield f'# TYPE {self.name} {self.kind}'
+        yield from self._samples()
+
+    def _samples(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, doc, labels=()):
+        super().__init__(name, doc, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **label_values):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **label_values) -> float:
+        return self._values.get(self._key(label_values), 0.0)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f'{self.name}{_label_str(self.labels, key)} {value:g}'
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value: float, **label_values):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def dec(self, amount: float = 1.0, **label_values):
+        self.inc(-amount, **label_values)
+
+
+class _Timer:
+    __slots__ = ('histogram', 'label_values', 'started')
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.label_values)
+        return False
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, doc, labels=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets))
+        # 标签 -> [各分桶计数..., 总数, 总和]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **label_values):
+        key = self._key(label_values)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            row[-2] += 1
+            row[-1] += value
+
+    def time(self, **label_values) -> _Timer:
+        return _Timer(self, label_values)
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, list(row)) for key, row in self._values.items()]
+        for key, row in items:
+            cumulative = 0
+            for i, bound in enumerate(self.buckets):
+                cumulative += row[i]
+                le = 'le="%g"' % bound
+                yield f'{self.name}_bucket{_label_str(self.labels, key, le)} {cumulative}'
+            le = 'le="+Inf"'
+            yield f'{self.name}_bucket{_label_str(self.labels, key, le)} {row[-2]}'
+            yield f'{self.name}_count{_label_str(self.labels, key)} {row[-2]}'
+            yield f'{self.name}_sum{_label_str(self.labels, key)} {row[-1]:g}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, doc, labels, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, doc, labels, **kwargs)
+            elif not isinstance(metric, cls) or metric.labels != tuple(labels):
+                raise ValueError(f'指标 {name} 已以不同的类型或标签注册')
+            return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, doc: str, labels: Sequence[str] = ()) -> Counter:
+    return REGISTRY._get_or_create(Counter, name, doc, labels)
+
+
+def gauge(name: str, doc: str, labels: Sequence[str] = ()) -> Gauge:
+    return REGISTRY._get_or_create(Gauge, name, doc, labels)
+
+
+def histogram(name: str, doc: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY._get_or_create(Histogram, name, doc, labels, buckets=buckets)
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+# 指标服务上的其他只读路由：路径 -> 函数(查询参数字典) -> (Content-Type, 内容)
+_routes: Dict[str, Callable[[Dict[str, str]], Tuple[str, str]]] = {}
+
+
+def add_route(path: str, handler: Callable[[Dict[str, str]], Tuple[str, str]]):
+    """在机器人进程的指标服务上挂载额外的只读路由（例如最近消息耗时）"""
+    _routes[path] = handler
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path == '/metrics':
+            content_type, text = CONTENT_TYPE, render()
+        elif parsed.path in _routes:
+            query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+            try:
+                content_type, text = _routes[parsed.path](query)
+            except Exception as e:
+                self.send_error(400, str(e))
+                return
+        else:
+            self.send_error(404)
+            return
+        body = text.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 抓取请求不写访问日志
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_http_server(port: int, host: str = '0.0.0.0') -> Optional[ThreadingHTTPServer]:
+    """在后台线程中启动 /metrics HTTP 服务（机器人进程用；进程内只启动一次）"""
+    global _server
+    if _server is not None or port <= 0:
+        return _server
+    try:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        print(f'[Metrics] ❌ 指标服务启动失败 - 端口 {port}: {e}')
+        return None
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, daemon=True, name='metrics-http').start()
+    print(f'[Metrics] ✅ 指标服务已启动 - http://{host}:{port}/metrics')
+    return _server
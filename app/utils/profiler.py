@@ -0,0 +1,114 @@
+"""
+按需启动的采样分析器
+启动后由一个后台线程按固定间隔读取所有线程的调用栈（sys._current_frames），按栈累计采样次数，
+停止时输出 collapsed stack 格式（"线程;外层函数;...;内层函数 次数"），可直接交给 flamegraph.pl / speedscope 生成火焰图。
+未启动时没有任何线程或钩子，不产生开销；运行超过 max_seconds 后自动停止。
+
+API 进程通过 /api/admin/profiler/* 控制，机器人进程通过 /profiler 斜杠命令控制。
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+from app.config.settings import get_settings
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._stacks: Counter = Counter()
+        self._samples = 0
+        self._started_at = None
+        self._stopped_at = None
+        self.interval = 0.01
+        self.max_seconds = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms: Optional[float] = None, max_seconds: Optional[float] = None) -> bool:
+        """开始采样（已在运行时返回 False）；上一次的结果被清空"""
+        settings = get_settings()
+        with self._lock:
+            if self.running:
+                return False
+            self.interval = max(1.0, interval_ms or settings.PROFILER_INTERVAL_MS) / 1000.0
+            self.max_seconds = min(max_seconds or settings.PROFILER_MAX_SECONDS, settings.PROFILER_MAX_SECONDS)
+            self._stacks = Counter()
+            self._samples = 0
+            self._started_at = time.time()
+            self._stopped_at = None
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True, name='sampling-profiler')
+            self._thread.start()
+        print(f'[Profiler] ▶️ 采样开始 - 间隔: {self.interval * 1000:g}ms, 最长: {self.max_seconds:g}秒')
+        return True
+
+    def stop(self) -> str:
+        """停止采样并返回 collapsed stack 文本（未运行时返回上一次的结果）"""
+        thread = self._thread
+        if thread is not None:
+            self._stop.set()
+            thread.join(timeout=5)
+        return self.collapsed()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + self.max_seconds
+        stacks = self._stacks
+        try:
+            while not self._stop.wait(self.interval):
+                if time.monotonic() >= deadline:
+                    print(f'[Profiler] ⏹️ 已达到最长采样时间 {self.max_seconds:g} 秒，自动停止')
+                    break
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own_id:
+                        continue
+                    labels = []
+                    while frame is not None:
+                        labels.append(_frame_label(frame))
+                        frame = frame.f_back
+                    labels.append(names.get(ident, f'thread-{ident}'))
+                    labels.reverse()
+                    stacks[';'.join(labels)] += 1
+                self._samples += 1
+        finally:
+            self._stopped_at = time.time()
+            print(f'[Profiler] ⏹️ 采样结束 - {self._samples} 轮, {len(stacks)} 个不同的调用栈')
+
+    def collapsed(self) -> str:
+        stacks = list(self._stacks.items())
+        stacks.sort(key=lambda kv: kv[1], reverse=True)
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks)
+
+    def status(self) -> Dict:
+        end = self._stopped_at or time.time()
+        return {
+            'running': self.running,
+            'interval_ms': self.interval * 1000,
+            'max_seconds': self.max_seconds,
+            'samples': self._samples,
+            'stacks': len(self._stacks),
+            'started_at': self._started_at,
+            'duration_sec': round(end - self._started_at, 3) if self._started_at else None,
+        }
+
+
+_profiler = SamplingProfiler()
+
+
+def get_profiler() -> SamplingProfiler:
+    """进程内共享的分析器"""
+    return _profiler
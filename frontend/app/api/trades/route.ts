@@ -8,12 +8,10 @@ export async function GET(request: Request) {
   try {
     const API_BASE_URL = process.env.NEXT_PUBLIC_API_BASE_URL || "http://localhost:8000"
   const { searchParams } = new URL(request.url)
-  const channelId = searchParams.get("channel_id")
 
-    let url = `${API_BASE_URL}/api/trades`
-    if (channelId) {
-      url += `?channel_id=${channelId}`
-    }
+    // 透传筛选与分页参数（channel_id、trader_id、status、symbol、side、since、until、limit、cursor）
+    const query = searchParams.toString()
+    const url = query ? `${API_BASE_URL}/api/trades?${query}` : `${API_BASE_URL}/api/trades`
     
     // 从请求头中获取Authorization token
     const authHeader = request.headers.get("authorization")
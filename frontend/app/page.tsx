@@ -2,13 +2,13 @@
 
 import { useMemo, useEffect } from "react"
 import { useRouter } from "next/navigation"
-import { useTrades, useTraders } from "@/hooks/use-trades"
+import { useTradeStats, useTraders } from "@/hooks/use-trades"
 import { useAuth } from "@/hooks/use-auth"
 import { TraderOverviewCard } from "@/components/trader-overview-card"
 import { PriceTicker } from "@/components/price-ticker"
 import { Skeleton } from "@/components/ui/skeleton"
 import { Button } from "@/components/ui/button"
-import type { Trader } from "@/lib/types"
+import type { TradeStats } from "@/lib/types"
 import { Activity, Settings, LogOut, RefreshCw, Users } from "lucide-react"
 import { cn } from "@/lib/utils"
 import Link from "next/link"
@@ -18,8 +18,8 @@ export default function TradingDashboard() {
   const { isAuthenticated, logout, isAdmin } = useAuth()
   const { traders, isLoading: tradersLoading, refresh: refreshTraders } = useTraders()
   
-  // 获取所有交易数据（不指定channel_id，获取所有）
-  const { trades: allTrades, isLoading: tradesLoading, refresh: refreshTrades } = useTrades()
+  // 按带单员汇总的统计（服务端聚合，不拉取全部交易单）
+  const { stats, isLoading: tradesLoading, refresh: refreshTrades } = useTradeStats()
 
   useEffect(() => {
     if (!isAuthenticated) {
@@ -27,14 +27,14 @@ export default function TradingDashboard() {
     }
   }, [isAuthenticated, router])
 
-  // 按带单员分组交易
-  const tradesByTrader = useMemo(() => {
-    const grouped: Record<string, typeof allTrades> = {}
-    traders.forEach(trader => {
-      grouped[trader.id] = allTrades.filter(t => t.channel_id === trader.channel_id)
+  // 按带单员索引统计
+  const statsByTrader = useMemo(() => {
+    const indexed: Record<string, TradeStats> = {}
+    stats.forEach(s => {
+      indexed[s.trader_id] = s
     })
-    return grouped
-  }, [traders, allTrades])
+    return indexed
+  }, [stats])
 
   const handleRefresh = () => {
     refreshTraders()
@@ -104,7 +104,7 @@ export default function TradingDashboard() {
               <TraderOverviewCard 
                 key={trader.id} 
                 trader={trader} 
-                trades={tradesByTrader[trader.id] || []} 
+                stats={statsByTrader[trader.id]} 
               />
             ))}
           </div>
@@ -2,7 +2,7 @@
 
 import { useState, useMemo, useEffect } from "react"
 import { useRouter, useParams } from "next/navigation"
-import { useTrades, useTraders } from "@/hooks/use-trades"
+import { useTradePages, useTradeStats, useTraders } from "@/hooks/use-trades"
 import { useAuth } from "@/hooks/use-auth"
 import { TradeCard } from "@/components/trade-card"
 import { FilterBar } from "@/components/filter-bar"
@@ -11,12 +11,10 @@ import { StatsSummary } from "@/components/stats-summary"
 import { HistorySection } from "@/components/history-section"
 import { Skeleton } from "@/components/ui/skeleton"
 import { Button } from "@/components/ui/button"
-import type { StatusFilter, SideFilter, TradeStatus } from "@/lib/types"
+import type { StatusFilter, SideFilter } from "@/lib/types"
 import { Activity, ArrowLeft, Settings, LogOut, Users } from "lucide-react"
 import Link from "next/link"
 
-const ENDED_STATUSES: TradeStatus[] = ["已止盈", "已止损", "带单主动止盈", "带单主动止损"]
-
 export default function TraderDetailPage() {
   const router = useRouter()
   const params = useParams()
@@ -25,10 +23,26 @@ export default function TraderDetailPage() {
   const { traders, isLoading: tradersLoading } = useTraders()
   const trader = traders.find(t => t.id === traderId)
   
-  // 只有在找到 trader 时才获取交易数据
-  const { trades, isLoading, isError, error, refresh } = useTrades(
-    trader ? trader.channel_id : undefined
-  )
+  // 只有在找到 trader 时才获取交易数据：未结束的交易单一次取一整页，历史交易单按需分页加载
+  const {
+    trades: activeTrades,
+    hasMore: activeHasMore,
+    loadMore: loadMoreActive,
+    isLoadingMore: activeLoadingMore,
+    isLoading,
+    isError,
+    error,
+    refresh: refreshActive,
+  } = useTradePages(trader ? { trader_id: trader.id, status: "open", limit: 500 } : null)
+  const history = useTradePages(trader ? { trader_id: trader.id, status: "ended" } : null, 10000)
+  const { stats, refresh: refreshStats } = useTradeStats(traderId, !!trader)
+  const traderStats = stats.find((s) => s.trader_id === traderId)
+
+  const refresh = () => {
+    refreshActive()
+    history.refresh()
+    refreshStats()
+  }
 
   useEffect(() => {
     if (!isAuthenticated) {
@@ -41,25 +55,8 @@ export default function TraderDetailPage() {
   const [symbolFilter, setSymbolFilter] = useState<string>("all")
 
   const symbols = useMemo(() => {
-    return [...new Set(trades.map((t) => t.symbol))]
-  }, [trades])
-
-  const { activeTrades, historyTrades } = useMemo(() => {
-    const active: typeof trades = []
-    const history: typeof trades = []
-
-    trades.forEach((trade) => {
-      if (ENDED_STATUSES.includes(trade.status)) {
-        history.push(trade)
-      } else {
-        active.push(trade)
-      }
-    })
-
-    history.sort((a, b) => b.created_at - a.created_at)
-
-    return { activeTrades: active, historyTrades: history }
-  }, [trades])
+    return [...new Set(activeTrades.map((t) => t.symbol))]
+  }, [activeTrades])
 
   const filteredTrades = useMemo(() => {
     return activeTrades.filter((trade) => {
@@ -131,7 +128,7 @@ export default function TraderDetailPage() {
       </header>
 
       <main className="max-w-7xl mx-auto px-4 py-6 space-y-6">
-        {isLoading && trades.length === 0 ? (
+        {isLoading && activeTrades.length === 0 ? (
           <div className="grid grid-cols-1 md:grid-cols-2 gap-4">
             {[...Array(4)].map((_, i) => (
               <Skeleton key={i} className="h-48 rounded-lg" />
@@ -140,7 +137,7 @@ export default function TraderDetailPage() {
         ) : (
           <>
             {/* 统计摘要 */}
-            <StatsSummary trades={trades} />
+            <StatsSummary stats={traderStats} />
 
             {/* 筛选栏 */}
             <FilterBar
@@ -182,9 +179,18 @@ export default function TraderDetailPage() {
                 ))}
               </div>
             )}
+            {activeHasMore && (
+              <Button variant="outline" className="w-full" onClick={loadMoreActive} disabled={activeLoadingMore}>
+                {activeLoadingMore ? "加载中..." : "加载更多"}
+              </Button>
+            )}
 
             <HistorySection 
-              trades={historyTrades} 
+              trades={history.trades} 
+              total={traderStats?.ended}
+              hasMore={history.hasMore}
+              isLoadingMore={history.isLoadingMore}
+              onLoadMore={history.loadMore}
               onTradeDelete={() => refresh()}
             />
           </>
@@ -8,10 +8,14 @@ import { ChevronDown, ChevronUp, History } from "lucide-react"
 
 interface HistorySectionProps {
   trades: Trade[]
+  total?: number  // 已结束交易单总数（服务端统计），未传时显示已加载的数量
+  hasMore?: boolean
+  isLoadingMore?: boolean
+  onLoadMore?: () => void
   onTradeDelete?: (tradeId: number) => void
 }
 
-export function HistorySection({ trades, onTradeDelete }: HistorySectionProps) {
+export function HistorySection({ trades, total, hasMore, isLoadingMore, onLoadMore, onTradeDelete }: HistorySectionProps) {
   const [expanded, setExpanded] = useState(false)
 
   if (trades.length === 0) {
@@ -34,7 +38,7 @@ export function HistorySection({ trades, onTradeDelete }: HistorySectionProps) {
         <div className="flex items-center gap-2">
           <History className="w-4 h-4 text-muted-foreground" />
           <span className="font-medium">历史带单</span>
-          <span className="text-xs text-muted-foreground bg-muted px-2 py-0.5 rounded-full">{trades.length} 单</span>
+          <span className="text-xs text-muted-foreground bg-muted px-2 py-0.5 rounded-full">{total ?? trades.length} 单</span>
         </div>
         {expanded ? (
           <ChevronUp className="w-4 h-4 text-muted-foreground" />
@@ -48,6 +52,11 @@ export function HistorySection({ trades, onTradeDelete }: HistorySectionProps) {
           {trades.map((trade) => (
             <HistoryTradeCard key={trade.id} trade={trade} onDelete={handleDelete} />
           ))}
+          {hasMore && onLoadMore && (
+            <Button variant="outline" className="w-full" onClick={onLoadMore} disabled={isLoadingMore}>
+              {isLoadingMore ? "加载中..." : "加载更多"}
+            </Button>
+          )}
         </div>
       )}
     </div>
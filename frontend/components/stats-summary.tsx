@@ -1,23 +1,23 @@
 "use client"
 
 import { Card, CardContent } from "@/components/ui/card"
-import type { Trade } from "@/lib/types"
+import type { TradeStats } from "@/lib/types"
 import { TrendingUp, TrendingDown, Clock, CheckCircle } from "lucide-react"
 
 interface StatsSummaryProps {
-  trades: Trade[]
+  stats?: TradeStats
 }
 
-export function StatsSummary({ trades }: StatsSummaryProps) {
+export function StatsSummary({ stats: summary }: StatsSummaryProps) {
+  // 统计由服务端汇总（/api/trades/stats），不依赖已加载的交易单页数
   const stats = {
-    total: trades.length,
-    profit: trades.filter((t) => t.status === "浮盈").length,
-    loss: trades.filter((t) => t.status === "浮亏").length,
-    closed: trades.filter((t) => ["已止盈", "已止损", "带单主动止盈", "带单主动止损"].includes(t.status)).length,
-    pending: trades.filter((t) => t.status === "未进场").length,
+    total: summary?.total ?? 0,
+    profit: summary?.floating_profit ?? 0,
+    loss: summary?.floating_loss ?? 0,
+    closed: summary?.ended ?? 0,
   }
 
-  const totalPnL = trades.reduce((sum, t) => sum + t.pnl_points, 0)
+  const totalPnL = summary?.total_pnl_points ?? 0
 
   return (
     <div className="grid grid-cols-2 md:grid-cols-5 gap-3">
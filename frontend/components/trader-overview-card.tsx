@@ -3,47 +3,30 @@
 import { Card, CardContent } from "@/components/ui/card"
 import { Avatar, AvatarFallback, AvatarImage } from "@/components/ui/avatar"
 import { cn } from "@/lib/utils"
-import type { Trader, Trade, TradeStatus } from "@/lib/types"
+import type { Trader, TradeStats } from "@/lib/types"
 import { TrendingUp, TrendingDown, Clock, ArrowRight } from "lucide-react"
 import { formatPnL, formatPercent } from "@/lib/trade-utils"
 import { useRouter } from "next/navigation"
 
 interface TraderOverviewCardProps {
   trader: Trader
-  trades: Trade[]
+  stats?: TradeStats
 }
 
-const ENDED_STATUSES: TradeStatus[] = ["已止盈", "已止损", "带单主动止盈", "带单主动止损"]
-
 export function TraderOverviewCard({ trader, trades }: TraderOverviewCardProps) {
   const router = useRouter()
   
-  // 计算统计数据
-  const activeTrades = trades.filter(t => !ENDED_STATUSES.includes(t.status))
-  const pendingTrades = trades.filter(t => t.status === "待入场")
-  const endedTrades = trades.filter(t => ENDED_STATUSES.includes(t.status))
-  
-  // 计算总盈亏（只计算已入场的交易）
-  const enteredTrades = activeTrades.filter(t => t.status !== "待入场")
-  const totalPnl = enteredTrades.reduce((sum, t) => {
-    if (t.pnl_points !== null && t.pnl_points !== undefined) {
-      return sum + t.pnl_points
-    }
-    return sum
-  }, 0)
-  
-  const totalPnlPercent = enteredTrades.length > 0 
-    ? enteredTrades.reduce((sum, t) => {
-        if (t.pnl_percent !== null && t.pnl_percent !== undefined) {
-          return sum + t.pnl_percent
-        }
-        return sum
-      }, 0) / enteredTrades.length
-    : 0
-  
-  // 计算盈利和亏损交易数
-  const profitableTrades = enteredTrades.filter(t => (t.pnl_points ?? 0) >= 0).length
-  const losingTrades = enteredTrades.filter(t => (t.pnl_points ?? 0) < 0).length
+  // 统计数据由服务端汇总（/api/trades/stats）
+  const openCount = stats?.open ?? 0
+  const pendingCount = stats?.pending ?? 0
+  const endedCount = stats?.ended ?? 0
+  const enteredCount = stats?.entered ?? 0
+  // 总盈亏只计算已入场的交易
+  const totalPnl = stats?.entered_pnl_points ?? 0
+  const totalPnlPercent = stats?.entered_pnl_percent_avg ?? 0
+  const profitableTrades = stats?.profitable ?? 0
+  const losingTrades = stats?.losing ?? 0
+  const latestTrades = stats?.latest_open ?? []
   
   const handleClick = () => {
     router.push(`/trader/${trader.id}`)
@@ -102,20 +85,20 @@ export function TraderOverviewCard({ trader, trades }: TraderOverviewCardProps)
         <div className="grid grid-cols-3 gap-3 text-center">
           <div className="space-y-1">
             <p className="text-xs text-muted-foreground">活跃单</p>
-            <p className="text-lg font-semibold">{activeTrades.length}</p>
+            <p className="text-lg font-semibold">{openCount}</p>
           </div>
           <div className="space-y-1">
             <p className="text-xs text-muted-foreground">待入场</p>
-            <p className="text-lg font-semibold text-muted-foreground">{pendingTrades.length}</p>
+            <p className="text-lg font-semibold text-muted-foreground">{pendingCount}</p>
           </div>
           <div className="space-y-1">
             <p className="text-xs text-muted-foreground">已结束</p>
-            <p className="text-lg font-semibold">{endedTrades.length}</p>
+            <p className="text-lg font-semibold">{endedCount}</p>
           </div>
         </div>
 
         {/* 盈亏统计 */}
-        {enteredTrades.length > 0 && (
+        {enteredCount > 0 && (
           <div className="flex items-center justify-between pt-2 border-t border-border">
             <div className="flex items-center gap-4 text-sm">
               <div className="flex items-center gap-1.5">
@@ -133,10 +116,10 @@ export function TraderOverviewCard({ trader, trades }: TraderOverviewCardProps)
         )}
 
         {/* 最新交易预览 */}
-        {activeTrades.length > 0 && (
+        {latestTrades.length > 0 && (
           <div className="pt-2 border-t border-border space-y-2">
             <p className="text-xs text-muted-foreground mb-2">最新交易</p>
-            {activeTrades.slice(0, 3).map((trade) => (
+            {latestTrades.map((trade) => (
               <div key={trade.id} className="flex items-center justify-between text-sm">
                 <div className="flex items-center gap-2">
                   <span className="font-medium">{trade.symbol}</span>
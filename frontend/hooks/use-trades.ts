@@ -1,7 +1,14 @@
 "use client"
 
 import useSWR from "swr"
-import type { TradesResponse, TradersResponse, PricesResponse } from "@/lib/types"
+import useSWRInfinite from "swr/infinite"
+import type {
+  TradesResponse,
+  TradersResponse,
+  PricesResponse,
+  TradeQuery,
+  TradeStatsResponse,
+} from "@/lib/types"
 
 const fetcher = async (url: string) => {
   const token = typeof window !== "undefined" ? localStorage.getItem("auth_token") : null
@@ -40,14 +47,37 @@ const fetcher = async (url: string) => {
   return data
 }
 
-export function useTrades(channelId?: string) {
-  const url = channelId ? `/api/trades?channel_id=${channelId}` : "/api/trades"
-  const { data, error, isLoading, mutate } = useSWR<TradesResponse>(
-    url,
+function tradesUrl(query: TradeQuery, cursor?: string | null) {
+  const params = new URLSearchParams()
+  Object.entries(query).forEach(([key, value]) => {
+    if (value !== undefined && value !== null && value !== "") {
+      params.set(key, String(value))
+    }
+  })
+  if (cursor) {
+    params.set("cursor", cursor)
+  }
+  const qs = params.toString()
+  return qs ? `/api/trades?${qs}` : "/api/trades"
+}
+
+/**
+ * 分页获取交易单（服务端筛选，按创建时间倒序的游标分页）
+ * query 为 null 时不发起请求；刷新时只重新请求已加载的页
+ */
+export function useTradePages(query: TradeQuery | null, refreshInterval = 3000) {
+  const getKey = (pageIndex: number, previous: TradesResponse | null) => {
+    if (!query) return null
+    if (pageIndex === 0) return tradesUrl(query)
+    if (!previous?.next_cursor) return null
+    return tradesUrl(query, previous.next_cursor)
+  }
+  const { data, error, isLoading, isValidating, mutate, size, setSize } = useSWRInfinite<TradesResponse>(
+    getKey,
     fetcher,
     {
-    refreshInterval: 3000,
-    revalidateOnFocus: true,
+      refreshInterval,
+      revalidateOnFocus: true,
       revalidateOnReconnect: true,
       errorRetryCount: 3,
       errorRetryInterval: 2000,
@@ -57,8 +87,46 @@ export function useTrades(channelId?: string) {
     }
   )
 
+  const pages = data || []
+  // 刷新期间新交易单会让各页边界移动，按 id 去重
+  const seen = new Set<number>()
+  const trades = pages.flatMap((page) => page.data).filter((trade) => {
+    if (seen.has(trade.id)) return false
+    seen.add(trade.id)
+    return true
+  })
+
+  return {
+    trades,
+    hasMore: !!pages[pages.length - 1]?.next_cursor,
+    loadMore: () => setSize(size + 1),
+    isLoadingMore: isValidating && size > pages.length,
+    isLoading,
+    isError: !!error,
+    error: error?.message,
+    refresh: mutate,
+  }
+}
+
+/**
+ * 按带单员汇总的交易统计（总数、各状态数量、盈亏、最新未结束交易单）
+ * enabled 为 false 时不发起请求
+ */
+export function useTradeStats(traderId?: string, enabled = true) {
+  const url = !enabled ? null : traderId ? `/api/trades/stats?trader_id=${encodeURIComponent(traderId)}` : "/api/trades/stats"
+  const { data, error, isLoading, mutate } = useSWR<TradeStatsResponse>(url, fetcher, {
+    refreshInterval: 3000,
+    revalidateOnFocus: true,
+    revalidateOnReconnect: true,
+    errorRetryCount: 3,
+    errorRetryInterval: 2000,
+    onError: (err) => {
+      console.error("获取交易统计失败:", err)
+    },
+  })
+
   return {
-    trades: data?.data || [],
+    stats: data?.data || [],
     isLoading,
     isError: !!error,
     error: error?.message,
@@ -43,6 +43,42 @@ export interface Trader {
 export interface TradesResponse {
   success: boolean
   data: Trade[]
+  next_cursor?: string | null  // 分页时下一页的游标（传 limit / cursor 时返回），为空表示没有下一页
+}
+
+// 按带单员汇总的交易统计（/api/trades/stats）
+export interface TradeStats {
+  trader_id: string
+  total: number
+  open: number  // 未结束（待入场 + 已入场）
+  pending: number  // 待入场
+  entered: number  // 已入场（持仓中 + 部分出局）
+  ended: number  // 已结束
+  floating_profit: number  // 浮盈中
+  floating_loss: number  // 浮亏中
+  entered_pnl_points: number  // 已入场交易单的总盈亏
+  entered_pnl_percent_avg: number  // 已入场交易单的平均盈亏比例
+  profitable: number  // 已入场盈利单数
+  losing: number  // 已入场亏损单数
+  total_pnl_points: number  // 全部交易单的总盈亏
+  latest_open: Trade[]  // 最新的未结束交易单
+}
+
+export interface TradeStatsResponse {
+  success: boolean
+  data: TradeStats[]
+}
+
+// /api/trades 的筛选参数
+export type TradeStatusGroup = "pending" | "active" | "open" | "ended"
+
+export interface TradeQuery {
+  channel_id?: string
+  trader_id?: string
+  status?: TradeStatusGroup
+  symbol?: string
+  side?: TradeSide
+  limit?: number
 }
 
 export interface PricesResponse {
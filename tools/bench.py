@@ -0,0 +1,526 @@
+"""
+交易状态计算与 API 查询基准
+按规模（默认 1k / 10k / 100k 笔交易单）生成合成的 membership.db：多个带单员、多个交易对，
+生命周期分布接近线上（大部分已结束，少量待入场 / 持仓中 / 部分出局），并附带更新记录、事件和会员数据；
+然后在同一进程内计时：
+  sweep_load            机器人启动时加载未结束交易单（ActiveTradeStore.load）
+  sweep_round           一轮定时状态计算 MonitorCog._compute_round 占用事件循环的时间（币价随机游走）
+  sweep_flush           该轮变化在后台线程中批量写回数据库的时间
+  compute_trade_status  MonitorCog._compute_trade_status 单次调用
+  sweep_reconcile       内存交易单与数据库对账
+  api_trades_list       GET /api/trades 首页（通过 ASGI 直接调用 FastAPI 应用，不经过网络）
+  api_trades_by_trader  GET /api/trades?trader_id=...
+  api_trade_stats       GET /api/trades/stats（首页概览的按带单员汇总）
+  api_trade_detail      GET /api/trades/{id}
+  membership_expiry     MembershipCog._check_expired 一轮（会员角色下的全部成员）
+每个规模在独立的子进程中运行（各自的数据库和配置），结果写入 JSON，可用 --baseline 与之前的结果对比
+
+用法:
+  python -m tools.bench                                   # 1k / 10k / 100k
+  python -m tools.bench --scales 1000,10000 --out bench.json
+  python -m tools.bench --baseline bench-old.json         # 输出与上次结果的 p50 变化
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import secrets
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+from tools.parser_eval import percentile
+
+SYMBOLS = {
+    'BTC': 65000.0, 'ETH': 3200.0, 'SOL': 150.0, 'DOGE': 0.15, 'XRP': 0.55, 'LTC': 80.0, 'ADA': 0.45,
+    'AVAX': 35.0, 'LINK': 15.0, 'DOT': 7.0, 'TRX': 0.12, 'BCH': 450.0, 'TON': 6.5, 'SUI': 1.2,
+    'APT': 9.0, 'ARB': 1.1, 'OP': 2.2, 'NEAR': 6.0, 'FIL': 5.5, 'ATOM': 8.5,
+}
+
+# 生命周期分布：(权重, 生命周期, 结束状态)
+LIFECYCLE_MIX = (
+    (0.35, 'closed', '已止盈'),
+    (0.25, 'closed', '已止损'),
+    (0.05, 'closed', '带单主动止盈'),
+    (0.05, 'closed', '带单主动止损'),
+    (0.08, 'pending', None),
+    (0.17, 'active', None),
+    (0.05, 'partial', None),
+)
+
+GUILD_ID = '900000000000000001'
+MEMBER_ROLE_ID = '900000000000000002'
+CHANNEL_BASE = 1100000000000000000
+MESSAGE_BASE = 1200000000000000000
+USER_BASE = 1300000000000000000
+
+
+def _inst_id(base: str) -> str:
+    return f'{base}-USDT-SWAP'
+
+
+def _traders(count: int) -> List[Dict]:
+    return [{'id': f'trader{n}', 'channel_id': str(CHANNEL_BASE + n), 'name': f'带单员{n}'} for n in range(1, count + 1)]
+
+
+def _pick_lifecycle(rng: random.Random):
+    r = rng.random()
+    for weight, lifecycle, final_status in LIFECYCLE_MIX:
+        r -= weight
+        if r <= 0:
+            return lifecycle, final_status
+    return LIFECYCLE_MIX[-1][1:]
+
+
+# ========== 数据生成 ==========
+
+def generate(db_path: str, trades: int, traders: List[Dict], members: int, seed: int = 42) -> Dict:
+    """向 membership.db 写入合成数据，返回各表行数"""
+    from app.db.connection import get_database
+    from app.db.migrations import migrate_membership_db
+    from app.services.trades import ledger
+
+    migrate_membership_db(db_path)
+    rng = random.Random(seed)
+    now = int(time.time())
+    span = 90 * 86400
+    trade_rows, update_rows, status_rows, event_rows = [], [], [], []
+    bases = list(SYMBOLS)
+
+    for trade_id in range(1, trades + 1):
+        trader = traders[trade_id % len(traders)]
+        base = rng.choice(bases)
+        side = rng.choice(('long', 'short'))
+        sign = 1 if side == 'long' else -1
+        # 入场价在参考价 ±3% 内，止盈 2%~8%，止损 1%~4%
+        entry = SYMBOLS[base] * (1 + rng.uniform(-0.03, 0.03))
+        tp = entry * (1 + sign * rng.uniform(0.02, 0.08))
+        sl = entry * (1 - sign * rng.uniform(0.01, 0.04))
+        created = now - span + int(span * trade_id / trades)
+        message_id = str(MESSAGE_BASE + trade_id * 10)
+        lifecycle, final_status = _pick_lifecycle(rng)
+        filled_at = created + rng.randint(60, 3600)
+        closed_at = final_pnl = None
+
+        fields = {'trader_id': trader['id'], 'channel_id': trader['channel_id'], 'symbol': _inst_id(base),
+                  'side': side, 'entry_price': entry, 'take_profit': tp, 'stop_loss': sl,
+                  'confidence': round(rng.uniform(0.6, 0.99), 2)}
+        data = dict(fields, source_message_id=message_id)
+        event_rows.append((trade_id, ledger.EVENT_ENTRY_PARSED, '待入场', entry, None,
+                           json.dumps(data, ensure_ascii=False), 'bot', created))
+        if lifecycle != 'pending':
+            event_rows.append((trade_id, ledger.EVENT_ENTRY_FILLED, '浮盈', entry, None, None, 'bot', filled_at))
+        # 带单员中途的喊单更新（不改变状态）
+        for n in range(rng.randint(0, 2)):
+            update_rows.append((trader['id'], trade_id, str(MESSAGE_BASE + trade_id * 10 + 1 + n), message_id,
+                                trader['channel_id'], str(USER_BASE), '继续拿住，移动止损到成本', None, None, 0,
+                                created + 600 * (n + 1)))
+        if lifecycle == 'partial':
+            pnl = round(abs(tp - entry) * rng.uniform(0.3, 0.6), 4)
+            partial_at = filled_at + rng.randint(600, 86400)
+            update_rows.append((trader['id'], trade_id, str(MESSAGE_BASE + trade_id * 10 + 5), message_id,
+                                trader['channel_id'], str(USER_BASE), '部分止盈，剩余仓位继续持有', pnl, '部分出局', 1,
+                                partial_at))
+            event_rows.append((trade_id, ledger.EVENT_PARTIAL_EXIT, '部分出局', None, pnl, None, 'message', partial_at))
+        if lifecycle == 'closed':
+            closed_at = filled_at + rng.randint(600, 5 * 86400)
+            if final_status in ('已止盈', '带单主动止盈'):
+                close_price = tp if final_status == '已止盈' else entry + (tp - entry) * rng.uniform(0.3, 0.9)
+            else:
+                close_price = sl if final_status == '已止损' else entry + (sl - entry) * rng.uniform(0.3, 0.9)
+            final_pnl = round(sign * (close_price - entry), 4)
+            if final_status.startswith('带单'):
+                update_rows.append((trader['id'], trade_id, str(MESSAGE_BASE + trade_id * 10 + 6), message_id,
+                                    trader['channel_id'], str(USER_BASE), final_status, final_pnl, final_status, 0,
+                                    closed_at))
+            event_rows.append((trade_id, ledger.close_event_for_status(final_status), final_status, close_price,
+                               final_pnl, None, 'bot', closed_at))
+            status_rows.append((trade_id, final_status, final_pnl, final_pnl / entry * 100, close_price, closed_at))
+        elif lifecycle == 'pending':
+            status_rows.append((trade_id, '待入场', None, None, entry * (1 + sign * 0.01), now))
+        else:
+            mark = entry * (1 + rng.uniform(-0.02, 0.02))
+            pnl = round(sign * (mark - entry), 4)
+            status_rows.append((trade_id, '浮盈' if pnl > 0 else '浮亏', pnl, pnl / entry * 100, mark, now))
+
+        trade_rows.append((trade_id, trader['id'], message_id, trader['channel_id'], str(USER_BASE), fields['symbol'],
+                           side, entry, tp, sl, fields['confidence'], created, lifecycle, closed_at, final_pnl))
+
+    db = get_database(db_path)
+    with db.transaction() as con:
+        con.executemany(
+            """
+            INSERT INTO trades(id, trader_id, source_message_id, channel_id, user_id, symbol, side, entry_price,
+                take_profit, stop_loss, confidence, created_at, lifecycle, closed_at, final_pnl)
+            VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+            """,
+            trade_rows
+        )
+        con.executemany(
+            """
+            INSERT INTO trade_updates(trader_id, trade_ref_id, source_message_id, reply_to_message_id, channel_id,
+                user_id, text, pnl_points, status, is_partial, created_at)
+            VALUES(?,?,?,?,?,?,?,?,?,?,?)
+            """,
+            update_rows
+        )
+        con.executemany(
+            """
+            INSERT INTO trade_status_detail(trade_id, status, pnl_points, pnl_percent, current_price, updated_at)
+            VALUES(?,?,?,?,?,?)
+            """,
+            status_rows
+        )
+        con.executemany(
+            """
+            INSERT INTO trade_events(trade_id, event_type, status, price, pnl_points, data, source, created_at)
+            VALUES(?,?,?,?,?,?,?,?)
+            """,
+            event_rows
+        )
+        # 读模型与线上一样由事件重放得到
+        ledger.rebuild(con, full=True)
+
+        # 会员：过期体验 / 有效会员 / 过期会员 / 体验中
+        member_rows = []
+        for n in range(members):
+            kind = n % 10
+            if kind < 4:
+                row = (1, now - 86400, now - 64800, None)
+            elif kind < 7:
+                row = (1, now - 30 * 86400, now - 29 * 86400, now + rng.randint(1, 30) * 86400)
+            elif kind < 9:
+                row = (1, now - 60 * 86400, now - 59 * 86400, now - rng.randint(1, 30) * 86400)
+            else:
+                row = (1, now - 3600, now + 3 * 3600, None)
+            member_rows.append((str(USER_BASE + n),) + row)
+        con.executemany(
+            "INSERT INTO users(user_id, used_trial, trial_start, trial_end, member_end) VALUES(?,?,?,?,?)",
+            member_rows
+        )
+    return {
+        'trades': len(trade_rows),
+        'trade_updates': len(update_rows),
+        'trade_events': len(event_rows),
+        'members': members,
+        'open_trades': sum(1 for r in trade_rows if r[12] != 'closed'),
+    }
+
+
+# ========== 计时 ==========
+
+def _summary(samples_ms: List[float]) -> Dict:
+    return {
+        'n': len(samples_ms),
+        'mean_ms': round(sum(samples_ms) / len(samples_ms), 4) if samples_ms else None,
+        'p50_ms': round(percentile(samples_ms, 50), 4) if samples_ms else None,
+        'p95_ms': round(percentile(samples_ms, 95), 4) if samples_ms else None,
+        'max_ms': round(max(samples_ms), 4) if samples_ms else None,
+    }
+
+
+def _repeat(fn: Callable, repeat: int, budget_sec: float) -> List[float]:
+    """至少运行一次，最多 repeat 次或超过时间预算为止"""
+    samples = []
+    deadline = time.perf_counter() + budget_sec
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+        if time.perf_counter() >= deadline:
+            break
+    return samples
+
+
+async def _asgi_get(app, path: str, query: str = '', token: str = ''):
+    """直接调用 ASGI 应用（不经过网络和 HTTP 客户端），返回 (状态码, 响应体)"""
+    messages = []
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'bench'), (b'authorization', f'Bearer {token}'.encode())],
+        'client': ('127.0.0.1', 0), 'server': ('bench', 80),
+    }
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    status = next(m['status'] for m in messages if m['type'] == 'http.response.start')
+    body = b''.join(m.get('body', b'') for m in messages if m['type'] == 'http.response.body')
+    return status, body
+
+
+class _FakeMember:
+    """_check_expired 只用到成员的 id / name 和 remove_roles"""
+
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.name = f'user{user_id}'
+
+    async def remove_roles(self, *roles, reason=None):
+        return None
+
+
+class _FakeGuild:
+    def __init__(self, members: List[_FakeMember]):
+        self.role = type('Role', (), {'members': members})()
+
+    def get_role(self, role_id):
+        return self.role
+
+
+def _bench_api(api, traders: List[Dict], trades: int, repeat: int, budget: float, rng: random.Random) -> Dict:
+    with api.users_db.transaction() as con:
+        cur = con.execute(
+            "INSERT INTO users(username, password_hash, role, created_at, updated_at) VALUES('bench', '', 'admin', ?, ?)",
+            (int(time.time()), int(time.time()))
+        )
+        token = secrets.token_urlsafe(24)
+        con.execute("INSERT INTO sessions(token, user_id, expires_at, created_at) VALUES(?,?,?,?)",
+                    (token, cur.lastrowid, int(time.time()) + 86400, int(time.time())))
+    loop = asyncio.new_event_loop()
+    results = {}
+    try:
+        def call(path, query=''):
+            status, body = loop.run_until_complete(_asgi_get(api.app, path, query, token))
+            if status != 200:
+                raise RuntimeError(f'{path}?{query} 返回 {status}: {body[:200]!r}')
+            return body
+
+        size = len(call('/api/trades'))
+        results['api_trades_list'] = dict(_summary(_repeat(lambda: call('/api/trades'), repeat, budget)),
+                                          response_bytes=size)
+        results['api_trades_by_trader'] = _summary(_repeat(
+            lambda: call('/api/trades', f'trader_id={rng.choice(traders)["id"]}'), repeat * 4, budget))
+        results['api_trade_stats'] = _summary(_repeat(lambda: call('/api/trades/stats'), repeat, budget))
+        results['api_trade_detail'] = _summary(_repeat(
+            lambda: call(f'/api/trades/{rng.randint(1, trades)}'), repeat * 40, budget))
+    finally:
+        loop.close()
+    return results
+
+
+def _bench_sweep(cog, rounds: int, budget: float, rng: random.Random) -> Dict:
+    results = {}
+    started = time.perf_counter()
+    loaded = cog.active_trades.load()
+    results['sweep_load'] = dict(_summary([(time.perf_counter() - started) * 1000]), open_trades=loaded)
+
+    prices = {_inst_id(base): price for base, price in SYMBOLS.items()}
+
+    async def run_rounds():
+        # 与线上一样在事件循环中运行：sweep_round 是占用事件循环的部分，sweep_flush 是后台线程中的批量写回
+        samples, flushes = [], []
+        deadline = time.perf_counter() + budget
+        for _ in range(max(1, rounds)):
+            # 每轮币价随机游走 ±0.5%，部分交易单会入场 / 止盈 / 止损
+            for inst_id in prices:
+                prices[inst_id] *= 1 + rng.uniform(-0.005, 0.005)
+            cog.okx_cache.prices.update(prices)
+            started = time.perf_counter()
+            cog._compute_round()
+            samples.append((time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+            if cog._flush_future is not None:
+                await cog._flush_future
+            flushes.append((time.perf_counter() - started) * 1000)
+            if time.perf_counter() >= deadline:
+                break
+        return samples, flushes
+
+    flushed_before = cog.active_trades.flushed_rows
+    samples, flushes = asyncio.run(run_rounds())
+    results['sweep_round'] = dict(_summary(samples), open_trades=len(cog.active_trades))
+    results['sweep_flush'] = dict(_summary(flushes), flushed_rows=cog.active_trades.flushed_rows - flushed_before)
+
+    # 纯计算部分：对全部未结束交易单各调用一次
+    args = [(t.symbol, t.side, t.entry_price, t.take_profit, t.stop_loss, prices[t.symbol])
+            for t in list(cog.active_trades._records.values())] or [('BTC-USDT-SWAP', 'long', 1.0, 2.0, 0.5, 1.1)]
+    calls = max(len(args), 10000)
+    started = time.perf_counter()
+    compute = cog._compute_trade_status
+    for i in range(calls):
+        compute(*args[i % len(args)])
+    per_call_ms = (time.perf_counter() - started) * 1000 / calls
+    results['compute_trade_status'] = dict(_summary([per_call_ms]), calls=calls, per_call_us=round(per_call_ms * 1000, 3))
+
+    results['sweep_reconcile'] = _summary(_repeat(cog.active_trades.reconcile, 5, budget))
+    return results
+
+
+def _bench_membership(cog, members: int, repeat: int, budget: float) -> Dict:
+    fake = [_FakeMember(USER_BASE + n) for n in range(members)]
+    cog.bot = type('Bot', (), {'get_guild': lambda self, guild_id: _FakeGuild(fake)})()
+    loop = asyncio.new_event_loop()
+    try:
+        samples = _repeat(lambda: loop.run_until_complete(cog._check_expired()), repeat, budget)
+    finally:
+        loop.close()
+    return dict(_summary(samples), members=members,
+                per_member_us=round(percentile(samples, 50) * 1000 / max(1, members), 3))
+
+
+def _run_scale(scale: int, args_dict: Dict, work_dir: str, out):
+    """子进程：按规模生成数据库并运行全部基准"""
+    # 子进程的控制台输出（应用日志、后台价格轮询的连接错误）全部丢弃，结果通过队列返回
+    sys.stdout = open(os.devnull, 'w', encoding='utf-8')
+    try:
+        traders = _traders(args_dict['traders'])
+        db_dir = os.path.join(work_dir, f'scale-{scale}')
+        os.makedirs(db_dir, exist_ok=True)
+        # 必须在导入 app 之前设置：配置在首次导入时读取
+        os.environ.update({
+            'MEMBERSHIP_DB_PATH': os.path.join(db_dir, 'membership.db'),
+            'MONITOR_LOG_DIR': os.path.join(db_dir, 'logs'),
+            'TRADER_CONFIG': ';'.join(f"{t['id']}|{t['channel_id']}|{t['name']}" for t in traders),
+            'TRADER_CONFIG_PATH': '',
+            'OKX_INST_IDS': ','.join(_inst_id(b) for b in SYMBOLS),
+            # 指向本机关闭的端口：后台的价格轮询 / 交易对加载立即失败，币价由基准注入
+            'OKX_REST_BASE': 'http://127.0.0.1:9',
+            'GUILD_ID': GUILD_ID,
+            'MEMBER_ROLE_ID': MEMBER_ROLE_ID,
+            'METRICS_BOT_PORT': '0',
+            'MONITOR_LOG_DEBUG_SAMPLE_RATE': '0',
+        })
+        members = args_dict['members'] or max(100, scale // 10)
+        started = time.perf_counter()
+        counts = generate(os.environ['MEMBERSHIP_DB_PATH'], scale, traders, members, args_dict['seed'])
+        result = {'scale': scale, 'data': counts, 'generate_sec': round(time.perf_counter() - started, 2)}
+        result['db_bytes'] = os.path.getsize(os.environ['MEMBERSHIP_DB_PATH'])
+
+        import logging
+        from app.api import main as api
+        from app.bots.discord_bot import MembershipCog, MonitorCog
+        monitor = MonitorCog(None)
+        membership = MembershipCog(None)
+        for cache in (api.okx_cache, monitor.okx_cache):
+            cache.stop()
+            cache.prices.update({_inst_id(b): p for b, p in SYMBOLS.items()})
+        monitor.instruments.loaded_at = time.monotonic()
+        # 入场 / 结单等逐笔日志不计入基准
+        logging.getLogger('monitor').setLevel(logging.WARNING)
+
+        rng = random.Random(args_dict['seed'])
+        result['timings'] = {}
+        result['timings'].update(_bench_sweep(monitor, args_dict['rounds'], args_dict['budget'], rng))
+        result['timings'].update(_bench_api(api, traders, scale, args_dict['repeat'], args_dict['budget'], rng))
+        result['timings']['membership_expiry'] = _bench_membership(membership, members, args_dict['repeat'],
+                                                                   args_dict['budget'])
+        out.put(result)
+    except Exception as e:
+        import traceback
+        out.put({'scale': scale, 'error': f'{e}\n{traceback.format_exc()}'})
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run(scales: List[int], args_dict: Dict, keep: bool = False) -> Dict:
+    work_dir = tempfile.mkdtemp(prefix='bench_')
+    ctx = multiprocessing.get_context('spawn')
+    report = {
+        'meta': {
+            'timestamp': int(time.time()),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': args_dict,
+        },
+        'results': {},
+    }
+    try:
+        for scale in scales:
+            out = ctx.Queue()
+            proc = ctx.Process(target=_run_scale, args=(scale, args_dict, work_dir, out))
+            proc.start()
+            result = out.get()
+            proc.join()
+            report['results'][str(scale)] = result
+            _print_scale(result)
+    finally:
+        if keep:
+            print(f'数据库保留在: {work_dir}')
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return report
+
+
+def _fmt(value) -> str:
+    return '-' if value is None else f'{value:.3f}'
+
+
+def _print_scale(result: Dict):
+    if 'error' in result:
+        print(f"规模 {result['scale']}: ❌ {result['error']}")
+        return
+    data = result['data']
+    print(f"规模 {result['scale']}: 交易单 {data['trades']} (未结束 {data['open_trades']}), 更新 {data['trade_updates']}, "
+          f"事件 {data['trade_events']}, 会员 {data['members']}, 生成 {result['generate_sec']}s, "
+          f"数据库 {result['db_bytes'] / 1024 / 1024:.1f} MB")
+    for name, t in result['timings'].items():
+        print(f"  {name:<22} n={t['n']:<5} p50 {_fmt(t['p50_ms'])} ms  p95 {_fmt(t['p95_ms'])} ms  max {_fmt(t['max_ms'])} ms")
+
+
+def compare(report: Dict, baseline: Dict):
+    """按规模和基准项输出 p50 相对基线的变化"""
+    print(f"对比基线 (commit {baseline['meta'].get('commit')} -> {report['meta'].get('commit')}):")
+    for scale, result in report['results'].items():
+        base = baseline['results'].get(scale)
+        if not base or 'timings' not in base or 'timings' not in result:
+            continue
+        print(f'  规模 {scale}:')
+        for name, t in result['timings'].items():
+            old = base['timings'].get(name, {}).get('p50_ms')
+            new = t.get('p50_ms')
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            flag = '⚠️' if change > 10 else ('✅' if change < -10 else '  ')
+            print(f"    {flag} {name:<22} {_fmt(old)} -> {_fmt(new)} ms ({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='交易状态计算与 API 查询基准')
+    parser.add_argument('--scales', default='1000,10000,100000', help='交易单数量，逗号分隔')
+    parser.add_argument('--traders', type=int, default=20)
+    parser.add_argument('--members', type=int, default=0, help='会员数量（默认为交易单数量的 1/10，至少 100）')
+    parser.add_argument('--rounds', type=int, default=20, help='定时状态计算的轮数')
+    parser.add_argument('--repeat', type=int, default=10, help='列表接口 / 会员检查的重复次数（按交易员过滤 x4，详情 x40）')
+    parser.add_argument('--budget', type=float, default=30.0, help='每个基准项的时间预算（秒）')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default=None, help='结果 JSON 输出路径（默认 bench-<时间>.json）')
+    parser.add_argument('--baseline', default=None, help='之前的结果 JSON，输出 p50 变化')
+    parser.add_argument('--keep', action='store_true', help='保留生成的数据库')
+    args = parser.parse_args(argv)
+
+    scales = [int(s) for s in args.scales.split(',') if s.strip()]
+    args_dict = {k: getattr(args, k) for k in ('traders', 'members', 'rounds', 'repeat', 'budget', 'seed')}
+    report = run(scales, args_dict, args.keep)
+
+    out_path = args.out or time.strftime('bench-%Y%m%d-%H%M%S.json')
+    with open(out_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'结果已写入 {out_path}')
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            compare(report, json.load(f))
+    return 1 if any('error' in r for r in report['results'].values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""
+SQLite 读写争用基准
+一个写进程模拟机器人全速写入（新交易单 + 状态批量写回），多个读进程模拟 API 请求（列表页 + 详情页），
+统计写入吞吐、读取吞吐、读取 p50/p95 延迟以及 "database is locked" 错误次数
+
+用法:
+  python -m tools.db_contention                         # 共享连接层（WAL + busy_timeout + 串行写入）
+  python -m tools.db_contention --legacy                # 旧方式：每次操作新建连接，默认回滚日志
+  python -m tools.db_contention --readers 8 --seconds 20
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from tools.parser_eval import percentile
+
+SYMBOLS = ('BTC', 'ETH', 'SOL', 'DOGE', 'XRP')
+TRADERS = ('trader1', 'trader2', 'trader3')
+
+LIST_SQL = """
+    SELECT t.id, t.trader_id, t.symbol, t.side, t.entry_price, t.lifecycle, ts.status, ts.pnl_points
+    FROM trades t
+    LEFT JOIN trade_status_detail ts ON ts.trade_id = t.id
+    ORDER BY t.created_at DESC LIMIT 50
+"""
+DETAIL_SQL = "SELECT id, symbol, side, entry_price, lifecycle FROM trades WHERE id=?"
+
+
+def _open(db_path: str, legacy: bool):
+    """legacy 模式每次返回新连接；否则返回共享连接层"""
+    if legacy:
+        return None
+    from app.db.connection import get_database
+    return get_database(db_path)
+
+
+def _write_once(db, db_path: str, legacy: bool, n: int):
+    from app.db import queries
+    now = int(time.time())
+    symbol = random.choice(SYMBOLS)
+    entry = random.uniform(100, 1000)
+    trade_sql = (
+        "INSERT INTO trades(user_id, trader_id, channel_id, symbol, side, entry_price, take_profit, stop_loss, "
+        "created_at, lifecycle) VALUES(0, ?, 'bench', ?, 'long', ?, ?, ?, ?, 'active')"
+    )
+    trade_params = (random.choice(TRADERS), symbol, entry, entry * 1.05, entry * 0.95, now)
+
+    def body(con):
+        cur = con.execute(trade_sql, trade_params)
+        tid = cur.lastrowid
+        # 模拟定时任务的批量状态写回：最近的若干交易单
+        rows = [
+            {'trade_id': t, 'status': '浮盈', 'pnl_points': n % 100, 'pnl_percent': 0.1,
+             'current_price': entry, 'now': now}
+            for t in range(max(1, tid - 20), tid + 1)
+        ]
+        con.executemany(queries.UPSERT_OPEN_TRADE_STATUS, rows)
+
+    if legacy:
+        con = sqlite3.connect(db_path)
+        try:
+            body(con)
+            con.commit()
+        finally:
+            con.close()
+    else:
+        with db.transaction() as con:
+            body(con)
+
+
+def _read_once(db, db_path: str, legacy: bool):
+    if legacy:
+        con = sqlite3.connect(db_path)
+        try:
+            rows = con.execute(LIST_SQL).fetchall()
+            if rows:
+                con.execute(DETAIL_SQL, (random.choice(rows)[0],)).fetchone()
+        finally:
+            con.close()
+    else:
+        with db.reader() as con:
+            rows = con.execute(LIST_SQL).fetchall()
+            if rows:
+                con.execute(DETAIL_SQL, (random.choice(rows)[0],)).fetchone()
+
+
+def _worker(role: str, db_path: str, legacy: bool, seconds: float, start_at: float, out):
+    db = _open(db_path, legacy)
+    ops, locked, errors = 0, 0, 0
+    latencies: List[float] = []
+    while time.time() < start_at:
+        time.sleep(0.001)
+    deadline = start_at + seconds
+    while time.time() < deadline:
+        t0 = time.perf_counter()
+        try:
+            if role == 'writer':
+                _write_once(db, db_path, legacy, ops)
+            else:
+                _read_once(db, db_path, legacy)
+            ops += 1
+            latencies.append((time.perf_counter() - t0) * 1000)
+        except sqlite3.OperationalError as e:
+            if 'locked' in str(e) or 'busy' in str(e):
+                locked += 1
+            else:
+                errors += 1
+    out.put({'role': role, 'ops': ops, 'locked': locked, 'errors': errors, 'latencies': latencies})
+
+
+def run(readers: int, seconds: float, legacy: bool, busy_timeout_ms: int) -> Dict:
+    tmp = tempfile.mkdtemp(prefix='db_contention_')
+    db_path = os.path.join(tmp, 'membership.db')
+    os.environ['MEMBERSHIP_DB_PATH'] = db_path
+    os.environ['DB_BUSY_TIMEOUT_MS'] = str(busy_timeout_ms)
+    from app.db.migrations import migrate_membership_db
+    migrate_membership_db(db_path)
+
+    ctx = multiprocessing.get_context('spawn')
+    out = ctx.Queue()
+    start_at = time.time() + 2.0
+    procs = [ctx.Process(target=_worker, args=('writer', db_path, legacy, seconds, start_at, out))]
+    procs += [ctx.Process(target=_worker, args=('reader', db_path, legacy, seconds, start_at, out))
+              for _ in range(readers)]
+    for p in procs:
+        p.start()
+    results = [out.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    writes = [r for r in results if r['role'] == 'writer']
+    reads = [r for r in results if r['role'] == 'reader']
+    read_lat = [v for r in reads for v in r['latencies']]
+    write_lat = [v for r in writes for v in r['latencies']]
+    return {
+        'mode': 'legacy' if legacy else 'shared',
+        'writes_per_sec': sum(r['ops'] for r in writes) / seconds,
+        'reads_per_sec': sum(r['ops'] for r in reads) / seconds,
+        'write_p95_ms': percentile(write_lat, 95),
+        'read_p50_ms': percentile(read_lat, 50),
+        'read_p95_ms': percentile(read_lat, 95),
+        'locked_errors': sum(r['locked'] for r in results),
+        'other_errors': sum(r['errors'] for r in results),
+    }
+
+
+def _fmt(value) -> str:
+    return '-' if value is None else f'{value:.2f}'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='SQLite 读写争用基准')
+    parser.add_argument('--readers', type=int, default=4, help='读进程数量（模拟 API 并发请求）')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--legacy', action='store_true', help='旧方式：每次操作新建连接、默认回滚日志')
+    parser.add_argument('--busy-timeout-ms', type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    r = run(args.readers, args.seconds, args.legacy, args.busy_timeout_ms)
+    print(f"模式: {r['mode']}  读进程: {args.readers}  时长: {args.seconds:.0f}s")
+    print(f"  写入: {r['writes_per_sec']:.1f}/s  p95 {_fmt(r['write_p95_ms'])} ms")
+    print(f"  读取: {r['reads_per_sec']:.1f}/s  p50 {_fmt(r['read_p50_ms'])} ms  p95 {_fmt(r['read_p95_ms'])} ms")
+    print(f"  database is locked: {r['locked_errors']}  其他错误: {r['other_errors']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,495 @@
+"""
+消息入库链路压测
+按固定速率构造合成的 Discord 消息（入场信号、回复更新、回复链、webhook 发送者、闲聊），
+直接送入 MonitorCog.on_message，走完整的预过滤 -> LLM 解析 -> 入库 -> 初始状态链路；
+LLM 由本地替身服务（tools.llm_stub）代替，OKX 价格由压测注入（随机游走），不访问外部服务。
+MonitorCog 通过 cog_load 启动，定时状态计算 / 批量写回与线上一样在同一事件循环中运行；
+可选启动 API 读进程（与 tools.db_contention 相同的列表 + 详情查询）制造 SQLite 读写争用。
+
+统计: 吞吐、端到端延迟 p50/p95/p99（从计划发送时刻算起，发送落后也计入延迟）、处理中的消息数、
+结果分布、database is locked 次数、进程 RSS 增长、事件循环延迟；每 --report-every 秒输出一行，结束时写入 JSON
+
+用法:
+  python -m tools.ingest_load --rate 20 --seconds 60
+  python -m tools.ingest_load --rate 50 --seconds 3600 --latency-ms 800 --readers 4 --out soak.json   # 长时间浸泡
+  python -m tools.ingest_load --rate 50 --batch                                                        # 微批解析
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from tools.parser_eval import percentile
+
+DISCORD_EPOCH_MS = 1420070400000
+CHANNEL_BASE = 1400000000000000000
+WEBHOOK_BASE = 1500000000000000000
+USER_BASE = 1600000000000000000
+
+# 交易对：(消息中的写法, instId, 初始价格)
+COINS = (
+    (('BTC', '比特币', '大饼', 'btc'), 'BTC-USDT-SWAP', 65000.0),
+    (('ETH', '以太坊', '姨太', 'eth'), 'ETH-USDT-SWAP', 3200.0),
+    (('SOL', 'sol'), 'SOL-USDT-SWAP', 150.0),
+    (('DOGE', '狗狗币'), 'DOGE-USDT-SWAP', 0.15),
+    (('XRP', '瑞波币'), 'XRP-USDT-SWAP', 0.55),
+)
+
+NOISE = (
+    '今天波动小，休息一天，大家不要乱开单', '早安各位', '本周总结：整体收益不错，感谢大家的信任，下周继续加油',
+    '晚上有数据公布，注意控制仓位', '抱歉昨天那单没有及时通知，以后会注意', '这单取消，等待更好的点位',
+)
+
+
+def _fmt_price(value: float) -> str:
+    return f'{value:.0f}' if value >= 100 else f'{value:.4g}'
+
+
+# ========== 合成消息 ==========
+
+class _Author:
+    def __init__(self, user_id: int, name: str, bot: bool = False):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.bot = bot
+
+
+class _Channel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+
+
+class _Reference:
+    def __init__(self, message_id: int):
+        self.message_id = message_id
+        self.resolved = None
+
+
+class SyntheticMessage:
+    """MonitorCog 处理消息时用到的 discord.Message 属性"""
+
+    def __init__(self, message_id: int, channel: _Channel, author: _Author, content: str,
+                 webhook_id: Optional[int] = None, reply_to: Optional[int] = None):
+        self.id = message_id
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.webhook_id = webhook_id
+        self.reference = _Reference(reply_to) if reply_to else None
+        self.created_at = datetime.now(timezone.utc)
+
+
+class MessageFactory:
+    """按比例生成带单员消息，并把每条消息的期望解析结果写入 LLM 替身的脚本"""
+
+    def __init__(self, script: Dict[str, str], channels: int, prices: Dict[str, float],
+                 webhook_ratio: float = 0.3, seed: int = 7):
+        self.script = script
+        self.prices = prices
+        self.rng = random.Random(seed)
+        self._seq = 0
+        self.channels = []
+        for n in range(channels):
+            channel = _Channel(CHANNEL_BASE + n)
+            if self.rng.random() < webhook_ratio:
+                webhook_id = WEBHOOK_BASE + n
+                author = _Author(webhook_id, f'信号推送{n}', bot=True)
+            else:
+                webhook_id = None
+                author = _Author(USER_BASE + n, f'带单员{n}')
+            self.channels.append({'channel': channel, 'author': author, 'webhook_id': webhook_id,
+                                  'open': [], 'last_update': {}})
+
+    def _snowflake(self) -> int:
+        self._seq += 1
+        return ((int(time.time() * 1000) - DISCORD_EPOCH_MS) << 22) | (self._seq & 0x3FFFFF)
+
+    def _register(self, text: str, expected: Dict):
+        completion = json.dumps(expected, ensure_ascii=False)
+        self.script[text] = completion
+        self.script[f'[回复消息] {text}'] = completion
+
+    def _entry(self, state) -> SyntheticMessage:
+        names, inst_id, _ = self.rng.choice(COINS)
+        name = self.rng.choice(names)
+        price = self.prices[inst_id] * (1 + self.rng.uniform(-0.004, 0.004))
+        side = self.rng.choice(('long', 'short'))
+        sign = 1 if side == 'long' else -1
+        tp = price * (1 + sign * self.rng.uniform(0.01, 0.05))
+        sl = price * (1 - sign * self.rng.uniform(0.005, 0.02))
+        entry, tp, sl = _fmt_price(price), _fmt_price(tp), _fmt_price(sl)
+        if self.rng.random() < 0.5:
+            text = f"{name}现价{entry}附近做{'多' if side == 'long' else '空'}\n\n止盈:{tp}\n\n止损:{sl}"
+        else:
+            text = (f"合约策略（限价）\n\n具体产品：{name}\n\n进行方向：{'做多' if side == 'long' else '做空'}\n\n"
+                    f"进场点位：{entry}\n\n止损点位：{sl}\n\n止盈点位：{tp}")
+        # 同一价格的消息在一次压测中可能重复，追加编号保证脚本中一条文本只对应一个结果
+        text += f'\n#{self._seq + 1}'
+        self._register(text, {'type': 'entry', 'symbol': inst_id, 'side': side, 'entry_price': float(entry),
+                              'take_profit': float(tp), 'stop_loss': float(sl)})
+        message = self._message(state, text)
+        state['open'].append(message.id)
+        del state['open'][:-20]
+        return message
+
+    def _update(self, state) -> SyntheticMessage:
+        entry_id = self.rng.choice(state['open'])
+        # 有时回复上一条更新（回复链），否则直接回复入场消息
+        reply_to = state['last_update'].get(entry_id) if self.rng.random() < 0.3 else None
+        reply_to = reply_to or entry_id
+        pts = self.rng.randint(50, 2000)
+        kind = self.rng.random()
+        if kind < 0.3:
+            text, expected = f'部分止盈{pts}点，剩余部分继续持有', {'type': 'update', 'status': '部分止盈', 'pnl_points': pts}
+        elif kind < 0.5:
+            text, expected = f'全部出局，获利{pts}点', {'type': 'update', 'status': '已止盈', 'pnl_points': pts}
+            state['open'].remove(entry_id)
+        elif kind < 0.65:
+            text, expected = f'止损出局，亏损{pts}点', {'type': 'update', 'status': '已止损', 'pnl_points': -pts}
+            state['open'].remove(entry_id)
+        elif kind < 0.85:
+            text, expected = '设置成本价止损，继续持有', {'type': 'update', 'status': '浮盈'}
+        else:
+            text, expected = '补仓一次，止损不变', {'type': 'update', 'status': '补仓'}
+        text += f' #{self._seq + 1}'
+        self._register(text, expected)
+        message = self._message(state, text, reply_to)
+        state['last_update'][entry_id] = message.id
+        if len(state['last_update']) > 50:
+            state['last_update'].pop(next(iter(state['last_update'])))
+        return message
+
+    def _message(self, state, text: str, reply_to: Optional[int] = None) -> SyntheticMessage:
+        return SyntheticMessage(self._snowflake(), state['channel'], state['author'], text,
+                                state['webhook_id'], reply_to)
+
+    def next(self) -> SyntheticMessage:
+        state = self.rng.choice(self.channels)
+        r = self.rng.random()
+        if r < 0.2:
+            text = self.rng.choice(NOISE)
+            self._register(text, {})
+            return self._message(state, text)
+        if r < 0.6 and state['open']:
+            return self._update(state)
+        return self._entry(state)
+
+
+# ========== 统计 ==========
+
+class _ErrorCounter(logging.Handler):
+    """统计 monitor 日志中的错误和 database is locked（在记录日志的线程中计数，不格式化）"""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.errors = 0
+        self.locked = 0
+
+    def emit(self, record):
+        self.errors += 1
+        text = str(record.msg) + (str(record.exc_info[1]) if record.exc_info else '')
+        if 'locked' in text or 'busy' in text:
+            self.locked += 1
+
+
+def _rss_mb() -> Optional[float]:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        except Exception:
+            return None
+
+
+def _pct(values: List[float]) -> Dict:
+    if not values:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'max_ms': None}
+    return {
+        'p50_ms': round(percentile(values, 50), 1),
+        'p95_ms': round(percentile(values, 95), 1),
+        'p99_ms': round(percentile(values, 99), 1),
+        'max_ms': round(max(values), 1),
+    }
+
+
+class LoadRun:
+    def __init__(self, cog, factory: MessageFactory, rate: float, seconds: float, report_every: float, out):
+        self.cog = cog
+        self.factory = factory
+        self.rate = rate
+        self.seconds = seconds
+        self.report_every = report_every
+        self.out = out
+        self.sent = 0
+        self.done = 0
+        self.exceptions = 0
+        self.exception_locked = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.latencies: List[float] = []
+        self.loop_lag: List[float] = []
+        self.intervals: List[Dict] = []
+        self._tasks = set()
+
+    async def _one(self, message, scheduled: float):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await self.cog.on_message(message)
+        except Exception as e:
+            self.exceptions += 1
+            if 'locked' in str(e) or 'busy' in str(e):
+                self.exception_locked += 1
+        finally:
+            self.in_flight -= 1
+            self.done += 1
+            self.latencies.append((time.perf_counter() - scheduled) * 1000)
+
+    async def _lag_sampler(self, stop: asyncio.Event, interval: float = 0.05):
+        while not stop.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.loop_lag.append(max(0.0, (time.perf_counter() - started - interval) * 1000))
+
+    async def _price_walker(self, stop: asyncio.Event):
+        """每秒随机游走 ±0.2%，部分交易单会入场 / 止盈 / 止损"""
+        prices = self.factory.prices
+        while not stop.is_set():
+            for inst_id in prices:
+                prices[inst_id] *= 1 + self.factory.rng.uniform(-0.002, 0.002)
+            self.cog.okx_cache.prices.update(prices)
+            await asyncio.sleep(1.0)
+
+    async def _reporter(self, stop: asyncio.Event, started: float):
+        last_done, last_lat, last_lag = 0, 0, 0
+        while not stop.is_set():
+            await asyncio.sleep(self.report_every)
+            lat = self.latencies[last_lat:]
+            lag = self.loop_lag[last_lag:]
+            row = {
+                'elapsed_sec': round(time.perf_counter() - started, 1),
+                'sent': self.sent,
+                'done': self.done,
+                'in_flight': self.in_flight,
+                'throughput': round((self.done - last_done) / self.report_every, 2),
+                'p95_ms': round(percentile(lat, 95), 1) if lat else None,
+                'loop_lag_max_ms': round(max(lag), 1) if lag else None,
+                'rss_mb': round(_rss_mb() or 0, 1),
+            }
+            self.intervals.append(row)
+            print(f"[Load] {row['elapsed_sec']:>7.1f}s 发送 {row['sent']} 完成 {row['done']} 处理中 {row['in_flight']} "
+                  f"吞吐 {row['throughput']}/s p95 {row['p95_ms']} ms 事件循环延迟 max {row['loop_lag_max_ms']} ms "
+                  f"RSS {row['rss_mb']} MB", file=self.out, flush=True)
+            last_done, last_lat, last_lag = self.done, len(self.latencies), len(self.loop_lag)
+
+    async def run(self, drain_sec: float):
+        stop = asyncio.Event()
+        started = time.perf_counter()
+        helpers = [asyncio.create_task(c) for c in (
+            self._lag_sampler(stop), self._price_walker(stop), self._reporter(stop, started))]
+        # 开环发送：按计划时刻发送，不等待前一条处理完成
+        total = int(self.rate * self.seconds)
+        for i in range(total):
+            scheduled = started + i / self.rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            task = asyncio.create_task(self._one(self.factory.next(), scheduled))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            self.sent += 1
+        send_elapsed = time.perf_counter() - started
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=drain_sec)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        for task in helpers:
+            task.cancel()
+        return send_elapsed, elapsed
+
+
+def _message_results() -> Dict[str, float]:
+    from app.bots.discord_bot import MESSAGES
+    return {result: MESSAGES.value(source='live', result=result)
+            for result in ('stored', 'rejected', 'no_signal', 'skipped', 'error')}
+
+
+def _blocked_count() -> float:
+    from app.utils import metrics
+    text = metrics.render()
+    return sum(float(line.rsplit(' ', 1)[1]) for line in text.splitlines()
+               if line.startswith('event_loop_blocked_total{'))
+
+
+def _growth_per_10k(run: LoadRun, rss_start: Optional[float], rss_end: Optional[float]) -> Optional[float]:
+    """以第一个统计周期结束时为基准（跳过启动和缓存预热），每处理 1 万条消息的 RSS 增长"""
+    if rss_start is None or rss_end is None:
+        return None
+    base_rss, base_done = rss_start, 0
+    if len(run.intervals) >= 2:
+        base_rss, base_done = run.intervals[0]['rss_mb'], run.intervals[0]['done']
+    return round((rss_end - base_rss) / max(1, run.done - base_done) * 10000, 2)
+
+
+async def _main_async(args, workdir: str, out, stub) -> Dict:
+    from app.bots.discord_bot import MonitorCog
+    from app.utils.loop_watchdog import LoopWatchdog
+
+    prices = {inst_id: price for _, inst_id, price in COINS}
+    factory = MessageFactory(stub.script, args.channels, prices, args.webhook_ratio, args.seed)
+    bot = type('Bot', (), {'user': None, 'is_ready': lambda self: False})()
+    cog = MonitorCog(bot)
+    cog.okx_cache.stop()
+    cog.okx_cache.prices.update(prices)
+    cog.instruments.loaded_at = time.monotonic()
+    counter = _ErrorCounter()
+    logging.getLogger('monitor').addHandler(counter)
+    await cog.cog_load()
+    watchdog = LoopWatchdog()
+    watchdog.start()
+
+    readers = []
+    if args.readers:
+        from tools.db_contention import _worker
+        ctx = multiprocessing.get_context('spawn')
+        reader_out = ctx.Queue()
+        start_at = time.time() + 1.0
+        readers = [ctx.Process(target=_worker, args=('reader', os.environ['MEMBERSHIP_DB_PATH'], False,
+                                                     args.seconds, start_at, reader_out))
+                   for _ in range(args.readers)]
+        for p in readers:
+            p.start()
+
+    rss_start = _rss_mb()
+    run = LoadRun(cog, factory, args.rate, args.seconds, args.report_every, out)
+    try:
+        send_elapsed, elapsed = await run.run(args.drain_sec)
+    finally:
+        watchdog.stop()
+        await cog.cog_unload()
+    rss_end = _rss_mb()
+
+    reader_stats = None
+    if readers:
+        results = [reader_out.get() for _ in readers]
+        for p in readers:
+            p.join()
+        lat = [v for r in results for v in r['latencies']]
+        reader_stats = dict(_pct(lat), reads=sum(r['ops'] for r in results),
+                            locked=sum(r['locked'] for r in results), errors=sum(r['errors'] for r in results))
+
+    return {
+        'config': {k: getattr(args, k) for k in ('rate', 'seconds', 'channels', 'webhook_ratio', 'latency_ms',
+                                                 'jitter_ms', 'error_rate', 'readers', 'batch', 'seed')},
+        'sent': run.sent,
+        'completed': run.done,
+        'unfinished': run.sent - run.done,
+        'send_elapsed_sec': round(send_elapsed, 2),
+        'elapsed_sec': round(elapsed, 2),
+        'throughput_per_sec': round(run.done / elapsed, 2) if elapsed else None,
+        'latency': _pct(run.latencies),
+        'max_in_flight': run.max_in_flight,
+        'results': _message_results(),
+        'exceptions': run.exceptions,
+        'log_errors': counter.errors,
+        'locked_errors': counter.locked + run.exception_locked,
+        'llm_requests': stub.requests,
+        'loop_lag': _pct(run.loop_lag),
+        'loop_blocked': _blocked_count(),
+        'rss_mb': {'start': round(rss_start or 0, 1), 'end': round(rss_end or 0, 1),
+                   'growth_per_10k_messages': _growth_per_10k(run, rss_start, rss_end)},
+        'active_trades': len(cog.active_trades),
+        'api_readers': reader_stats,
+        'slowest': cog.traces.slowest(5),
+        'intervals': run.intervals,
+        'workdir': workdir,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='消息入库链路压测')
+    parser.add_argument('--rate', type=float, default=20.0, help='每秒发送的消息数')
+    parser.add_argument('--seconds', type=float, default=60.0, help='发送时长（长时间浸泡可设为数小时）')
+    parser.add_argument('--channels', type=int, default=10, help='带单员频道数')
+    parser.add_argument('--webhook-ratio', type=float, default=0.3, help='通过 webhook 发送消息的频道比例')
+    parser.add_argument('--latency-ms', type=float, default=300.0, help='LLM 替身服务延迟')
+    parser.add_argument('--jitter-ms', type=float, default=100.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='LLM 替身服务返回 503 的比例')
+    parser.add_argument('--readers', type=int, default=0, help='同时运行的 API 读进程数')
+    parser.add_argument('--batch', action='store_true', help='启用微批解析（MONITOR_BATCH_ENABLED）')
+    parser.add_argument('--drain-sec', type=float, default=60.0, help='发送结束后等待处理完成的最长时间')
+    parser.add_argument('--report-every', type=float, default=10.0)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--out', default=None, help='结果 JSON 输出路径')
+    args = parser.parse_args(argv)
+
+    from tools.llm_stub import StubLLM, StubServer
+    # 脚本由 MessageFactory 在生成消息时填充
+    stub = StubLLM({}, args.latency_ms, args.jitter_ms, 0.0, '', args.error_rate)
+    server = StubServer(stub).start()
+
+    workdir = tempfile.mkdtemp(prefix='ingest_load_')
+    channels = [CHANNEL_BASE + n for n in range(args.channels)]
+    # 必须在导入 app 之前设置：配置在首次导入时读取
+    os.environ.update({
+        'MEMBERSHIP_DB_PATH': os.path.join(workdir, 'membership.db'),
+        'MONITOR_LOG_DIR': os.path.join(workdir, 'logs'),
+        'TRADER_CONFIG': ';'.join(f'trader{n}|{cid}|带单员{n}' for n, cid in enumerate(channels)),
+        'TRADER_CONFIG_PATH': '',
+        'OKX_INST_IDS': ','.join(inst_id for _, inst_id, _ in COINS),
+        # 指向本机关闭的端口：后台价格轮询立即失败，币价由压测注入
+        'OKX_REST_BASE': 'http://127.0.0.1:9',
+        'DEEPSEEK_ENDPOINT': server.url,
+        'DEEPSEEK_API_KEY': 'stub',
+        'DEEPSEEK_FALLBACK_ENDPOINT': '',
+        'MONITOR_PARSE_ENABLED': 'true',
+        'MONITOR_BATCH_ENABLED': 'true' if args.batch else 'false',
+        'METRICS_BOT_PORT': '0',
+        'TRACE_BUFFER_SIZE': '5000',
+    })
+    # 应用的控制台输出（逐条消息日志、价格轮询错误）写入工作目录，压测进度输出到原来的 stdout
+    out = sys.stdout
+    sys.stdout = open(os.path.join(workdir, 'console.log'), 'w', encoding='utf-8')
+    print(f'[Load] 🚀 {args.rate}/s x {args.seconds:.0f}s, 频道 {args.channels}, LLM 延迟 {args.latency_ms}ms, '
+          f'工作目录 {workdir}', file=out, flush=True)
+    try:
+        report = asyncio.run(_main_async(args, workdir, out, stub))
+    finally:
+        server.stop()
+        sys.stdout.close()
+        sys.stdout = out
+
+    lat = report['latency']
+    print(f"完成 {report['completed']}/{report['sent']}，吞吐 {report['throughput_per_sec']}/s，"
+          f"最多同时处理 {report['max_in_flight']} 条")
+    print(f"  延迟 p50 {lat['p50_ms']} ms  p95 {lat['p95_ms']} ms  p99 {lat['p99_ms']} ms  max {lat['max_ms']} ms")
+    print(f"  结果 {report['results']}  异常 {report['exceptions']}  错误日志 {report['log_errors']}  "
+          f"database is locked {report['locked_errors']}")
+    print(f"  事件循环延迟 p99 {report['loop_lag']['p99_ms']} ms  max {report['loop_lag']['max_ms']} ms  "
+          f"阻塞次数 {report['loop_blocked']:g}")
+    print(f"  RSS {report['rss_mb']['start']} -> {report['rss_mb']['end']} MB "
+          f"({report['rss_mb']['growth_per_10k_messages']} MB / 1万条)")
+    if report['api_readers']:
+        r = report['api_readers']
+        print(f"  API 读取 {r['reads']} 次 p95 {r['p95_ms']} ms  locked {r['locked']}")
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'结果已写入 {args.out}')
+    return 0 if report['unfinished'] == 0 and report['locked_errors'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
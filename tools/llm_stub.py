@@ -0,0 +1,205 @@
+"""
+本地 OpenAI 兼容的 LLM 替身服务
+返回脚本化/录制的补全结果，延迟可配置，支持流式（SSE）和 usage 字段，用于离线评估和压测，无需调用付费端点
+
+用法: python -m tools.llm_stub --port 8900 --corpus tools/data/parser_corpus.jsonl --latency-ms 800
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+
+def load_script(corpus_path: Optional[str]) -> Dict[str, str]:
+    """从语料加载 {消息文本: 补全内容}；有 recorded 字段用录制的原始输出，否则用 expected 序列化
+    （后者是合成的补全，parser_eval 只把它们当作链路检查，不计入准确率）"""
+    script = {}
+    if not corpus_path:
+        return script
+    with open(corpus_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            completion = row.get('recorded')
+            if completion is None:
+                completion = json.dumps(row.get('expected') or {}, ensure_ascii=False)
+            script[row['text']] = completion
+            # 回复消息在送往模型前会加上前缀
+            script[f"[回复消息] {row['text']}"] = completion
+    return script
+
+
+class StubLLM:
+    """补全逻辑：按用户消息查脚本，批量请求按数组逐条查找后拼成数组"""
+
+    def __init__(self, script: Dict[str, str], latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 chunk_delay_ms: float = 20.0, trailing_text: str = '', error_rate: float = 0.0):
+        self.script = script
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.chunk_delay_ms = chunk_delay_ms
+        # 模拟啰嗦的模型：在 JSON 之后追加解释文字（流式模式下应被提前截断）
+        self.trailing_text = trailing_text
+        self.error_rate = error_rate
+        self.requests = 0
+        self._seen_prefixes = set()
+        self._lock = threading.Lock()
+
+    def _lookup(self, text: str) -> str:
+        return self.script.get(text, '{}')
+
+    def complete(self, body: Dict):
+        messages = body.get('messages') or []
+        system = next((m.get('content', '') for m in messages if m.get('role') == 'system'), '')
+        user = next((m.get('content', '') for m in reversed(messages) if m.get('role') == 'user'), '')
+        content = None
+        if user.lstrip().startswith('[{') and '"id"' in user:
+            try:
+                items = json.loads(user)
+                parts = []
+                for item in items:
+                    result = self._lookup(item.get('text', ''))
+                    try:
+                        result_obj = json.loads(result)
+                    except ValueError:
+                        result_obj = {}
+                    parts.append({'id': item.get('id'), 'result': result_obj})
+                content = json.dumps(parts, ensure_ascii=False)
+            except ValueError:
+                content = None
+        if content is None:
+            content = self._lookup(user)
+        content += self.trailing_text
+        with self._lock:
+            self.requests += 1
+            # 粗略模拟前缀缓存：同一系统提示词第二次出现起视为缓存命中
+            cached = system in self._seen_prefixes
+            self._seen_prefixes.add(system)
+        prompt_tokens = (len(system) + len(user)) // 2 + 8
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'prompt_cache_hit_tokens': len(system) // 2 if cached else 0,
+            'completion_tokens': max(1, len(content) // 2),
+        }
+        return content, usage
+
+    def delay(self):
+        latency = self.latency_ms + (random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0)
+        if latency > 0:
+            time.sleep(latency / 1000.0)
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+
+def _make_handler(stub: StubLLM):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send_json(self, status: int, payload: Dict):
+            data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                self._send_json(400, {'error': 'invalid json'})
+                return
+            stub.delay()
+            if stub.should_fail():
+                self._send_json(503, {'error': 'stub injected failure'})
+                return
+            content, usage = stub.complete(body)
+            if not body.get('stream'):
+                self._send_json(200, {
+                    'id': 'stub',
+                    'object': 'chat.completion',
+                    'model': body.get('model'),
+                    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+                    'usage': usage,
+                })
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            try:
+                step = 6
+                for i in range(0, len(content), step):
+                    chunk = {'choices': [{'index': 0, 'delta': {'content': content[i:i + step]}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+                    if stub.chunk_delay_ms:
+                        time.sleep(stub.chunk_delay_ms / 1000.0)
+                if (body.get('stream_options') or {}).get('include_usage'):
+                    self.wfile.write(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode('utf-8'))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # 对冲落败的请求被取消，客户端提前断开
+                pass
+            self.close_connection = True
+
+    return Handler
+
+
+class StubServer:
+    """在后台线程运行替身服务，url 属性为 chat/completions 端点"""
+
+    def __init__(self, stub: StubLLM, host: str = '127.0.0.1', port: int = 0):
+        self.stub = stub
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(stub))
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}/v1/chat/completions'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地 OpenAI 兼容 LLM 替身服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--corpus', default='tools/data/parser_corpus.jsonl')
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--chunk-delay-ms', type=float, default=20.0)
+    parser.add_argument('--trailing-text', default='')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    stub = StubLLM(load_script(args.corpus), args.latency_ms, args.jitter_ms, args.chunk_delay_ms, args.trailing_text, args.error_rate)
+    server = StubServer(stub, args.host, args.port)
+    print(f'LLM 替身服务已启动: {server.url}（脚本 {len(stub.script)} 条）')
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print('退出')
+
+
+if __name__ == '__main__':
+    main()
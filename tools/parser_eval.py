@@ -0,0 +1,264 @@
+"""
+离线解析评估工具
+用带标注的交易消息语料回放解析器（默认连接本地 LLM 替身服务），统计各模板的准确率、p50/p95 延迟和 token 用量；
+影子模式下同时运行生产解析器和候选解析器并输出差异
+
+使用替身服务时，只有带 recorded（录制的真实模型输出）的语料行计入准确率；其余行由替身直接返回标注结果，
+只能检查请求/解析链路和延迟，单独报告为"链路检查"。连接真实端点或使用自定义解析器时全部语料行计入准确率。
+
+用法:
+  python -m tools.parser_eval                                   # 替身服务 + deepseek 解析器
+  python -m tools.parser_eval --parser deepseek-stream --trailing-text "\\n解释：..."
+  python -m tools.parser_eval --shadow prefilter+deepseek       # 影子模式对比
+  python -m tools.parser_eval --endpoint https://api.deepseek.com/v1/chat/completions   # 真实端点（需 DEEPSEEK_API_KEY）
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+PRICE_FIELDS = ('entry_price', 'take_profit', 'stop_loss', 'pnl_points')
+
+
+def load_corpus(path: str) -> List[Dict]:
+    rows = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                rows.append(json.loads(line))
+    return rows
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(p / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[idx]
+
+
+def _num_equal(a, b) -> bool:
+    try:
+        return abs(float(a) - float(b)) < 1e-6
+    except (TypeError, ValueError):
+        return False
+
+
+def score(expected: Dict, actual: Optional[Dict]) -> List[str]:
+    """返回不匹配的字段列表（空列表表示完全正确）"""
+    actual = actual if isinstance(actual, dict) else None
+    if actual is None:
+        return ['<error>']
+    if not expected:
+        return [] if not actual.get('type') else ['type']
+    if actual.get('type') != expected.get('type'):
+        return ['type']
+    mismatches = []
+    for key, value in expected.items():
+        if key == 'type':
+            continue
+        if key in PRICE_FIELDS:
+            if not _num_equal(actual.get(key), value):
+                mismatches.append(key)
+        elif actual.get(key) != value:
+            mismatches.append(key)
+    return mismatches
+
+
+# 评估中创建的 DeepseekClient（汇总用量前等待流式请求在后台读完 usage 分块）
+_clients: List = []
+
+
+def build_parser(name: str) -> Callable[[str, str], Optional[Dict]]:
+    """解析器名称 -> fn(text, tag)；tag 作为 trader_id 写入用量表，便于按解析器统计 token"""
+    from app.services.ai.deepseek import DeepseekClient
+    if name in ('deepseek', 'deepseek-stream'):
+        client = DeepseekClient()
+        _clients.append(client)
+        client.stream = name == 'deepseek-stream'
+        return lambda text, tag: client.extract_trade(text, tag)
+    if name == 'prefilter+deepseek':
+        from app.services.ai.prefilter import SignalPrefilter
+        client = DeepseekClient()
+        _clients.append(client)
+        prefilter = SignalPrefilter(log_path='')
+        prefilter.audit_rate = 0.0
+
+        def run(text, tag):
+            is_reply = text.startswith('[回复消息] ')
+            raw = text[len('[回复消息] '):] if is_reply else text
+            if not prefilter.evaluate(raw, is_reply=is_reply).call_llm:
+                return {}
+            return client.extract_trade(text, tag)
+        return run
+    # 自定义解析器：module:function，签名为 fn(text) -> dict
+    module_name, _, attr = name.partition(':')
+    fn = getattr(importlib.import_module(module_name), attr)
+    return lambda text, tag: fn(text)
+
+
+def uses_llm(parser_name: str) -> bool:
+    return parser_name in ('deepseek', 'deepseek-stream', 'prefilter+deepseek')
+
+
+def evaluate(parser_name: str, fn: Callable, corpus: List[Dict], synthetic: bool = False) -> Dict:
+    """synthetic=True 表示模型输出来自替身服务：没有 recorded 的行只做链路检查，不计入准确率"""
+    per_template: Dict[str, Dict] = {}
+    latencies = []
+    outputs = {}
+    failures = []
+    plumbing = {'total': 0, 'ok': 0, 'failures': []}
+    for row in corpus:
+        text = f"[回复消息] {row['text']}" if row.get('is_reply') else row['text']
+        start = time.perf_counter()
+        try:
+            result = fn(text, parser_name)
+        except Exception as e:
+            print(f'[Eval] ❌ {parser_name} 解析 {row["id"]} 异常: {e}')
+            result = None
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        latencies.append(elapsed_ms)
+        outputs[row['id']] = result
+        mismatches = score(row.get('expected') or {}, result)
+        tpl = per_template.setdefault(row.get('template', 'default'), {'total': 0, 'correct': 0, 'latencies': []})
+        tpl['latencies'].append(elapsed_ms)
+        if synthetic and 'recorded' not in row:
+            # 替身返回的就是标注结果，不匹配只能说明请求/解析链路有问题
+            plumbing['total'] += 1
+            if mismatches:
+                plumbing['failures'].append({'id': row['id'], 'template': row.get('template'), 'fields': mismatches, 'output': result})
+            else:
+                plumbing['ok'] += 1
+            continue
+        tpl['total'] += 1
+        if mismatches:
+            failures.append({'id': row['id'], 'template': row.get('template'), 'fields': mismatches, 'output': result})
+        else:
+            tpl['correct'] += 1
+    total = sum(t['total'] for t in per_template.values())
+    correct = sum(t['correct'] for t in per_template.values())
+    return {
+        'parser': parser_name,
+        'accuracy': correct / total if total else None,
+        'scored': total,
+        'plumbing': plumbing,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'templates': {
+            name: {
+                'total': t['total'],
+                'accuracy': t['correct'] / t['total'] if t['total'] else None,
+                'p50_ms': percentile(t['latencies'], 50),
+                'p95_ms': percentile(t['latencies'], 95),
+            }
+            for name, t in sorted(per_template.items())
+        },
+        'failures': failures,
+        'outputs': outputs,
+    }
+
+
+def shadow_diff(corpus: List[Dict], prod: Dict, candidate: Dict) -> List[Dict]:
+    diffs = []
+    for row in corpus:
+        a = prod['outputs'].get(row['id'])
+        b = candidate['outputs'].get(row['id'])
+        if score(a or {}, b) if isinstance(a, dict) else a != b:
+            diffs.append({'id': row['id'], 'template': row.get('template'), 'production': a, 'candidate': b})
+    return diffs
+
+
+def print_report(report: Dict, tokens: Optional[Dict]):
+    fmt = lambda v: '-' if v is None else f'{v:.0f}'
+    pct = lambda v: '-' if v is None else f'{v:.2%}'
+    print(f"\n=== 解析器: {report['parser']} ===")
+    print(f"准确率: {pct(report['accuracy'])} ({report['scored']} 条)  p50: {fmt(report['p50_ms'])}ms  p95: {fmt(report['p95_ms'])}ms")
+    plumbing = report['plumbing']
+    if plumbing['total']:
+        print(f"链路检查: {plumbing['ok']}/{plumbing['total']} 通过（替身返回标注结果的语料行，不计入准确率）")
+    if tokens:
+        print(f"Token: 提示 {tokens['prompt_tokens']} (缓存 {tokens['cached_tokens']}, 命中率 {tokens['cache_hit_ratio'] or 0:.2%}), "
+              f"输出 {tokens['completion_tokens']}, 每条 {tokens['tokens_per_message']}, "
+              f"用量未知 {tokens['usage_unknown_calls']} 次请求 / {tokens['usage_unknown_messages']} 条消息")
+    print(f"{'模板':<16}{'条数':>6}{'准确率':>10}{'p50(ms)':>10}{'p95(ms)':>10}")
+    for name, t in report['templates'].items():
+        print(f"{name:<16}{t['total']:>6}{pct(t['accuracy']):>10}{fmt(t['p50_ms']):>10}{fmt(t['p95_ms']):>10}")
+    for f in report['failures']:
+        print(f"  ✗ {f['id']} ({f['template']}) 字段: {','.join(f['fields'])} 输出: {json.dumps(f['output'], ensure_ascii=False)}")
+    for f in plumbing['failures']:
+        print(f"  ⚠ 链路 {f['id']} ({f['template']}) 字段: {','.join(f['fields'])} 输出: {json.dumps(f['output'], ensure_ascii=False)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='离线解析评估')
+    parser.add_argument('--corpus', default=os.path.join(os.path.dirname(__file__), 'data', 'parser_corpus.jsonl'))
+    parser.add_argument('--parser', default='deepseek', help='deepseek | deepseek-stream | prefilter+deepseek | module:function')
+    parser.add_argument('--shadow', default=None, help='候选解析器，与 --parser 同时运行并输出差异')
+    parser.add_argument('--endpoint', default=None, help='真实端点；不指定时启动本地替身服务')
+    parser.add_argument('--latency-ms', type=float, default=300.0)
+    parser.add_argument('--jitter-ms', type=float, default=100.0)
+    parser.add_argument('--chunk-delay-ms', type=float, default=10.0)
+    parser.add_argument('--trailing-text', default='')
+    parser.add_argument('--out', default=None, help='结果 JSON 输出路径')
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus(args.corpus)
+    workdir = tempfile.mkdtemp(prefix='parser_eval_')
+    server = None
+    if args.endpoint:
+        os.environ['DEEPSEEK_ENDPOINT'] = args.endpoint
+    else:
+        from tools.llm_stub import StubLLM, StubServer, load_script
+        stub = StubLLM(load_script(args.corpus), args.latency_ms, args.jitter_ms, args.chunk_delay_ms, args.trailing_text)
+        server = StubServer(stub).start()
+        os.environ['DEEPSEEK_ENDPOINT'] = server.url
+        os.environ['DEEPSEEK_API_KEY'] = 'stub'
+        print(f'[Eval] 🧪 本地替身服务: {server.url}')
+    # 评估期间的用量和日志写入临时目录，不污染生产数据
+    os.environ['MEMBERSHIP_DB_PATH'] = os.path.join(workdir, 'membership.db')
+    os.environ['MONITOR_LOG_DIR'] = workdir
+    os.environ['DEEPSEEK_FALLBACK_ENDPOINT'] = ''
+
+    from app.services.ai.usage import UsageRecorder
+    # 替身服务下 LLM 解析器的输出只有 recorded 行是真实的
+    synthetic = lambda name: server is not None and uses_llm(name)
+    try:
+        names = [args.parser] + ([args.shadow] if args.shadow else [])
+        fns = {name: build_parser(name) for name in names}
+        if args.shadow:
+            # 影子模式：两个解析器并行处理同一语料
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                futures = {name: pool.submit(evaluate, name, fns[name], corpus, synthetic(name)) for name in names}
+                reports = {name: fut.result() for name, fut in futures.items()}
+        else:
+            reports = {args.parser: evaluate(args.parser, fns[args.parser], corpus, synthetic(args.parser))}
+        for client in _clients:
+            client.flush_usage()
+        usage = {row['trader_id']: row for row in UsageRecorder().summary()['traders']}
+        for name in names:
+            print_report(reports[name], usage.get(name))
+        result = {'corpus': args.corpus, 'reports': reports, 'tokens': usage}
+        if args.shadow:
+            diffs = shadow_diff(corpus, reports[args.parser], reports[args.shadow])
+            result['shadow_diffs'] = diffs
+            print(f"\n=== 影子对比: {args.parser} vs {args.shadow} — 差异 {len(diffs)}/{len(corpus)} ===")
+            for d in diffs:
+                print(f"  ≠ {d['id']} ({d['template']}) 生产: {json.dumps(d['production'], ensure_ascii=False)} 候选: {json.dumps(d['candidate'], ensure_ascii=False)}")
+        if args.out:
+            with open(args.out, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            print(f'\n结果已保存: {args.out}')
+    finally:
+        if server:
+            server.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())